@@ -0,0 +1,484 @@
+"""Quarto実行前のダイアグラム事前レンダリングと画像キャッシュ."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Union
+
+from src.converters.kroki_client import KrokiClient, KrokiClientError, get_shared_kroki_client
+from src.converters.kroki_health import KrokiHealthMonitor, get_shared_kroki_health_monitor
+from src.core.deadline import current_deadline
+from src.core.document import QuartoDocument
+from src.core.settings import Settings, get_settings
+from src.core.spawner import create_subprocess_exec
+from src.core.fence_tokenizer import FencedBlock, splice
+
+
+logger = logging.getLogger(__name__)
+
+
+class DiagramRenderError(Exception):
+    """ダイアグラムのレンダリング失敗エラー."""
+    pass
+
+
+class DiagramImageCache:
+    """
+    コンテンツアドレス方式のダイアグラム画像キャッシュ.
+    
+    キーはレンダラー名・画像形式・ダイアグラムソースのSHA-256.
+    同じダイアグラムはリクエストをまたいで再レンダリングされない.
+    """
+    
+    def __init__(self, cache_dir: Path):
+        """
+        Args:
+            cache_dir: キャッシュディレクトリのパス
+        """
+        self.cache_dir = Path(cache_dir).expanduser()
+    
+    @staticmethod
+    def make_key(engine: str, image_format: str, source: str) -> str:
+        """
+        キャッシュキーを計算する.
+        
+        Args:
+            engine: レンダラー名（kroki, mmdc等）
+            image_format: 画像形式（svg/png）
+            source: ダイアグラムのソース
+            
+        Returns:
+            16進数のSHA-256ダイジェスト
+        """
+        digest = hashlib.sha256()
+        digest.update(engine.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_format.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(source.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def path_for(self, key: str, image_format: str) -> Path:
+        """キーに対応するキャッシュファイルのパスを返す."""
+        return self.cache_dir / key[:2] / f"{key}.{image_format}"
+    
+    def get(self, key: str, image_format: str) -> Optional[Path]:
+        """
+        キャッシュ済み画像のパスを返す.
+        
+        Returns:
+            キャッシュ済みの場合はパス、未キャッシュの場合はNone
+        """
+        path = self.path_for(key, image_format)
+        return path if path.exists() else None
+    
+    def put(self, key: str, image_format: str, data: bytes) -> Path:
+        """
+        画像をキャッシュに保存する.
+        
+        一時ファイルに書き込んでからリネームするため、並行する読み込みが
+        書き込み途中のファイルを参照することはない.
+        
+        Returns:
+            保存した画像のパス
+        """
+        path = self.path_for(key, image_format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        
+        return path
+
+
+class KrokiDiagramBackend:
+    """
+    Krokiサーバーでダイアグラムをレンダリングするバックエンド.
+    
+    複数のダイアグラムはKrokiClient.render_manyでまとめて取得し、同時リクエスト数は
+    クライアントのホストごとの上限に任せる. 取得全体はbudget秒（要求に期限がある場合は
+    残りの予算）で打ち切る.
+    """
+    
+    name = "kroki"
+    
+    def __init__(
+        self,
+        client: KrokiClient,
+        health: Optional[KrokiHealthMonitor] = None,
+        budget: Optional[float] = None,
+    ):
+        """
+        Args:
+            client: 接続プールを共有するKrokiクライアント
+            health: 取得結果を記録するヘルスモニター（回路が開いている間は即座に失敗する）
+            budget: render_manyの呼び出し全体の時間予算（秒、Noneで1リクエストごとのタイムアウトのみ）
+        """
+        self.client = client
+        self.health = health
+        self.budget = budget
+    
+    async def render(self, source: str, image_format: str) -> bytes:
+        """
+        ダイアグラムをレンダリングする.
+        
+        Args:
+            source: Mermaidソース
+            image_format: 画像形式（svg/png）
+            
+        Returns:
+            画像データ
+            
+        Raises:
+            DiagramRenderError: レンダリングに失敗した場合
+        """
+        result = (await self.render_many([source], image_format))[0]
+        if isinstance(result, DiagramRenderError):
+            raise result
+        return result
+    
+    async def render_many(
+        self,
+        sources: List[str],
+        image_format: str,
+    ) -> List[Union[bytes, DiagramRenderError]]:
+        """
+        複数のダイアグラムを並行してレンダリングする.
+        
+        Args:
+            sources: Mermaidソースのリスト
+            image_format: 画像形式（svg/png）
+            
+        Returns:
+            sourcesと同じ順序の結果リスト（画像データまたはDiagramRenderError）
+        """
+        if self.health is not None and not self.health.breaker.is_closed:
+            error = DiagramRenderError("Kroki service is unavailable (circuit open)")
+            return [error] * len(sources)
+        
+        budget = self.budget
+        deadline = current_deadline()
+        if deadline is not None:
+            budget = deadline.bound(budget) if budget is not None else max(deadline.remaining(), 0.0)
+        
+        results = await self.client.render_many(
+            [("mermaid", source, image_format) for source in sources], budget=budget
+        )
+        
+        rendered: List[Union[bytes, DiagramRenderError]] = []
+        for result in results:
+            if isinstance(result, KrokiClientError):
+                # 4xxはダイアグラムの構文エラーなのでサービス障害として数えない
+                if self.health is not None and (result.status_code is None or result.status_code >= 500):
+                    self.health.record_failure()
+                error = DiagramRenderError(str(result))
+                error.__cause__ = result
+                rendered.append(error)
+            else:
+                if self.health is not None:
+                    self.health.record_success()
+                rendered.append(result)
+        return rendered
+
+
+class MermaidCliDiagramBackend:
+    """Mermaid CLI（mmdc）でダイアグラムをローカルレンダリングするバックエンド."""
+    
+    name = "mmdc"
+    
+    def __init__(self, cli_path: str = "mmdc", timeout: float = 60.0):
+        """
+        Args:
+            cli_path: mmdcコマンドのパス
+            timeout: 1ダイアグラムあたりのタイムアウト秒数
+        """
+        self.cli_path = cli_path
+        self.timeout = timeout
+    
+    async def render(self, source: str, image_format: str) -> bytes:
+        """
+        ダイアグラムをレンダリングする.
+        
+        Args:
+            source: Mermaidソース
+            image_format: 画像形式（svg/png）
+            
+        Returns:
+            画像データ
+            
+        Raises:
+            DiagramRenderError: レンダリングに失敗した場合
+        """
+        with tempfile.TemporaryDirectory(prefix="quarto_mcp_mmdc_") as temp_dir:
+            input_path = Path(temp_dir) / "diagram.mmd"
+            output_path = Path(temp_dir) / f"diagram.{image_format}"
+            input_path.write_text(source, encoding="utf-8")
+            
+            try:
+                process = await create_subprocess_exec(
+                    self.cli_path,
+                    "-i", str(input_path),
+                    "-o", str(output_path),
+                )
+            except FileNotFoundError as e:
+                raise DiagramRenderError(f"Mermaid CLI not found: {self.cli_path}") from e
+            
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError as e:
+                process.kill()
+                await process.wait()
+                raise DiagramRenderError(
+                    f"Mermaid CLI timed out after {self.timeout} seconds"
+                ) from e
+            
+            if process.returncode != 0 or not output_path.exists():
+                raise DiagramRenderError(
+                    f"Mermaid CLI exited with code {process.returncode}: "
+                    f"{stderr.decode('utf-8', errors='replace').strip()}"
+                )
+            
+            return output_path.read_bytes()
+
+
+class DiagramPrerenderer:
+    """
+    Quarto実行前にMermaidブロックを画像へ変換するクラス.
+    
+    処理内容:
+    1. ドキュメントからMermaidブロックを抽出
+    2. キャッシュにない画像だけを並行してレンダリング
+    3. 画像を作業ディレクトリに配置し、ブロックを画像参照に置き換え
+    
+    レンダリングに失敗したブロックはそのまま残し、通常のMermaid/Kroki
+    処理に任せる.
+    """
+    
+    # 作業ディレクトリ内の画像配置先
+    IMAGE_DIR = "_diagrams"
+    
+    def __init__(self, backend, cache: DiagramImageCache, concurrency: int = 4):
+        """
+        Args:
+            backend: レンダリングバックエンド（KrokiDiagramBackend等）
+            cache: 画像キャッシュ
+            concurrency: 同時レンダリング数の上限（render_manyを持たないバックエンドに適用する）
+        """
+        self.backend = backend
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+    
+    @classmethod
+    def from_environment(cls, settings: Optional[Settings] = None) -> Optional["DiagramPrerenderer"]:
+        """
+        設定から事前レンダリングの構成を生成する.
+        
+        設定（環境変数）:
+        - diagram_prerender (QUARTO_MCP_DIAGRAM_PRERENDER): kroki / mmdc / off（未設定時はoff）
+        - diagram_cache_dir (QUARTO_MCP_DIAGRAM_CACHE_DIR): 画像キャッシュディレクトリ
+        - diagram_concurrency (QUARTO_MCP_DIAGRAM_CONCURRENCY): 同時レンダリング数
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            事前レンダリングが有効な場合はインスタンス、無効な場合はNone
+        """
+        if settings is None:
+            settings = get_settings()
+        mode = settings.diagram_prerender
+        if mode == "off":
+            return None
+        
+        if mode == "kroki":
+            client = get_shared_kroki_client()
+            if client is None:
+                logger.warning("Diagram pre-render mode 'kroki' requires QUARTO_MCP_KROKI_URL")
+                return None
+            backend = KrokiDiagramBackend(
+                client, get_shared_kroki_health_monitor(), budget=settings.kroki_fetch_budget
+            )
+        else:  # mmdc
+            cli_path = shutil.which("mmdc")
+            if not cli_path:
+                logger.warning("Diagram pre-render mode 'mmdc' requires Mermaid CLI (mmdc)")
+                return None
+            backend = MermaidCliDiagramBackend(cli_path)
+        
+        return cls(backend, DiagramImageCache(Path(settings.diagram_cache_dir)), settings.diagram_concurrency)
+    
+    async def prerender(
+        self,
+        document: QuartoDocument,
+        image_format: str,
+        workspace: Path,
+    ) -> List[str]:
+        """
+        ドキュメント内のMermaidブロックを画像参照に置き換える.
+        
+        Args:
+            document: 解析済みドキュメント（この場で書き換える）
+            image_format: 画像形式（svg/png）
+            workspace: 作業ディレクトリ
+            
+        Returns:
+            警告メッセージのリスト
+        """
+        blocks = [
+            block for block in document.blocks_by_language("mermaid")
+            if block.closed
+        ]
+        if not blocks:
+            return []
+        
+        body = document.body
+        sources = [self._diagram_source(block.content(body)) for block in blocks]
+        
+        # 同じソースのダイアグラムは1回だけレンダリングする
+        keys = [
+            self.cache.make_key(self.backend.name, image_format, source)
+            for source in sources
+        ]
+        unique: Dict[str, str] = {}
+        for key, source in zip(keys, sources):
+            unique.setdefault(key, source)
+        
+        images, warnings = await self._resolve_images(unique, image_format)
+        
+        image_dir = workspace / self.IMAGE_DIR
+        replacements: List[Tuple[int, int, str]] = []
+        for block, key in zip(blocks, keys):
+            cached_path = images.get(key)
+            if cached_path is None:
+                continue
+            
+            target = image_dir / cached_path.name
+            if not target.exists():
+                image_dir.mkdir(parents=True, exist_ok=True)
+                self._link_or_copy(cached_path, target)
+            
+            relative = f"{self.IMAGE_DIR}/{cached_path.name}"
+            replacements.append((block.start, block.end, self._image_markdown(block, body, relative)))
+        
+        if replacements:
+            document.replace_body(splice(body, replacements))
+        
+        logger.info(
+            f"[DIAGRAM_PRERENDER] Replaced {len(replacements)}/{len(blocks)} mermaid blocks "
+            f"with {image_format} images"
+        )
+        return warnings
+    
+    async def _resolve_images(
+        self,
+        sources: Dict[str, str],
+        image_format: str,
+    ) -> Tuple[Dict[str, Path], List[str]]:
+        """
+        キャッシュを参照し、未キャッシュの画像を並行してレンダリングする.
+        
+        バックエンドがrender_manyを持つ場合はまとめて渡し、同時実行数と時間予算は
+        バックエンドに任せる. 持たない場合はconcurrency件ずつrenderを呼ぶ.
+        
+        Args:
+            sources: キャッシュキーからダイアグラムソースへの辞書
+            image_format: 画像形式
+            
+        Returns:
+            (キャッシュキーから画像パスへの辞書, 警告メッセージのリスト) のタプル
+        """
+        images: Dict[str, Path] = {}
+        missing: Dict[str, str] = {}
+        for key, source in sources.items():
+            cached = self.cache.get(key, image_format)
+            if cached is not None:
+                images[key] = cached
+            else:
+                missing[key] = source
+        
+        logger.info(
+            f"[DIAGRAM_PRERENDER] Cache hits: {len(images)}, to render: {len(missing)}"
+        )
+        
+        warnings: List[str] = []
+        if not missing:
+            return images, warnings
+        
+        render_many = getattr(self.backend, "render_many", None)
+        if render_many is not None:
+            # 同時実行数と時間予算はバックエンド（Krokiクライアント）に任せる
+            results = await render_many(list(missing.values()), image_format)
+            for key, result in zip(missing, results):
+                if isinstance(result, DiagramRenderError):
+                    warnings.append(f"Diagram pre-render failed, using standard flow: {result}")
+                else:
+                    images[key] = self.cache.put(key, image_format, result)
+            return images, warnings
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def render_one(key: str, source: str) -> None:
+            async with semaphore:
+                try:
+                    data = await self.backend.render(source, image_format)
+                except DiagramRenderError as e:
+                    warnings.append(f"Diagram pre-render failed, using standard flow: {e}")
+                    return
+            images[key] = self.cache.put(key, image_format, data)
+        
+        await asyncio.gather(*(render_one(key, source) for key, source in missing.items()))
+        return images, warnings
+    
+    def _diagram_source(self, code: str) -> str:
+        """
+        ブロック本体からQuartoのセルオプション（%%|）を除いたソースを返す.
+        """
+        lines = code.splitlines()
+        return "\n".join(line for line in lines if not line.lstrip().startswith("%%|")).strip() + "\n"
+    
+    def _image_markdown(self, block: FencedBlock, body: str, path: str) -> str:
+        """
+        ブロックを置き換える画像参照のMarkdownを生成する.
+        
+        ```{mermaid #fig-id} のラベルとセルオプションの label / fig-cap を引き継ぐ.
+        """
+        label = None
+        caption = ""
+        
+        info = block.info
+        if block.is_braced:
+            for token in info[1:].rstrip("}").split():
+                if token.startswith("#"):
+                    label = token[1:]
+        
+        for line in block.content(body).splitlines():
+            stripped = line.strip()
+            if not stripped.startswith("%%|"):
+                continue
+            option, _, value = stripped[3:].partition(":")
+            value = value.strip().strip('"').strip("'")
+            if option.strip() == "label":
+                label = value
+            elif option.strip() == "fig-cap":
+                caption = value
+        
+        attributes = f"{{#{label}}}" if label else ""
+        line_ending = "\n" if body[block.start:block.end].endswith("\n") else ""
+        return f"{block.indent}![{caption}]({path}){attributes}{line_ending}"
+    
+    def _link_or_copy(self, source: Path, target: Path) -> None:
+        """キャッシュ画像を作業ディレクトリにハードリンクする（失敗時はコピー）."""
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
@@ -0,0 +1,273 @@
+"""接続プールを共有する非同期Krokiクライアント."""
+
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, List, Tuple, Union
+from urllib.parse import urlparse
+
+import httpx
+
+from src.core.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class KrokiClientError(Exception):
+    """Krokiへのリクエスト失敗エラー."""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class KrokiTimeoutError(KrokiClientError):
+    """Krokiへのリクエストがタイムアウトまたは時間予算を超過したエラー."""
+    pass
+
+
+# render_manyに渡すリクエスト: (ダイアグラム種別, ソース, 出力形式)
+DiagramRequest = Tuple[str, str, str]
+
+
+class KrokiClient:
+    """
+    Krokiサービスにダイアグラムを送信してレンダリングするクライアント.
+    
+    特徴:
+    - keep-aliveの接続プールをリクエスト間で共有する
+    - ダイアグラムはPOSTで送信する（GETのURL長制限を回避）
+    - ホストごとの同時リクエスト数を制限して並行取得する
+    - render_manyの呼び出し全体に時間予算を設定できる
+    """
+    
+    def __init__(
+        self,
+        service_url: str,
+        max_connections: int = 32,
+        max_per_host: int = 8,
+        request_timeout: float = 30.0,
+        keepalive_expiry: float = 30.0,
+    ):
+        """
+        Args:
+            service_url: KrokiサービスのURL
+            max_connections: 接続プール全体の最大接続数
+            max_per_host: ホストごとの同時リクエスト数
+            request_timeout: 1リクエストあたりのタイムアウト秒数
+            keepalive_expiry: アイドル接続を保持する秒数
+        """
+        self.service_url = service_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_per_host = max(1, max_per_host)
+        self.request_timeout = request_timeout
+        self.keepalive_expiry = keepalive_expiry
+        
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+    
+    @classmethod
+    def from_environment(cls, settings: Optional[Settings] = None) -> Optional["KrokiClient"]:
+        """
+        設定からクライアントを生成する.
+        
+        設定（環境変数）:
+        - kroki_url (QUARTO_MCP_KROKI_URL): KrokiサービスのURL
+        - kroki_max_connections (QUARTO_MCP_KROKI_MAX_CONNECTIONS): ホストごとの同時リクエスト数（デフォルト: 8）
+        - kroki_request_timeout (QUARTO_MCP_KROKI_REQUEST_TIMEOUT): 1リクエストあたりのタイムアウト秒数（デフォルト: 30）
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            Krokiが有効な場合はクライアント、それ以外はNone
+        """
+        if settings is None:
+            settings = get_settings()
+        if not settings.kroki_enabled:
+            return None
+        
+        service_url = settings.kroki_url
+        max_per_host = settings.kroki_max_connections
+        request_timeout = settings.kroki_request_timeout
+        
+        return cls(
+            service_url,
+            max_connections=max(max_per_host * 4, 32),
+            max_per_host=max_per_host,
+            request_timeout=request_timeout,
+        )
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        共有のhttpx.AsyncClientを返す.
+        
+        httpxのクライアントはイベントループに紐づくため、別のループから
+        呼ばれた場合は作り直す.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.request_timeout,
+            )
+            self._client_loop = loop
+            self._host_semaphores = {}
+        return self._client
+    
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """ホストごとの同時リクエスト数を制限するセマフォを返す."""
+        host = urlparse(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+    
+    async def render(
+        self,
+        diagram_type: str,
+        source: str,
+        output_format: str,
+        timeout: Optional[float] = None,
+    ) -> bytes:
+        """
+        ダイアグラムを1つレンダリングする.
+        
+        Args:
+            diagram_type: ダイアグラム種別（mermaid, plantuml等）
+            source: ダイアグラムのソース
+            output_format: 出力形式（svg/png）
+            timeout: タイムアウト秒数（省略時はrequest_timeout）
+            
+        Returns:
+            画像データ
+            
+        Raises:
+            KrokiTimeoutError: タイムアウトした場合
+            KrokiClientError: HTTPエラーまたは接続エラーの場合
+        """
+        url = f"{self.service_url}/{diagram_type}/{output_format}"
+        if timeout is None:
+            timeout = self.request_timeout
+        if timeout <= 0:
+            raise KrokiTimeoutError(f"Kroki time budget exhausted before request: {url}")
+        
+        client = self._get_client()
+        semaphore = self._host_semaphore(url)
+        try:
+            async with semaphore:
+                response = await client.post(
+                    url,
+                    content=source.encode("utf-8"),
+                    headers={"Content-Type": "text/plain"},
+                    timeout=timeout,
+                )
+        except httpx.TimeoutException as e:
+            raise KrokiTimeoutError(f"Kroki request timed out after {timeout} seconds: {url}") from e
+        except httpx.HTTPError as e:
+            raise KrokiClientError(f"Kroki request failed: {url}: {e}") from e
+        
+        if response.status_code != 200:
+            raise KrokiClientError(
+                f"Kroki returned HTTP {response.status_code} for {url}: {response.text[:200]}",
+                status_code=response.status_code,
+            )
+        
+        return response.content
+    
+    async def health(self, timeout: Optional[float] = None) -> bool:
+        """
+        Krokiサービスのヘルスチェックエンドポイントを確認する.
+        
+        Args:
+            timeout: タイムアウト秒数（省略時はrequest_timeout）
+            
+        Returns:
+            GET /health がHTTP 200を返した場合True、それ以外False
+        """
+        url = f"{self.service_url}/health"
+        try:
+            response = await self._get_client().get(
+                url, timeout=timeout if timeout is not None else self.request_timeout
+            )
+        except httpx.HTTPError as e:
+            logger.debug(f"Kroki health check failed: {url}: {e}")
+            return False
+        return response.status_code == 200
+    
+    async def render_many(
+        self,
+        requests: List[DiagramRequest],
+        budget: Optional[float] = None,
+    ) -> List[Union[bytes, KrokiClientError]]:
+        """
+        複数のダイアグラムを並行してレンダリングする.
+        
+        同時リクエスト数はホストごとの上限で制限される. budgetを指定した場合、
+        呼び出し全体がその秒数を超えないように各リクエストのタイムアウトを
+        残り時間で切り詰める.
+        
+        Args:
+            requests: (ダイアグラム種別, ソース, 出力形式) のリスト
+            budget: 呼び出し全体の時間予算（秒）
+            
+        Returns:
+            リクエストと同じ順序の結果リスト（画像データまたはKrokiClientError）
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+        
+        async def render_one(request: DiagramRequest) -> Union[bytes, KrokiClientError]:
+            diagram_type, source, output_format = request
+            timeout = None
+            if deadline is not None:
+                timeout = min(self.request_timeout, deadline - time.monotonic())
+            try:
+                return await self.render(diagram_type, source, output_format, timeout=timeout)
+            except KrokiClientError as e:
+                return e
+        
+        return list(await asyncio.gather(*(render_one(request) for request in requests)))
+    
+    async def aclose(self) -> None:
+        """接続プールを閉じる（別のイベントループで作られたクライアントは破棄だけ行う）."""
+        if (
+            self._client is not None
+            and not self._client.is_closed
+            and self._client_loop is asyncio.get_running_loop()
+        ):
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+
+# プロセス内で共有するクライアント（URLごと）
+_shared_clients: Dict[str, KrokiClient] = {}
+
+
+def get_shared_kroki_client() -> Optional[KrokiClient]:
+    """
+    設定のkroki_url（QUARTO_MCP_KROKI_URL）に対応するプロセス共有のクライアントを返す.
+    
+    Returns:
+        Krokiが有効な場合はクライアント、それ以外はNone
+    """
+    settings = get_settings()
+    client = _shared_clients.get(settings.kroki_url)
+    if client is None:
+        client = KrokiClient.from_environment(settings)
+        if client is None:
+            return None
+        _shared_clients[settings.kroki_url] = client
+    return client
+
+
+async def close_shared_kroki_clients() -> None:
+    """共有クライアントの接続プールをすべて閉じる（サーバー終了時に呼ぶ）."""
+    for client in list(_shared_clients.values()):
+        await client.aclose()
@@ -1,25 +1,15 @@
 """Mermaid記法をKroki記法に変換するモジュール."""
 
-import os
-import re
-from typing import Optional, Literal
+from typing import Optional, Literal, List
+
+from src.core.document import QuartoDocument
+from src.core.fence_tokenizer import FencedBlock, tokenize_fenced_blocks, rewrite_fence_info
+from src.core.settings import get_settings
 
 
 class KrokiConverter:
     """Quarto MardownコンテンツのMermaid記法をKroki記法に変換するクラス."""
     
-    # Quarto拡張記法のパターン（```{mermaid}）
-    QUARTO_MERMAID_PATTERN = re.compile(
-        r'^```\{mermaid([^\}]*)\}',
-        re.MULTILINE
-    )
-    
-    # 標準Markdown記法のパターン（```mermaid）
-    MARKDOWN_MERMAID_PATTERN = re.compile(
-        r'^```mermaid',
-        re.MULTILINE
-    )
-    
     # 画像形式の型定義
     ImageFormat = Literal["svg", "png", "auto"]
     
@@ -61,29 +51,61 @@ class KrokiConverter:
         1. ```{mermaid} → ```kroki-mermaid
         2. ```mermaid → ```kroki-mermaid
         
+        他のコードブロック内に書かれたMermaidフェンスは変換しない.
+        ~~~ や4文字以上のフェンスは元のフェンス文字列を保持したまま変換する.
+        
         Args:
             content: 元のQuarto Markdownコンテンツ
             
         Returns:
             Kroki記法に変換されたコンテンツ
         """
-        # 画像形式を決定
-        image_format = self._determine_image_format()
+        blocks = self._mermaid_blocks(tokenize_fenced_blocks(content))
+        return rewrite_fence_info(content, blocks, "kroki-mermaid")
+    
+    def convert_document(self, document: QuartoDocument) -> int:
+        """
+        解析済みドキュメントの本文のMermaid記法をKroki記法に変換する.
+        
+        YAMLヘッダーには触れず、本文のみをブロック位置で書き換える.
         
-        # Quarto拡張記法を変換
-        content = self._convert_quarto_syntax(content, image_format)
+        Args:
+            document: 解析済みドキュメント
+            
+        Returns:
+            変換したMermaidブロック数
+        """
+        blocks = self._mermaid_blocks(document.blocks)
+        document.rewrite_fence_info(blocks, "kroki-mermaid")
+        return len(blocks)
+    
+    def _mermaid_blocks(self, blocks: List[FencedBlock]) -> List[FencedBlock]:
+        """
+        変換対象のMermaidブロックを抽出する.
         
-        # 標準Markdown記法を変換
-        content = self._convert_markdown_syntax(content, image_format)
+        fermarsan/quarto-kroki拡張では{オプション}形式はサポートされていないため、
+        ```{mermaid #fig-example} のオプションは削除してシンプルな
+        ```kroki-mermaid形式に変換する.
         
-        return content
+        Args:
+            blocks: フェンスコードブロックのリスト
+            
+        Returns:
+            Mermaidブロックのリスト
+        """
+        return [block for block in blocks if block.language == "mermaid"]
+    
+    @property
+    def image_format(self) -> Optional[str]:
+        """使用する画像形式（svg/png、未決定の場合はNone）."""
+        return self._determine_image_format()
     
     def _determine_image_format(self) -> Optional[str]:
         """
         使用する画像形式を決定する.
         
         優先順位:
-        1. 環境変数 QUARTO_MCP_KROKI_IMAGE_FORMAT (svg/png)
+        1. 設定 kroki_image_format（環境変数 QUARTO_MCP_KROKI_IMAGE_FORMAT）(svg/png)
         2. コンストラクタのimage_format引数 (svg/png)
         3. 出力形式に応じた自動選択
         4. デフォルト: None (Kroki拡張のデフォルトに任せる)
@@ -91,10 +113,10 @@ class KrokiConverter:
         Returns:
             画像形式 ("svg", "png", または None)
         """
-        # 1. 環境変数をチェック（最優先）
-        env_format = os.environ.get("QUARTO_MCP_KROKI_IMAGE_FORMAT", "").lower()
-        if env_format in ("svg", "png"):
-            return env_format
+        # 1. 設定をチェック（最優先）
+        configured_format = get_settings().kroki_image_format
+        if configured_format:
+            return configured_format
         
         # 2. 明示的な指定をチェック
         if self._image_format and self._image_format != "auto":
@@ -102,41 +124,3 @@ class KrokiConverter:
         
         # 3. 出力形式に応じた自動選択
         return self.FORMAT_TO_IMAGE.get(self.format_id)
-    
-    def _convert_quarto_syntax(self, content: str, image_format: Optional[str]) -> str:
-        """
-        Quarto拡張記法を変換する.
-        
-        ```{mermaid #fig-example}
-        ↓
-        ```kroki-mermaid
-        
-        Note: fermarsan/quarto-kroki拡張では{オプション}形式はサポートされていないため、
-              シンプルな```kroki-mermaid形式に変換します。
-        
-        Args:
-            content: 元のコンテンツ
-            image_format: 画像形式 (使用されません)
-            
-        Returns:
-            変換後のコンテンツ
-        """
-        # シンプルに```kroki-mermaidに変換（オプションは削除）
-        return self.QUARTO_MERMAID_PATTERN.sub("```kroki-mermaid", content)
-    
-    def _convert_markdown_syntax(self, content: str, image_format: Optional[str]) -> str:
-        """
-        標準Markdown記法を変換する.
-        
-        ```mermaid
-        ↓
-        ```kroki-mermaid
-        
-        Args:
-            content: 元のコンテンツ
-            image_format: 画像形式 (使用されません)
-            
-        Returns:
-            変換後のコンテンツ
-        """
-        return self.MARKDOWN_MERMAID_PATTERN.sub("```kroki-mermaid", content)
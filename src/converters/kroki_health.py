@@ -0,0 +1,246 @@
+"""Krokiサービスのヘルスチェックとサーキットブレーカー."""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from src.converters.kroki_client import KrokiClient, get_shared_kroki_client
+from src.core.settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    連続した失敗で回路を開き、一定時間後に1件だけ試行を許可するサーキットブレーカー.
+    
+    状態:
+    - closed: 通常状態. すべてのリクエストを許可する
+    - open: 失敗が続いた状態. reset_timeout秒が経過するまでリクエストを拒否する
+    - half_open: 回復確認中. 試行1件の結果でclosedまたはopenに遷移する
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            failure_threshold: 回路を開くまでの連続失敗回数
+            reset_timeout: 回路を開いてから試行を許可するまでの秒数
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+    
+    @property
+    def state(self) -> str:
+        """現在の状態."""
+        return self._state
+    
+    @property
+    def is_closed(self) -> bool:
+        """回路が閉じている（通常状態）かどうか."""
+        return self._state == self.CLOSED
+    
+    def allow_request(self) -> bool:
+        """
+        リクエストを許可するかどうかを判定する.
+        
+        open状態でreset_timeoutが経過している場合はhalf_openに遷移し、
+        その呼び出し1件だけを許可する.
+        
+        Returns:
+            許可する場合True
+        """
+        if self._state == self.CLOSED:
+            return True
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            logger.info("Kroki circuit half-open: allowing a trial request")
+            return True
+        return False
+    
+    def record_success(self) -> None:
+        """成功を記録し、回路を閉じる."""
+        if self._state != self.CLOSED:
+            logger.info("Kroki circuit closed: service recovered")
+        self._state = self.CLOSED
+        self._failures = 0
+    
+    def record_failure(self) -> None:
+        """失敗を記録する. half_open中の失敗または連続失敗が閾値に達した場合は回路を開く."""
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.trip()
+    
+    def trip(self) -> None:
+        """回路を直ちに開く."""
+        if self._state != self.OPEN:
+            logger.warning("Kroki circuit opened: service marked unavailable")
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+
+
+class KrokiHealthMonitor:
+    """
+    Krokiサービスの可用性をキャッシュして判定するモニター.
+    
+    ヘルスチェック結果はttl秒間キャッシュし、期限切れ後はバックグラウンドで
+    再確認する（判定は待たせない）. ヘルスチェックの失敗は回路を直ちに開き、
+    ダイアグラム取得の失敗は連続回数が閾値に達した時点で回路を開く.
+    """
+    
+    def __init__(
+        self,
+        client: KrokiClient,
+        ttl: float = 15.0,
+        probe_timeout: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            client: ヘルスチェックに使うKrokiクライアント
+            ttl: ヘルスチェック結果をキャッシュする秒数
+            probe_timeout: ヘルスチェックのタイムアウト秒数
+            breaker: サーキットブレーカー（省略時は既定値で生成）
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.client = client
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self._clock = clock
+        self._checked_at: Optional[float] = None
+        self._probe_task: Optional[asyncio.Task] = None
+    
+    @classmethod
+    def from_environment(
+        cls,
+        client: KrokiClient,
+        settings: Optional[Settings] = None,
+    ) -> "KrokiHealthMonitor":
+        """
+        設定からモニターを生成する.
+        
+        設定（環境変数）:
+        - kroki_health_ttl (QUARTO_MCP_KROKI_HEALTH_TTL): ヘルスチェック結果のキャッシュ秒数（デフォルト: 15）
+        - kroki_health_timeout (QUARTO_MCP_KROKI_HEALTH_TIMEOUT): ヘルスチェックのタイムアウト秒数（デフォルト: 2）
+        - kroki_breaker_threshold (QUARTO_MCP_KROKI_BREAKER_THRESHOLD): 回路を開く連続失敗回数（デフォルト: 3）
+        - kroki_breaker_reset (QUARTO_MCP_KROKI_BREAKER_RESET): 回路を開いてから再試行するまでの秒数（デフォルト: 30）
+        
+        Args:
+            client: ヘルスチェックに使うKrokiクライアント
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            KrokiHealthMonitor
+        """
+        if settings is None:
+            settings = get_settings()
+        
+        breaker = CircuitBreaker(
+            failure_threshold=settings.kroki_breaker_threshold,
+            reset_timeout=settings.kroki_breaker_reset,
+        )
+        return cls(
+            client,
+            ttl=settings.kroki_health_ttl,
+            probe_timeout=settings.kroki_health_timeout,
+            breaker=breaker,
+        )
+    
+    async def is_available(self) -> bool:
+        """
+        Krokiサービスを利用してよいかどうかを判定する.
+        
+        - 回路が閉じていればキャッシュ結果で即答し、期限切れなら裏で再確認する
+          （初回のみヘルスチェックの完了を待つ）
+        - 回路が開いていれば即座にFalseを返す
+        - 回路がhalf_openに遷移した呼び出しだけがヘルスチェックを待ち、結果で回復を判定する
+        
+        Returns:
+            利用可能な場合True
+        """
+        if self.breaker.is_closed:
+            if self._checked_at is None:
+                await asyncio.shield(self._ensure_probe())
+                return self.breaker.is_closed
+            if self._clock() - self._checked_at >= self.ttl:
+                self._ensure_probe()
+            return True
+        
+        if not self.breaker.allow_request():
+            return False
+        
+        await asyncio.shield(self._ensure_probe())
+        return self.breaker.is_closed
+    
+    def record_success(self) -> None:
+        """Krokiへのリクエスト成功を記録する."""
+        self.breaker.record_success()
+    
+    def record_failure(self) -> None:
+        """Krokiへのリクエスト失敗（接続エラー・タイムアウト・5xx）を記録する."""
+        self.breaker.record_failure()
+    
+    def _ensure_probe(self) -> asyncio.Task:
+        """実行中のヘルスチェックを返す. なければ開始する."""
+        loop = asyncio.get_running_loop()
+        task = self._probe_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._probe())
+            self._probe_task = task
+        return task
+    
+    async def _probe(self) -> None:
+        """
+        ヘルスチェックを実行し、結果をブレーカーに反映する.
+        
+        HTTPエラー以外の例外も失敗として回路を開く（half_openのまま残さない）.
+        """
+        try:
+            healthy = await self.client.health(timeout=self.probe_timeout)
+        except Exception as e:
+            logger.warning(f"Kroki health check raised an error: {self.client.service_url}: {e}")
+            healthy = False
+        self._checked_at = self._clock()
+        if healthy:
+            self.breaker.record_success()
+        else:
+            logger.warning(f"Kroki health check failed: {self.client.service_url}")
+            self.breaker.trip()
+
+
+# プロセス内で共有するモニター（URLごと）
+_shared_monitors: Dict[str, KrokiHealthMonitor] = {}
+
+
+def get_shared_kroki_health_monitor() -> Optional[KrokiHealthMonitor]:
+    """
+    設定のkroki_url（QUARTO_MCP_KROKI_URL）に対応するプロセス共有のモニターを返す.
+    
+    Returns:
+        Krokiが有効な場合はモニター、それ以外はNone
+    """
+    client = get_shared_kroki_client()
+    if client is None:
+        return None
+    monitor = _shared_monitors.get(client.service_url)
+    if monitor is None or monitor.client is not client:
+        monitor = KrokiHealthMonitor.from_environment(client)
+        _shared_monitors[client.service_url] = monitor
+    return monitor
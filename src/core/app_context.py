@@ -0,0 +1,313 @@
+"""サーバー起動時に1回だけ構築するアプリケーションコンテキスト."""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.core.deadline import Deadline, DeadlineExceededError, deadline_scope
+from src.core.http_client import close_shared_http_client
+from src.core.jobs import JobManager, current_job
+from src.core.latency import measure
+from src.core.limits import BATCH, INTERACTIVE, JOB, WARMUP, lane_scope
+from src.core.renderer import QuartoRenderer
+from src.core.scheduler import DEFAULT_CLIENT, OverloadedError, RenderScheduler
+from src.core.sessions import SessionRegistry
+from src.core.settings import Settings, get_settings
+from src.core.template_registry import TemplateRegistry, get_template_registry
+from src.core.warmup import QuartoWarmup
+from src.core.worker_pool import WorkerPool
+from src.converters.kroki_client import close_shared_kroki_clients
+from src.models.schemas import ErrorInfo, ErrorResponse
+from src.tools.jobs import submit as submit_job
+from src.tools.render import render, render_batch
+
+
+logger = logging.getLogger(__name__)
+
+
+class AppContext:
+    """
+    リクエスト間で共有するコンポーネントをまとめたコンテキスト.
+    
+    ツール呼び出しのたびにQuartoRenderer（とその配下のTemplateManager、
+    ExtensionManager、KrokiConverterなど）を構築し直さないよう、
+    サーバー起動時に1回だけ構築して使い回す. 各コンポーネントは
+    リクエスト固有の状態を持たないため、同時実行されるレンダリング間で共有できる.
+    HTTPトランスポートでは全セッションがこのコンテキストを共有する.
+    """
+    
+    def __init__(self, config_path: Optional[Path] = None, settings: Optional[Settings] = None):
+        """
+        Args:
+            config_path: テンプレート設定ファイルのパス
+            settings: 使用する設定（省略時はプロセス共有の設定）
+        """
+        self.config_path = config_path
+        self.settings = settings if settings is not None else get_settings()
+        self.template_registry: TemplateRegistry = get_template_registry(config_path)
+        self.renderer = QuartoRenderer(config_path=config_path, settings=self.settings)
+        # Quartoの所要時間の分布はレンダラーのものを1つだけ持ち、受け付けの推定とタイムアウトで共有する
+        self.workers = WorkerPool.from_settings(config_path, self.settings, latency=self.renderer.latency)
+        self.scheduler = RenderScheduler.from_settings(self.settings, latency=self.renderer.latency)
+        self.jobs = JobManager.from_settings(self._run_render_job, self.settings)
+        self.sessions = SessionRegistry(idle_timeout=self.settings.server_session_idle_timeout)
+        self.warmup = QuartoWarmup(self._render_warmup, self.settings.warmup_formats)
+    
+    async def startup(self) -> None:
+        """
+        テンプレートファイルのダイジェストを計算し、ページキャッシュに載せておく.
+        
+        Quarto CLIの起動方法を解決し、保存されているレンダリングジョブも読み込み、
+        設定されていればQuartoのウォームアップをバックグラウンドで開始する.
+        """
+        await asyncio.to_thread(self.template_registry.warm)
+        await self.renderer.launcher.resolve()
+        await self.jobs.load()
+        self.warmup.start()
+        logger.info(f"Application context ready ({len(self.template_registry.templates)} templates)")
+    
+    async def aclose(self) -> None:
+        """ウォームアップ、ジョブのワーカーとワーカープロセスを停止し、共有しているHTTP接続プールを閉じる."""
+        await self.warmup.aclose()
+        await self.jobs.aclose()
+        if self.workers is not None:
+            await self.workers.aclose()
+        await close_shared_kroki_clients()
+        await close_shared_http_client()
+    
+    async def render(
+        self,
+        client: str = DEFAULT_CLIENT,
+        client_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        **request: Any,
+    ) -> Dict[str, Any]:
+        """
+        レンダリングを実行する.
+        
+        スケジューラーで受け付けを判定し、実行枠が空くのを待ってから実行する.
+        ワーカープロセスが設定されている場合はワーカーに振り分け、
+        そうでなければ共有のレンダラーでこのプロセス内で実行する.
+        
+        Args:
+            client: クライアントキー（MCPセッションID）
+            client_name: クライアント名（重みの設定の参照用）
+            deadline: 期限
+            **request: render()の引数（content, format, output_filenameなど）
+            
+        Returns:
+            変換結果（成功時はRenderResult、失敗時はErrorResponseの辞書.
+            待ち行列が上限に達している場合はOVERLOADED、期限を過ぎた場合はDEADLINE_EXCEEDED）.
+            待ち行列の情報をqueue、期限の使用状況をdeadlineに含む
+        """
+        return await self._schedule(
+            lambda: self._render_now(request),
+            [request],
+            client=client,
+            weight=self.scheduler.weight_for(client, client_name),
+            deadline=deadline,
+            lane=INTERACTIVE,
+        )
+    
+    async def _render_warmup(self, **request: Any) -> Dict[str, Any]:
+        """ウォームアップのレンダリング（Quartoはwarmupレーンの優先度で実行する）."""
+        return await self._schedule(lambda: self._render_now(request), [request], lane=WARMUP)
+    
+    async def render_batch(
+        self,
+        documents: List[Dict[str, Any]],
+        client: str = DEFAULT_CLIENT,
+        client_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """
+        複数の文書を出力形式ごとに1つのQuartoプロジェクトとしてまとめてレンダリングする.
+        
+        バッチ全体で1つの実行枠を使い、推定所要時間は文書ごとの推定の合計とする.
+        バッチの処理時間の大半はQuartoの実行そのものであるため、ワーカープロセスの設定に
+        かかわらずこのプロセス内の共有レンダラーで実行する.
+        
+        Args:
+            documents: render()の引数の辞書のリスト
+            client: クライアントキー（MCPセッションID）
+            client_name: クライアント名（重みの設定の参照用）
+            deadline: バッチ全体の期限
+            
+        Returns:
+            文書ごとの変換結果（待ち行列が上限に達している場合はOVERLOADED、
+            期限を過ぎた場合はDEADLINE_EXCEEDEDのErrorResponse）
+        """
+        return await self._schedule(
+            lambda: render_batch(documents, renderer=self.renderer),
+            documents,
+            client=client,
+            weight=self.scheduler.weight_for(client, client_name),
+            deadline=deadline,
+            lane=BATCH,
+        )
+    
+    async def submit(
+        self,
+        client: str = DEFAULT_CLIENT,
+        client_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        **request: Any,
+    ) -> Dict[str, Any]:
+        """
+        レンダリングを非同期ジョブとして投入する.
+        
+        受け付けの判定は同期のレンダリングと同じ規則で投入時に行い、スケジューラーの
+        待ち行列に加えて、ジョブの待ち行列で実行を待っているジョブも数える.
+        受け付けたジョブは実行時には拒否しない.
+        
+        Args:
+            client: クライアントキー（MCPセッションID）
+            client_name: クライアント名（重みの設定の参照用）
+            deadline: 期限
+            **request: render()の引数（content, format, output_filenameなど）
+            
+        Returns:
+            ジョブID・状態・待ち順位（待ち行列が上限に達している場合はOVERLOADEDのErrorResponse）
+        """
+        backlog = [
+            self.scheduler.estimate(queued.get("format"), *measure(queued.get("content") or ""))
+            for queued in self.jobs.queued_requests()
+        ]
+        try:
+            self.scheduler.admit(
+                [request.get("format")],
+                client=client,
+                sizes=[measure(request.get("content") or "")],
+                backlog=backlog,
+            )
+        except OverloadedError as e:
+            return _overloaded(e)
+        return await submit_job(
+            self.jobs,
+            **request,
+            client=client,
+            weight=self.scheduler.weight_for(client, client_name),
+            deadline=deadline,
+        )
+    
+    async def _schedule(
+        self,
+        func: Callable[[], Awaitable[Dict[str, Any]]],
+        requests: List[Dict[str, Any]],
+        admit: bool = True,
+        client: str = DEFAULT_CLIENT,
+        weight: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+        lane: str = INTERACTIVE,
+    ) -> Dict[str, Any]:
+        """
+        スケジューラーを通してfuncを実行し、受け付けを拒否された場合はOVERLOADEDを返す.
+        
+        推定所要時間は要求（requests）ごとの出力形式と文書の大きさから求める.
+        funcは期限とレーンのスコープ内で実行し、Quartoのタイムアウトを残りの予算で打ち切る.
+        Quartoの子プロセスにはレーンごとの優先度（nice値、I/O優先度）を適用する.
+        結果にはクライアントごとの待ち順位と待ち時間（queue）、期限がある場合は
+        予算の使用状況（deadline）を加える.
+        """
+        formats = [request.get("format") for request in requests]
+        sizes = [measure(request.get("content") or "") for request in requests]
+        try:
+            async with self.scheduler.slot(
+                formats, admit=admit, client=client, weight=weight, deadline=deadline, sizes=sizes
+            ) as ticket:
+                with deadline_scope(deadline), lane_scope(lane):
+                    result = await func()
+            result["queue"] = ticket.describe()
+        except DeadlineExceededError as e:
+            result = ErrorResponse(
+                error=ErrorInfo(
+                    code="DEADLINE_EXCEEDED",
+                    message=str(e),
+                    details="The render was dropped without running Quarto. Retry with a longer time budget.",
+                )
+            ).model_dump()
+        except OverloadedError as e:
+            result = _overloaded(e)
+        if deadline is not None:
+            result["deadline"] = deadline.describe()
+        return result
+    
+    async def _render_now(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """実行枠を確保した後のレンダリング本体."""
+        if self.workers is not None:
+            return await self.workers.render(request)
+        return await render(**request, renderer=self.renderer)
+    
+    def status(self) -> Dict[str, Any]:
+        """
+        サーバーの状態（ウォームアップ、ジョブ、待ち行列、Quartoの所要時間の分布、セッション、ワーカー）を返す.
+        
+        Returns:
+            状態の辞書
+        """
+        return {
+            "ready": self.warmup.ready,
+            "warmup": self.warmup.status(),
+            "jobs": self.jobs.stats(),
+            "scheduler": self.scheduler.stats(),
+            "latency": self.renderer.latency.snapshot(),
+            "resource_limits": self.renderer.limits.describe(),
+            "sessions": self.sessions.snapshot(),
+            "workers": self.workers.stats() if self.workers is not None else None,
+            "templates": len(self.template_registry.templates),
+            "quarto_launcher": self.renderer.launcher.describe(),
+        }
+    
+    async def _run_render_job(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        非同期ジョブとして投入されたレンダリングを実行する.
+        
+        ジョブは投入時に受け付け済みのため拒否はせず、実行枠だけを同期呼び出しと共有する.
+        実行枠の待ち行列では、ジョブを投入したクライアントとして扱う.
+        """
+        job = current_job()
+        return await self._schedule(
+            lambda: self._render_now(request),
+            [request],
+            admit=False,
+            client=job.client if job is not None else DEFAULT_CLIENT,
+            deadline=job.time_budget() if job is not None else None,
+            lane=JOB,
+        )
+
+
+def _overloaded(error: OverloadedError) -> Dict[str, Any]:
+    """受け付けを拒否されたレンダリングのErrorResponse."""
+    return ErrorResponse(
+        error=ErrorInfo(
+            code="OVERLOADED",
+            message=str(error),
+            details="Too much render work is queued. Retry after retry_after_ms milliseconds.",
+            retry_after_ms=error.retry_after_ms,
+        )
+    ).model_dump()
+
+
+_context: Optional[AppContext] = None
+
+
+def get_app_context() -> Optional[AppContext]:
+    """
+    現在のアプリケーションコンテキストを返す.
+    
+    Returns:
+        set_app_context()で設定されたコンテキスト（未設定の場合はNone）
+    """
+    return _context
+
+
+def set_app_context(context: Optional[AppContext]) -> None:
+    """
+    アプリケーションコンテキストを設定する.
+    
+    Args:
+        context: 設定するコンテキスト（Noneで解除）
+    """
+    global _context
+    _context = context
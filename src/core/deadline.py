@@ -0,0 +1,142 @@
+"""レンダリング要求の期限（時間予算）."""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class DeadlineExceededError(Exception):
+    """レンダリングを始める前、または実行中に期限を過ぎたエラー."""
+    pass
+
+
+class Deadline:
+    """
+    レンダリング要求の期限.
+    
+    期限はUNIX時間で持ち、ワーカープロセスにもそのまま渡せるようにする.
+    待ち行列で期限を過ぎた要求はQuartoを起動する前に破棄し、
+    Quartoのタイムアウトは固定値ではなく残りの予算で打ち切る.
+    """
+    
+    def __init__(self, at: float, budget: float, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            at: 期限（UNIX時間）
+            budget: 要求を受け付けた時点での予算（秒）
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.at = at
+        self.budget = budget
+        self._clock = clock
+    
+    @classmethod
+    def from_request(
+        cls,
+        time_budget_ms: Any = None,
+        deadline: Any = None,
+        clock: Callable[[], float] = time.time,
+    ) -> Optional["Deadline"]:
+        """
+        ツール引数から期限を作る.
+        
+        両方指定された場合は早い方を使う.
+        
+        Args:
+            time_budget_ms: 受け付けからの時間予算（ミリ秒）
+            deadline: 期限（UNIX時間の秒数、またはタイムゾーン付きのISO 8601文字列）
+            clock: 現在時刻（秒）を返す関数
+            
+        Returns:
+            Deadline（どちらも指定されていない場合はNone）
+            
+        Raises:
+            ValueError: 値が不正な場合
+        """
+        now = clock()
+        candidates = []
+        if time_budget_ms is not None:
+            if isinstance(time_budget_ms, bool) or not isinstance(time_budget_ms, (int, float)):
+                raise ValueError("time_budget_ms must be a number")
+            if time_budget_ms <= 0:
+                raise ValueError("time_budget_ms must be greater than 0")
+            candidates.append(now + time_budget_ms / 1000)
+        if deadline is not None:
+            candidates.append(_parse_timestamp(deadline))
+        if not candidates:
+            return None
+        at = min(candidates)
+        return cls(at, max(at - now, 0.0), clock=clock)
+    
+    @property
+    def started_at(self) -> float:
+        """予算の起点（受け付けた時刻）."""
+        return self.at - self.budget
+    
+    @property
+    def expired(self) -> bool:
+        """期限を過ぎているか."""
+        return self.remaining() <= 0
+    
+    def remaining(self) -> float:
+        """期限までの残り秒数（過ぎている場合は0以下）."""
+        return self.at - self._clock()
+    
+    def bound(self, timeout: float) -> float:
+        """タイムアウト秒数を期限までの残りで切り詰める."""
+        return min(timeout, max(self.remaining(), 0.0))
+    
+    def describe(self) -> Dict[str, int]:
+        """応答に含める予算の使用状況."""
+        used = self._clock() - self.started_at
+        return {
+            "budget_ms": round(self.budget * 1000),
+            "used_ms": int(used * 1000),
+            "remaining_ms": max(int((self.budget - used) * 1000), 0),
+        }
+
+
+# 処理中のレンダリングの期限
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "quarto_mcp_deadline", default=None
+)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """処理中のレンダリングの期限を返す. 期限がなければNone."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """
+    スコープ内のレンダリングに期限を設定する.
+    
+    Args:
+        deadline: 期限（Noneの場合は期限なし）
+        
+    Yields:
+        deadline
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def _parse_timestamp(value: Any) -> float:
+    """UNIX時間の秒数またはISO 8601文字列をUNIX時間にする."""
+    if isinstance(value, bool):
+        raise ValueError("deadline must be a UNIX timestamp or an ISO 8601 string")
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("deadline must be a UNIX timestamp or an ISO 8601 string")
+    if parsed.tzinfo is None:
+        raise ValueError("deadline must include a time zone")
+    return parsed.timestamp()
@@ -0,0 +1,155 @@
+"""解析済みQuarto Markdownドキュメントモデル."""
+
+import re
+from typing import Optional, Dict, Any, List
+import yaml
+
+from src.core.fence_tokenizer import FencedBlock, tokenize_fenced_blocks, rewrite_fence_info
+
+
+class QuartoDocument:
+    """
+    YAMLフロントマターと本文に分解したQuarto Markdownドキュメント.
+    
+    リクエストごとに1回だけ解析し、KrokiConverter・YAMLFrontmatterManager・
+    QuartoRenderer._write_qmd の間で共有する. 文字列への変換は
+    serialize() の1回のみで行う.
+    """
+    
+    # YAMLヘッダーのパターン（先頭の---で始まる）
+    YAML_HEADER_PATTERN = re.compile(
+        r'^---\s*\n(.*?)\n---\s*\n',
+        re.DOTALL
+    )
+    
+    def __init__(
+        self,
+        source: str,
+        front_matter: Optional[Dict[str, Any]],
+        body_start: int,
+    ):
+        """
+        Args:
+            source: 元のコンテンツ文字列
+            front_matter: YAMLフロントマター（ヘッダーがない場合はNone）
+            body_start: source内の本文開始位置
+        """
+        self._source = source
+        self._body_start = body_start
+        self._body: Optional[str] = None
+        self._blocks: Optional[List[FencedBlock]] = None
+        self.front_matter = front_matter
+    
+    @classmethod
+    def parse(cls, content: str) -> "QuartoDocument":
+        """
+        コンテンツを解析してドキュメントを生成する.
+        
+        YAMLとして解析できないヘッダー、または辞書でないヘッダーは
+        空のフロントマターとして扱う.
+        
+        Args:
+            content: Quarto Markdown形式の文字列
+            
+        Returns:
+            解析済みドキュメント
+        """
+        match = cls.YAML_HEADER_PATTERN.match(content)
+        if not match:
+            return cls(content, None, 0)
+        
+        yaml_str = match.group(1).strip()
+        front_matter: Dict[str, Any] = {}
+        if yaml_str:
+            try:
+                loaded = yaml.safe_load(yaml_str)
+                if isinstance(loaded, dict):
+                    front_matter = loaded
+            except yaml.YAMLError:
+                pass
+        
+        return cls(content, front_matter, match.end())
+    
+    @property
+    def has_front_matter(self) -> bool:
+        """元のコンテンツにYAMLヘッダーが存在したかどうか."""
+        return self.front_matter is not None
+    
+    @property
+    def body(self) -> str:
+        """本文（YAMLヘッダーを除いた部分）."""
+        if self._body is None:
+            self._body = self._source[self._body_start:]
+        return self._body
+    
+    def replace_body(self, body: str) -> None:
+        """
+        本文を置き換える.
+        
+        Args:
+            body: 新しい本文
+        """
+        self._body = body
+        self._blocks = None
+    
+    @property
+    def blocks(self) -> List[FencedBlock]:
+        """本文中のフェンスコードブロック（初回アクセス時に解析）."""
+        if self._blocks is None:
+            self._blocks = tokenize_fenced_blocks(self.body)
+        return self._blocks
+    
+    def blocks_by_language(self, language: str) -> List[FencedBlock]:
+        """
+        指定言語のフェンスコードブロックを返す.
+        
+        Args:
+            language: 言語名（mermaid等）
+            
+        Returns:
+            該当するブロックのリスト
+        """
+        return [block for block in self.blocks if block.language == language]
+    
+    def rewrite_fence_info(self, blocks: List[FencedBlock], info: str) -> None:
+        """
+        指定ブロックの開始フェンス行のinfo文字列を置き換える.
+        
+        本文全体への正規表現置換ではなく、ブロック位置での差し替えを
+        1回の結合で行う.
+        
+        Args:
+            blocks: 書き換え対象のブロック（self.blocksの要素）
+            info: 新しいinfo文字列
+        """
+        if blocks:
+            self.replace_body(rewrite_fence_info(self.body, blocks, info))
+    
+    def ensure_front_matter(self) -> Dict[str, Any]:
+        """フロントマターを辞書として返す（存在しない場合は空辞書を作成）."""
+        if not isinstance(self.front_matter, dict):
+            self.front_matter = {}
+        return self.front_matter
+    
+    def serialize(self, sort_keys: bool = False) -> str:
+        """
+        YAMLヘッダーと本文を結合した文字列を返す.
+        
+        フロントマターが空の場合は本文のみを返す.
+        
+        Args:
+            sort_keys: YAMLのキーをソートするかどうか
+            
+        Returns:
+            Quarto Markdown形式の文字列
+        """
+        if not self.front_matter:
+            return self.body
+        
+        yaml_str = yaml.dump(
+            self.front_matter,
+            allow_unicode=True,
+            default_flow_style=False,
+            sort_keys=sort_keys,
+        )
+        return f"---\n{yaml_str}---\n\n{self.body}"
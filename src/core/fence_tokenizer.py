@@ -0,0 +1,316 @@
+"""フェンスコードブロックのトークナイザー.
+
+CommonMarkのフェンス規則（``` / ~~~ / 4文字以上のフェンス、インデント、
+入れ子）に従ってコードブロックの位置を1回の走査で収集する.
+KrokiConverter・QuartoRenderer・MermaidExtractorで共有する.
+"""
+
+import re
+from typing import List, Optional, Iterable, Tuple
+
+
+# フェンスに許されるインデントの上限（リスト項目の本文位置からの桁数. 4桁以上はインデントコードブロック）
+MAX_FENCE_INDENT = 3
+
+# リスト項目のマーカー（-、+、*、1.、1)）と後続の空白
+_LIST_MARKER = re.compile(r"([-+*]|\d{1,9}[.)])(?: +|$)")
+
+
+class FencedBlock:
+    """
+    フェンスコードブロックの位置情報.
+    
+    オフセットはすべて走査対象テキスト先頭からの文字位置.
+    """
+    
+    def __init__(
+        self,
+        start: int,
+        end: int,
+        open_end: int,
+        close_start: int,
+        info: str,
+        fence: str,
+        indent: str,
+        start_line: int,
+        end_line: int,
+        closed: bool,
+    ):
+        """
+        Args:
+            start: 開始フェンス行の先頭位置
+            end: ブロック末尾位置（終了フェンス行の改行を含む）
+            open_end: 開始フェンス行の末尾位置（改行を含む）
+            close_start: 終了フェンス行の先頭位置（未閉鎖の場合はend）
+            info: 開始フェンスのinfo文字列（前後の空白除去済み）
+            fence: 開始フェンス文字列（```、~~~、````等）
+            indent: 開始フェンスのインデント文字列
+            start_line: 開始フェンスの行番号（1始まり）
+            end_line: 終了フェンスの行番号（1始まり、未閉鎖の場合は最終行）
+            closed: 終了フェンスで閉じられているかどうか
+        """
+        self.start = start
+        self.end = end
+        self.open_end = open_end
+        self.close_start = close_start
+        self.info = info
+        self.fence = fence
+        self.indent = indent
+        self.start_line = start_line
+        self.end_line = end_line
+        self.closed = closed
+    
+    @property
+    def language(self) -> str:
+        """
+        info文字列から言語名を取得する.
+        
+        ```{mermaid #fig-id} と ```mermaid のどちらも "mermaid" を返す.
+        """
+        info = self.info
+        if info.startswith("{"):
+            info = info[1:].rstrip("}")
+        parts = info.split()
+        return parts[0] if parts else ""
+    
+    @property
+    def is_braced(self) -> bool:
+        """Quarto拡張記法（```{lang}）かどうか."""
+        return self.info.startswith("{")
+    
+    def content(self, text: str) -> str:
+        """
+        ブロック本体（フェンス行を除く）を返す.
+        
+        Args:
+            text: 走査対象のテキスト
+            
+        Returns:
+            ブロック本体の文字列
+        """
+        return text[self.open_end:self.close_start]
+    
+    def __repr__(self) -> str:
+        return (
+            f"FencedBlock(start={self.start}, end={self.end}, "
+            f"info={self.info!r}, fence={self.fence!r}, closed={self.closed})"
+        )
+
+
+def _parse_fence(line: str) -> Optional[Tuple[str, str, str]]:
+    """
+    行がフェンス行かどうかを判定する.
+    
+    Args:
+        line: 改行を除いた1行
+        
+    Returns:
+        (インデント, フェンス文字列, 残りの文字列) のタプル、フェンスでなければNone
+    """
+    stripped = line.lstrip(" \t")
+    if not stripped:
+        return None
+    
+    marker = stripped[0]
+    if marker != "`" and marker != "~":
+        return None
+    
+    length = len(stripped) - len(stripped.lstrip(marker))
+    if length < 3:
+        return None
+    
+    indent = line[:len(line) - len(stripped)]
+    return indent, stripped[:length], stripped[length:]
+
+
+def _columns(indent: str) -> int:
+    """インデント文字列の桁数（タブは4桁ごとのタブ位置まで進める）."""
+    column = 0
+    for char in indent:
+        column = column + 4 - column % 4 if char == "\t" else column + 1
+    return column
+
+
+def _list_content_column(stripped: str, column: int) -> Optional[int]:
+    """
+    リスト項目の行であれば、その項目の本文が始まる桁を返す.
+    
+    Args:
+        stripped: 先頭の空白を除いた行
+        column: マーカーの桁
+        
+    Returns:
+        本文の桁（リスト項目でなければNone）
+    """
+    match = _LIST_MARKER.match(stripped)
+    if match is None:
+        return None
+    spaces = match.end() - len(match.group(1))
+    # マーカーの後が空行、または5桁以上の空白（インデントコード）の場合は1桁とみなす
+    if spaces == 0 or spaces > 4 or match.end() == len(stripped):
+        spaces = 1
+    return column + len(match.group(1)) + spaces
+
+
+def tokenize_fenced_blocks(text: str) -> List[FencedBlock]:
+    """
+    テキストを1回走査してフェンスコードブロックを収集する.
+    
+    規則:
+    - ``` または ~~~ を3文字以上並べた行が開始フェンス
+    - フェンスのインデントは3桁まで. リスト項目の中では項目の本文の桁から数える
+      （4桁以上インデントされた行はインデントコードブロックの一部でフェンスではない）
+    - バッククォートのフェンスではinfo文字列にバッククォートを含められない
+    - 終了フェンスは開始と同じ文字で、開始以上の長さを持ち、後続は空白のみ
+    - ブロック内のフェンス風の行は入れ子として扱わず本体の一部とみなす
+    - 閉じられていないブロックはテキスト末尾までをブロックとする
+    
+    Args:
+        text: 走査対象のテキスト
+        
+    Returns:
+        出現順のフェンスコードブロックのリスト
+    """
+    blocks: List[FencedBlock] = []
+    
+    open_fence: Optional[Tuple[str, str, str]] = None
+    open_start = 0
+    open_end = 0
+    open_line = 0
+    open_base = 0
+    
+    # 開いているリスト項目の本文の桁（先頭は文書本体の0）
+    containers = [0]
+    previous_blank = True
+    
+    pos = 0
+    line_no = 0
+    text_len = len(text)
+    
+    while pos < text_len:
+        newline = text.find("\n", pos)
+        line_end = text_len if newline < 0 else newline + 1
+        line = text[pos:line_end].rstrip("\r\n")
+        line_no += 1
+        
+        parsed = _parse_fence(line)
+        if open_fence is None:
+            stripped = line.lstrip(" \t")
+            column = _columns(line[:len(line) - len(stripped)])
+            if not stripped:
+                previous_blank = True
+                pos = line_end
+                continue
+            
+            # 空行の後で本文の桁より浅い行はそのリスト項目の外（空行がなければ段落の続き）
+            if previous_blank or parsed is not None:
+                while len(containers) > 1 and column < containers[-1]:
+                    containers.pop()
+            previous_blank = False
+            
+            # 本文の桁より4桁以上深い行はインデントコードブロック（または段落の続き）なので見ない
+            if column - containers[-1] <= MAX_FENCE_INDENT:
+                if parsed is not None:
+                    indent, fence, rest = parsed
+                    if not (fence[0] == "`" and "`" in rest):
+                        open_fence = (indent, fence, rest.strip())
+                        open_start = pos
+                        open_end = line_end
+                        open_line = line_no
+                        open_base = containers[-1]
+                else:
+                    content_column = _list_content_column(stripped, column)
+                    if content_column is not None:
+                        while len(containers) > 1 and containers[-1] > column:
+                            containers.pop()
+                        containers.append(content_column)
+        elif parsed is not None:
+            indent, fence, rest = parsed
+            open_marker = open_fence[1]
+            if (
+                fence[0] == open_marker[0]
+                and len(fence) >= len(open_marker)
+                and not rest.strip()
+                and _columns(indent) - open_base <= MAX_FENCE_INDENT
+            ):
+                blocks.append(FencedBlock(
+                    start=open_start,
+                    end=line_end,
+                    open_end=open_end,
+                    close_start=pos,
+                    info=open_fence[2],
+                    fence=open_marker,
+                    indent=open_fence[0],
+                    start_line=open_line,
+                    end_line=line_no,
+                    closed=True,
+                ))
+                open_fence = None
+        
+        pos = line_end
+    
+    if open_fence is not None:
+        blocks.append(FencedBlock(
+            start=open_start,
+            end=text_len,
+            open_end=open_end,
+            close_start=text_len,
+            info=open_fence[2],
+            fence=open_fence[1],
+            indent=open_fence[0],
+            start_line=open_line,
+            end_line=max(line_no, open_line),
+            closed=False,
+        ))
+    
+    return blocks
+
+
+def splice(text: str, replacements: Iterable[Tuple[int, int, str]]) -> str:
+    """
+    位置指定の置換をまとめて適用する.
+    
+    置換範囲は重複せず、昇順に並んでいる必要がある. 元テキストの断片と
+    置換文字列を1回のjoinで結合する.
+    
+    Args:
+        text: 元のテキスト
+        replacements: (開始位置, 終了位置, 置換文字列) のイテラブル
+        
+    Returns:
+        置換後のテキスト
+    """
+    parts: List[str] = []
+    pos = 0
+    for start, end, replacement in replacements:
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    
+    if not parts:
+        return text
+    
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def rewrite_fence_info(text: str, blocks: Iterable[FencedBlock], info: str) -> str:
+    """
+    指定ブロックの開始フェンス行のinfo文字列を置き換える.
+    
+    フェンス文字列・インデント・改行コードは元の行のまま保持する.
+    
+    Args:
+        text: 元のテキスト
+        blocks: 書き換え対象のブロック（出現順）
+        info: 新しいinfo文字列（kroki-mermaid、{mermaid}等）
+        
+    Returns:
+        置換後のテキスト
+    """
+    replacements = []
+    for block in blocks:
+        line = text[block.start:block.open_end]
+        ending = line[len(line.rstrip("\r\n")):]
+        replacements.append((block.start, block.open_end, f"{block.indent}{block.fence}{info}{ending}"))
+    return splice(text, replacements)
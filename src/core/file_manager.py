@@ -6,6 +6,8 @@ from pathlib import Path
 from contextlib import contextmanager
 from typing import Generator
 
+from src.core.tracing import get_tracer
+
 
 class TempFileManager:
     """一時ファイルとディレクトリの安全な管理を担当するクラス."""
@@ -29,4 +31,5 @@ class TempFileManager:
         finally:
             # クリーンアップ（エラーが発生しても必ず実行）
             if temp_dir and Path(temp_dir).exists():
-                shutil.rmtree(temp_dir, ignore_errors=True)
+                with get_tracer().span("workspace.cleanup"):
+                    shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,52 @@
+"""サーバー全体で共有するHTTPクライアント."""
+
+import asyncio
+from typing import Optional
+
+import httpx
+
+from src.core.settings import get_settings
+
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """
+    接続プールを共有するhttpx.AsyncClientを返す.
+    
+    リクエストごとにクライアントを作らないため、同じホストへの接続は
+    keep-aliveで再利用され、TCP/TLSハンドシェイクが繰り返されない.
+    httpxのクライアントはイベントループに紐づくため、別のループから
+    呼ばれた場合は作り直す. 接続数の上限は設定（QUARTO_MCP_HTTP_*）で変更でき、
+    タイムアウトはリクエストごとに指定すること.
+    
+    Returns:
+        共有クライアント
+    """
+    global _client, _client_loop
+    
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        settings = get_settings()
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_shared_http_client() -> None:
+    """共有クライアントを閉じる（サーバー終了時に呼ぶ）."""
+    global _client, _client_loop
+    
+    if _client is not None and not _client.is_closed and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
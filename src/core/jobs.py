@@ -0,0 +1,482 @@
+"""非同期レンダリングジョブの管理（投入・状態確認・結果取得・キャンセル）."""
+
+import asyncio
+import contextvars
+import logging
+import os
+import secrets
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.core.deadline import Deadline
+from src.core.scheduler import DEFAULT_CLIENT, FairQueue
+from src.core.settings import Settings, get_settings
+from src.models.schemas import ErrorInfo, ErrorResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobState:
+    """ジョブの状態."""
+    
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobNotFoundError(Exception):
+    """指定されたジョブが存在しない（または保持期間を過ぎた）エラー."""
+    pass
+
+
+class JobRecord(BaseModel):
+    """ジョブのメタデータと結果."""
+    
+    job_id: str = Field(description="ジョブID")
+    state: str = Field(default=JobState.QUEUED, description="ジョブの状態")
+    format: str = Field(description="出力形式ID")
+    output_filename: str = Field(description="出力ファイル名")
+    client: str = Field(default=DEFAULT_CLIENT, description="投入したクライアント（MCPセッションID）")
+    submitted_at: float = Field(description="投入時刻（UNIX時間）")
+    deadline: Optional[float] = Field(default=None, description="期限（UNIX時間）")
+    time_budget_ms: Optional[int] = Field(default=None, description="投入時点での時間予算（ミリ秒）")
+    started_at: Optional[float] = Field(default=None, description="実行開始時刻")
+    finished_at: Optional[float] = Field(default=None, description="終了時刻")
+    stage: str = Field(default="queued", description="実行中の段階")
+    progress: float = Field(default=0.0, description="進捗（0〜1）")
+    expected_ms: Optional[int] = Field(
+        default=None, description="実行中の段階の推定所要時間（ミリ秒、出力形式ごとの実測から推定）"
+    )
+    result: Optional[Dict[str, Any]] = Field(default=None, description="レンダリング結果（RenderResultまたはErrorResponse）")
+    
+    @property
+    def finished(self) -> bool:
+        """終了状態かどうか."""
+        return self.state in JobState.FINISHED
+    
+    def time_budget(self) -> Optional[Deadline]:
+        """ジョブの期限を返す. 期限がなければNone."""
+        if self.deadline is None:
+            return None
+        return Deadline(self.deadline, (self.time_budget_ms or 0) / 1000)
+
+
+# 実行中のジョブ（進捗の報告先）
+_current_job: contextvars.ContextVar[Optional[JobRecord]] = contextvars.ContextVar(
+    "quarto_mcp_job", default=None
+)
+
+
+def current_job() -> Optional[JobRecord]:
+    """実行中のジョブを返す. ジョブとして実行されていない場合はNone."""
+    return _current_job.get()
+
+
+def report_progress(stage: str, progress: float, expected: Optional[float] = None) -> None:
+    """
+    実行中のジョブの進捗を報告する.
+    
+    ジョブとして実行されていない場合は何もしない.
+    
+    Args:
+        stage: 段階の名前
+        progress: 進捗（0〜1）
+        expected: この段階の推定所要時間（秒）
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.stage = stage
+        job.progress = max(job.progress, min(progress, 1.0))
+        job.expected_ms = int(expected * 1000) if expected is not None else None
+
+
+JobRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """
+    プロセス内のジョブテーブルとワーカー.
+    
+    特徴:
+    - 投入されたジョブはクライアントごとの公平キューの順にmax_concurrency件ずつ実行する
+      （同じクライアントのジョブは先入れ先出し）
+    - 実行を始める前に期限を過ぎたジョブは実行せずDEADLINE_EXCEEDEDで失敗させる
+    - 待機中のジョブは待ち順位、実行中のジョブは段階と進捗を返す
+    - 終了したジョブはretention秒、最大max_retained件まで保持する
+    - ジョブのメタデータと結果をstore_dirにJSONで保存し、再起動後も結果を取得できる
+      （再起動時に未完了だったジョブはINTERRUPTEDとして失敗扱いにする）
+    """
+    
+    def __init__(
+        self,
+        runner: JobRunner,
+        max_concurrency: int = 2,
+        retention: float = 3600.0,
+        max_retained: int = 500,
+        store_dir: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            runner: ジョブの引数を受け取り結果の辞書を返す非同期関数
+            max_concurrency: 同時に実行するジョブ数
+            retention: 終了したジョブを保持する秒数
+            max_retained: 保持するジョブ数の上限
+            store_dir: ジョブを保存するディレクトリ（Noneの場合は保存しない）
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.runner = runner
+        self.max_concurrency = max_concurrency
+        self.retention = retention
+        self.max_retained = max_retained
+        self.store_dir = Path(store_dir).expanduser() if store_dir else None
+        self._clock = clock
+        self._jobs: "OrderedDict[str, JobRecord]" = OrderedDict()
+        self._requests: Dict[str, Dict[str, Any]] = {}
+        self._pending: FairQueue[str] = FairQueue()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    @classmethod
+    def from_settings(cls, runner: JobRunner, settings: Optional[Settings] = None) -> "JobManager":
+        """
+        設定からジョブマネージャーを生成する.
+        
+        設定（環境変数）:
+        - jobs_max_concurrency (QUARTO_MCP_JOBS_CONCURRENCY): 同時実行数（デフォルト: 2）
+        - jobs_retention (QUARTO_MCP_JOBS_RETENTION): 終了したジョブの保持秒数（デフォルト: 3600）
+        - jobs_max_retained (QUARTO_MCP_JOBS_MAX_RETAINED): 保持するジョブ数の上限（デフォルト: 500）
+        - jobs_store_dir (QUARTO_MCP_JOBS_DIR): 保存先ディレクトリ（offで保存しない）
+        
+        Args:
+            runner: ジョブを実行する非同期関数
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            JobManager
+        """
+        if settings is None:
+            settings = get_settings()
+        return cls(
+            runner,
+            max_concurrency=settings.jobs_max_concurrency,
+            retention=settings.jobs_retention,
+            max_retained=settings.jobs_max_retained,
+            store_dir=Path(settings.jobs_store_dir) if settings.jobs_store_dir else None,
+        )
+    
+    async def load(self) -> int:
+        """
+        保存されたジョブを読み込む.
+        
+        Returns:
+            読み込んだジョブ数
+        """
+        if self.store_dir is None:
+            return 0
+        records = await asyncio.to_thread(self._read_store)
+        interrupted = []
+        for record in sorted(records, key=lambda r: r.submitted_at):
+            if not record.finished:
+                record.state = JobState.FAILED
+                record.finished_at = self._clock()
+                record.stage = "interrupted"
+                record.result = _error_result(
+                    "INTERRUPTED",
+                    "The server was restarted before the job finished",
+                    "Submit the render job again.",
+                )
+                interrupted.append(record)
+            self._jobs[record.job_id] = record
+        for record in interrupted:
+            await self._persist(record)
+        await self._prune()
+        return len(records)
+    
+    async def submit(
+        self,
+        request: Dict[str, Any],
+        client: str = DEFAULT_CLIENT,
+        weight: float = 1.0,
+        deadline: Optional[Deadline] = None,
+    ) -> JobRecord:
+        """
+        ジョブを投入する.
+        
+        Args:
+            request: runnerに渡す引数（content, format, output_filenameなど）
+            client: 投入したクライアント（MCPセッションID）
+            weight: クライアントの重み
+            deadline: 期限
+            
+        Returns:
+            投入したジョブ
+        """
+        await self._prune()
+        record = JobRecord(
+            job_id=secrets.token_hex(8),
+            format=str(request.get("format", "")),
+            output_filename=str(request.get("output_filename", "")),
+            client=client,
+            submitted_at=self._clock(),
+            deadline=deadline.at if deadline is not None else None,
+            time_budget_ms=round(deadline.budget * 1000) if deadline is not None else None,
+        )
+        self._jobs[record.job_id] = record
+        self._requests[record.job_id] = request
+        self._pending.push(record.job_id, client, weight=weight)
+        await self._persist(record)
+        self._ensure_workers()
+        self._wakeup.set()
+        return record
+    
+    def get(self, job_id: str) -> JobRecord:
+        """
+        ジョブを取得する.
+        
+        Raises:
+            JobNotFoundError: ジョブが存在しない場合
+        """
+        record = self._jobs.get(job_id)
+        if record is None:
+            raise JobNotFoundError(f"Job not found: {job_id}")
+        return record
+    
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """
+        ジョブの状態を返す（結果本体は含めない）.
+        
+        Args:
+            job_id: ジョブID
+            
+        Returns:
+            状態・待ち順位・進捗などの辞書
+            
+        Raises:
+            JobNotFoundError: ジョブが存在しない場合
+        """
+        record = self.get(job_id)
+        status = record.model_dump(exclude={"result"})
+        status["queue_position"] = self.queue_position(job_id)
+        if record.finished and record.result is not None:
+            status["success"] = bool(record.result.get("success"))
+        return status
+    
+    def stats(self) -> Dict[str, int]:
+        """状態ごとのジョブ数を返す."""
+        counts = {state: 0 for state in (JobState.QUEUED, JobState.RUNNING) + JobState.FINISHED}
+        for record in self._jobs.values():
+            counts[record.state] = counts.get(record.state, 0) + 1
+        return counts
+    
+    def queued_requests(self) -> List[Dict[str, Any]]:
+        """実行を待っているジョブの引数を、取り出される順に返す."""
+        return [self._requests[job_id] for job_id in self._pending if job_id in self._requests]
+    
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """待機中のジョブの順位（1始まり）を返す. 待機中でなければNone."""
+        return self._pending.position(job_id)
+    
+    async def cancel(self, job_id: str) -> JobRecord:
+        """
+        ジョブをキャンセルする.
+        
+        待機中のジョブはキューから取り除き、実行中のジョブはタスクをキャンセルする.
+        終了済みのジョブは変更しない.
+        
+        Args:
+            job_id: ジョブID
+            
+        Returns:
+            キャンセル後のジョブ
+            
+        Raises:
+            JobNotFoundError: ジョブが存在しない場合
+        """
+        record = self.get(job_id)
+        if record.state == JobState.QUEUED:
+            self._pending.remove(job_id)
+            self._requests.pop(job_id, None)
+            await self._finish(record, JobState.CANCELLED, None)
+        elif record.state == JobState.RUNNING:
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+                # 実行中のタスクが状態を更新するまで待つ
+                await asyncio.wait({task})
+        return record
+    
+    async def aclose(self) -> None:
+        """
+        ワーカーを停止する.
+        
+        実行中のジョブはキャンセルとして保存する. 待機中のジョブは保存された
+        状態のまま残り、次回起動時のload()で中断として扱われる.
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        # キャンセルした状態を保存し終えてからワーカーを止める
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+    
+    def _ensure_workers(self) -> None:
+        """ワーカーが動いていなければ起動する（イベントループが変わった場合も作り直す）."""
+        loop = asyncio.get_running_loop()
+        alive = [w for w in self._workers if not w.done() and w.get_loop() is loop]
+        if len(alive) == self.max_concurrency and self._wakeup is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = alive
+        for index in range(len(alive), self.max_concurrency):
+            self._workers.append(loop.create_task(self._worker(), name=f"render-job-worker-{index}"))
+    
+    async def _worker(self) -> None:
+        """待機中のジョブを1件ずつ取り出して実行する."""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job_id = self._pending.pop()
+            record = self._jobs.get(job_id)
+            request = self._requests.pop(job_id, None)
+            if record is None or request is None:
+                continue
+            deadline = record.time_budget()
+            if deadline is not None and deadline.expired:
+                # 待っている間に期限を過ぎたジョブはQuartoを起動せずに失敗させる
+                logger.warning(f"Dropping render job {record.job_id}: its deadline expired while queued")
+                await self._finish(
+                    record,
+                    JobState.FAILED,
+                    _error_result(
+                        "DEADLINE_EXCEEDED",
+                        "The deadline expired before the job started",
+                        "The job was dropped without running Quarto. Submit it again with a longer time budget.",
+                    ),
+                )
+                continue
+            task = asyncio.create_task(self._run(record, request))
+            self._tasks[job_id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # ワーカー自体が停止された
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+            finally:
+                self._tasks.pop(job_id, None)
+    
+    async def _run(self, record: JobRecord, request: Dict[str, Any]) -> None:
+        """ジョブを1件実行して結果を記録する."""
+        record.state = JobState.RUNNING
+        record.started_at = self._clock()
+        record.stage = "starting"
+        await self._persist(record)
+        token = _current_job.set(record)
+        try:
+            result = await self.runner(request)
+        except asyncio.CancelledError:
+            await self._finish(record, JobState.CANCELLED, None)
+            raise
+        except Exception as e:
+            logger.exception(f"Render job {record.job_id} failed")
+            await self._finish(
+                record,
+                JobState.FAILED,
+                _error_result("UNKNOWN_ERROR", f"An unexpected error occurred: {e}", "Please check the logs."),
+            )
+        else:
+            state = JobState.SUCCEEDED if result.get("success") else JobState.FAILED
+            await self._finish(record, state, result)
+        finally:
+            _current_job.reset(token)
+    
+    async def _finish(self, record: JobRecord, state: str, result: Optional[Dict[str, Any]]) -> None:
+        record.state = state
+        record.finished_at = self._clock()
+        record.stage = state
+        record.expected_ms = None
+        if state == JobState.SUCCEEDED:
+            record.progress = 1.0
+        record.result = result
+        await self._persist(record)
+    
+    async def _prune(self) -> None:
+        """保持期間を過ぎたジョブと、上限を超えた古い終了済みジョブを削除する."""
+        now = self._clock()
+        expired = [
+            job_id for job_id, record in self._jobs.items()
+            if record.finished and record.finished_at is not None and now - record.finished_at > self.retention
+        ]
+        finished = [job_id for job_id, record in self._jobs.items() if record.finished and job_id not in expired]
+        overflow = len(self._jobs) - len(expired) - self.max_retained
+        if overflow > 0:
+            expired += finished[:overflow]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+        if expired and self.store_dir is not None:
+            await asyncio.to_thread(self._delete_files, expired)
+    
+    async def _persist(self, record: JobRecord) -> None:
+        if self.store_dir is None:
+            return
+        data = record.model_dump_json()
+        try:
+            await asyncio.to_thread(self._write_file, record.job_id, data)
+        except OSError as e:
+            logger.warning(f"Failed to persist render job {record.job_id}: {e}")
+    
+    def _path(self, job_id: str) -> Path:
+        return self.store_dir / f"{job_id}.json"
+    
+    def _write_file(self, job_id: str, data: str) -> None:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.store_dir, prefix=".job_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_name, self._path(job_id))
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+    
+    def _delete_files(self, job_ids: List[str]) -> None:
+        for job_id in job_ids:
+            self._path(job_id).unlink(missing_ok=True)
+    
+    def _read_store(self) -> List[JobRecord]:
+        if not self.store_dir.is_dir():
+            return []
+        records = []
+        for path in self.store_dir.glob("*.json"):
+            try:
+                records.append(JobRecord.model_validate_json(path.read_text(encoding="utf-8")))
+            except (OSError, ValidationError) as e:
+                logger.warning(f"Ignoring unreadable job file {path}: {e}")
+        return records
+
+
+def _error_result(code: str, message: str, details: str) -> Dict[str, Any]:
+    """ErrorResponseと同じ形式の辞書を作る."""
+    return ErrorResponse(error=ErrorInfo(code=code, message=message, details=details)).model_dump()
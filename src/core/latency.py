@@ -0,0 +1,187 @@
+"""出力形式ごとのレンダリング所要時間の分布と、そこから導く適応タイムアウト."""
+
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from src.core.fence_tokenizer import FencedBlock, tokenize_fenced_blocks
+from src.core.settings import Settings, get_settings
+
+
+# 所要時間の見積もりで図として数えるコードブロックの言語
+DIAGRAM_LANGUAGES = frozenset({
+    "mermaid", "dot", "graphviz", "plantuml", "ditaa", "d2", "blockdiag", "seqdiag",
+    "actdiag", "nwdiag", "c4plantuml", "erd", "excalidraw", "nomnoml", "pikchr",
+    "structurizr", "svgbob", "vega", "vegalite", "wavedrom", "bpmn", "bytefield",
+})
+
+
+def measure(content: str, blocks: Optional[Iterable[FencedBlock]] = None) -> Tuple[int, int]:
+    """
+    所要時間の見積もりに使う文書の大きさを返す.
+    
+    Args:
+        content: Quarto Markdown形式の文字列
+        blocks: 解析済みのコードブロック（省略時はcontentを走査する）
+        
+    Returns:
+        (UTF-8でのバイト数, 図のコードブロック数)
+    """
+    if blocks is None:
+        blocks = tokenize_fenced_blocks(content)
+    diagrams = sum(1 for block in blocks if block.language in DIAGRAM_LANGUAGES)
+    return len(content.encode("utf-8")), diagrams
+
+
+class LatencyModel:
+    """
+    出力形式ごとの所要時間の分布.
+    
+    所要時間は文書の大きさで割った「作業量あたりの秒数」として直近window件を保持する.
+    作業量は 1 + バイト数 / SIZE_UNIT + 図の数 * DIAGRAM_UNIT で、1はQuartoの起動などの固定分にあたる.
+    
+    - expected(): 作業量あたりの秒数の中央値 × 作業量（実測がなければdefault_estimate）
+    - timeout(): 作業量あたりの秒数のquantile分位点 × 作業量 × multiplier を
+      min_timeout〜max_timeoutに収めた値（実測がmin_samples件に満たない形式はmax_timeout）
+    
+    gfmのように数百ミリ秒で終わる形式は、ハングしてもmin_timeout（既定10秒）で打ち切られる.
+    
+    journalにリストを設定すると、record()した実測をそのまま追記する
+    （ワーカープロセスの実測をサーバープロセスのモデルに送り返すため）.
+    """
+    
+    # 作業量1にあたるバイト数
+    SIZE_UNIT = 16 * 1024
+    
+    # 図1つあたりの作業量
+    DIAGRAM_UNIT = 1.0
+    
+    def __init__(
+        self,
+        max_timeout: float = 600.0,
+        min_timeout: float = 10.0,
+        multiplier: float = 3.0,
+        quantile: float = 0.99,
+        min_samples: int = 5,
+        window: int = 200,
+        default_estimate: float = 10.0,
+        adaptive: bool = True,
+    ):
+        """
+        Args:
+            max_timeout: タイムアウトの上限（実測が足りない形式のタイムアウト）
+            min_timeout: 適応タイムアウトの下限（秒）
+            multiplier: 分位点に掛ける倍率
+            quantile: タイムアウトの基準にする分位点（0〜1）
+            min_samples: 適応タイムアウトを使い始める実測数
+            window: 形式ごとに保持する実測数
+            default_estimate: 実測のない形式の推定所要時間（秒）
+            adaptive: Falseの場合、timeout()は常にmax_timeoutを返す
+        """
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.multiplier = multiplier
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.window = window
+        self.default_estimate = default_estimate
+        self.adaptive = adaptive
+        self.journal: Optional[List[Tuple[str, float, int, int]]] = None
+        self._samples: Dict[str, Deque[float]] = {}
+    
+    @classmethod
+    def from_settings(
+        cls,
+        settings: Optional[Settings] = None,
+        max_timeout: Optional[float] = None,
+    ) -> "LatencyModel":
+        """
+        設定からモデルを生成する.
+        
+        設定（環境変数）:
+        - quarto_timeout (QUARTO_TIMEOUT): タイムアウトの上限
+        - adaptive_timeouts (QUARTO_MCP_ADAPTIVE_TIMEOUTS): 適応タイムアウトを使うか
+        - adaptive_timeout_min (QUARTO_MCP_ADAPTIVE_TIMEOUT_MIN): 適応タイムアウトの下限（秒）
+        - adaptive_timeout_multiplier (QUARTO_MCP_ADAPTIVE_TIMEOUT_MULTIPLIER): 分位点に掛ける倍率
+        - adaptive_timeout_min_samples (QUARTO_MCP_ADAPTIVE_TIMEOUT_MIN_SAMPLES): 使い始める実測数
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            max_timeout: タイムアウトの上限（省略時は設定のquarto_timeout）
+            
+        Returns:
+            LatencyModel
+        """
+        if settings is None:
+            settings = get_settings()
+        return cls(
+            max_timeout=max_timeout if max_timeout is not None else settings.quarto_timeout,
+            min_timeout=settings.adaptive_timeout_min,
+            multiplier=settings.adaptive_timeout_multiplier,
+            min_samples=settings.adaptive_timeout_min_samples,
+            adaptive=settings.adaptive_timeouts,
+        )
+    
+    @classmethod
+    def work(cls, size_bytes: int = 0, diagrams: int = 0) -> float:
+        """文書の大きさから作業量を求める."""
+        return 1.0 + size_bytes / cls.SIZE_UNIT + diagrams * cls.DIAGRAM_UNIT
+    
+    def record(self, format_id: str, seconds: float, size_bytes: int = 0, diagrams: int = 0) -> None:
+        """
+        成功したレンダリングの所要時間を記録する.
+        
+        Args:
+            format_id: 出力形式ID
+            seconds: 所要時間（秒）
+            size_bytes: 文書のバイト数
+            diagrams: 図の数
+        """
+        samples = self._samples.get(format_id)
+        if samples is None:
+            samples = self._samples[format_id] = deque(maxlen=self.window)
+        samples.append(seconds / self.work(size_bytes, diagrams))
+        if self.journal is not None:
+            self.journal.append((format_id, seconds, size_bytes, diagrams))
+    
+    def expected(self, format_id: str, size_bytes: int = 0, diagrams: int = 0) -> float:
+        """推定所要時間（秒）を返す."""
+        samples = self._samples.get(format_id)
+        if not samples:
+            return self.default_estimate
+        return _quantile(sorted(samples), 0.5) * self.work(size_bytes, diagrams)
+    
+    def timeout(self, format_id: str, size_bytes: int = 0, diagrams: int = 0) -> float:
+        """Quartoのタイムアウト秒数を返す."""
+        samples = self._samples.get(format_id)
+        if not self.adaptive or samples is None or len(samples) < self.min_samples:
+            return self.max_timeout
+        limit = _quantile(sorted(samples), self.quantile) * self.work(size_bytes, diagrams) * self.multiplier
+        return min(max(limit, self.min_timeout), self.max_timeout)
+    
+    def formats(self) -> List[str]:
+        """実測のある出力形式IDを返す."""
+        return sorted(self._samples)
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """形式ごとの実測数、分位点（作業量1あたりのミリ秒）と作業量1のタイムアウトを返す."""
+        result = {}
+        for format_id, samples in sorted(self._samples.items()):
+            ordered = sorted(samples)
+            result[format_id] = {
+                "samples": len(ordered),
+                "p50_ms": int(_quantile(ordered, 0.5) * 1000),
+                "p90_ms": int(_quantile(ordered, 0.9) * 1000),
+                "p99_ms": int(_quantile(ordered, 0.99) * 1000),
+                "timeout_s": round(self.timeout(format_id), 3),
+            }
+        return result
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    """昇順に並んだ値の分位点（線形補間）."""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -0,0 +1,168 @@
+"""Quartoの子プロセスに適用する資源制限と、レーンごとの優先度."""
+
+import contextvars
+import logging
+import shutil
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from src.core.settings import LANES, Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# 要求を受け付けた経路（レーン）
+INTERACTIVE = "interactive"
+BATCH = "batch"
+JOB = "job"
+WARMUP = "warmup"
+
+# I/O優先度のクラスとionice -cの値
+_IO_CLASSES = {"best-effort": "2", "idle": "3"}
+
+
+class ResourceLimits:
+    """
+    Quartoの子プロセスに適用する資源制限とレーンごとの優先度.
+    
+    仮想メモリ（RLIMIT_AS）、CPU時間（RLIMIT_CPU）、開けるファイル数（RLIMIT_NOFILE）は
+    すべてのレーンで共通とし、nice値とI/O優先度はレーンごとに設定する.
+    制限は子プロセスがexecする直前に設定され、Quartoが起動するpandocやLaTeXにも引き継がれる.
+    I/O優先度はionice経由で起動して設定する（ioniceがない場合は設定しない）.
+    """
+    
+    def __init__(
+        self,
+        memory_bytes: int = 0,
+        cpu_seconds: int = 0,
+        open_files: int = 0,
+        nice: Optional[Dict[str, int]] = None,
+        io_priority: Optional[Dict[str, str]] = None,
+        ionice_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            memory_bytes: 仮想メモリの上限（バイト、0で制限なし）
+            cpu_seconds: CPU時間の上限（秒、0で制限なし）
+            open_files: 開けるファイル数の上限（0で制限なし）
+            nice: レーンごとのnice値
+            io_priority: レーンごとのI/O優先度（idle、best-effort:0〜7）
+            ionice_path: ioniceコマンドのパス（省略時はPATHから探す）
+        """
+        self.memory_bytes = memory_bytes
+        self.cpu_seconds = cpu_seconds
+        self.open_files = open_files
+        self.nice = dict(nice or {})
+        self.io_priority = dict(io_priority or {})
+        self.ionice_path = ionice_path
+        if self.io_priority and self.ionice_path is None:
+            self.ionice_path = shutil.which("ionice")
+            if self.ionice_path is None:
+                logger.warning("ionice was not found; Quarto runs without the configured I/O priorities")
+    
+    @classmethod
+    def from_settings(cls, settings: Optional[Settings] = None) -> "ResourceLimits":
+        """
+        設定から資源制限を生成する.
+        
+        設定（環境変数）:
+        - quarto_memory_limit_mb (QUARTO_MCP_QUARTO_MEMORY_LIMIT_MB): 仮想メモリの上限（MiB）
+        - quarto_cpu_limit (QUARTO_MCP_QUARTO_CPU_LIMIT): CPU時間の上限（秒）
+        - quarto_open_files_limit (QUARTO_MCP_QUARTO_OPEN_FILES_LIMIT): 開けるファイル数の上限
+        - lane_nice (QUARTO_MCP_LANE_NICE): レーンごとのnice値
+        - lane_io_priority (QUARTO_MCP_LANE_IO_PRIORITY): レーンごとのI/O優先度
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            ResourceLimits
+        """
+        if settings is None:
+            settings = get_settings()
+        return cls(
+            memory_bytes=settings.quarto_memory_limit_mb * 1024 * 1024,
+            cpu_seconds=settings.quarto_cpu_limit,
+            open_files=settings.quarto_open_files_limit,
+            nice=settings.lane_nice,
+            io_priority=settings.lane_io_priority,
+        )
+    
+    def for_lane(self, lane: str) -> Optional[Dict[str, int]]:
+        """
+        子プロセスの起動時に渡す資源制限とnice値を返す.
+        
+        Args:
+            lane: レーン
+            
+        Returns:
+            spawner_helper.limit_process()の形式の辞書（制限がなければNone）
+        """
+        limits = {
+            "as": self.memory_bytes,
+            "cpu": self.cpu_seconds,
+            "nofile": self.open_files,
+            "nice": self.nice.get(lane, 0),
+        }
+        limits = {key: value for key, value in limits.items() if value}
+        return limits or None
+    
+    def command(self, argv: Sequence[str], lane: str) -> List[str]:
+        """
+        レーンのI/O優先度を設定して起動するコマンドを返す.
+        
+        Args:
+            argv: コマンドと引数
+            lane: レーン
+            
+        Returns:
+            ioniceを前に付けたコマンド（I/O優先度の設定がなければargvのまま）
+        """
+        priority = self.io_priority.get(lane)
+        if priority is None or self.ionice_path is None:
+            return list(argv)
+        io_class, _, level = priority.partition(":")
+        prefix = [self.ionice_path, "-c", _IO_CLASSES[io_class]]
+        if level:
+            prefix += ["-n", level]
+        # -t: I/O優先度を設定できなくてもコマンドは実行する
+        return prefix + ["-t", "--", *argv]
+    
+    def describe(self) -> Dict[str, Any]:
+        """状態表示用の設定値."""
+        return {
+            "memory_mb": self.memory_bytes // (1024 * 1024) or None,
+            "cpu_seconds": self.cpu_seconds or None,
+            "open_files": self.open_files or None,
+            "nice": dict(self.nice),
+            "io_priority": dict(self.io_priority) if self.ionice_path is not None else {},
+        }
+
+
+# 処理中のレンダリングのレーン
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("quarto_mcp_lane", default=INTERACTIVE)
+
+
+def current_lane() -> str:
+    """処理中のレンダリングのレーンを返す（既定はinteractive）."""
+    return _current_lane.get()
+
+
+@contextmanager
+def lane_scope(lane: str) -> Iterator[str]:
+    """
+    スコープ内のレンダリングのレーンを設定する.
+    
+    Args:
+        lane: レーン（LANESのいずれか）
+        
+    Yields:
+        lane
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield lane
+    finally:
+        _current_lane.reset(token)
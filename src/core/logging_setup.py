@@ -0,0 +1,355 @@
+"""キューを介した非同期ログ出力と、失敗時にだけ出力する診断情報バッファ."""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.settings import Settings, get_settings
+from src.core.tracing import TraceContextFilter
+
+
+logger = logging.getLogger(__name__)
+
+# LogRecordが標準で持つ属性（これ以外はextraとしてJSONに含める）
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONにするフォーマッター."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    ロガー名ごとにINFO以下のログを間引くフィルター.
+    
+    rateが0.1なら10件に1件だけ通す. WARNING以上は常に通す.
+    ロガー名は最も長く一致する接頭辞の設定を使う.
+    """
+    
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Args:
+            rates: ロガー名（接頭辞）から記録割合（0〜1）への対応
+        """
+        super().__init__()
+        self.rates = dict(rates)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        prefix = self._match(record.name)
+        if prefix is None:
+            return True
+        rate = self.rates[prefix]
+        if rate <= 0:
+            return False
+        if rate >= 1:
+            return True
+        interval = round(1 / rate)
+        with self._lock:
+            count = self._counters.get(prefix, 0)
+            self._counters[prefix] = count + 1
+        return count % interval == 0
+    
+    def _match(self, name: str) -> Optional[str]:
+        best = None
+        for prefix in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                if best is None or len(prefix) > len(best):
+                    best = prefix
+        return best
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    メッセージを確定させたレコードをキューに入れるハンドラー.
+    
+    標準のQueueHandlerはフォーマット済み文字列をメッセージに入れるため、
+    extraや例外情報を出力側のフォーマッターで扱えるようにレコードのまま渡す.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DiagnosticsBuffer:
+    """
+    レンダリング1回分の詳細な出力（Quartoのstdout/stderr、YAMLヘッダーなど）を保持するバッファ.
+    
+    合計サイズがmax_bytesを超えると古いものから捨てる.
+    成功時は破棄し、失敗時だけflush()でログに書き出す.
+    """
+    
+    def __init__(self, max_bytes: int = 64 * 1024):
+        """
+        Args:
+            max_bytes: 保持する合計サイズの上限（文字数）
+        """
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._entries: deque = deque()
+        self._size = 0
+    
+    def add(self, label: str, text: str) -> None:
+        """
+        診断情報を追加する.
+        
+        Args:
+            label: 内容の名前（例: "quarto stderr"）
+            text: 内容
+        """
+        if len(text) > self.max_bytes:
+            marker = "...(truncated)\n"
+            text = marker + text[len(text) - max(self.max_bytes - len(marker), 0):]
+        self._entries.append((label, text))
+        self._size += len(text)
+        # 最新の1件は常に残す
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, removed = self._entries.popleft()
+            self._size -= len(removed)
+            self.dropped += 1
+    
+    def entries(self) -> List[Tuple[str, str]]:
+        """保持している (label, text) の一覧を返す."""
+        return list(self._entries)
+    
+    def flush(self, target: logging.Logger, reason: str, level: int = logging.ERROR) -> None:
+        """
+        保持している診断情報をログに書き出す.
+        
+        Args:
+            target: 書き出し先のロガー
+            reason: 書き出す理由（エラーメッセージなど）
+            level: ログレベル
+        """
+        for label, text in self._entries:
+            target.log(level, f"{label}:\n{text}", extra={"diagnostic": label, "reason": reason})
+        if self.dropped:
+            target.log(level, f"{self.dropped} diagnostic entries were dropped (buffer limit {self.max_bytes})")
+        self._entries.clear()
+        self._size = 0
+
+
+_current_diagnostics: contextvars.ContextVar[Optional[DiagnosticsBuffer]] = contextvars.ContextVar(
+    "quarto_mcp_diagnostics", default=None
+)
+
+
+@contextmanager
+def diagnostics_scope(target: logging.Logger, max_bytes: Optional[int] = None) -> Iterator[DiagnosticsBuffer]:
+    """
+    診断情報を集めるスコープ. スコープ内で例外が発生した場合だけ書き出す.
+    
+    Args:
+        target: 書き出し先のロガー
+        max_bytes: バッファの上限（省略時は設定のlog_diagnostics_max_bytes）
+        
+    Yields:
+        DiagnosticsBuffer
+    """
+    if max_bytes is None:
+        max_bytes = get_settings().log_diagnostics_max_bytes
+    buffer = DiagnosticsBuffer(max_bytes)
+    token = _current_diagnostics.set(buffer)
+    try:
+        yield buffer
+    except BaseException as e:
+        buffer.flush(target, reason=str(e).splitlines()[0] if str(e) else type(e).__name__)
+        raise
+    finally:
+        _current_diagnostics.reset(token)
+
+
+def capture_diagnostics(label: str, text: str) -> None:
+    """
+    現在のスコープの診断情報バッファに内容を追加する.
+    
+    スコープ外で呼ばれた場合はDEBUGレベルでログに出力する.
+    
+    Args:
+        label: 内容の名前
+        text: 内容
+    """
+    if not text or not text.strip():
+        return
+    buffer = _current_diagnostics.get()
+    if buffer is None:
+        logger.debug(f"{label}:\n{text}")
+    else:
+        buffer.add(label, text)
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_lock = threading.Lock()
+
+
+def configure_logging(settings: Optional[Settings] = None) -> QueueListener:
+    """
+    キュー経由のログ出力を設定する.
+    
+    ロガーはキューにレコードを入れるだけで、標準エラー出力とローテーション付き
+    ファイルへの書き込みはバックグラウンドスレッドのリスナーが行う.
+    そのためイベントループ上でファイルI/Oやローテーションが発生しない.
+    
+    Args:
+        settings: 使用する設定（省略時はプロセス共有の設定）
+        
+    Returns:
+        起動したQueueListener
+    """
+    global _listener, _queue_handler
+    
+    if settings is None:
+        settings = get_settings()
+    
+    with _lock:
+        _shutdown_locked()
+        
+        log_path = Path(settings.log_dir)
+        log_path.mkdir(parents=True, exist_ok=True)
+        
+        if settings.log_format == "json":
+            formatter: logging.Formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        
+        # 注: stdoutはJSON-RPC通信に使用されるため、ログはstderrに出力する
+        handlers: List[logging.Handler] = [
+            logging.StreamHandler(sys.stderr),
+            RotatingFileHandler(
+                log_path / 'quarto_mcp_server.log',
+                maxBytes=10 * 1024 * 1024,  # 10MB
+                backupCount=3,
+                encoding='utf-8',
+            ),
+        ]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler = _RecordQueueHandler(log_queue)
+        # 同じリクエストのスパンとログを対応付けられるようにtrace_idを付与する
+        _queue_handler.addFilter(TraceContextFilter())
+        if settings.log_sample_rates:
+            _queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        
+        root = logging.getLogger()
+        root.setLevel(settings.log_level)
+        root.addHandler(_queue_handler)
+        for name, level in settings.log_levels.items():
+            logging.getLogger(name).setLevel(level)
+        
+        return _listener
+
+
+def configure_worker_logging(log_queue: Any, settings: Optional[Settings] = None) -> None:
+    """
+    ワーカープロセスのログを親プロセスへ送るように設定する.
+    
+    ワーカーはファイルに直接書き込まず、レコードをプロセス間キューに入れる.
+    親プロセスではforward_worker_logs()で受け取り、通常のログ出力に流す.
+    
+    Args:
+        log_queue: 親プロセスが作成したmultiprocessingのキュー
+        settings: 使用する設定（省略時はプロセス共有の設定）
+    """
+    if settings is None:
+        settings = get_settings()
+    
+    # 間引きは親プロセスのハンドラーで行う
+    handler = _RecordQueueHandler(log_queue)
+    handler.addFilter(TraceContextFilter())
+    
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(settings.log_level)
+    root.addHandler(handler)
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+class _ForwardHandler(logging.Handler):
+    """ワーカープロセスから受け取ったレコードを同名のロガーに流し直すハンドラー."""
+    
+    def handle(self, record: logging.LogRecord) -> bool:
+        logging.getLogger(record.name).handle(record)
+        return True
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        pass
+
+
+def forward_worker_logs(log_queue: Any) -> QueueListener:
+    """
+    ワーカープロセスのログを受け取るリスナーを起動する.
+    
+    Args:
+        log_queue: ワーカーに渡すmultiprocessingのキュー
+        
+    Returns:
+        起動したQueueListener（停止はstop()で行う）
+    """
+    listener = QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    return listener
+
+
+def shutdown_logging() -> None:
+    """リスナーを停止し、キューに残ったログをすべて書き出す."""
+    with _lock:
+        _shutdown_locked()
+
+
+def _shutdown_locked() -> None:
+    global _listener, _queue_handler
+    
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
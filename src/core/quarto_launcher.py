@@ -0,0 +1,232 @@
+"""Quartoのシェルラッパーを経由せずにDenoを直接起動するランチャー."""
+
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.spawner import create_subprocess_exec
+
+
+logger = logging.getLogger(__name__)
+
+# 解決用にラッパーへ渡す引数（Denoの引数の末尾にそのまま現れる）
+PROBE_ARGUMENT = "__quarto_mcp_launcher_probe__"
+
+# 代わりのDenoが起動時の引数と環境変数を書き出すファイル
+PROBE_OUTPUT_ENV = "QUARTO_MCP_LAUNCHER_PROBE"
+
+# ラッパーが参照するDeno実行ファイルの環境変数
+DENO_ENV = "QUARTO_DENO"
+
+# シェルが自動で設定する環境変数（ラッパーの設定としては引き継がない）
+_SHELL_VARIABLES = ("_", "SHLVL", "PWD", "OLDPWD")
+
+# platform.machine()とQuartoのbin/tools配下のディレクトリ名の対応
+_ARCH_DIRS = {
+    "x86_64": "x86_64",
+    "amd64": "x86_64",
+    "aarch64": "aarch64",
+    "arm64": "aarch64",
+}
+
+
+class QuartoLauncher:
+    """
+    Quarto CLIの起動コマンドを決める.
+    
+    quartoコマンドの実体はシェルスクリプトで、呼び出しのたびにパスの解決と
+    環境変数の設定を行ってからDenoでquarto.jsを実行する. resolve()はラッパーを1回だけ
+    代わりのDeno（QUARTO_DENOで差し替え）で実行して、Denoに渡される引数と
+    ラッパーが設定する環境変数を記録し、以後はDenoを直接起動する.
+    
+    ラッパーの構成を認識できない場合（Windows、開発版のレイアウト、QUARTO_DENOを
+    参照しない古い版など）は、従来どおりラッパーを起動する.
+    """
+    
+    WRAPPER = "wrapper"
+    DIRECT = "direct"
+    
+    def __init__(self, quarto_path: str = "quarto", enabled: bool = True, timeout: float = 10.0):
+        """
+        Args:
+            quarto_path: Quarto CLI（ラッパー）のパス
+            enabled: Denoの直接起動を試みるか（Falseの場合は常にラッパーを起動する）
+            timeout: 解決時にラッパーの実行を待つ秒数
+        """
+        self.quarto_path = quarto_path
+        self.enabled = enabled
+        self.timeout = timeout
+        self.mode = self.WRAPPER
+        self.deno_path: Optional[str] = None
+        self.quarto_js: Optional[str] = None
+        self.reason: Optional[str] = None
+        self._prefix: List[str] = [quarto_path]
+        self._env_overrides: Dict[str, str] = {}
+        self._env_removed: List[str] = []
+        self._resolved = False
+    
+    @property
+    def direct(self) -> bool:
+        """Denoを直接起動するか."""
+        return self.mode == self.DIRECT
+    
+    def command(self, *args: str) -> List[str]:
+        """
+        Quarto CLIのサブコマンドを実行するコマンドラインを返す.
+        
+        Args:
+            *args: quartoに渡す引数（"render", "doc.qmd", ...）
+            
+        Returns:
+            コマンドライン引数のリスト
+        """
+        return [*self._prefix, *args]
+    
+    def environment(self) -> Optional[Dict[str, str]]:
+        """
+        起動時の環境変数を返す.
+        
+        Returns:
+            ラッパーが設定する環境変数を反映した辞書（ラッパーを起動する場合はNone）
+        """
+        if not self.direct:
+            return None
+        env = dict(os.environ)
+        for name in self._env_removed:
+            env.pop(name, None)
+        env.update(self._env_overrides)
+        return env
+    
+    async def resolve(self) -> bool:
+        """
+        ラッパーを1回実行してDenoの起動方法を調べる（2回目以降は何もしない）.
+        
+        Returns:
+            Denoを直接起動できるようになった場合はTrue
+        """
+        if self._resolved:
+            return self.direct
+        self._resolved = True
+        if not self.enabled:
+            self.reason = "disabled"
+            return False
+        
+        try:
+            self._apply(await self._probe())
+        except _UnrecognizedLayout as e:
+            self.reason = str(e)
+            logger.info(f"Launching Quarto through the wrapper script: {e}")
+            return False
+        
+        logger.info(f"Launching Quarto directly: {self.deno_path} ({self.quarto_js})")
+        return True
+    
+    def describe(self) -> Dict[str, Any]:
+        """起動方法を辞書で返す（状態表示用）."""
+        return {
+            "mode": self.mode,
+            "quarto_path": self.quarto_path,
+            "deno_path": self.deno_path,
+            "quarto_js": self.quarto_js,
+            "reason": self.reason,
+        }
+    
+    async def _probe(self) -> Dict[str, Any]:
+        """代わりのDenoを置いてラッパーを実行し、Denoに渡される引数と環境変数を返す."""
+        if sys.platform == "win32":
+            raise _UnrecognizedLayout("the wrapper is not a shell script on Windows")
+        wrapper = shutil.which(self.quarto_path)
+        if wrapper is None:
+            raise _UnrecognizedLayout(f"{self.quarto_path} was not found")
+        
+        with tempfile.TemporaryDirectory(prefix="quarto_mcp_launcher_") as temp_dir:
+            probe = Path(temp_dir) / "deno"
+            output = Path(temp_dir) / "probe.json"
+            probe.write_text(
+                "#!/bin/sh\n"
+                f'exec "{sys.executable}" -c '
+                "\"import json, os, sys; "
+                f"json.dump({{'argv': sys.argv[1:], 'env': dict(os.environ)}}, open(os.environ['{PROBE_OUTPUT_ENV}'], 'w'))\" "
+                '"$@"\n',
+                encoding="utf-8",
+            )
+            probe.chmod(probe.stat().st_mode | stat.S_IXUSR)
+            
+            env = dict(os.environ)
+            env[DENO_ENV] = str(probe)
+            env[PROBE_OUTPUT_ENV] = str(output)
+            try:
+                process = await create_subprocess_exec(wrapper, PROBE_ARGUMENT, env=env)
+                await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise _UnrecognizedLayout(f"running {wrapper} failed: {e!r}") from e
+            if not output.exists():
+                raise _UnrecognizedLayout(f"{wrapper} did not run Deno through {DENO_ENV}")
+            data = json.loads(output.read_text(encoding="utf-8"))
+        
+        data["base_env"] = env
+        data["probe"] = str(probe)
+        return data
+    
+    def _apply(self, data: Dict[str, Any]) -> None:
+        """調べた引数と環境変数から直接起動のコマンドを組み立てる."""
+        argv: List[str] = data["argv"]
+        if not argv or argv[-1] != PROBE_ARGUMENT:
+            raise _UnrecognizedLayout("the wrapper did not pass its arguments through to Deno")
+        quarto_js = next((arg for arg in argv[:-1] if Path(arg).name == "quarto.js"), None)
+        if quarto_js is None or not Path(quarto_js).is_file():
+            raise _UnrecognizedLayout("quarto.js was not found in the Deno arguments")
+        deno_path = self._find_deno(Path(quarto_js).parent)
+        if deno_path is None:
+            raise _UnrecognizedLayout("the Deno executable was not found next to quarto.js")
+        
+        probe = data["probe"]
+        base_env: Dict[str, str] = data["base_env"]
+        env: Dict[str, str] = data["env"]
+        overrides = {}
+        for name, value in env.items():
+            if name == PROBE_OUTPUT_ENV or name in _SHELL_VARIABLES:
+                continue
+            if probe in value:
+                # ラッパーがQUARTO_DENOなどを子に引き継ぐ場合は本物のDenoに戻す
+                value = value.replace(probe, deno_path)
+            if base_env.get(name) != value:
+                overrides[name] = value
+        
+        self.mode = self.DIRECT
+        self.deno_path = deno_path
+        self.quarto_js = quarto_js
+        self.reason = None
+        self._prefix = [deno_path, *argv[:-1]]
+        self._env_overrides = overrides
+        self._env_removed = [
+            name for name in base_env
+            if name not in env and name != DENO_ENV and name not in _SHELL_VARIABLES
+        ]
+    
+    def _find_deno(self, bin_dir: Path) -> Optional[str]:
+        """quarto.jsと同じbinディレクトリからDenoの実行ファイルを探す."""
+        configured = os.environ.get(DENO_ENV)
+        if configured:
+            return configured if os.access(configured, os.X_OK) else None
+        candidates = []
+        arch_dir = _ARCH_DIRS.get(platform.machine().lower())
+        if arch_dir is not None:
+            candidates.append(bin_dir / "tools" / arch_dir / "deno")
+        candidates.append(bin_dir / "tools" / "deno")
+        for candidate in candidates:
+            if candidate.is_file() and os.access(candidate, os.X_OK):
+                return str(candidate)
+        return None
+
+
+class _UnrecognizedLayout(Exception):
+    """ラッパーの構成を認識できなかったことを表す（ラッパーの起動に切り替える）."""
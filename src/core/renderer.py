@@ -2,23 +2,38 @@
 
 import asyncio
 import logging
-import os
 import re
 import shutil
+import signal
 import time
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Any, Dict, List, Optional, Tuple, Union
 import yaml
 
 from src.core.file_manager import TempFileManager
 from src.core.template_manager import TemplateManager
-from src.models.schemas import RenderResult, OutputInfo, Metadata
+from src.core.deadline import current_deadline
+from src.core.document import QuartoDocument
+from src.core.logging_setup import capture_diagnostics, diagnostics_scope
+from src.core.settings import Settings, get_settings
+from src.core.jobs import report_progress
+from src.core.latency import LatencyModel, measure
+from src.core.limits import ResourceLimits, current_lane
+from src.core.quarto_launcher import QuartoLauncher
+from src.core.spawner import create_subprocess_exec
+from src.core.tracing import current_span, get_tracer
+from src.models.schemas import RenderResult, OutputInfo, Metadata, ResourceUsage
 from src.models.formats import FORMAT_DEFINITIONS
 from src.converters.kroki_converter import KrokiConverter
+from src.converters.diagram_prerenderer import DiagramPrerenderer
+from src.converters.kroki_health import get_shared_kroki_health_monitor
 from src.managers.yaml_frontmatter_manager import YAMLFrontmatterManager
 from src.managers.extension_manager import ExtensionManager
 
 
+logger = logging.getLogger(__name__)
+
+
 class QuartoRenderError(Exception):
     """Quarto変換処理のエラー."""
     
@@ -33,33 +48,70 @@ class QuartoRenderError(Exception):
         self.code = code
 
 
+def _template_kind(template: Optional[str]) -> str:
+    """スパン属性用にテンプレート指定の種類を返す（URLそのものは記録しない）."""
+    if not template:
+        return "none"
+    if template.startswith(("http://", "https://")):
+        return "url"
+    return "id"
+
+
+def _kill_process(process: Optional[Any]) -> None:
+    """終了していない子プロセスを強制終了する."""
+    if process is not None and process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
 class QuartoRenderer:
     """Quarto CLIを使用した変換処理を実装するクラス."""
     
     def __init__(
         self,
         quarto_path: str = "quarto",
-        timeout: int = 600,  # デフォルト10分（600秒）
+        timeout: Optional[int] = None,
         config_path: Optional[Path] = None,
+        settings: Optional[Settings] = None,
     ):
         """
         Args:
             quarto_path: Quarto CLI実行ファイルのパス
-            timeout: 変換処理のタイムアウト秒数
+            timeout: 変換処理のタイムアウト秒数の上限（省略時は設定のquarto_timeout）
             config_path: テンプレート設定ファイルのパス
+            settings: 使用する設定（省略時はプロセス共有の設定）
         """
-        import os
-        # 環境変数QUARTO_TIMEOUTがあれば優先
-        env_timeout = os.environ.get("QUARTO_TIMEOUT")
-        if env_timeout is not None:
-            try:
-                timeout = int(env_timeout)
-            except ValueError:
-                pass  # 不正な値は無視してデフォルト/引数を使う
+        if settings is None:
+            settings = get_settings()
+        if timeout is None:
+            timeout = settings.quarto_timeout
+        self.settings = settings
         self.quarto_path = quarto_path
+        self.launcher = QuartoLauncher(quarto_path, enabled=settings.quarto_launcher == "auto")
         self.timeout = timeout
+        # 出力形式ごとの所要時間の分布（Quartoのタイムアウトと推定所要時間に使う）
+        self.latency = LatencyModel.from_settings(settings, max_timeout=timeout)
+        # Quartoの子プロセスの資源制限とレーンごとの優先度
+        self.limits = ResourceLimits.from_settings(settings)
         self.temp_manager = TempFileManager()
-        self.template_manager = TemplateManager(config_path=config_path)
+        self.template_manager = TemplateManager(config_path=config_path, settings=settings)
+        self.diagram_prerenderer = DiagramPrerenderer.from_environment(settings)
+        
+        # Kroki統合の設定はインスタンス生成時に1回だけ確定する
+        self.kroki_url = settings.kroki_url
+        self._kroki_enabled = settings.kroki_enabled
+        self.kroki_image_format = settings.kroki_image_format
+        
+        # リクエスト間で再利用するコンポーネント
+        self.extension_manager = ExtensionManager(
+            extensions_source=settings.extensions_source
+        )
+        self.kroki_yaml_manager = YAMLFrontmatterManager(kroki_service_url=self.kroki_url)
+        self.mermaid_yaml_manager = YAMLFrontmatterManager(kroki_service_url="")  # kroki_service_urlは未使用
+        self._kroki_converters: Dict[str, KrokiConverter] = {}
+        self._quarto_version: Optional[str] = None
     
     async def render(
         self,
@@ -85,6 +137,19 @@ class QuartoRenderer:
         Raises:
             QuartoRenderError: 変換処理が失敗した場合
         """
+        with get_tracer().span("QuartoRenderer.render", **{"quarto.format": format_id}):
+            return await self._render(content, format_id, output_filename, template, format_options)
+    
+    async def _render(
+        self,
+        content: str,
+        format_id: str,
+        output_filename: str,
+        template: Optional[str],
+        format_options: Optional[Dict[str, Any]],
+    ) -> RenderResult:
+        """render()の本体. 各段階をスパンとして記録する."""
+        tracer = get_tracer()
         if format_options is None:
             format_options = {}
         
@@ -98,45 +163,31 @@ class QuartoRenderer:
         format_info = FORMAT_DEFINITIONS[format_id]
         start_time = time.time()
         
-        # Kroki統合機能の適用
-        if self._is_kroki_enabled():
-            try:
-                content = self._apply_kroki_conversion(content, format_id, format_options)
-            except Exception as e:
-                # Kroki変換でエラーが発生した場合はフォールバック
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Kroki conversion failed, falling back to standard flow: {e}")
-        else:
-            # Krokiが無効な場合は標準Mermaid記法をQuarto拡張記法に変換
-            try:
-                content = self._apply_mermaid_conversion(content, format_id)
-            except Exception as e:
-                # Mermaid変換でエラーが発生した場合はフォールバック
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Mermaid conversion failed, falling back to standard flow: {e}")
+        # コンテンツを1回だけ解析し、以降の変換処理とファイル書き出しで共有する
+        document = QuartoDocument.parse(content)
+        size = measure(content, document.blocks)
+        
+        # Krokiが設定されていても障害中は標準Mermaidフローに切り替える
+        kroki_enabled = self._is_kroki_enabled()
+        pipeline_warnings = []
+        if kroki_enabled and not await self._is_kroki_available():
+            kroki_enabled = False
+            pipeline_warnings.append(
+                "Kroki service is unavailable; rendered Mermaid diagrams with the standard Quarto flow"
+            )
         
         # 一時作業ディレクトリを作成
-        with self.temp_manager.create_workspace() as temp_dir:
+        # Quartoの出力などの詳細は診断情報バッファに集め、失敗した場合だけログに書き出す
+        with diagnostics_scope(logger), self.temp_manager.create_workspace() as temp_dir:
             # Kroki有効時は拡張を配置
-            if self._is_kroki_enabled():
-                try:
-                    self._deploy_kroki_extension(temp_dir)
-                except Exception as e:
-                    # 拡張配置に失敗した場合は例外を発生
-                    raise QuartoRenderError(
-                        f"Failed to deploy Kroki extension: {e}",
-                        code="EXTENSION_DEPLOY_FAILED"
-                    )
-            # テンプレートを解決（URLからダウンロードまたはIDから解決）
-            template_path = await self.template_manager.resolve_template(
-                template, format_id, temp_dir
-            )
+            if kroki_enabled:
+                self._deploy_kroki_extension_or_raise(temp_dir)
             
-            # .qmdファイルを作成
+            # ダイアグラム・Mermaid/Kroki記法・テンプレートを処理して.qmdファイルを作成
             qmd_path = temp_dir / "document.qmd"
-            self._write_qmd(qmd_path, content, format_id, format_options, template_path)
+            pipeline_warnings += await self._prepare_document(
+                document, format_id, template, format_options, temp_dir, qmd_path, temp_dir, kroki_enabled
+            )
             
             # 最終的な出力パス
             final_output_path = Path(output_filename)
@@ -149,7 +200,25 @@ class QuartoRenderer:
             command = self._build_command(qmd_path, format_id, temp_output)
             
             # Quarto CLIを実行（カレントディレクトリを一時ディレクトリに設定）
-            stdout, stderr = await self._execute_quarto(command, cwd=temp_dir)
+            # タイムアウトはこの形式の実測の所要時間と文書の大きさから決める
+            timeout = self.latency.timeout(format_id, *size)
+            report_progress("rendering", 0.4, expected=self.latency.expected(format_id, *size))
+            # 図をKrokiで描画する実行の成否はKrokiのヘルスモニターにも記録する
+            uses_kroki = kroki_enabled and size[1] > 0
+            with tracer.span(
+                "quarto.subprocess",
+                **{"process.command": " ".join(command), "quarto.timeout_s": round(timeout, 3)},
+            ):
+                quarto_start = time.monotonic()
+                try:
+                    stdout, stderr, usage = await self._execute_quarto(command, cwd=temp_dir, timeout=timeout)
+                except QuartoRenderError as e:
+                    if uses_kroki:
+                        self._record_kroki_outcome(e)
+                    raise
+                if uses_kroki:
+                    self._record_kroki_outcome()
+                self.latency.record(format_id, time.monotonic() - quarto_start, *size)
             
             # 一時ディレクトリ内の出力ファイルの存在を確認
             if not temp_output.exists():
@@ -160,36 +229,305 @@ class QuartoRenderer:
                 )
             
             # 一時ファイルを最終出力パスにコピー
-            shutil.copy2(temp_output, final_output_path)
+            report_progress("finalizing", 0.9)
+            return await self._finish_output(
+                temp_output, final_output_path, format_id, start_time, pipeline_warnings, stderr, usage=usage
+            )
+    
+    async def render_batch(self, requests: List[Dict[str, Any]]) -> List[Union[RenderResult, Exception]]:
+        """
+        複数の文書を、出力形式ごとに1つのQuartoプロジェクトとしてまとめてレンダリングする.
+        
+        各文書をプロジェクトの作業ディレクトリにdoc_<番号>.qmdとして書き出し、
+        render一覧を持つ_quarto.ymlを作成して、形式ごとにquarto renderを1回だけ実行する.
+        QuartoとDenoの起動、Luaフィルターの読み込み、拡張の解決がバッチ全体で1回で済む.
+        出力ファイルは文書ごとの出力先にコピーする.
+        
+        プロジェクトのレンダリングが途中で失敗した場合、出力が得られなかった文書は
+        1件ずつrender()でレンダリングし直し、エラーをその文書の結果として返す.
+        
+        Args:
+            requests: render()の引数（content, format_id, output_filename, template, format_options）の辞書のリスト
+            
+        Returns:
+            requestsと同じ順序の結果のリスト（成功時はRenderResult、失敗時は送出されるはずだった例外）
+        """
+        with get_tracer().span("QuartoRenderer.render_batch", **{"quarto.batch_size": len(requests)}):
+            results: List[Union[RenderResult, Exception, None]] = [None] * len(requests)
+            groups: Dict[str, List[int]] = {}
+            for index, request in enumerate(requests):
+                format_id = request["format_id"]
+                if format_id not in FORMAT_DEFINITIONS:
+                    results[index] = QuartoRenderError(f"Unsupported format: {format_id}", code="UNSUPPORTED_FORMAT")
+                else:
+                    groups.setdefault(format_id, []).append(index)
+            
+            # Krokiの状態はバッチ全体で1回だけ判定する
+            kroki_enabled = self._is_kroki_enabled()
+            pipeline_warnings = []
+            if kroki_enabled and not await self._is_kroki_available():
+                kroki_enabled = False
+                pipeline_warnings.append(
+                    "Kroki service is unavailable; rendered Mermaid diagrams with the standard Quarto flow"
+                )
+            
+            for format_id, indices in groups.items():
+                await self._render_project(format_id, indices, requests, results, kroki_enabled, pipeline_warnings)
+            return results
+    
+    async def _render_project(
+        self,
+        format_id: str,
+        indices: List[int],
+        requests: List[Dict[str, Any]],
+        results: List[Union[RenderResult, Exception, None]],
+        kroki_enabled: bool,
+        pipeline_warnings: List[str],
+    ) -> None:
+        """同じ出力形式の文書を1つのプロジェクトでレンダリングし、resultsの該当位置に結果を設定する."""
+        tracer = get_tracer()
+        extension = FORMAT_DEFINITIONS[format_id].extension
+        start_time = time.time()
+        
+        with diagnostics_scope(logger), self.temp_manager.create_workspace() as project_dir:
+            if kroki_enabled:
+                try:
+                    self._deploy_kroki_extension_or_raise(project_dir)
+                except QuartoRenderError as e:
+                    for index in indices:
+                        results[index] = e
+                    return
             
-            # 出力ファイル情報を取得
-            file_info = self._get_file_info(final_output_path, format_info.mime_type)
+            # 文書ごとの準備（失敗した文書だけをバッチから外す）
+            prepared: List[Tuple[int, str, List[str]]] = []
+            sizes: Dict[int, Tuple[int, int]] = {}
+            for index in indices:
+                request = requests[index]
+                name = f"doc_{index}"
+                template_dir = project_dir / f"{name}_template"
+                template_dir.mkdir()
+                try:
+                    document = QuartoDocument.parse(request["content"])
+                    sizes[index] = measure(request["content"], document.blocks)
+                    warnings = await self._prepare_document(
+                        document,
+                        format_id,
+                        request.get("template"),
+                        dict(request.get("format_options") or {}),
+                        project_dir,
+                        project_dir / f"{name}.qmd",
+                        template_dir,
+                        kroki_enabled,
+                    )
+                except Exception as e:
+                    results[index] = e
+                    continue
+                prepared.append((index, name, pipeline_warnings + warnings))
+            if not prepared:
+                return
             
-            # Quartoバージョンを取得
-            quarto_version = await self._get_quarto_version()
+            # render一覧を持つプロジェクト設定を作成し、quarto renderを1回だけ実行する
+            project_config = {
+                "project": {"type": "default", "render": [f"{name}.qmd" for _, name, _ in prepared]}
+            }
+            (project_dir / "_quarto.yml").write_text(
+                yaml.safe_dump(project_config, sort_keys=False), encoding="utf-8"
+            )
+            command = self.launcher.command("render", "--to", format_id, "--no-execute")
+            batch_error: Optional[QuartoRenderError] = None
+            stderr = ""
+            usage: Optional[Dict[str, int]] = None
+            # タイムアウトは文書ごとのタイムアウトの合計とする
+            timeout = sum(self.latency.timeout(format_id, *sizes[index]) for index, _, _ in prepared)
+            uses_kroki = kroki_enabled and any(sizes[index][1] for index, _, _ in prepared)
+            with tracer.span(
+                "quarto.subprocess",
+                **{
+                    "process.command": " ".join(command),
+                    "quarto.batch_size": len(prepared),
+                    "quarto.timeout_s": round(timeout, 3),
+                },
+            ):
+                quarto_start = time.monotonic()
+                try:
+                    _, stderr, usage = await self._execute_quarto(command, cwd=project_dir, timeout=timeout)
+                except QuartoRenderError as e:
+                    batch_error = e
+                    stderr = e.stderr or ""
+                    if uses_kroki:
+                        self._record_kroki_outcome(e)
+                else:
+                    if uses_kroki:
+                        self._record_kroki_outcome()
+                    # 所要時間は作業量に応じて文書ごとに按分して記録する
+                    elapsed = time.monotonic() - quarto_start
+                    total = sum(LatencyModel.work(*sizes[index]) for index, _, _ in prepared)
+                    for index, _, _ in prepared:
+                        share = LatencyModel.work(*sizes[index]) / total
+                        self.latency.record(format_id, elapsed * share, *sizes[index])
             
-            # 変換時間を計算
-            render_time_ms = int((time.time() - start_time) * 1000)
+            for index, name, warnings in prepared:
+                request = requests[index]
+                output = project_dir / f"{name}{extension}"
+                if output.exists():
+                    try:
+                        results[index] = await self._finish_output(
+                            output,
+                            Path(request["output_filename"]),
+                            format_id,
+                            start_time,
+                            warnings,
+                            stderr,
+                            batch_size=len(prepared),
+                            usage=usage,
+                        )
+                    except Exception as e:
+                        results[index] = e
+                elif batch_error is None:
+                    results[index] = QuartoRenderError(
+                        f"Output file was not generated: {output}",
+                        stderr=stderr,
+                        code="OUTPUT_NOT_FOUND",
+                    )
+                elif batch_error.code not in ("RENDER_FAILED", "RESOURCE_LIMIT"):
+                    # タイムアウトやQuarto CLIがない場合は、個別に実行し直しても結果は変わらない
+                    results[index] = batch_error
+                else:
+                    # どの文書で失敗したかを特定するため、出力のない文書は個別にレンダリングする
+                    # （CPU時間の上限はプロセスごとのため、1件ずつなら上限に収まることもある）
+                    logger.info(f"Project render failed; rendering {name} on its own")
+                    try:
+                        results[index] = await self.render(
+                            content=request["content"],
+                            format_id=format_id,
+                            output_filename=request["output_filename"],
+                            template=request.get("template"),
+                            format_options=request.get("format_options"),
+                        )
+                    except Exception as e:
+                        results[index] = e
+    
+    async def _finish_output(
+        self,
+        temp_output: Path,
+        final_output_path: Path,
+        format_id: str,
+        start_time: float,
+        pipeline_warnings: List[str],
+        stderr: str,
+        batch_size: Optional[int] = None,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> RenderResult:
+        """
+        作業ディレクトリの出力ファイルを出力先にコピーし、変換結果を作成する.
+        
+        Args:
+            temp_output: 作業ディレクトリ内の出力ファイル
+            final_output_path: 出力先のパス
+            format_id: 出力形式ID
+            start_time: 変換の開始時刻
+            pipeline_warnings: Quarto実行前の処理で発生した警告
+            stderr: Quarto CLIの標準エラー出力
+            batch_size: まとめてレンダリングした文書数（1件ずつの場合はNone）
+            usage: Quarto CLIの資源使用量（回収できなかった場合はNone）
             
-            # 警告メッセージを抽出
-            warnings = self._extract_warnings(stderr)
+        Returns:
+            RenderResult: 変換結果
+        """
+        format_info = FORMAT_DEFINITIONS[format_id]
+        final_output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(temp_output, final_output_path)
+        
+        # 出力ファイル情報を取得
+        file_info = self._get_file_info(final_output_path, format_info.mime_type)
+        
+        # Quartoバージョンを取得
+        quarto_version = await self._get_quarto_version()
+        
+        # 変換時間を計算
+        render_time_ms = int((time.time() - start_time) * 1000)
+        
+        # 警告メッセージを抽出
+        warnings = pipeline_warnings + self._extract_warnings(stderr)
+        
+        # 結果を返す
+        return RenderResult(
+            success=True,
+            format=format_id,
+            output=file_info,
+            metadata=Metadata(
+                quarto_version=quarto_version,
+                render_time_ms=render_time_ms,
+                warnings=warnings,
+                batch_size=batch_size,
+                resource_usage=ResourceUsage(**usage) if usage is not None else None,
+            )
+        )
+    
+    async def _prepare_document(
+        self,
+        document: QuartoDocument,
+        format_id: str,
+        template: Optional[str],
+        format_options: Dict[str, Any],
+        work_dir: Path,
+        qmd_path: Path,
+        template_dir: Path,
+        kroki_enabled: bool,
+    ) -> list[str]:
+        """
+        ダイアグラムの事前レンダリング、Mermaid/Kroki記法の変換、テンプレートの解決を行い、.qmdファイルを作成する.
+        
+        Args:
+            document: 解析済みドキュメント（この場で書き換える）
+            format_id: 出力形式ID
+            template: テンプレート指定（IDまたはURL）
+            format_options: 形式固有オプション
+            work_dir: Quartoを実行するディレクトリ（事前レンダリングした画像の配置先）
+            qmd_path: 作成する.qmdファイルのパス
+            template_dir: URLテンプレートのダウンロード先
+            kroki_enabled: Kroki統合を使うか（拡張の配置は呼び出し元で行う）
             
-            # 結果を返す
-            return RenderResult(
-                success=True,
-                format=format_id,
-                output=file_info,
-                metadata=Metadata(
-                    quarto_version=quarto_version,
-                    render_time_ms=render_time_ms,
-                    warnings=warnings,
-                )
+        Returns:
+            警告メッセージのリスト
+        """
+        tracer = get_tracer()
+        
+        # ダイアグラムを事前レンダリングして画像参照に置き換える
+        report_progress("diagrams", 0.1)
+        with tracer.span("diagram.prerender"):
+            warnings = await self._prerender_diagrams(document, format_id, work_dir)
+        
+        # Kroki統合機能の適用
+        if kroki_enabled:
+            try:
+                with tracer.span("kroki.convert"):
+                    self._convert_kroki_document(document, format_id, format_options)
+            except Exception as e:
+                # Kroki変換でエラーが発生した場合はフォールバック
+                logger.warning(f"Kroki conversion failed, falling back to standard flow: {e}")
+        else:
+            # Krokiが無効な場合は標準Mermaid記法をQuarto拡張記法に変換
+            try:
+                self._convert_mermaid_document(document, format_id)
+            except Exception as e:
+                # Mermaid変換でエラーが発生した場合はフォールバック
+                logger.warning(f"Mermaid conversion failed, falling back to standard flow: {e}")
+        
+        # テンプレートを解決（URLからダウンロードまたはIDから解決）
+        report_progress("template", 0.3)
+        with tracer.span("template.resolve", **{"template.kind": _template_kind(template)}):
+            template_path = await self.template_manager.resolve_template(
+                template, format_id, template_dir
             )
+        
+        self._write_qmd(qmd_path, document, format_id, format_options, template_path)
+        return warnings
     
     def _write_qmd(
         self,
         qmd_path: Path,
-        content: str,
+        document: QuartoDocument,
         format_id: str,
         format_options: Dict[str, Any],
         template_path: Optional[str],
@@ -198,30 +536,30 @@ class QuartoRenderer:
         .qmdファイルを作成する.
         
         YAMLヘッダーのマージ処理:
-        - 入力contentに既存のYAMLヘッダーがある場合、それをベースとする
+        - ドキュメントに既存のYAMLヘッダーがある場合、それをベースとする
         - format_optionsで既存YAMLを上書き・追加
         - templateパラメータがあればreference-docキーを追加（既存値を上書き）
         
         Args:
             qmd_path: 出力する.qmdファイルのパス
-            content: Quarto Markdown形式の文字列
+            document: 解析済みドキュメント
             format_id: 出力形式ID
             format_options: 形式固有オプション
             template_path: テンプレートファイルのパス
         """
-        # 既存のYAMLヘッダーを抽出
-        yaml_header, body = self._extract_yaml_header(content)
-        
         # YAMLヘッダーをマージ
-        merged_yaml = self._merge_yaml_headers(yaml_header, format_id, format_options, template_path)
+        document.front_matter = self._merge_yaml_headers(
+            document.front_matter, format_id, format_options, template_path
+        )
         
-        # .qmdファイルを作成
+        # .qmdファイルを作成（シリアライズはここで1回だけ行う）
+        serialized = document.serialize(sort_keys=True)
         with open(qmd_path, 'w', encoding='utf-8') as f:
-            if merged_yaml:
-                f.write("---\n")
-                yaml.dump(merged_yaml, f, allow_unicode=True, default_flow_style=False)
-                f.write("---\n\n")
-            f.write(body)
+            f.write(serialized)
+        
+        # マージ後のYAMLヘッダーは失敗時の調査用に診断情報として保持
+        if document.front_matter:
+            capture_diagnostics("Merged YAML header", serialized[:len(serialized) - len(document.body)])
     
     def _extract_yaml_header(self, content: str) -> tuple[Optional[Dict[str, Any]], str]:
         """
@@ -329,60 +667,93 @@ class QuartoRenderer:
         qmd_filename = Path(qmd_path).name
         output_filename = Path(output_path).name
         
-        return [
-            self.quarto_path,
+        # launcher.resolve()済みであればラッパーを経由せずDenoを直接起動する
+        return self.launcher.command(
             "render",
             qmd_filename,
             "--to", format_id,
             "--output", output_filename,
             "--no-execute",
-        ]
+        )
     
-    async def _execute_quarto(self, command: list[str], cwd: Optional[Path] = None) -> tuple[str, str]:
+    async def _execute_quarto(
+        self,
+        command: list[str],
+        cwd: Optional[Path] = None,
+        timeout: Optional[float] = None,
+    ) -> tuple[str, str, Optional[Dict[str, int]]]:
         """
         Quarto CLIを非同期で実行する.
         
+        子プロセスにはレンダリングのレーンに応じた資源制限と優先度を適用し、
+        終了後に回収した資源使用量を現在のスパンの属性にも記録する.
+        
         Args:
             command: コマンドライン引数のリスト
             cwd: 実行時のカレントディレクトリ（オプション）
+            timeout: タイムアウト秒数（省略時はself.timeout）. 要求に期限がある場合は残りの予算で切り詰める
             
         Returns:
-            (stdout, stderr) のタプル
+            (stdout, stderr, 資源使用量) のタプル（資源使用量はスポナーを使わない場合None）
             
         Raises:
-            QuartoRenderError: 実行エラーまたはタイムアウト
+            QuartoRenderError: 実行エラー、タイムアウト、期限切れまたは資源制限の超過
         """
-        logger = logging.getLogger(__name__)
+        if timeout is None:
+            timeout = self.timeout
+        deadline = current_deadline()
+        limited_by_deadline = False
+        if deadline is not None:
+            if deadline.expired:
+                # 期限を過ぎた要求のためにQuartoを起動しない
+                raise QuartoRenderError(
+                    "The request deadline expired before Quarto was started",
+                    code="DEADLINE_EXCEEDED"
+                )
+            limited_by_deadline = deadline.remaining() < timeout
+            timeout = deadline.bound(timeout)
         
+        process = None
         try:
             # コマンド実行をログに記録
             logger.info(f"Executing Quarto command: {' '.join(command)}")
             if cwd:
                 logger.debug(f"Working directory: {cwd}")
             
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=str(cwd) if cwd else None,
+            lane = current_lane()
+            process = await create_subprocess_exec(
+                *self.limits.command(command, lane),
+                cwd=cwd,
+                env=self.launcher.environment(),
+                limits=self.limits.for_lane(lane),
             )
             
             # タイムアウト付きで完了を待機
             stdout, stderr = await asyncio.wait_for(
                 process.communicate(),
-                timeout=self.timeout,
+                timeout=timeout,
             )
             
             stdout_str = stdout.decode('utf-8', errors='replace')
             stderr_str = stderr.decode('utf-8', errors='replace')
+            usage = getattr(process, "usage", None)
+            span = current_span()
+            if span is not None and usage is not None:
+                for key, value in usage.items():
+                    span.set_attribute(f"process.{key}", value)
             
-            # 標準出力をログに記録
-            if stdout_str.strip():
-                logger.info(f"Quarto stdout:\n{stdout_str}")
+            # 標準出力・標準エラー出力は診断情報として保持（失敗時のみログに出力）
+            capture_diagnostics("Quarto stdout", stdout_str)
+            capture_diagnostics("Quarto stderr", stderr_str)
             
-            # 標準エラー出力をログに記録
-            if stderr_str.strip():
-                logger.info(f"Quarto stderr:\n{stderr_str}")
+            # CPU時間の上限を超えるとSIGXCPUで停止される
+            if process.returncode == -signal.SIGXCPU:
+                logger.error(f"Quarto CLI exceeded the CPU time limit of {self.limits.cpu_seconds} seconds")
+                raise QuartoRenderError(
+                    f"Quarto CLI exceeded the CPU time limit of {self.limits.cpu_seconds} seconds",
+                    stderr=stderr_str,
+                    code="RESOURCE_LIMIT"
+                )
             
             # 非ゼロ終了コードの場合はエラー
             if process.returncode != 0:
@@ -393,14 +764,27 @@ class QuartoRenderer:
                     code="RENDER_FAILED"
                 )
             
-            logger.info(f"Quarto CLI completed successfully (returncode: {process.returncode})")
-            return stdout_str, stderr_str
-            
+            logger.info(
+                f"Quarto CLI completed successfully "
+                f"(returncode: {process.returncode}, stderr: {len(stderr_str)} chars)"
+            )
+            return stdout_str, stderr_str, usage
+        
         except asyncio.TimeoutError as e:
+            _kill_process(process)
+            if limited_by_deadline:
+                raise QuartoRenderError(
+                    f"Quarto CLI was stopped after {timeout:.1f} seconds because the request deadline expired",
+                    code="DEADLINE_EXCEEDED"
+                ) from e
             raise QuartoRenderError(
-                f"Quarto CLI timed out after {self.timeout} seconds",
+                f"Quarto CLI timed out after {timeout} seconds",
                 code="TIMEOUT"
             ) from e
+        except asyncio.CancelledError:
+            # ジョブのキャンセル時にQuartoプロセスを残さない
+            _kill_process(process)
+            raise
         except FileNotFoundError as e:
             raise QuartoRenderError(
                 f"Quarto CLI not found: {self.quarto_path}",
@@ -431,16 +815,17 @@ class QuartoRenderer:
         """
         Quarto CLIのバージョンを取得する.
         
+        取得に成功したバージョンはインスタンス内にキャッシュし、
+        以降のレンダリングではquarto --versionを実行しない.
+        
         Returns:
             バージョン文字列
         """
+        if self._quarto_version is not None:
+            return self._quarto_version
+        
         try:
-            process = await asyncio.create_subprocess_exec(
-                self.quarto_path,
-                "--version",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
+            process = await create_subprocess_exec(self.quarto_path, "--version")
             
             stdout, _ = await asyncio.wait_for(
                 process.communicate(),
@@ -448,8 +833,10 @@ class QuartoRenderer:
             )
             
             version = stdout.decode('utf-8').strip()
+            if process.returncode == 0 and version:
+                self._quarto_version = version
             return version
-            
+        
         except Exception:
             return "unknown"
     
@@ -472,29 +859,98 @@ class QuartoRenderer:
         
         return warnings
     
+    async def _prerender_diagrams(
+        self,
+        document: QuartoDocument,
+        format_id: str,
+        temp_dir: Path,
+    ) -> list[str]:
+        """
+        Mermaidブロックを事前レンダリングし、画像参照に置き換える.
+        
+        事前レンダリングが無効な場合は何もしない. 失敗したブロックは
+        そのまま残り、Kroki変換または標準Mermaid変換で処理される.
+        
+        Args:
+            document: 解析済みドキュメント（この場で書き換える）
+            format_id: 出力形式ID
+            temp_dir: 一時作業ディレクトリのパス
+            
+        Returns:
+            警告メッセージのリスト
+        """
+        if self.diagram_prerenderer is None:
+            return []
+        
+        image_format = self._kroki_converter(format_id).image_format or "png"
+        try:
+            return await self.diagram_prerenderer.prerender(document, image_format, temp_dir)
+        except Exception as e:
+            logger.warning(f"Diagram pre-render failed, falling back to standard flow: {e}")
+            return [f"Diagram pre-render failed, using standard flow: {e}"]
+    
     def _is_kroki_enabled(self) -> bool:
         """
         Kroki統合が有効かどうかを判定する.
         
-        環境変数 QUARTO_MCP_KROKI_URL が設定されていて、
-        有効なURL形式（http または https で始まる）であれば有効と判定する.
+        設定 kroki_url（環境変数 QUARTO_MCP_KROKI_URL）が設定されていれば有効と判定する.
+        URL形式は設定の読み込み時に検証済みで、判定結果はインスタンス生成時に確定している.
         
         Returns:
             Kroki統合が有効な場合True、それ以外False
         """
-        kroki_url = os.environ.get("QUARTO_MCP_KROKI_URL", "").strip()
+        return self._kroki_enabled
+    
+    def _kroki_converter(self, format_id: str) -> KrokiConverter:
+        """出力形式ごとのKrokiConverterを返す（初回のみ生成）."""
+        converter = self._kroki_converters.get(format_id)
+        if converter is None:
+            converter = KrokiConverter(format_id=format_id, image_format=self.kroki_image_format)
+            self._kroki_converters[format_id] = converter
+        return converter
+    
+    async def _is_kroki_available(self) -> bool:
+        """
+        Krokiサービスが利用可能かどうかをヘルスモニターで判定する.
         
-        if not kroki_url:
-            return False
+        ヘルスチェック結果はプロセス内でキャッシュされ、サーキットブレーカーが
+        開いている間はKrokiに問い合わせずに即座にFalseを返す.
         
-        # URL形式の検証（http または https で始まるか）
-        if not (kroki_url.startswith("http://") or kroki_url.startswith("https://")):
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Invalid Kroki URL format: {kroki_url}")
-            return False
+        Returns:
+            利用可能な場合True
+        """
+        monitor = get_shared_kroki_health_monitor()
+        if monitor is None:
+            return True
         
-        return True
+        available = await monitor.is_available()
+        if not available:
+            logger.warning(
+                f"Kroki service unavailable (circuit {monitor.breaker.state}), using standard Mermaid flow"
+            )
+        return available
+    
+    def _record_kroki_outcome(self, error: Optional[QuartoRenderError] = None) -> None:
+        """
+        Kroki統合で図を描画したQuartoの実行結果をヘルスモニターに記録する.
+        
+        quarto-krokiフィルターはQuartoの中からKrokiにリクエストするため、/healthには応答するが
+        図の取得が遅い・失敗する障害はここでしか検出できない. タイムアウトと、stderrに
+        Krokiが現れる失敗を障害として数える（LaTeXのエラーなどKrokiと無関係な失敗は数えない）.
+        
+        Args:
+            error: Quartoの実行エラー（成功した場合はNone）
+        """
+        monitor = get_shared_kroki_health_monitor()
+        if monitor is None:
+            return
+        if error is None:
+            monitor.record_success()
+        elif error.code == "TIMEOUT" or (
+            error.code == "RENDER_FAILED" and "kroki" in (error.stderr or "").lower()
+        ):
+            logger.warning(f"Quarto run with Kroki diagrams failed ({error.code}); recording a Kroki failure")
+            monitor.record_failure()
     
     def _deploy_kroki_extension(self, temp_dir: Path) -> None:
         """
@@ -507,21 +963,25 @@ class QuartoRenderer:
             RuntimeError: 拡張の配置に失敗した場合
             FileNotFoundError: 拡張の検証に失敗した場合
         """
-        import logging
-        logger = logging.getLogger(__name__)
         
-        # 環境変数から拡張ソースを取得
-        extensions_source = os.environ.get("QUARTO_MCP_EXTENSIONS_SOURCE")
-        logger.info(f"[KROKI_EXTENSION] Deploying Kroki extension from: {extensions_source}")
-        logger.info(f"[KROKI_EXTENSION] Target directory: {temp_dir}")
-        
-        # ExtensionManagerを初期化
-        ext_manager = ExtensionManager(extensions_source=extensions_source)
+        logger.info(f"[KROKI_EXTENSION] Deploying Kroki extension from: {self.extension_manager.extensions_source}")
+        logger.debug(f"[KROKI_EXTENSION] Target directory: {temp_dir}")
         
         # 拡張を配置
-        ext_manager.deploy_extension(temp_dir)
+        self.extension_manager.deploy_extension(temp_dir)
         logger.info(f"[KROKI_EXTENSION] Extension deployed successfully")
     
+    def _deploy_kroki_extension_or_raise(self, temp_dir: Path) -> None:
+        """Kroki拡張を配置する（失敗した場合はEXTENSION_DEPLOY_FAILEDのQuartoRenderErrorを送出する）."""
+        try:
+            with get_tracer().span("kroki.deploy_extension"):
+                self._deploy_kroki_extension(temp_dir)
+        except Exception as e:
+            raise QuartoRenderError(
+                f"Failed to deploy Kroki extension: {e}",
+                code="EXTENSION_DEPLOY_FAILED"
+            )
+    
     def _apply_kroki_conversion(
         self,
         content: str,
@@ -529,11 +989,7 @@ class QuartoRenderer:
         format_options: Optional[Dict[str, Any]] = None,
     ) -> str:
         """
-        Kroki統合変換を適用する.
-        
-        処理内容:
-        1. KrokiConverterでMermaid記法をKroki記法に変換
-        2. YAMLFrontmatterManagerでKroki設定をYAMLヘッダーに追加
+        Kroki統合変換を文字列に適用する.
         
         Args:
             content: 元のQuarto Markdownコンテンツ
@@ -542,91 +998,93 @@ class QuartoRenderer:
             
         Returns:
             Kroki統合が適用されたコンテンツ
+        """
+        document = QuartoDocument.parse(content)
+        self._convert_kroki_document(document, format_id, format_options)
+        return document.serialize()
+    
+    def _convert_kroki_document(
+        self,
+        document: QuartoDocument,
+        format_id: str,
+        format_options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        解析済みドキュメントにKroki統合変換を適用する.
+        
+        処理内容:
+        1. KrokiConverterで本文のMermaid記法をKroki記法に変換
+        2. YAMLFrontmatterManagerでKroki設定をフロントマターに追加
+        
+        Args:
+            document: 解析済みドキュメント（この場で書き換える）
+            format_id: 出力形式ID
+            format_options: 形式固有オプション（未使用だが将来の拡張用）
             
         Raises:
             Exception: 変換処理でエラーが発生した場合
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        # 環境変数からKroki URLを取得
-        kroki_url = os.environ.get("QUARTO_MCP_KROKI_URL", "").strip()
-        
-        # 環境変数から画像形式を取得（オプション）
-        image_format_env = os.environ.get("QUARTO_MCP_KROKI_IMAGE_FORMAT", "").lower()
-        image_format = image_format_env if image_format_env in ("svg", "png") else None
         
         logger.info(f"[KROKI_CONVERSION] Starting Kroki conversion for format={format_id}")
-        logger.info(f"[KROKI_CONVERSION] Kroki URL: {kroki_url}")
-        logger.info(f"[KROKI_CONVERSION] Image format: {image_format}")
-        logger.info(f"[KROKI_CONVERSION] Original content length: {len(content)} chars")
-        
-        # Mermaidブロック数をカウント
-        mermaid_count = content.count('```{mermaid') + content.count('```mermaid')
-        logger.info(f"[KROKI_CONVERSION] Found {mermaid_count} mermaid blocks in content")
+        logger.debug(f"[KROKI_CONVERSION] Kroki URL: {self.kroki_url}")
+        logger.debug(f"[KROKI_CONVERSION] Image format: {self.kroki_image_format}")
+        logger.debug(f"[KROKI_CONVERSION] Original body length: {len(document.body)} chars")
         
         # 1. Mermaid記法をKroki記法に変換
-        converter = KrokiConverter(format_id=format_id, image_format=image_format)
-        content_before = content
-        content = converter.convert(content)
+        converter = self._kroki_converter(format_id)
+        converted_count = converter.convert_document(document)
         
         # 変換結果を確認
-        kroki_count = content.count('```kroki-mermaid')
-        logger.info(f"[KROKI_CONVERSION] After conversion: {kroki_count} kroki-mermaid blocks")
-        if content_before != content:
-            logger.info(f"[KROKI_CONVERSION] Content was modified by KrokiConverter")
-        else:
+        logger.info(f"[KROKI_CONVERSION] Converted {converted_count} mermaid blocks to kroki-mermaid")
+        if converted_count == 0:
             logger.warning(f"[KROKI_CONVERSION] Content was NOT modified by KrokiConverter")
         
         # 2. YAMLフロントマターにKroki設定を追加
-        yaml_manager = YAMLFrontmatterManager(kroki_service_url=kroki_url)
-        content_before_yaml = content
-        content = yaml_manager.add_kroki_config(content)
-        
-        if content_before_yaml != content:
-            logger.info(f"[KROKI_CONVERSION] YAML frontmatter was modified")
-            # YAMLヘッダーの開始部分を抽出してログ出力
-            yaml_end_pos = content.find('---\n', 4)  # 2つ目の---を探す
-            if yaml_end_pos > 0:
-                yaml_header = content[4:yaml_end_pos]  # 最初の---以降、2つ目の---まで
-                logger.info(f"[KROKI_CONVERSION] YAML Header:\n{yaml_header}")
-        else:
-            logger.warning(f"[KROKI_CONVERSION] YAML frontmatter was NOT modified")
-        
-        logger.info(f"[KROKI_CONVERSION] Conversion completed, final content length: {len(content)} chars")
+        self.kroki_yaml_manager.apply_kroki_config(document)
+        capture_diagnostics("Kroki YAML frontmatter", str(document.front_matter))
         
-        return content
+        logger.debug(f"[KROKI_CONVERSION] Conversion completed, final body length: {len(document.body)} chars")
     
     def _apply_mermaid_conversion(self, content: str, format_id: str = "pptx") -> str:
         """
         標準Mermaid記法をQuarto拡張記法に変換し、Mermaid設定を追加する.
         
-        処理内容:
-        1. 標準Markdown記法（```mermaid）をQuarto拡張記法（```{mermaid}）に変換
-        2. YAMLフロントマターにMermaid設定（mermaid-format: png）を追加
-        
         Args:
             content: 元のQuarto Markdownコンテンツ
             format_id: 出力形式ID（デフォルト: pptx）
             
         Returns:
             Quarto拡張記法に変換され、Mermaid設定が追加されたコンテンツ
+        """
+        document = QuartoDocument.parse(content)
+        self._convert_mermaid_document(document, format_id)
+        return document.serialize()
+    
+    def _convert_mermaid_document(self, document: QuartoDocument, format_id: str = "pptx") -> None:
+        """
+        解析済みドキュメントの標準Mermaid記法をQuarto拡張記法に変換し、Mermaid設定を追加する.
+        
+        処理内容:
+        1. 標準Markdown記法（```mermaid）をQuarto拡張記法（```{mermaid}）に変換
+        2. YAMLフロントマターにMermaid設定（mermaid-format: png）を追加
+        
+        Args:
+            document: 解析済みドキュメント（この場で書き換える）
+            format_id: 出力形式ID（デフォルト: pptx）
             
         Raises:
             Exception: 変換処理でエラーが発生した場合
         """
-        import logging
-        logger = logging.getLogger(__name__)
         
         # 1. 標準Markdown記法（```mermaid）をQuarto拡張記法（```{mermaid}）に変換
-        # 既に```{mermaid}形式のものはそのまま保持される
-        pattern = re.compile(r'^```mermaid', re.MULTILINE)
-        content = pattern.sub('```{mermaid}', content)
+        # 既に```{mermaid}形式のものと、他のコードブロック内のものはそのまま保持される
+        blocks = [
+            block for block in document.blocks_by_language("mermaid")
+            if not block.is_braced
+        ]
+        document.rewrite_fence_info(blocks, "{mermaid}")
         
         # 2. YAMLフロントマターにMermaid設定を追加
-        yaml_manager = YAMLFrontmatterManager(kroki_service_url="")  # kroki_service_urlは未使用
-        content = yaml_manager.add_mermaid_config(content, format_id)
+        self.mermaid_yaml_manager.apply_mermaid_config(document, format_id)
         
         logger.info(f"[MERMAID_CONVERSION] Standard Mermaid conversion completed for format={format_id}")
-        
-        return content
@@ -0,0 +1,614 @@
+"""レンダリングの受け付け制御（アドミッション制御）と実行枠の割り当て."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from src.core.deadline import Deadline, DeadlineExceededError
+from src.core.latency import LatencyModel
+from src.core.settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# クライアントを区別しない呼び出し（ウォームアップなど）のクライアントキー
+DEFAULT_CLIENT = "default"
+
+
+class OverloadedError(Exception):
+    """待ち行列が上限に達していてレンダリングを受け付けられないエラー."""
+    
+    def __init__(self, message: str, retry_after_ms: int):
+        super().__init__(message)
+        self.retry_after_ms = retry_after_ms
+
+
+class _Entry(Generic[T]):
+    """FairQueueの1要素."""
+    
+    def __init__(self, item: T, client: str, cost: float, start: float, seq: int):
+        self.item = item
+        self.client = client
+        self.cost = cost
+        self.start = start
+        self.seq = seq
+    
+    @property
+    def key(self) -> Tuple[float, int]:
+        return (self.start, self.seq)
+
+
+class FairQueue(Generic[T]):
+    """
+    クライアントごとの重み付き公平キュー（開始時刻公平キューイング）.
+    
+    各要素には投入時に仮想開始時刻 max(仮想時刻, そのクライアントの前の要素の仮想終了時刻) を割り当て、
+    仮想開始時刻の小さい順に取り出す. 仮想終了時刻は開始時刻に cost / weight を加えたもので、
+    大量に投入したクライアントの要素ほど後ろに回るため、後から来たクライアントは
+    先行するクライアントの投入がすべて終わるのを待たずに順番が来る.
+    同じクライアントの要素は投入順に取り出される.
+    """
+    
+    def __init__(self):
+        self._queues: Dict[str, Deque[_Entry[T]]] = {}
+        self._finish: Dict[str, float] = {}
+        self._virtual = 0.0
+        self._seq = 0
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __iter__(self) -> Iterator[T]:
+        """取り出される順に要素を返す."""
+        return (entry.item for entry in self._ordered())
+    
+    def push(self, item: T, client: str = DEFAULT_CLIENT, cost: float = 1.0, weight: float = 1.0) -> None:
+        """
+        要素を投入する.
+        
+        Args:
+            item: 要素
+            client: クライアントキー
+            cost: 要素の重さ（推定所要時間など）
+            weight: クライアントの重み（大きいほど多く取り出される）
+        """
+        start = self.next_start(client)
+        self._finish[client] = start + cost / weight
+        self._seq += 1
+        self._queues.setdefault(client, deque()).append(_Entry(item, client, cost, start, self._seq))
+        self._size += 1
+    
+    def pop(self, eligible: Optional[Callable[[str], bool]] = None) -> Optional[T]:
+        """
+        次の要素を取り出す.
+        
+        Args:
+            eligible: 取り出してよいクライアントかを判定する関数（上限に達したクライアントを飛ばす）
+            
+        Returns:
+            要素（取り出せる要素がなければNone）
+        """
+        heads = [
+            queue[0] for client, queue in self._queues.items()
+            if eligible is None or eligible(client)
+        ]
+        if not heads:
+            return None
+        entry = min(heads, key=lambda e: e.key)
+        self._take(entry)
+        self._virtual = max(self._virtual, entry.start)
+        self._forget_idle()
+        return entry.item
+    
+    def remove(self, item: T) -> bool:
+        """
+        要素を取り除く（キャンセルされた場合など）.
+        
+        Returns:
+            取り除いた場合はTrue
+        """
+        for queue in self._queues.values():
+            for entry in queue:
+                if entry.item == item:
+                    self._take(entry)
+                    return True
+        return False
+    
+    def clear(self) -> None:
+        """すべての要素を取り除き、仮想時刻も初期状態に戻す."""
+        self._queues.clear()
+        self._finish.clear()
+        self._virtual = 0.0
+        self._size = 0
+    
+    def position(self, item: T) -> Optional[int]:
+        """要素が取り出されるまでの順位（1始まり）を返す. キューになければNone."""
+        for index, entry in enumerate(self._ordered(), start=1):
+            if entry.item == item:
+                return index
+        return None
+    
+    def next_start(self, client: str) -> float:
+        """クライアントが次に投入する要素の仮想開始時刻."""
+        return max(self._virtual, self._finish.get(client, 0.0))
+    
+    def cost_before(self, client: str) -> float:
+        """クライアントが次に投入する要素より先に取り出される要素の重さの合計."""
+        start = self.next_start(client)
+        return sum(entry.cost for entry in self._entries() if entry.start <= start)
+    
+    def count_before(self, client: str) -> int:
+        """クライアントが次に投入する要素より先に取り出される要素の数."""
+        start = self.next_start(client)
+        return sum(1 for entry in self._entries() if entry.start <= start)
+    
+    def clients(self) -> Dict[str, int]:
+        """要素のあるクライアントごとの要素数を返す."""
+        return {client: len(queue) for client, queue in self._queues.items()}
+    
+    def _entries(self) -> Iterator[_Entry[T]]:
+        for queue in self._queues.values():
+            yield from queue
+    
+    def _ordered(self) -> List[_Entry[T]]:
+        return sorted(self._entries(), key=lambda e: e.key)
+    
+    def _take(self, entry: _Entry[T]) -> None:
+        queue = self._queues[entry.client]
+        queue.remove(entry)
+        if not queue:
+            del self._queues[entry.client]
+        self._size -= 1
+    
+    def _forget_idle(self) -> None:
+        """仮想時刻に追い越されたクライアントの仮想終了時刻を破棄する（結果は変わらない）."""
+        for client in [c for c, finish in self._finish.items() if finish <= self._virtual]:
+            if client not in self._queues:
+                del self._finish[client]
+
+
+class Ticket:
+    """実行枠を待っている、または実行中の1件のレンダリング."""
+    
+    def __init__(
+        self,
+        formats: Sequence[str],
+        estimate: float,
+        client: str,
+        loop: asyncio.AbstractEventLoop,
+        clock: Callable[[], float],
+        deadline: Optional[Deadline] = None,
+    ):
+        self.formats = list(formats)
+        self.estimate = estimate
+        self.client = client
+        self.deadline = deadline
+        self.granted: asyncio.Future = loop.create_future()
+        self.queue_position: Optional[int] = None
+        self._clock = clock
+        self.enqueued_at = clock()
+        self.started_at: Optional[float] = None
+    
+    @property
+    def waited(self) -> float:
+        """実行枠を待った秒数."""
+        end = self.started_at if self.started_at is not None else self._clock()
+        return end - self.enqueued_at
+    
+    def describe(self) -> Dict[str, Any]:
+        """応答に含める待ち行列の情報."""
+        return {
+            "client": self.client,
+            "queue_position": self.queue_position,
+            "queued_ms": int(self.waited * 1000),
+        }
+
+
+class RenderScheduler:
+    """
+    レンダリングの同時実行数を制限し、待ち行列が長すぎる場合は受け付けを拒否する.
+    
+    受け付けの判定には、待ち行列の件数と、新しいレンダリングより先に実行される
+    レンダリングの推定所要時間の合計を同時実行数で割った推定待ち時間を使う. 上限を超える場合は
+    OverloadedErrorを送出し、再試行までの目安（retry_after_ms）を返す. QUARTO_TIMEOUTまで
+    待たせてから失敗させるより、すぐに断って呼び出し元に再試行させる.
+    
+    待ち行列はクライアント（MCPセッション）ごとの重み付き公平キューで、あるクライアントが
+    大量のレンダリングを投入しても、ほかのクライアントはその後ろにすべて並ぶことはない.
+    クライアントごとの同時実行数の上限も設定できる.
+    
+    推定所要時間は出力形式ごとの実測の分布（LatencyModel）の中央値を文書の大きさで伸縮した値で、
+    実測がない形式は既定値を使う. 分布はQuartoのタイムアウトを決めるレンダラーのものを共有し、
+    スケジューラー自身は実測を記録しない.
+    
+    期限付きのレンダリングは、実行枠を待っている間に期限を過ぎると待ち行列から外し、
+    DeadlineExceededErrorで打ち切る（Quartoは起動しない）.
+    """
+    
+    # 再試行までの目安の最小値（ミリ秒）
+    MIN_RETRY_AFTER_MS = 100
+    
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_depth: int,
+        max_queue_seconds: float,
+        default_estimate: float = 10.0,
+        client_max_concurrency: int = 0,
+        client_weights: Optional[Dict[str, float]] = None,
+        latency: Optional[LatencyModel] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            max_concurrency: 同時に実行するレンダリング数
+            max_queue_depth: 実行枠を待てるレンダリング数の上限
+            max_queue_seconds: 新しいレンダリングが実行開始まで待つ推定時間の上限（秒）
+            default_estimate: 実測のない出力形式の推定所要時間（秒、latencyを渡した場合はその既定値を使う）
+            client_max_concurrency: 1クライアントが同時に実行できるレンダリング数（0で制限なし）
+            client_weights: クライアントキーまたはクライアント名ごとの重み（指定のないクライアントは1）
+            latency: 推定に使う所要時間の分布（通常はレンダラーのもの. 省略時は空の分布）
+            clock: 経過時間の計測に使う関数
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_seconds = max_queue_seconds
+        self.latency = latency if latency is not None else LatencyModel(default_estimate=default_estimate)
+        self.default_estimate = self.latency.default_estimate
+        self.client_max_concurrency = client_max_concurrency
+        self.client_weights = dict(client_weights or {})
+        self._clock = clock
+        self._running = 0
+        self._client_running: Dict[str, int] = {}
+        self._waiting: FairQueue[Ticket] = FairQueue()
+        self.metrics: Dict[str, int] = {
+            "admitted": 0,
+            "rejected": 0,
+            "expired": 0,
+            "completed": 0,
+        }
+    
+    @classmethod
+    def from_settings(
+        cls,
+        settings: Optional[Settings] = None,
+        latency: Optional[LatencyModel] = None,
+    ) -> "RenderScheduler":
+        """
+        設定からスケジューラーを生成する.
+        
+        設定（環境変数）:
+        - render_max_concurrency (QUARTO_MCP_RENDER_CONCURRENCY): 同時に実行するレンダリング数
+        - render_max_queue_depth (QUARTO_MCP_MAX_QUEUE_DEPTH): 待ち行列の件数の上限
+        - render_max_queue_seconds (QUARTO_MCP_MAX_QUEUE_SECONDS): 推定待ち時間の上限（秒）
+        - render_client_max_concurrency (QUARTO_MCP_CLIENT_CONCURRENCY): クライアントごとの同時実行数
+        - render_client_weights (QUARTO_MCP_CLIENT_WEIGHTS): クライアントごとの重み
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            latency: 推定に使う所要時間の分布（レンダラーのものを渡す）
+            
+        Returns:
+            RenderScheduler
+        """
+        if settings is None:
+            settings = get_settings()
+        return cls(
+            max_concurrency=settings.render_max_concurrency,
+            max_queue_depth=settings.render_max_queue_depth,
+            max_queue_seconds=settings.render_max_queue_seconds,
+            client_max_concurrency=settings.render_client_max_concurrency,
+            client_weights=settings.render_client_weights,
+            latency=latency,
+        )
+    
+    def estimate(self, format_id: str, size_bytes: int = 0, diagrams: int = 0) -> float:
+        """
+        文書の推定所要時間（秒）を返す.
+        
+        Args:
+            format_id: 出力形式ID
+            size_bytes: 文書のバイト数
+            diagrams: 図の数
+        """
+        return self.latency.expected(format_id, size_bytes, diagrams)
+    
+    def weight_for(self, *names: Optional[str]) -> float:
+        """
+        クライアントの重みを返す.
+        
+        Args:
+            *names: クライアントキー、クライアント名など（最初に重みが設定されているものを使う）
+            
+        Returns:
+            重み（どれにも設定がなければ1）
+        """
+        for name in names:
+            if name is not None and name in self.client_weights:
+                return self.client_weights[name]
+        return 1.0
+    
+    def queued_seconds(self, client: Optional[str] = None) -> float:
+        """
+        待っているレンダリングが実行を始めるまでの推定時間（秒）.
+        
+        Args:
+            client: 指定した場合は、そのクライアントが次に投入するレンダリングより先に実行される分だけを数える
+        """
+        if client is None:
+            total = sum(ticket.estimate for ticket in self._waiting)
+        else:
+            total = self._waiting.cost_before(client)
+        return total / self.max_concurrency
+    
+    async def run(
+        self,
+        func: Callable[[], Awaitable[T]],
+        formats: Sequence[str],
+        admit: bool = True,
+        client: str = DEFAULT_CLIENT,
+        weight: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+    ) -> T:
+        """
+        実行枠が空くのを待ってfuncを実行する.
+        
+        Args:
+            func: レンダリングを実行する非同期関数
+            formats: レンダリングする文書の出力形式（バッチの場合は文書ごと）
+            admit: 受け付けの判定を行うか（受け付け済みのジョブの実行ではFalse）
+            client: クライアントキー（MCPセッションID）
+            weight: クライアントの重み（省略時はclient_weightsから決める）
+            deadline: 期限（実行枠を待っている間に過ぎた場合は打ち切る）
+            sizes: 文書ごとの(バイト数, 図の数)（formatsと同じ順. 推定所要時間の伸縮に使う）
+            
+        Returns:
+            funcの戻り値
+            
+        Raises:
+            OverloadedError: 待ち行列が上限に達している場合
+            DeadlineExceededError: 実行を始める前に期限を過ぎた場合
+        """
+        async with self.slot(
+            formats, admit=admit, client=client, weight=weight, deadline=deadline, sizes=sizes
+        ):
+            return await func()
+    
+    @asynccontextmanager
+    async def slot(
+        self,
+        formats: Sequence[str],
+        admit: bool = True,
+        client: str = DEFAULT_CLIENT,
+        weight: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+    ) -> AsyncIterator[Ticket]:
+        """
+        実行枠を確保し、ブロックを抜けるときに返す.
+        
+        Args:
+            formats: レンダリングする文書の出力形式（バッチの場合は文書ごと）
+            admit: 受け付けの判定を行うか
+            client: クライアントキー（MCPセッションID）
+            weight: クライアントの重み（省略時はclient_weightsから決める）
+            deadline: 期限（実行枠を待っている間に過ぎた場合は打ち切る）
+            sizes: 文書ごとの(バイト数, 図の数)（formatsと同じ順）
+            
+        Yields:
+            Ticket（待ち順位と待ち時間を持つ）
+            
+        Raises:
+            OverloadedError: 待ち行列が上限に達している場合
+            DeadlineExceededError: 実行を始める前に期限を過ぎた場合
+        """
+        if deadline is not None and deadline.expired:
+            self.metrics["expired"] += 1
+            raise DeadlineExceededError("The deadline expired before the render was queued")
+        if sizes is None:
+            sizes = [(0, 0)] * len(formats)
+        estimate = self._total_estimate(formats, sizes)
+        if admit:
+            self._admit(estimate, client)
+        self.metrics["admitted"] += 1
+        
+        ticket = Ticket(formats, estimate, client, asyncio.get_running_loop(), self._clock, deadline)
+        await self._acquire(ticket, weight if weight is not None else self.weight_for(client))
+        ticket.started_at = self._clock()
+        try:
+            yield ticket
+        finally:
+            self.metrics["completed"] += 1
+            self._release(client)
+    
+    def admit(
+        self,
+        formats: Sequence[str],
+        client: str = DEFAULT_CLIENT,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+        backlog: Sequence[float] = (),
+    ) -> float:
+        """
+        実行枠を確保せずに受け付けの判定だけを行う（非同期ジョブの投入時）.
+        
+        判定の規則はslot()と同じで、スケジューラーの待ち行列にまだ並んでいない
+        受け付け済みのレンダリング（backlog）も待ち行列の件数と推定待ち時間に含める.
+        
+        Args:
+            formats: レンダリングする文書の出力形式
+            client: クライアントキー（MCPセッションID）
+            sizes: 文書ごとの(バイト数, 図の数)（formatsと同じ順）
+            backlog: 待ち行列の外で実行を待っているレンダリングの推定所要時間（秒）
+            
+        Returns:
+            推定所要時間（秒）
+            
+        Raises:
+            OverloadedError: 待ち行列が上限に達している場合
+        """
+        if sizes is None:
+            sizes = [(0, 0)] * len(formats)
+        estimate = self._total_estimate(formats, sizes)
+        self._admit(estimate, client, backlog)
+        return estimate
+    
+    def stats(self) -> Dict[str, Any]:
+        """実行中・待機中の件数、推定待ち時間、クライアントごとの件数、受け付けの件数を返す."""
+        queued = self._waiting.clients()
+        clients = {
+            client: {
+                "running": self._client_running.get(client, 0),
+                "queued": queued.get(client, 0),
+            }
+            for client in sorted(set(self._client_running) | set(queued))
+        }
+        return {
+            "running": self._running,
+            "queued": len(self._waiting),
+            "queued_seconds": round(self.queued_seconds(), 3),
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "max_queue_seconds": self.max_queue_seconds,
+            "client_max_concurrency": self.client_max_concurrency,
+            "clients": clients,
+            "estimates": {
+                format_id: round(self.latency.expected(format_id), 3) for format_id in self.latency.formats()
+            },
+            **self.metrics,
+        }
+    
+    def _eligible(self, client: str) -> bool:
+        """クライアントが同時実行数の上限に達していないか."""
+        if not self.client_max_concurrency:
+            return True
+        return self._client_running.get(client, 0) < self.client_max_concurrency
+    
+    def _total_estimate(self, formats: Sequence[str], sizes: Sequence[Tuple[int, int]]) -> float:
+        """文書ごとの推定所要時間の合計（秒）."""
+        return sum(self.estimate(format_id, *size) for format_id, size in zip(formats, sizes))
+    
+    def _admit(self, estimate: float, client: str, backlog: Sequence[float] = ()) -> None:
+        """
+        待ち行列が上限を超える場合はOverloadedErrorを送出する.
+        
+        backlogは待ち行列の外で実行を待っているレンダリングの推定所要時間で、
+        件数と推定待ち時間の両方に加える.
+        """
+        if (
+            self._running < self.max_concurrency
+            and not self._waiting
+            and not backlog
+            and self._eligible(client)
+        ):
+            return
+        
+        queued = len(self._waiting) + len(backlog)
+        backlog_seconds = sum(backlog) / self.max_concurrency
+        wait = self.queued_seconds(client) + backlog_seconds
+        if queued >= self.max_queue_depth:
+            # 先頭の1件が実行を始めれば1件分の空きができる
+            retry_after = (
+                (self.queued_seconds() + backlog_seconds) / queued if queued else estimate / self.max_concurrency
+            )
+            reason = f"{queued} renders are already queued (limit {self.max_queue_depth})"
+        elif wait + estimate / self.max_concurrency > self.max_queue_seconds:
+            retry_after = wait + estimate / self.max_concurrency - self.max_queue_seconds
+            reason = (
+                f"the estimated queue wait is {wait:.1f}s "
+                f"(limit {self.max_queue_seconds:g}s)"
+            )
+        else:
+            return
+        
+        self.metrics["rejected"] += 1
+        retry_after_ms = max(self.MIN_RETRY_AFTER_MS, int(retry_after * 1000))
+        logger.warning(f"Rejecting render from {client}: {reason}; retry after {retry_after_ms}ms")
+        raise OverloadedError(f"The server is overloaded: {reason}", retry_after_ms)
+    
+    async def _acquire(self, ticket: Ticket, weight: float) -> None:
+        """実行枠を1つ確保する（空いていなければ順番を待つ）."""
+        ticket.queue_position = self._waiting.count_before(ticket.client) + 1
+        self._waiting.push(ticket, ticket.client, ticket.estimate, weight)
+        self._dispatch()
+        if ticket.granted.done():
+            # 待たずに実行できた
+            ticket.queue_position = None
+            ticket.granted.result()
+            return
+        
+        timeout = ticket.deadline.remaining() if ticket.deadline is not None else None
+        try:
+            # 期限がある場合は期限までしか待たない（待っている間にフューチャーは取り消さない）
+            await asyncio.wait({ticket.granted}, timeout=timeout)
+        except asyncio.CancelledError:
+            granted = ticket.granted
+            if granted.done() and not granted.cancelled() and granted.exception() is None:
+                # 枠を受け取った直後に中止された場合は次に譲る
+                self._release(ticket.client)
+            else:
+                self._waiting.remove(ticket)
+            raise
+        
+        if not ticket.granted.done():
+            self._waiting.remove(ticket)
+            ticket.granted.cancel()
+            raise self._expire(ticket)
+        ticket.granted.result()
+    
+    def _release(self, client: str) -> None:
+        """実行枠を返し、待っているレンダリングがあれば引き渡す."""
+        self._running -= 1
+        remaining = self._client_running.get(client, 0) - 1
+        if remaining > 0:
+            self._client_running[client] = remaining
+        else:
+            self._client_running.pop(client, None)
+        self._dispatch()
+    
+    def _dispatch(self) -> None:
+        """空いている実行枠を、公平キューの順に待っているレンダリングへ割り当てる."""
+        while self._running < self.max_concurrency:
+            ticket = self._waiting.pop(self._eligible)
+            if ticket is None:
+                return
+            if ticket.granted.done():
+                continue
+            if ticket.deadline is not None and ticket.deadline.expired:
+                # 期限を過ぎたレンダリングには枠を渡さず、次の順番に回す
+                ticket.granted.set_exception(self._expire(ticket))
+                continue
+            self._running += 1
+            self._client_running[ticket.client] = self._client_running.get(ticket.client, 0) + 1
+            ticket.granted.set_result(None)
+    
+    def _expire(self, ticket: Ticket) -> DeadlineExceededError:
+        """期限を過ぎて待ち行列から外したレンダリングを記録し、送出する例外を返す."""
+        self.metrics["expired"] += 1
+        logger.warning(
+            f"Dropping render from {ticket.client}: its deadline expired after "
+            f"{int(ticket.waited * 1000)}ms in the queue"
+        )
+        return DeadlineExceededError(
+            f"The deadline expired after {int(ticket.waited * 1000)}ms in the render queue"
+        )
@@ -0,0 +1,161 @@
+"""MCPセッションごとの利用状況の集計."""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+logger = logging.getLogger(__name__)
+
+# stdioトランスポートのセッションID（1プロセスに1セッション）
+STDIO_SESSION_ID = "stdio"
+
+
+class SessionStats(BaseModel):
+    """1つのMCPセッションの利用状況."""
+    
+    session_id: str = Field(description="セッションID（HTTPではmcp-session-idヘッダーの値）")
+    transport: str = Field(description="トランスポート（stdioまたはhttp）")
+    opened_at: float = Field(description="開始時刻（UNIX時間）")
+    last_seen: float = Field(description="最後にリクエストを受けた時刻")
+    tool_calls: Dict[str, int] = Field(default_factory=dict, description="ツールごとの呼び出し回数")
+    active_calls: int = Field(default=0, description="実行中のツール呼び出し数")
+    errors: int = Field(default=0, description="例外で終了したツール呼び出し数")
+    renders: int = Field(default=0, description="レンダリング回数")
+    render_failures: int = Field(default=0, description="失敗したレンダリング回数")
+    busy_ms: float = Field(default=0.0, description="ツール呼び出しに費やした合計時間（ミリ秒）")
+
+
+class SessionRegistry:
+    """
+    開いているセッションとその利用状況を管理する.
+    
+    HTTPトランスポートのセッション数の上限判定にも使う.
+    セッションが閉じられたとき、または無通信のまま期限を過ぎたときに
+    集計結果をINFOでログに出力して破棄する.
+    """
+    
+    def __init__(self, idle_timeout: Optional[float] = None, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            idle_timeout: 無通信のセッションを破棄するまでの秒数（Noneの場合は破棄しない）
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._sessions: Dict[str, SessionStats] = {}
+    
+    def open(self, session_id: str, transport: str) -> SessionStats:
+        """
+        セッションを登録する. 登録済みの場合は既存の集計を返す.
+        
+        Args:
+            session_id: セッションID
+            transport: トランスポート名
+            
+        Returns:
+            SessionStats
+        """
+        stats = self._sessions.get(session_id)
+        if stats is None:
+            now = self._clock()
+            stats = SessionStats(session_id=session_id, transport=transport, opened_at=now, last_seen=now)
+            self._sessions[session_id] = stats
+            logger.info(f"MCP session opened: {session_id} ({transport})")
+        return stats
+    
+    def close(self, session_id: str, reason: str = "closed") -> Optional[SessionStats]:
+        """
+        セッションの登録を解除し、集計結果をログに出力する.
+        
+        Args:
+            session_id: セッションID
+            reason: 解除の理由（ログ用）
+            
+        Returns:
+            解除したセッションの集計（未登録の場合はNone）
+        """
+        stats = self._sessions.pop(session_id, None)
+        if stats is not None:
+            logger.info(
+                f"MCP session {reason}: {session_id} "
+                f"({sum(stats.tool_calls.values())} calls, {stats.renders} renders, {stats.errors} errors)",
+                extra={"session": stats.model_dump()},
+            )
+        return stats
+    
+    def expire_idle(self) -> List[str]:
+        """
+        無通信のまま期限を過ぎたセッションを破棄する.
+        
+        Returns:
+            破棄したセッションIDのリスト
+        """
+        if self.idle_timeout is None:
+            return []
+        now = self._clock()
+        expired = [
+            session_id for session_id, stats in self._sessions.items()
+            if stats.active_calls == 0 and now - stats.last_seen > self.idle_timeout
+        ]
+        for session_id in expired:
+            self.close(session_id, reason="expired")
+        return expired
+    
+    def count(self, transport: Optional[str] = None) -> int:
+        """開いているセッション数を返す（transportを指定した場合はそのトランスポートのみ）."""
+        if transport is None:
+            return len(self._sessions)
+        return sum(1 for stats in self._sessions.values() if stats.transport == transport)
+    
+    def get(self, session_id: str) -> Optional[SessionStats]:
+        """セッションの集計を返す."""
+        return self._sessions.get(session_id)
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """全セッションの集計を辞書のリストで返す."""
+        return [stats.model_dump() for stats in self._sessions.values()]
+    
+    @contextmanager
+    def track_call(self, session_id: str, transport: str, tool: str) -> Iterator[SessionStats]:
+        """
+        ツール呼び出し1回分を集計するコンテキストマネージャー.
+        
+        Args:
+            session_id: セッションID
+            transport: トランスポート名
+            tool: ツール名
+            
+        Yields:
+            呼び出し元のセッションの集計
+        """
+        stats = self.open(session_id, transport)
+        stats.tool_calls[tool] = stats.tool_calls.get(tool, 0) + 1
+        stats.active_calls += 1
+        stats.last_seen = self._clock()
+        start = time.perf_counter()
+        try:
+            yield stats
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            stats.active_calls -= 1
+            stats.busy_ms += (time.perf_counter() - start) * 1000
+            stats.last_seen = self._clock()
+    
+    @staticmethod
+    def record_render(stats: SessionStats, result: Dict[str, Any]) -> None:
+        """
+        レンダリング結果をセッションの集計に加える.
+        
+        Args:
+            stats: セッションの集計
+            result: quarto_renderの結果
+        """
+        stats.renders += 1
+        if not result.get("success"):
+            stats.render_failures += 1
@@ -0,0 +1,528 @@
+"""サーバー全体の設定（環境変数・設定ファイルから1回だけ読み込む）."""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Mapping, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+
+class SettingsError(ValueError):
+    """設定値が不正な場合のエラー."""
+    pass
+
+
+# フィールド名と環境変数名の対応
+ENV_VARS: Dict[str, str] = {
+    # Quarto CLI
+    "quarto_timeout": "QUARTO_TIMEOUT",
+    "extensions_source": "QUARTO_MCP_EXTENSIONS_SOURCE",
+    "log_dir": "QUARTO_MCP_LOG_DIR",
+    "quarto_launcher": "QUARTO_MCP_QUARTO_LAUNCHER",
+    "warmup_formats": "QUARTO_MCP_WARMUP_FORMATS",
+    "batch_max_documents": "QUARTO_MCP_BATCH_MAX_DOCUMENTS",
+    "adaptive_timeouts": "QUARTO_MCP_ADAPTIVE_TIMEOUTS",
+    "adaptive_timeout_min": "QUARTO_MCP_ADAPTIVE_TIMEOUT_MIN",
+    "adaptive_timeout_multiplier": "QUARTO_MCP_ADAPTIVE_TIMEOUT_MULTIPLIER",
+    "adaptive_timeout_min_samples": "QUARTO_MCP_ADAPTIVE_TIMEOUT_MIN_SAMPLES",
+    # Quarto子プロセスの資源制限
+    "quarto_memory_limit_mb": "QUARTO_MCP_QUARTO_MEMORY_LIMIT_MB",
+    "quarto_cpu_limit": "QUARTO_MCP_QUARTO_CPU_LIMIT",
+    "quarto_open_files_limit": "QUARTO_MCP_QUARTO_OPEN_FILES_LIMIT",
+    "lane_nice": "QUARTO_MCP_LANE_NICE",
+    "lane_io_priority": "QUARTO_MCP_LANE_IO_PRIORITY",
+    # MCPトランスポート
+    "transport": "QUARTO_MCP_TRANSPORT",
+    "server_host": "QUARTO_MCP_HOST",
+    "server_port": "QUARTO_MCP_PORT",
+    "server_path": "QUARTO_MCP_PATH",
+    "server_max_sessions": "QUARTO_MCP_MAX_SESSIONS",
+    "server_session_idle_timeout": "QUARTO_MCP_SESSION_IDLE_TIMEOUT",
+    # ログ
+    "log_format": "QUARTO_MCP_LOG_FORMAT",
+    "log_level": "QUARTO_MCP_LOG_LEVEL",
+    "log_levels": "QUARTO_MCP_LOG_LEVELS",
+    "log_sample_rates": "QUARTO_MCP_LOG_SAMPLE_RATES",
+    "log_diagnostics_max_bytes": "QUARTO_MCP_LOG_DIAGNOSTICS_MAX_BYTES",
+    "trace_file": "QUARTO_MCP_TRACE_FILE",
+    # テンプレート
+    "template_download_timeout": "QUARTO_TEMPLATE_DOWNLOAD_TIMEOUT",
+    "template_cache_dir": "QUARTO_TEMPLATE_CACHE_DIR",
+    "template_cache_ttl": "QUARTO_TEMPLATE_CACHE_TTL",
+    "template_cache_max_bytes": "QUARTO_TEMPLATE_CACHE_MAX_BYTES",
+    "template_poll_interval": "QUARTO_MCP_TEMPLATE_POLL_INTERVAL",
+    # レンダリングの受け付け制御
+    "render_max_concurrency": "QUARTO_MCP_RENDER_CONCURRENCY",
+    "render_max_queue_depth": "QUARTO_MCP_MAX_QUEUE_DEPTH",
+    "render_max_queue_seconds": "QUARTO_MCP_MAX_QUEUE_SECONDS",
+    "render_client_max_concurrency": "QUARTO_MCP_CLIENT_CONCURRENCY",
+    "render_client_weights": "QUARTO_MCP_CLIENT_WEIGHTS",
+    # ワーカープロセス
+    "render_workers": "QUARTO_MCP_WORKERS",
+    "spawner_enabled": "QUARTO_MCP_SPAWNER",
+    # 非同期レンダリングジョブ
+    "jobs_max_concurrency": "QUARTO_MCP_JOBS_CONCURRENCY",
+    "jobs_retention": "QUARTO_MCP_JOBS_RETENTION",
+    "jobs_max_retained": "QUARTO_MCP_JOBS_MAX_RETAINED",
+    "jobs_store_dir": "QUARTO_MCP_JOBS_DIR",
+    # 共有HTTPクライアント
+    "http_max_connections": "QUARTO_MCP_HTTP_MAX_CONNECTIONS",
+    "http_max_keepalive": "QUARTO_MCP_HTTP_MAX_KEEPALIVE",
+    "http_keepalive_expiry": "QUARTO_MCP_HTTP_KEEPALIVE_EXPIRY",
+    # Kroki
+    "kroki_url": "QUARTO_MCP_KROKI_URL",
+    "kroki_image_format": "QUARTO_MCP_KROKI_IMAGE_FORMAT",
+    "kroki_max_connections": "QUARTO_MCP_KROKI_MAX_CONNECTIONS",
+    "kroki_request_timeout": "QUARTO_MCP_KROKI_REQUEST_TIMEOUT",
+    "kroki_fetch_budget": "QUARTO_MCP_KROKI_FETCH_BUDGET",
+    "kroki_health_ttl": "QUARTO_MCP_KROKI_HEALTH_TTL",
+    "kroki_health_timeout": "QUARTO_MCP_KROKI_HEALTH_TIMEOUT",
+    "kroki_breaker_threshold": "QUARTO_MCP_KROKI_BREAKER_THRESHOLD",
+    "kroki_breaker_reset": "QUARTO_MCP_KROKI_BREAKER_RESET",
+    # 図の事前レンダリング
+    "diagram_prerender": "QUARTO_MCP_DIAGRAM_PRERENDER",
+    "diagram_cache_dir": "QUARTO_MCP_DIAGRAM_CACHE_DIR",
+    "diagram_concurrency": "QUARTO_MCP_DIAGRAM_CONCURRENCY",
+}
+
+# 設定ファイルのパスを指定する環境変数
+CONFIG_FILE_ENV = "QUARTO_MCP_CONFIG_FILE"
+
+# 「無効」を表す値
+_OFF_VALUES = ("", "off", "false", "0", "none")
+
+# レンダリングの経路（レーン）. 子プロセスの優先度をレーンごとに設定できる
+# interactive: quarto_render、batch: quarto_render_batch、job: quarto_render_submit、warmup: 起動時のウォームアップ
+LANES = ("interactive", "batch", "job", "warmup")
+
+# 指定できるI/O優先度のクラス（realtimeは特権が必要なため受け付けない）
+_IO_CLASSES = ("best-effort", "idle")
+
+
+class Settings(BaseModel):
+    """
+    サーバーの設定値.
+    
+    読み込み時にすべての値を検証し、不正な値があればSettingsErrorを送出する.
+    インスタンスは不変で、再読み込みはreload_settings()で明示的に行う.
+    """
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
+    
+    # Quarto CLI
+    quarto_timeout: int = Field(600, gt=0, description="変換処理のタイムアウト秒数")
+    extensions_source: Optional[str] = Field(None, description="Quarto拡張のソースディレクトリ")
+    log_dir: str = Field("logs", min_length=1, description="ログ出力ディレクトリ")
+    quarto_launcher: Literal["auto", "wrapper"] = Field(
+        "auto", description="Quarto CLIの起動方法（autoでDenoを直接起動、wrapperで常にquartoコマンドを起動）"
+    )
+    warmup_formats: List[str] = Field(default_factory=list, description="起動時にウォームアップする出力形式")
+    batch_max_documents: int = Field(200, ge=1, description="quarto_render_batchで1回に受け付ける文書数")
+    adaptive_timeouts: bool = Field(True, description="出力形式ごとの実測の所要時間からQuartoのタイムアウトを決めるか")
+    adaptive_timeout_min: float = Field(10.0, gt=0, description="適応タイムアウトの下限（秒）")
+    adaptive_timeout_multiplier: float = Field(3.0, ge=1, description="所要時間の99パーセンタイルに掛ける倍率")
+    adaptive_timeout_min_samples: int = Field(5, ge=1, description="適応タイムアウトを使い始める実測数")
+    
+    # Quarto子プロセスの資源制限
+    quarto_memory_limit_mb: int = Field(0, ge=0, description="Quartoの仮想メモリの上限（MiB、RLIMIT_AS. 0で制限なし）")
+    quarto_cpu_limit: int = Field(0, ge=0, description="QuartoのCPU時間の上限（秒、RLIMIT_CPU. 0で制限なし）")
+    quarto_open_files_limit: int = Field(
+        0, ge=0, description="Quartoが開けるファイル数の上限（RLIMIT_NOFILE. 0で制限なし）"
+    )
+    lane_nice: Dict[str, int] = Field(default_factory=dict, description="レーンごとのQuartoのnice値（0〜19）")
+    lane_io_priority: Dict[str, str] = Field(
+        default_factory=dict, description="レーンごとのQuartoのI/O優先度（idle、best-effort[:0〜7]）"
+    )
+    
+    # MCPトランスポート
+    transport: Literal["stdio", "http", "both"] = Field("stdio", description="MCPクライアントとの通信方式")
+    server_host: str = Field("127.0.0.1", min_length=1, description="HTTPトランスポートの待ち受けアドレス")
+    server_port: int = Field(8765, ge=0, le=65535, description="HTTPトランスポートの待ち受けポート")
+    server_path: str = Field("/mcp", description="HTTPトランスポートのエンドポイント")
+    server_max_sessions: int = Field(64, ge=1, description="同時に開けるHTTPセッション数")
+    server_session_idle_timeout: float = Field(1800.0, gt=0, description="HTTPセッションを破棄するまでの無通信秒数")
+    
+    # ログ
+    log_format: Literal["json", "text"] = Field("json", description="ログの出力形式")
+    log_level: str = Field("INFO", description="ルートロガーのレベル")
+    log_levels: Dict[str, str] = Field(default_factory=dict, description="ロガー名ごとのレベル")
+    log_sample_rates: Dict[str, float] = Field(
+        default_factory=dict, description="ロガー名ごとのINFO以下のログの記録割合（0〜1）"
+    )
+    log_diagnostics_max_bytes: int = Field(
+        64 * 1024, ge=0, description="レンダリング失敗時に出力する診断情報の上限バイト数"
+    )
+    trace_file: Optional[str] = Field(
+        "", description="スパンの出力先（空でログディレクトリのtraces.jsonl、Noneで出力しない）"
+    )
+    
+    # テンプレート
+    template_download_timeout: int = Field(600, gt=0, description="URLテンプレートのダウンロードタイムアウト秒数")
+    template_cache_dir: Optional[str] = Field(
+        "~/.cache/quarto-mcp/templates", description="URLテンプレートのキャッシュディレクトリ（Noneで無効）"
+    )
+    template_cache_ttl: float = Field(300.0, ge=0, description="再検証なしでキャッシュを使用できる秒数")
+    template_cache_max_bytes: int = Field(2 * 1024 ** 3, gt=0, description="キャッシュの合計サイズ上限")
+    template_poll_interval: float = Field(2.0, ge=0, description="templates.yamlの変更を確認する間隔（秒）")
+    
+    # レンダリングの受け付け制御
+    render_max_concurrency: int = Field(4, ge=1, description="同時に実行するレンダリング数")
+    render_max_queue_depth: int = Field(32, ge=0, description="実行枠を待てるレンダリング数の上限")
+    render_max_queue_seconds: float = Field(
+        120.0, ge=0, description="新しいレンダリングが実行開始まで待つ推定時間の上限（秒）"
+    )
+    render_client_max_concurrency: int = Field(
+        0, ge=0, description="1クライアントが同時に実行できるレンダリング数（0で制限なし）"
+    )
+    render_client_weights: Dict[str, float] = Field(
+        default_factory=dict, description="セッションIDまたはクライアント名ごとの待ち行列の重み"
+    )
+    
+    # ワーカープロセス
+    render_workers: int = Field(0, ge=0, description="レンダリングを実行するワーカープロセス数（0でサーバープロセス内で実行）")
+    spawner_enabled: bool = Field(True, description="子プロセスの起動をスポナーのヘルパープロセスに任せるか")
+    
+    # 非同期レンダリングジョブ
+    jobs_max_concurrency: int = Field(2, ge=1, description="同時に実行するジョブ数")
+    jobs_retention: float = Field(3600.0, ge=0, description="終了したジョブを保持する秒数")
+    jobs_max_retained: int = Field(500, ge=1, description="保持するジョブ数の上限")
+    jobs_store_dir: Optional[str] = Field(
+        "~/.cache/quarto-mcp/jobs", description="ジョブのメタデータと結果の保存先（Noneで保存しない）"
+    )
+    
+    # 共有HTTPクライアント
+    http_max_connections: int = Field(64, ge=1, description="共有HTTPクライアントの最大接続数")
+    http_max_keepalive: int = Field(16, ge=0, description="keep-aliveで保持する接続数")
+    http_keepalive_expiry: float = Field(60.0, ge=0, description="keep-alive接続を保持する秒数")
+    
+    # Kroki
+    kroki_url: str = Field("", description="KrokiサービスのURL（空でKroki統合を無効化）")
+    kroki_image_format: Optional[Literal["svg", "png"]] = Field(
+        None, description="Krokiの画像形式（autoまたはNoneで出力形式に応じて自動選択）"
+    )
+    kroki_max_connections: int = Field(8, ge=1, description="ホストごとの同時リクエスト数")
+    kroki_request_timeout: float = Field(30.0, gt=0, description="1リクエストあたりのタイムアウト秒数")
+    kroki_fetch_budget: float = Field(60.0, gt=0, description="1回のレンダリングでダイアグラムの取得全体にかける秒数")
+    kroki_health_ttl: float = Field(15.0, ge=0, description="ヘルスチェック結果のキャッシュ秒数")
+    kroki_health_timeout: float = Field(2.0, gt=0, description="ヘルスチェックのタイムアウト秒数")
+    kroki_breaker_threshold: int = Field(3, ge=1, description="回路を開く連続失敗回数")
+    kroki_breaker_reset: float = Field(30.0, ge=0, description="回路を開いてから再試行するまでの秒数")
+    
+    # 図の事前レンダリング
+    diagram_prerender: Literal["off", "kroki", "mmdc"] = Field("off", description="事前レンダリングの方式")
+    diagram_cache_dir: str = Field("~/.cache/quarto-mcp/diagrams", description="画像キャッシュディレクトリ")
+    diagram_concurrency: int = Field(4, ge=1, description="同時レンダリング数")
+    
+    @property
+    def kroki_enabled(self) -> bool:
+        """Kroki統合が有効かどうか."""
+        return bool(self.kroki_url)
+    
+    @field_validator("kroki_url", mode="before")
+    @classmethod
+    def _validate_kroki_url(cls, value: Any) -> str:
+        url = str(value or "").strip()
+        if url and not url.startswith(("http://", "https://")):
+            raise ValueError("must start with http:// or https://")
+        return url
+    
+    @field_validator("warmup_formats", mode="before")
+    @classmethod
+    def _validate_warmup_formats(cls, value: Any) -> List[str]:
+        from src.models.formats import FORMAT_DEFINITIONS
+        
+        if value is None:
+            return []
+        items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+        formats = []
+        for item in items:
+            format_id = str(item).strip()
+            if not format_id:
+                continue
+            if format_id not in FORMAT_DEFINITIONS:
+                raise ValueError(f"unknown format {format_id!r}")
+            if format_id not in formats:
+                formats.append(format_id)
+        return formats
+    
+    @field_validator("server_path", mode="before")
+    @classmethod
+    def _validate_server_path(cls, value: Any) -> str:
+        path = str(value or "").strip()
+        if not path.startswith("/"):
+            raise ValueError("must start with /")
+        return path.rstrip("/") or "/"
+    
+    @field_validator("quarto_launcher", "transport", "log_format", mode="before")
+    @classmethod
+    def _normalize_choice(cls, value: Any) -> str:
+        return str(value or "").strip().lower()
+    
+    @field_validator("log_level", mode="before")
+    @classmethod
+    def _validate_log_level(cls, value: Any) -> str:
+        return _parse_level(value)
+    
+    @field_validator("log_levels", mode="before")
+    @classmethod
+    def _validate_log_levels(cls, value: Any) -> Dict[str, str]:
+        return {name: _parse_level(level) for name, level in _parse_mapping(value).items()}
+    
+    @field_validator("log_sample_rates", mode="before")
+    @classmethod
+    def _validate_sample_rates(cls, value: Any) -> Dict[str, float]:
+        rates = {}
+        for name, rate in _parse_mapping(value).items():
+            try:
+                rate = float(rate)
+            except (TypeError, ValueError):
+                raise ValueError(f"sample rate for {name!r} must be a number")
+            if not 0 <= rate <= 1:
+                raise ValueError(f"sample rate for {name!r} must be between 0 and 1")
+            rates[name] = rate
+        return rates
+    
+    @field_validator("render_client_weights", mode="before")
+    @classmethod
+    def _validate_client_weights(cls, value: Any) -> Dict[str, float]:
+        weights = {}
+        for name, weight in _parse_mapping(value).items():
+            try:
+                weight = float(weight)
+            except (TypeError, ValueError):
+                raise ValueError(f"weight for {name!r} must be a number")
+            if weight <= 0:
+                raise ValueError(f"weight for {name!r} must be greater than 0")
+            weights[name] = weight
+        return weights
+    
+    @field_validator("lane_nice", mode="before")
+    @classmethod
+    def _validate_lane_nice(cls, value: Any) -> Dict[str, int]:
+        values = {}
+        for lane, nice in _parse_mapping(value).items():
+            _check_lane(lane)
+            try:
+                nice = int(nice)
+            except (TypeError, ValueError):
+                raise ValueError(f"nice value for {lane!r} must be an integer")
+            if not 0 <= nice <= 19:
+                raise ValueError(f"nice value for {lane!r} must be between 0 and 19")
+            values[lane] = nice
+        return values
+    
+    @field_validator("lane_io_priority", mode="before")
+    @classmethod
+    def _validate_lane_io_priority(cls, value: Any) -> Dict[str, str]:
+        priorities = {}
+        for lane, priority in _parse_mapping(value).items():
+            _check_lane(lane)
+            io_class, _, level = str(priority).strip().lower().partition(":")
+            if io_class not in _IO_CLASSES:
+                raise ValueError(f"I/O priority for {lane!r} must be idle or best-effort[:0-7], got {priority!r}")
+            if io_class == "idle":
+                if level:
+                    raise ValueError(f"I/O priority for {lane!r} does not take a level in the idle class")
+                priorities[lane] = io_class
+                continue
+            if not level:
+                level = "4"
+            if not level.isdigit() or not 0 <= int(level) <= 7:
+                raise ValueError(f"I/O priority level for {lane!r} must be between 0 and 7")
+            priorities[lane] = f"{io_class}:{int(level)}"
+        return priorities
+    
+    @field_validator("trace_file", mode="before")
+    @classmethod
+    def _normalize_trace_file(cls, value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        value = str(value).strip()
+        return None if value.lower() in ("off", "false", "0", "none") else value
+    
+    @field_validator("kroki_image_format", mode="before")
+    @classmethod
+    def _normalize_image_format(cls, value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        value = str(value).strip().lower()
+        # autoは未設定と同じく出力形式に応じて自動選択する
+        return None if value in ("", "auto") else value
+    
+    @field_validator("template_cache_dir", "jobs_store_dir", "extensions_source", mode="before")
+    @classmethod
+    def _normalize_optional_path(cls, value: Any, info) -> Optional[str]:
+        if value is None:
+            return None
+        value = str(value).strip()
+        if info.field_name != "extensions_source" and value.lower() in _OFF_VALUES:
+            return None
+        return value or None
+    
+    @field_validator("diagram_prerender", mode="before")
+    @classmethod
+    def _normalize_prerender(cls, value: Any) -> str:
+        value = str(value or "").strip().lower()
+        return "off" if value in _OFF_VALUES else value
+    
+    @classmethod
+    def load(
+        cls,
+        environ: Optional[Mapping[str, str]] = None,
+        config_file: Optional[Path] = None,
+    ) -> "Settings":
+        """
+        設定ファイルと環境変数から設定を読み込む.
+        
+        設定ファイル（YAML、キーはフィールド名）の値を環境変数が上書きする.
+        設定ファイルは引数または環境変数 QUARTO_MCP_CONFIG_FILE で指定する.
+        
+        Args:
+            environ: 環境変数（省略時はos.environ）
+            config_file: 設定ファイルのパス
+            
+        Returns:
+            検証済みの設定
+            
+        Raises:
+            SettingsError: 設定ファイルが読めない場合、または不正な値がある場合
+        """
+        if environ is None:
+            environ = os.environ
+        if config_file is None and environ.get(CONFIG_FILE_ENV):
+            config_file = Path(environ[CONFIG_FILE_ENV])
+        
+        values: Dict[str, Any] = {}
+        if config_file is not None:
+            values.update(_read_config_file(Path(config_file)))
+        for field_name, env_name in ENV_VARS.items():
+            if env_name in environ:
+                values[field_name] = environ[env_name]
+        
+        try:
+            return cls(**values)
+        except ValidationError as e:
+            raise SettingsError(_format_errors(e)) from e
+
+
+def _parse_mapping(value: Any) -> Dict[str, Any]:
+    """ "name=value,name=value" 形式の文字列（または辞書）を辞書にする."""
+    if value is None:
+        return {}
+    if isinstance(value, dict):
+        return {str(name): item for name, item in value.items()}
+    mapping = {}
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, item = part.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"expected name=value pairs separated by commas, got {part!r}")
+        mapping[name.strip()] = item.strip()
+    return mapping
+
+
+def _check_lane(lane: str) -> None:
+    """レーン名を検証する."""
+    if lane not in LANES:
+        raise ValueError(f"unknown lane {lane!r} (expected one of {', '.join(LANES)})")
+
+
+def _parse_level(value: Any) -> str:
+    """ログレベル名を検証して大文字で返す."""
+    level = str(value or "").strip().upper()
+    if level not in ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"):
+        raise ValueError(f"unknown log level {value!r}")
+    return level
+
+
+def _read_config_file(path: Path) -> Dict[str, Any]:
+    """設定ファイルを読み込む."""
+    # 設定ファイルを使わない場合はyamlを読み込まない（起動時間の短縮）
+    import yaml
+    
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        raise SettingsError(f"Failed to read settings file {path}: {e}") from e
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise SettingsError(f"Settings file {path} must contain a mapping")
+    return data
+
+
+def _format_errors(error: ValidationError) -> str:
+    """検証エラーを環境変数名つきのメッセージにする."""
+    lines = ["Invalid settings:"]
+    for item in error.errors():
+        field_name = str(item["loc"][0]) if item["loc"] else ""
+        env_name = ENV_VARS.get(field_name)
+        name = f"{env_name} ({field_name})" if env_name else field_name
+        lines.append(f"  - {name}: {item['msg']} (got {item.get('input')!r})")
+    return "\n".join(lines)
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """
+    プロセス共有の設定を返す（初回のみ読み込む）.
+    
+    Returns:
+        Settings
+        
+    Raises:
+        SettingsError: 不正な値がある場合
+    """
+    global _settings
+    
+    settings = _settings
+    if settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.load()
+            settings = _settings
+    return settings
+
+
+def set_settings(settings: Settings) -> None:
+    """
+    プロセス共有の設定を差し替える（ワーカープロセスに親の設定を引き継ぐ場合など）.
+    
+    Args:
+        settings: 使用する設定
+    """
+    global _settings
+    
+    with _settings_lock:
+        _settings = settings
+
+
+def reload_settings(**kwargs) -> Settings:
+    """
+    環境変数と設定ファイルから設定を読み込み直す.
+    
+    読み込みに失敗した場合は以前の設定を維持する.
+    生成済みのコンポーネント（レンダラー、接続プールなど）には反映されない.
+    
+    Args:
+        **kwargs: Settings.load()への引数
+        
+    Returns:
+        新しい設定
+        
+    Raises:
+        SettingsError: 不正な値がある場合
+    """
+    global _settings
+    
+    settings = Settings.load(**kwargs)
+    with _settings_lock:
+        _settings = settings
+    return settings
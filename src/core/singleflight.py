@@ -0,0 +1,100 @@
+"""同じキーの同時実行を1回にまとめるユーティリティ."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """実行中の処理と、その結果を待っている呼び出し元の数."""
+    
+    def __init__(self, task: asyncio.Task, cleanup: Optional[Callable[[Any], None]]):
+        self.task = task
+        self.cleanup = cleanup
+        self.users = 0
+    
+    def release_if_unused(self) -> None:
+        """処理が成功して誰も結果を使っていなければcleanupを呼ぶ."""
+        if self.users > 0 or not self.task.done() or self.cleanup is None:
+            return
+        if self.task.cancelled() or self.task.exception() is not None:
+            return
+        cleanup, self.cleanup = self.cleanup, None
+        cleanup(self.task.result())
+
+
+class SingleFlight:
+    """
+    同じキーに対する同時呼び出しを1回の実行にまとめる.
+    
+    実行中に同じキーで呼び出されたものは、新たに実行せずに同じ結果
+    （または例外）を受け取る. 処理は呼び出し元とは別のタスクで実行されるため、
+    最初の呼び出し元がキャンセルされても他の待機者には影響しない.
+    完了後の呼び出しは新たに実行される.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+    
+    def in_flight(self, key: Hashable) -> bool:
+        """キーに対する処理が実行中かどうかを返す."""
+        return key in self._calls
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キーに対する処理を実行し、結果を返す.
+        
+        Args:
+            key: まとめる単位のキー
+            fn: 結果を返すコルーチン関数
+            
+        Returns:
+            fnの結果（同時呼び出しの間で共有される）
+        """
+        async with self.shared(key, fn) as result:
+            return result
+    
+    @asynccontextmanager
+    async def shared(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        cleanup: Optional[Callable[[Any], None]] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        結果を共有する処理を実行し、コンテキストの間だけ結果を利用する.
+        
+        同じ実行の結果を使うすべての呼び出し元がコンテキストを抜けた時点で
+        cleanup(result) を呼ぶ（一時ファイルの削除など）.
+        
+        Args:
+            key: まとめる単位のキー
+            fn: 結果を返すコルーチン関数
+            cleanup: 結果が不要になったときに呼ぶ関数
+            
+        Yields:
+            fnの結果
+        """
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        if call is None or call.task.get_loop() is not loop:
+            call = _Call(loop.create_task(fn()), cleanup)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._finish(key, call))
+        
+        call.users += 1
+        try:
+            result = await asyncio.shield(call.task)
+            yield result
+        finally:
+            call.users -= 1
+            call.release_if_unused()
+    
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        """処理の完了時に登録を外す."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # 待機者がいない場合でも例外が未取得の警告を出さない
+            call.task.exception()
+        call.release_if_unused()
@@ -0,0 +1,304 @@
+"""子プロセスの起動をヘルパープロセスに任せるスポナー."""
+
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+from src.core.spawner_helper import limit_process
+
+
+logger = logging.getLogger(__name__)
+
+HELPER_PATH = Path(__file__).with_name("spawner_helper.py")
+
+# ヘルパーからの応答1行の上限（出力は64KiBずつbase64で送られる）
+_LINE_LIMIT = 1024 * 1024
+
+
+class SpawnedProcess:
+    """
+    スポナー経由で起動した子プロセス.
+    
+    asyncio.subprocess.Processと同じ使い方（communicate, wait, kill, returncode, pid）ができる.
+    終了後はusageにwait4()で回収した資源使用量（CPU時間、最大RSS、I/Oブロック数）が入る.
+    """
+    
+    def __init__(self, spawner: "Spawner", process_id: int):
+        self._spawner = spawner
+        self._id = process_id
+        self.pid: Optional[int] = None
+        self.returncode: Optional[int] = None
+        self.usage: Optional[Dict[str, int]] = None
+        self._started: asyncio.Future = spawner._loop.create_future()
+        self._exited: asyncio.Future = spawner._loop.create_future()
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._input_sent = False
+    
+    async def communicate(self, input: Optional[bytes] = None) -> Tuple[bytes, bytes]:
+        """
+        標準入力にinputを書き込んで閉じ、終了を待って出力を返す.
+        
+        Args:
+            input: 標準入力に渡すデータ
+            
+        Returns:
+            (標準出力, 標準エラー出力)
+        """
+        self._send_input(input)
+        await self.wait()
+        return bytes(self._stdout), bytes(self._stderr)
+    
+    async def wait(self) -> int:
+        """終了を待って終了コードを返す."""
+        return await asyncio.shield(self._exited)
+    
+    def kill(self) -> None:
+        """子プロセスを強制終了する."""
+        if self.returncode is not None:
+            raise ProcessLookupError(self.pid)
+        if self._spawner.running:
+            self._spawner._send({"id": self._id, "kill": True})
+    
+    def _send_input(self, input: Optional[bytes]) -> None:
+        if self._input_sent or self.returncode is not None:
+            return
+        self._input_sent = True
+        message: Dict[str, Any] = {"id": self._id, "input": ""}
+        if input:
+            message["input"] = base64.b64encode(input).decode("ascii")
+        self._spawner._send(message)
+    
+    def _handle(self, message: Dict[str, Any]) -> None:
+        if "pid" in message:
+            self.pid = message["pid"]
+            if not self._started.done():
+                self._started.set_result(None)
+        elif "error" in message:
+            # FileNotFoundErrorなど、直接起動した場合と同じ例外型にする
+            error = OSError(message.get("errno") or 0, message["error"])
+            if not self._started.done():
+                self._started.set_exception(error)
+            self._spawner._processes.pop(self._id, None)
+        elif "stream" in message:
+            buffer = self._stdout if message["stream"] == "stdout" else self._stderr
+            buffer.extend(base64.b64decode(message["data"]))
+        elif "exit" in message:
+            self.returncode = message["exit"]
+            self.usage = message.get("usage")
+            if not self._exited.done():
+                self._exited.set_result(self.returncode)
+            self._spawner._processes.pop(self._id, None)
+    
+    def _fail(self, error: BaseException) -> None:
+        if not self._started.done():
+            self._started.set_exception(error)
+        if not self._exited.done():
+            self._exited.set_exception(error)
+            # 誰もwait()しなかった場合に警告が出ないようにする
+            self._exited.exception()
+
+
+class Spawner:
+    """
+    子プロセスの起動を小さなヘルパープロセス（spawner_helper.py）に任せる.
+    
+    サーバープロセスはキャッシュ・接続プール・ワーカーとの通信などでメモリが大きくなり、
+    そこからfork/execするたびにページテーブルのコピーが重くなる. ヘルパーはサーバーが
+    まだ小さいうちに起動しておき、以後のQuartoやmmdcの起動はヘルパーが行う.
+    子プロセスの標準出力・標準エラー出力と終了コードはパイプ経由でサーバーに返される.
+    
+    ヘルパーが異常終了した場合、以後の起動は呼び出し元のプロセスから直接行われる.
+    """
+    
+    def __init__(self) -> None:
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._processes: Dict[int, SpawnedProcess] = {}
+        self._ids = itertools.count(1)
+    
+    @property
+    def running(self) -> bool:
+        """ヘルパープロセスが動いているか."""
+        return self._process is not None and self._process.returncode is None and not self._reader.done()
+    
+    async def start(self) -> None:
+        """ヘルパープロセスを起動する."""
+        self._loop = asyncio.get_running_loop()
+        self._process = await asyncio.create_subprocess_exec(
+            sys.executable, "-u", str(HELPER_PATH),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=_LINE_LIMIT,
+        )
+        self._reader = asyncio.create_task(self._read(), name="spawner-reader")
+        logger.info(f"Spawner helper started (pid {self._process.pid})")
+    
+    async def spawn(
+        self,
+        argv: Sequence[str],
+        cwd: Optional[Union[str, Path]] = None,
+        env: Optional[Dict[str, str]] = None,
+        limits: Optional[Dict[str, int]] = None,
+    ) -> SpawnedProcess:
+        """
+        子プロセスを起動する.
+        
+        Args:
+            argv: コマンドと引数
+            cwd: 作業ディレクトリ
+            env: 環境変数（省略時はサーバープロセスの現在の環境変数）
+            limits: 資源制限とnice値（spawner_helper.limit_process()の形式）
+            
+        Returns:
+            SpawnedProcess
+            
+        Raises:
+            OSError: 起動に失敗した場合（コマンドが見つからない場合はFileNotFoundError）
+        """
+        process_id = next(self._ids)
+        process = SpawnedProcess(self, process_id)
+        self._send({
+            "id": process_id,
+            "argv": [str(arg) for arg in argv],
+            "cwd": str(cwd) if cwd is not None else None,
+            "env": dict(os.environ) if env is None else env,
+            "limits": limits,
+        })
+        self._processes[process_id] = process
+        try:
+            await asyncio.shield(process._started)
+        except asyncio.CancelledError:
+            # 起動待ちの間に呼び出し元が中止した場合は、起動した子プロセスを残さない
+            if self.running:
+                self._send({"id": process_id, "kill": True})
+            raise
+        return process
+    
+    async def aclose(self) -> None:
+        """ヘルパープロセスを終了する（実行中の子プロセスも終了する）."""
+        if self._process is None:
+            return
+        if self._process.returncode is None:
+            # 標準入力を閉じるとヘルパーは子プロセスを終了させてから終了する
+            self._process.stdin.close()
+            try:
+                await asyncio.wait_for(self._process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                self._process.kill()
+                await self._process.wait()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+    
+    def _send(self, message: Dict[str, Any]) -> None:
+        if not self.running:
+            raise OSError("The spawner helper is not running")
+        self._process.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+    
+    async def _read(self) -> None:
+        """ヘルパーからの応答を子プロセスごとに振り分ける."""
+        try:
+            while True:
+                line = await self._process.stdout.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                process = self._processes.get(message["id"])
+                if process is not None:
+                    process._handle(message)
+        finally:
+            error = OSError("The spawner helper exited")
+            for process in list(self._processes.values()):
+                process._fail(error)
+            self._processes.clear()
+            if self._process.returncode is None and not self._process.stdin.is_closing():
+                logger.error("Spawner helper stopped responding; launching subprocesses directly")
+
+
+_spawner: Optional[Spawner] = None
+
+
+async def start_spawner() -> Optional[Spawner]:
+    """
+    プロセス共有のスポナーを起動する（起動に失敗した場合はNone）.
+    
+    サーバーのメモリが大きくなる前、起動処理の最初に呼び出す.
+    """
+    global _spawner
+    
+    spawner = Spawner()
+    try:
+        await spawner.start()
+    except OSError as e:
+        logger.warning(f"Failed to start the spawner helper; launching subprocesses directly: {e}")
+        return None
+    _spawner = spawner
+    return spawner
+
+
+async def stop_spawner() -> None:
+    """プロセス共有のスポナーを終了する."""
+    global _spawner
+    
+    spawner, _spawner = _spawner, None
+    if spawner is not None:
+        await spawner.aclose()
+
+
+def get_spawner() -> Optional[Spawner]:
+    """現在のイベントループで使えるスポナーを返す（ない場合はNone）."""
+    spawner = _spawner
+    if spawner is None or not spawner.running:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return spawner if spawner._loop is loop else None
+
+
+async def create_subprocess_exec(
+    *argv: str,
+    cwd: Optional[Union[str, Path]] = None,
+    env: Optional[Dict[str, str]] = None,
+    limits: Optional[Dict[str, int]] = None,
+) -> Union[SpawnedProcess, asyncio.subprocess.Process]:
+    """
+    子プロセスを起動する（標準入出力はすべてパイプ）.
+    
+    スポナーが起動していればヘルパープロセス経由で、そうでなければ（ワーカープロセスや
+    テストなど）asyncio.create_subprocess_execで直接起動する. どちらの場合も
+    communicate(), wait(), kill(), returncode, pidを持つオブジェクトを返す.
+    資源使用量（usage）はスポナー経由で起動した場合だけ得られる.
+    
+    Args:
+        *argv: コマンドと引数
+        cwd: 作業ディレクトリ
+        env: 環境変数（省略時は現在の環境変数）
+        limits: 子プロセスの資源制限とnice値（spawner_helper.limit_process()の形式）
+        
+    Returns:
+        SpawnedProcessまたはasyncio.subprocess.Process
+        
+    Raises:
+        OSError: 起動に失敗した場合
+    """
+    spawner = get_spawner()
+    if spawner is not None:
+        return await spawner.spawn(argv, cwd=cwd, env=env, limits=limits)
+    return await asyncio.create_subprocess_exec(
+        *argv,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(cwd) if cwd is not None else None,
+        env=env,
+        preexec_fn=limit_process(limits),
+    )
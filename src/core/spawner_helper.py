@@ -0,0 +1,182 @@
+"""
+子プロセスを起動する小さなヘルパープロセス（src.core.spawnerから起動される）.
+
+サーバー本体がキャッシュや接続プールで大きくなる前に起動しておき、
+Quarto・mmdcなどの起動はこのプロセスが代わりに行う. 標準ライブラリだけを使い、
+サーバーのモジュールは読み込まない.
+
+プロトコル（標準入出力、1行1つのJSON、バイト列はbase64）:
+- 要求: {"id", "argv", "cwd", "env", "limits"} で起動、{"id", "input"} で標準入力へ書き込んで閉じる、
+  {"id", "kill": true} で強制終了
+- 応答: {"id", "pid"} 起動成功、{"id", "error", "errno"} 起動失敗、
+  {"id", "stream": "stdout"|"stderr", "data"} 出力、{"id", "exit", "usage"} 終了コードと資源使用量
+
+limitsとusageの形式はlimit_process()とdescribe_usage()を参照. 子プロセスを直接起動する場合も
+（src.core.spawnerから）同じ関数を使う.
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# CPU時間の上限を超えてからSIGKILLで止めるまでの猶予（秒）. 上限ではまずSIGXCPUが送られる
+CPU_LIMIT_GRACE = 5
+
+
+def limit_process(limits):
+    """
+    子プロセスでexecの直前に呼ぶ関数（preexec_fn）を返す.
+    
+    limits: {"as": 仮想メモリのバイト数, "cpu": CPU時間の秒数, "nofile": ファイル数, "nice": nice値の増分}
+    （値が0または省略の項目は変更しない）. 現在のハードリミットを超える値はハードリミットに切り詰める.
+    制限がなければNoneを返す（Popenの高速な起動経路を使えるようにする）.
+    """
+    if not limits or resource is None:
+        return None
+    rlimits = []
+    for key, which in (("as", resource.RLIMIT_AS), ("cpu", resource.RLIMIT_CPU), ("nofile", resource.RLIMIT_NOFILE)):
+        value = limits.get(key)
+        if value:
+            hard = value + CPU_LIMIT_GRACE if key == "cpu" else value
+            rlimits.append((which, value, hard))
+    nice = limits.get("nice") or 0
+    if not rlimits and not nice:
+        return None
+    
+    def preexec():
+        for which, soft, hard in rlimits:
+            _, current = resource.getrlimit(which)
+            if current != resource.RLIM_INFINITY:
+                hard = min(hard, current)
+            resource.setrlimit(which, (min(soft, hard), hard))
+        if nice:
+            os.nice(nice)
+    
+    return preexec
+
+
+def describe_usage(usage):
+    """wait4()のrusageを応答に含める辞書にする."""
+    # ru_maxrssはLinuxではKiB、macOSではバイト
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return {
+        "cpu_user_ms": int(usage.ru_utime * 1000),
+        "cpu_system_ms": int(usage.ru_stime * 1000),
+        "peak_rss_kb": peak_rss,
+        "io_read_blocks": usage.ru_inblock,
+        "io_write_blocks": usage.ru_oublock,
+    }
+
+
+class Helper:
+    """要求を読み、子プロセスを起動して出力と終了コードを返す."""
+    
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.processes = {}
+    
+    def send(self, message):
+        line = (json.dumps(message) + "\n").encode("utf-8")
+        with self.lock:
+            self.writer.write(line)
+            self.writer.flush()
+    
+    def run(self):
+        for line in self.reader:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            request_id = request["id"]
+            process = self.processes.get(request_id)
+            if "argv" in request:
+                self.spawn(request_id, request)
+            elif process is None:
+                continue
+            elif request.get("kill"):
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+            elif "input" in request:
+                threading.Thread(
+                    target=self.write_input,
+                    args=(process, base64.b64decode(request["input"])),
+                    daemon=True,
+                ).start()
+        # サーバーが終了したら残っている子プロセスも終了させる
+        for process in list(self.processes.values()):
+            try:
+                process.kill()
+            except OSError:
+                pass
+    
+    def spawn(self, request_id, request):
+        try:
+            process = subprocess.Popen(
+                request["argv"],
+                cwd=request.get("cwd"),
+                env=request.get("env"),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                preexec_fn=limit_process(request.get("limits")),
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            # SubprocessErrorはpreexec_fn（資源制限の設定）が失敗した場合
+            error = getattr(e, "strerror", None) or str(e)
+            self.send({"id": request_id, "error": error, "errno": getattr(e, "errno", None)})
+            return
+        self.processes[request_id] = process
+        self.send({"id": request_id, "pid": process.pid})
+        pumps = [
+            threading.Thread(target=self.pump, args=(request_id, process.stdout, "stdout"), daemon=True),
+            threading.Thread(target=self.pump, args=(request_id, process.stderr, "stderr"), daemon=True),
+        ]
+        for pump in pumps:
+            pump.start()
+        threading.Thread(target=self.wait, args=(request_id, process, pumps), daemon=True).start()
+    
+    def write_input(self, process, data):
+        try:
+            if data:
+                process.stdin.write(data)
+            process.stdin.close()
+        except (OSError, ValueError):
+            pass
+    
+    def pump(self, request_id, stream, name):
+        for chunk in iter(lambda: stream.read1(65536), b""):
+            self.send({"id": request_id, "stream": name, "data": base64.b64encode(chunk).decode("ascii")})
+    
+    def wait(self, request_id, process, pumps):
+        for pump in pumps:
+            pump.join()
+        # 終了コードと一緒に子プロセス（と子プロセスが回収した子孫）の資源使用量を回収する
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # kill()の直前のpoll()で回収済みの場合
+            returncode, usage = process.wait(), None
+        else:
+            returncode = process.returncode = os.waitstatus_to_exitcode(status)
+        self.processes.pop(request_id, None)
+        self.send({
+            "id": request_id,
+            "exit": returncode,
+            "usage": describe_usage(usage) if usage is not None else None,
+        })
+
+
+if __name__ == "__main__":
+    Helper(sys.stdin.buffer, sys.stdout.buffer).run()
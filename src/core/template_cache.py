@@ -0,0 +1,342 @@
+"""URLテンプレートのディスクキャッシュ."""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.core.settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCacheEntry(BaseModel):
+    """キャッシュ済みテンプレートのメタデータ."""
+    
+    url: str = Field(description="テンプレートのURL")
+    filename: str = Field(description="作業ディレクトリに配置するファイル名")
+    sha256: str = Field(description="ファイル内容のSHA-256")
+    size_bytes: int = Field(description="ファイルサイズ（バイト単位）")
+    etag: Optional[str] = Field(default=None, description="サーバーが返したETag")
+    last_modified: Optional[str] = Field(default=None, description="サーバーが返したLast-Modified")
+    fetched_at: float = Field(description="最後に取得または再検証した時刻（UNIX秒）")
+    last_used_at: float = Field(description="最後に使用した時刻（UNIX秒）")
+
+
+class TemplateCache:
+    """
+    URLをキーとするテンプレートファイルのディスクキャッシュ.
+    
+    特徴:
+    - ttl秒以内のエントリはネットワークにアクセスせずに再利用する
+    - ttl経過後はETag/Last-Modifiedによる条件付きGETで再検証する
+    - エントリごとにSHA-256を保持し、破損したファイルは使用しない
+    - 合計サイズがmax_bytesを超えると最終使用時刻の古い順に削除する
+    - 作業ディレクトリにはハードリンクで配置する（コピーしない）
+    """
+    
+    # プロセス内で検証済みのファイル: パス -> (mtime_ns, サイズ)
+    _verified: Dict[str, Tuple[int, int]] = {}
+    
+    def __init__(
+        self,
+        cache_dir: Path,
+        ttl: float = 300.0,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            cache_dir: キャッシュディレクトリのパス
+            ttl: 再検証なしで使用できる秒数
+            max_bytes: キャッシュの合計サイズ上限（バイト）
+            clock: 現在時刻（UNIX秒）を返す関数
+        """
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+    
+    @classmethod
+    def from_environment(cls, settings: Optional[Settings] = None) -> Optional["TemplateCache"]:
+        """
+        設定からキャッシュを生成する.
+        
+        設定（環境変数）:
+        - template_cache_dir (QUARTO_TEMPLATE_CACHE_DIR): キャッシュディレクトリ（offで無効化）
+        - template_cache_ttl (QUARTO_TEMPLATE_CACHE_TTL): 再検証なしで使用できる秒数（デフォルト: 300）
+        - template_cache_max_bytes (QUARTO_TEMPLATE_CACHE_MAX_BYTES): 合計サイズ上限（デフォルト: 2GiB）
+        
+        Args:
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            
+        Returns:
+            キャッシュが有効な場合はインスタンス、無効な場合はNone
+        """
+        if settings is None:
+            settings = get_settings()
+        if settings.template_cache_dir is None:
+            return None
+        
+        return cls(
+            Path(settings.template_cache_dir),
+            ttl=settings.template_cache_ttl,
+            max_bytes=settings.template_cache_max_bytes,
+        )
+    
+    @staticmethod
+    def make_key(url: str) -> str:
+        """URLからキャッシュキー（SHA-256）を計算する."""
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+    
+    def _data_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.pptx"
+    
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+    
+    def lookup(self, url: str) -> Optional[TemplateCacheEntry]:
+        """
+        URLに対応するキャッシュエントリを返す.
+        
+        ファイルが存在しない、サイズが一致しない、またはSHA-256が一致しない
+        エントリは削除してNoneを返す. SHA-256の検証はファイルが変更されない
+        限りプロセス内で1回だけ行う. 検証でファイル全体を読むため、
+        イベントループからはasyncio.to_threadで呼び出す.
+        
+        Args:
+            url: テンプレートのURL
+            
+        Returns:
+            有効なエントリ、またはNone
+        """
+        key = self.make_key(url)
+        entry = self._read_meta(self._meta_path(key))
+        if entry is None or entry.url != url:
+            return None
+        
+        data_path = self._data_path(key)
+        try:
+            stat = data_path.stat()
+        except FileNotFoundError:
+            self._remove(key)
+            return None
+        
+        if stat.st_size != entry.size_bytes:
+            logger.warning(f"Template cache entry has unexpected size, discarding: {url}")
+            self._remove(key)
+            return None
+        
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._verified.get(str(data_path)) != signature:
+            if self._file_digest(data_path) != entry.sha256:
+                logger.warning(f"Template cache entry failed SHA-256 check, discarding: {url}")
+                self._remove(key)
+                return None
+            self._verified[str(data_path)] = signature
+        
+        return entry
+    
+    def is_fresh(self, entry: TemplateCacheEntry) -> bool:
+        """エントリが再検証なしで使用できるかどうかを返す."""
+        return self._clock() - entry.fetched_at < self.ttl
+    
+    @staticmethod
+    def conditional_headers(entry: Optional[TemplateCacheEntry]) -> Dict[str, str]:
+        """
+        再検証用の条件付きリクエストヘッダーを返す.
+        
+        Args:
+            entry: キャッシュエントリ（Noneの場合は空）
+            
+        Returns:
+            If-None-Match / If-Modified-Since ヘッダー
+        """
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+    
+    def staging_path(self) -> Path:
+        """
+        ダウンロード中のファイルを書き込む一時パスを返す.
+        
+        キャッシュと同じファイルシステム上に作成するため、storeでの配置は
+        リネームだけで完了する. 呼び出し側は失敗時に削除すること.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=self.cache_dir, prefix=".download_", suffix=".pptx")
+        os.close(fd)
+        return Path(name)
+    
+    def store(
+        self,
+        url: str,
+        filename: str,
+        staged_path: Path,
+        sha256: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> TemplateCacheEntry:
+        """
+        ダウンロード済みのファイルをキャッシュに登録する.
+        
+        Args:
+            url: テンプレートのURL
+            filename: 作業ディレクトリに配置するファイル名
+            staged_path: staging_pathに書き込んだファイル
+            sha256: ファイル内容のSHA-256
+            etag: レスポンスのETag
+            last_modified: レスポンスのLast-Modified
+            
+        Returns:
+            登録したエントリ
+        """
+        key = self.make_key(url)
+        data_path = self._data_path(key)
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged_path, data_path)
+        
+        stat = data_path.stat()
+        self._verified[str(data_path)] = (stat.st_mtime_ns, stat.st_size)
+        
+        now = self._clock()
+        entry = TemplateCacheEntry(
+            url=url,
+            filename=filename,
+            sha256=sha256,
+            size_bytes=stat.st_size,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=now,
+            last_used_at=now,
+        )
+        self._write_meta(key, entry)
+        self._evict(keep=key)
+        return entry
+    
+    def mark_revalidated(
+        self,
+        entry: TemplateCacheEntry,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> TemplateCacheEntry:
+        """
+        304 Not Modifiedを受け取ったエントリの取得時刻を更新する.
+        
+        Args:
+            entry: 再検証したエントリ
+            etag: レスポンスのETag（あれば更新）
+            last_modified: レスポンスのLast-Modified（あれば更新）
+            
+        Returns:
+            更新したエントリ
+        """
+        entry = entry.model_copy(update={
+            "etag": etag or entry.etag,
+            "last_modified": last_modified or entry.last_modified,
+            "fetched_at": self._clock(),
+        })
+        self._write_meta(self.make_key(entry.url), entry)
+        return entry
+    
+    def materialize(self, entry: TemplateCacheEntry, workspace: Path) -> Path:
+        """
+        キャッシュ済みファイルを作業ディレクトリに配置する.
+        
+        ハードリンクを作成し、別のファイルシステムなどでリンクできない場合は
+        作業ディレクトリにコピーする. キャッシュ側のファイルは置き換え時に
+        リネームされるため、リンク先の内容が途中で変わることはない.
+        コピーすることがあるため、イベントループからはasyncio.to_threadで呼び出す.
+        
+        Args:
+            entry: キャッシュエントリ
+            workspace: 一時作業ディレクトリ
+            
+        Returns:
+            テンプレートファイルのパス
+        """
+        key = self.make_key(entry.url)
+        data_path = self._data_path(key)
+        self._write_meta(key, entry.model_copy(update={"last_used_at": self._clock()}))
+        
+        target = workspace / entry.filename
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(data_path, target)
+        except OSError as e:
+            # キャッシュ内のファイルは追い出しや再取得で置き換わるため、そのまま参照させない
+            logger.debug(f"Hard link into workspace failed, copying instead: {e}")
+            shutil.copy2(data_path, target)
+        return target
+    
+    def total_bytes(self) -> int:
+        """キャッシュ内のテンプレートの合計サイズを返す."""
+        return sum(entry.size_bytes for _, entry in self._entries())
+    
+    def _entries(self):
+        """(キー, エントリ) をすべて列挙する."""
+        if not self.cache_dir.exists():
+            return
+        for meta_path in self.cache_dir.glob("*/*.json"):
+            entry = self._read_meta(meta_path)
+            if entry is not None:
+                yield meta_path.stem, entry
+    
+    def _evict(self, keep: str) -> None:
+        """合計サイズが上限を超えている間、最終使用時刻の古いエントリから削除する."""
+        entries = sorted(self._entries(), key=lambda item: item[1].last_used_at)
+        total = sum(entry.size_bytes for _, entry in entries)
+        for key, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            logger.info(f"Evicting template from cache: {entry.url}")
+            self._remove(key)
+            total -= entry.size_bytes
+    
+    def _remove(self, key: str) -> None:
+        data_path = self._data_path(key)
+        self._verified.pop(str(data_path), None)
+        data_path.unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+    
+    @staticmethod
+    def _read_meta(meta_path: Path) -> Optional[TemplateCacheEntry]:
+        try:
+            return TemplateCacheEntry.model_validate_json(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValidationError, ValueError):
+            return None
+    
+    def _write_meta(self, key: str, entry: TemplateCacheEntry) -> None:
+        """メタデータを一時ファイル経由で書き込む."""
+        meta_path = self._meta_path(key)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=meta_path.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(entry.model_dump_json())
+            os.replace(tmp_name, meta_path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+    
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
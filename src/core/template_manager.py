@@ -1,11 +1,21 @@
 """PowerPointテンプレート管理とHTTP/HTTPSダウンロード対応."""
 
+import asyncio
+import hashlib
+import os
 import re
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from urllib.parse import urlparse
 import httpx
-import yaml
+
+from src.core.http_client import get_shared_http_client
+from src.core.settings import Settings, get_settings
+from src.core.singleflight import SingleFlight
+from src.core.template_cache import TemplateCache, TemplateCacheEntry
+from src.core.template_registry import get_template_registry
 
 
 class TemplateError(Exception):
@@ -38,6 +48,20 @@ class InvalidTemplateUrlError(TemplateError):
     pass
 
 
+# 同じURLの同時ダウンロードを1回の転送にまとめる（プロセス内で共有）
+_download_flight = SingleFlight()
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """ファイルをハードリンクで配置する. リンクできない場合はコピーする."""
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
 class TemplateManager:
     """
     PowerPointテンプレートの管理と解決を担当するクラス.
@@ -48,48 +72,37 @@ class TemplateManager:
     def __init__(
         self, 
         config_path: Optional[Path] = None,
-        download_timeout: int = 600,  # デフォルト10分（600秒）
+        download_timeout: Optional[int] = None,
         max_download_size: int = 50 * 1024 * 1024,  # 50MB
+        template_cache: Optional[TemplateCache] = None,
+        settings: Optional[Settings] = None,
     ):
         """
         Args:
-            config_path: テンプレート設定ファイルのパス
-            download_timeout: URLダウンロードのタイムアウト秒数
+            config_path: テンプレート設定ファイルのパス（プロセス共有のレジストリで読み込む）
+            download_timeout: URLダウンロードのタイムアウト秒数（省略時は設定のtemplate_download_timeout）
             max_download_size: ダウンロード可能な最大ファイルサイズ（バイト）
+            template_cache: URLテンプレートのキャッシュ（省略時は設定から生成）
+            settings: 使用する設定（省略時はプロセス共有の設定）
         """
-        import os
-        # 環境変数QUARTO_TEMPLATE_DOWNLOAD_TIMEOUTがあれば優先
-        env_dl_timeout = os.environ.get("QUARTO_TEMPLATE_DOWNLOAD_TIMEOUT")
-        if env_dl_timeout is not None:
-            try:
-                download_timeout = int(env_dl_timeout)
-            except ValueError:
-                pass  # 不正な値は無視してデフォルト/引数を使う
+        if settings is None:
+            settings = get_settings()
+        if download_timeout is None:
+            download_timeout = settings.template_download_timeout
         self.config_path = config_path
-        self.templates: Dict[str, str] = {}
         self.download_timeout = download_timeout
         self.max_download_size = max_download_size
+        self.template_cache = template_cache if template_cache is not None else TemplateCache.from_environment(settings)
         
-        # 設定ファイルが存在する場合は読み込む
-        if config_path and config_path.exists():
-            self._load_templates()
+        # テンプレート設定はプロセス共有のレジストリから参照する（変更時のみ再読み込み）
+        self.registry = get_template_registry(config_path) if config_path else None
     
-    def _load_templates(self) -> None:
-        """設定ファイルからテンプレート情報を読み込む."""
-        if not self.config_path:
-            return
-            
-        try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-                
-            if config and 'templates' in config:
-                for template_id, template_info in config['templates'].items():
-                    if 'path' in template_info:
-                        self.templates[template_id] = template_info['path']
-        except Exception as e:
-            # 設定ファイルの読み込みエラーは警告として扱い、継続
-            pass
+    @property
+    def templates(self) -> Dict[str, str]:
+        """テンプレートIDからファイルパスへの対応."""
+        if self.registry is None:
+            return {}
+        return self.registry.template_paths()
     
     async def resolve_template(
         self, 
@@ -168,6 +181,11 @@ class TemplateManager:
         """
         URLからテンプレートをダウンロードする.
         
+        テンプレートキャッシュが有効な場合は、キャッシュ済みのファイルを
+        作業ディレクトリにハードリンクで配置する. TTLを過ぎたエントリは
+        条件付きGETで再検証し、304の場合はダウンロードしない.
+        同じURLへの同時リクエストは1回の転送にまとめ、結果を共有する.
+        
         Args:
             url: テンプレートファイルのURL
             temp_dir: ダウンロード先の一時ディレクトリ
@@ -191,41 +209,152 @@ class TemplateManager:
         if not filename:
             filename = "template.pptx"
         
-        download_path = temp_dir / filename
+        if self.template_cache is None:
+            # キャッシュ無効時も同時ダウンロードは1回にまとめ、共有ファイルを各作業ディレクトリに配置する
+            download_path = temp_dir / filename
+            async with _download_flight.shared(
+                ("download", url),
+                lambda: self._download_to_shared_dir(url, filename),
+                cleanup=lambda shared_path: shutil.rmtree(shared_path.parent, ignore_errors=True),
+            ) as shared_path:
+                _link_or_copy(shared_path, download_path)
+            return str(download_path.absolute())
         
+        cache = self.template_cache
+        # 初回のSHA-256検証は数十MBを読むため、イベントループを止めないようスレッドで行う
+        entry = await asyncio.to_thread(cache.lookup, url)
+        if entry is None or not cache.is_fresh(entry):
+            entry = await _download_flight.do(
+                ("cache", str(cache.cache_dir), url),
+                lambda: self._refresh_cached_template(url, filename),
+            )
+        
+        path = await asyncio.to_thread(cache.materialize, entry, temp_dir)
+        return str(path.absolute())
+    
+    async def _refresh_cached_template(self, url: str, filename: str) -> TemplateCacheEntry:
+        """
+        キャッシュのエントリを取得または再検証する.
+        
+        Args:
+            url: テンプレートファイルのURL
+            filename: 作業ディレクトリに配置するファイル名
+            
+        Returns:
+            最新のキャッシュエントリ
+            
+        Raises:
+            TemplateDownloadError: 条件なしのGETに304が返った場合
+        """
+        cache = self.template_cache
+        entry = await asyncio.to_thread(cache.lookup, url)
+        if entry is not None and cache.is_fresh(entry):
+            return entry
+        
+        staged_path = cache.staging_path()
         try:
-            async with httpx.AsyncClient(timeout=self.download_timeout) as client:
-                # HEADリクエストでファイルサイズをチェック
-                try:
-                    head_response = await client.head(url, follow_redirects=True)
-                    content_length = head_response.headers.get('content-length')
-                    if content_length and int(content_length) > self.max_download_size:
-                        raise TemplateSizeExceededError(
-                            f"Template file size ({int(content_length)} bytes) exceeds "
-                            f"maximum allowed size ({self.max_download_size} bytes)"
-                        )
-                except httpx.HTTPStatusError:
-                    # HEADリクエストがサポートされていない場合は続行
-                    pass
-                
-                # ファイルをダウンロード
-                async with client.stream('GET', url, follow_redirects=True) as response:
-                    response.raise_for_status()
-                    
-                    # ストリーミングダウンロードでサイズを監視
-                    downloaded_size = 0
-                    with open(download_path, 'wb') as f:
-                        async for chunk in response.aiter_bytes(chunk_size=8192):
-                            downloaded_size += len(chunk)
-                            if downloaded_size > self.max_download_size:
-                                raise TemplateSizeExceededError(
-                                    f"Template file size exceeds maximum allowed size "
-                                    f"({self.max_download_size} bytes)"
-                                )
-                            f.write(chunk)
+            status, headers, digest = await self._fetch(
+                url, staged_path, headers=cache.conditional_headers(entry)
+            )
+            if status == 304:
+                if entry is None:
+                    # 条件を付けていないので、304には登録できる内容がない
+                    raise TemplateDownloadError(
+                        f"Unexpected 304 Not Modified for unconditional request: {url}"
+                    )
+                return cache.mark_revalidated(
+                    entry, headers.get("etag"), headers.get("last-modified")
+                )
+            return cache.store(
+                url,
+                filename,
+                staged_path,
+                digest,
+                etag=headers.get("etag"),
+                last_modified=headers.get("last-modified"),
+            )
+        finally:
+            staged_path.unlink(missing_ok=True)
+    
+    async def _download_to_shared_dir(self, url: str, filename: str) -> Path:
+        """
+        キャッシュ無効時に、同時リクエストで共有する一時ディレクトリへダウンロードする.
+        
+        Args:
+            url: テンプレートファイルのURL
+            filename: 保存するファイル名
             
-            return str(download_path.absolute())
+        Returns:
+            ダウンロードしたファイルのパス
+        """
+        shared_dir = Path(tempfile.mkdtemp(prefix="quarto_mcp_template_"))
+        try:
+            await self._fetch(url, shared_dir / filename)
+        except BaseException:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+            raise
+        return shared_dir / filename
+    
+    async def _fetch(
+        self,
+        url: str,
+        destination: Path,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, httpx.Headers, Optional[str]]:
+        """
+        URLの内容をストリーミングでファイルに書き込む.
+        
+        サーバー共有のHTTPクライアントを使うため、同じホストへの接続は
+        keep-aliveで再利用される. サイズ制限はGETレスポンスのContent-Lengthと
+        受信済みのバイト数で判定する（HEADリクエストは送らない）.
+        
+        Args:
+            url: テンプレートファイルのURL
+            destination: 書き込み先のパス
+            headers: 追加のリクエストヘッダー（条件付きGET用）
             
+        Returns:
+            (ステータスコード, レスポンスヘッダー, 内容のSHA-256)
+            304の場合はファイルを書き込まず、SHA-256はNone
+            
+        Raises:
+            TemplateDownloadTimeoutError: ダウンロードタイムアウト
+            TemplateSizeExceededError: ファイルサイズが制限超過
+            TemplateDownloadError: ダウンロード失敗
+        """
+        client = get_shared_http_client()
+        try:
+            async with client.stream(
+                'GET', url, headers=headers, timeout=self.download_timeout
+            ) as response:
+                if response.status_code == 304:
+                    return 304, response.headers, None
+                response.raise_for_status()
+                
+                # 本文を受信する前に宣言されたサイズをチェック
+                content_length = response.headers.get('content-length')
+                if content_length and content_length.isdigit() and int(content_length) > self.max_download_size:
+                    raise TemplateSizeExceededError(
+                        f"Template file size ({int(content_length)} bytes) exceeds "
+                        f"maximum allowed size ({self.max_download_size} bytes)"
+                    )
+                
+                # ストリーミングダウンロードでサイズを監視
+                downloaded_size = 0
+                digest = hashlib.sha256()
+                with open(destination, 'wb') as f:
+                    async for chunk in response.aiter_bytes(chunk_size=65536):
+                        downloaded_size += len(chunk)
+                        if downloaded_size > self.max_download_size:
+                            raise TemplateSizeExceededError(
+                                f"Template file size exceeds maximum allowed size "
+                                f"({self.max_download_size} bytes)"
+                            )
+                        digest.update(chunk)
+                        f.write(chunk)
+                
+                return response.status_code, response.headers, digest.hexdigest()
+        
         except httpx.TimeoutException as e:
             raise TemplateDownloadTimeoutError(
                 f"Template download timed out after {self.download_timeout} seconds: {url}"
@@ -273,6 +402,6 @@ class TemplateManager:
                 raise InvalidTemplateUrlError(
                     "URL must point to a .pptx file"
                 )
-                
+        
         except ValueError as e:
             raise InvalidTemplateUrlError(f"Invalid URL format: {url}") from e
@@ -0,0 +1,269 @@
+"""テンプレート設定ファイルのプロセス共有レジストリ."""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import yaml
+
+from src.core.settings import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateInfo:
+    """登録済みテンプレートの情報."""
+    
+    def __init__(
+        self,
+        template_id: str,
+        path: str,
+        description: str = "",
+        size_bytes: Optional[int] = None,
+        mtime_ns: Optional[int] = None,
+        sha256: Optional[str] = None,
+    ):
+        """
+        Args:
+            template_id: テンプレートID
+            path: テンプレートファイルのパス
+            description: 説明文
+            size_bytes: ファイルサイズ（ファイルが存在しない場合はNone）
+            mtime_ns: 更新時刻（ナノ秒）
+            sha256: ファイル内容のSHA-256（未計算の場合はNone）
+        """
+        self.template_id = template_id
+        self.path = path
+        self.description = description
+        self.size_bytes = size_bytes
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+    
+    @property
+    def exists(self) -> bool:
+        """読み込み時点でファイルが存在したかどうか."""
+        return self.size_bytes is not None
+    
+    @property
+    def cache_key(self) -> str:
+        """
+        テンプレートの内容を識別するキャッシュキー.
+        
+        SHA-256が計算済みならそれを、未計算ならパス・サイズ・更新時刻から作る.
+        """
+        if self.sha256:
+            return self.sha256
+        return f"{self.path}:{self.size_bytes}:{self.mtime_ns}"
+
+
+class TemplateRegistry:
+    """
+    templates.yamlを1回だけ読み込み、変更時にのみ再読み込みするレジストリ.
+    
+    特徴:
+    - 設定ファイルとテンプレートファイルの更新時刻・サイズをpoll_interval秒ごとに
+      確認し（mtimeポーリング）、変更があった場合だけ再読み込みする
+    - warm()でテンプレートファイルを読み込み、SHA-256を計算すると同時に
+      ページキャッシュに載せる（変更のないファイルは再計算しない）
+    - 再読み込みのたびにversionが増えるため、派生データ（ツール定義など）の
+      キャッシュキーに使える
+    """
+    
+    def __init__(
+        self,
+        config_path: Optional[Path],
+        poll_interval: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            config_path: テンプレート設定ファイルのパス
+            poll_interval: 変更を確認する間隔（秒）
+            clock: 現在時刻（秒）を返す関数
+        """
+        self.config_path = Path(config_path) if config_path else None
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._templates: Dict[str, TemplateInfo] = {}
+        self._signature: Optional[Tuple] = None
+        self._checked_at: Optional[float] = None
+        self.version = 0
+    
+    @property
+    def templates(self) -> Dict[str, TemplateInfo]:
+        """テンプレートIDから情報への対応（必要に応じて再読み込みする）."""
+        self.refresh()
+        return self._templates
+    
+    def template_paths(self) -> Dict[str, str]:
+        """テンプレートIDからファイルパスへの対応を返す."""
+        return {template_id: info.path for template_id, info in self.templates.items()}
+    
+    def get(self, template_id: str) -> Optional[TemplateInfo]:
+        """テンプレートIDに対応する情報を返す."""
+        return self.templates.get(template_id)
+    
+    def refresh(self, force: bool = False) -> bool:
+        """
+        設定ファイルまたはテンプレートファイルが変更されていれば再読み込みする.
+        
+        確認はpoll_interval秒に1回だけ行う.
+        
+        Args:
+            force: 確認間隔に関係なく確認する
+            
+        Returns:
+            再読み込みした場合True
+        """
+        now = self._clock()
+        if not force and self._checked_at is not None and now - self._checked_at < self.poll_interval:
+            return False
+        
+        with self._lock:
+            self._checked_at = now
+            signature = self._current_signature()
+            if signature == self._signature:
+                return False
+            self._load(signature)
+            return True
+    
+    def warm(self) -> None:
+        """
+        テンプレートファイルのSHA-256を計算し、ファイルをページキャッシュに載せる.
+        
+        ファイル全体を読むため、サーバー起動時にスレッドで実行することを想定している.
+        """
+        for info in list(self.templates.values()):
+            if not info.exists or info.sha256:
+                continue
+            try:
+                info.sha256 = _file_digest(Path(info.path))
+            except OSError as e:
+                logger.warning(f"Failed to read template file {info.path}: {e}")
+    
+    def describe(self) -> str:
+        """ツール説明文に追加するテンプレート一覧のテキストを返す."""
+        templates = self.templates
+        if not templates:
+            return ""
+        lines = ["\n\nAvailable template IDs:"]
+        for template_id, info in templates.items():
+            if info.description:
+                lines.append(f"  - {template_id}: {info.description}")
+            else:
+                lines.append(f"  - {template_id}")
+        return "\n".join(lines)
+    
+    def _current_signature(self) -> Optional[Tuple]:
+        """設定ファイルと登録済みテンプレートファイルの (mtime, サイズ) の組を返す."""
+        if self.config_path is None:
+            return None
+        config_stat = _stat(self.config_path)
+        if config_stat is None:
+            return None
+        template_stats = tuple(
+            (info.path, _stat(Path(info.path))) for info in self._templates.values()
+        )
+        return (config_stat, template_stats)
+    
+    def _load(self, signature: Optional[Tuple]) -> None:
+        """設定ファイルを解析して登録内容を更新する."""
+        previous = self._templates
+        templates: Dict[str, TemplateInfo] = {}
+        if self.config_path is not None and self.config_path.exists():
+            try:
+                with open(self.config_path, "r", encoding="utf-8") as f:
+                    config = yaml.safe_load(f)
+                entries = (config or {}).get("templates") or {}
+                for template_id, template_info in entries.items():
+                    if not isinstance(template_info, dict) or "path" not in template_info:
+                        continue
+                    templates[template_id] = self._build_info(
+                        template_id, template_info, previous.get(template_id)
+                    )
+            except Exception as e:
+                # 設定ファイルの読み込みエラーは警告として扱い、以前の内容を維持
+                # （ファイルが再度変更されるまで再解析しない）
+                logger.warning(f"Failed to load template config {self.config_path}: {e}")
+                self._signature = signature
+                return
+        
+        self._templates = templates
+        # テンプレートファイルの一覧が変わったため署名を取り直す
+        self._signature = self._current_signature()
+        self.version += 1
+        logger.info(f"Loaded {len(templates)} templates from {self.config_path} (version {self.version})")
+    
+    @staticmethod
+    def _build_info(template_id: str, template_info: dict, previous: Optional[TemplateInfo]) -> TemplateInfo:
+        """テンプレート情報を作成する. 内容が変わっていなければSHA-256を引き継ぐ."""
+        path = str(template_info["path"])
+        stat = _stat(Path(path))
+        info = TemplateInfo(
+            template_id,
+            path,
+            description=str(template_info.get("description", "") or ""),
+            size_bytes=stat[1] if stat else None,
+            mtime_ns=stat[0] if stat else None,
+        )
+        if (
+            previous is not None
+            and previous.path == info.path
+            and previous.size_bytes == info.size_bytes
+            and previous.mtime_ns == info.mtime_ns
+        ):
+            info.sha256 = previous.sha256
+        return info
+
+
+def _stat(path: Path) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, サイズ) を返す. ファイルがなければNone."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_digest(path: Path) -> str:
+    """ファイルのSHA-256を計算する."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# プロセス内で共有するレジストリ（設定ファイルのパスごと）
+_registries: Dict[str, TemplateRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_template_registry(config_path: Optional[Path]) -> TemplateRegistry:
+    """
+    設定ファイルに対応するプロセス共有のレジストリを返す.
+    
+    Args:
+        config_path: テンプレート設定ファイルのパス
+        
+    Returns:
+        TemplateRegistry
+    """
+    key = str(Path(config_path).resolve()) if config_path else ""
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = TemplateRegistry(
+                Path(key) if key else None,
+                poll_interval=get_settings().template_poll_interval,
+            )
+            _registries[key] = registry
+    return registry
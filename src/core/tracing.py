@@ -0,0 +1,350 @@
+"""レンダリングパイプラインのトレース（OpenTelemetry互換の形式でJSONLに出力する）."""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.core.settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    処理区間を表すスパン.
+    
+    IDはW3C Trace Context / OpenTelemetryと同じ形式
+    （trace_idは32桁、span_idは16桁の16進数）.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            name: スパン名
+            trace_id: トレースID
+            parent_span_id: 親スパンのID（ルートの場合はNone）
+            attributes: 属性
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = "UNSET"
+        self.status_message = ""
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+    
+    @property
+    def duration_ms(self) -> float:
+        """スパンの長さ（ミリ秒、終了前は現在までの長さ）."""
+        end = self.end_time_ns if self.end_time_ns is not None else time.time_ns()
+        return (end - self.start_time_ns) / 1_000_000
+    
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparentヘッダーの値."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        """属性を設定する."""
+        self.attributes[key] = value
+    
+    def set_status(self, status: str, message: str = "") -> None:
+        """ステータス（OK/ERROR）を設定する."""
+        self.status = status
+        self.status_message = message
+    
+    def add_event(self, name: str, **attributes: Any) -> None:
+        """イベントを記録する."""
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes})
+    
+    def record_exception(self, exc: BaseException) -> None:
+        """例外を記録し、ステータスをERRORにする."""
+        self.add_event(
+            "exception",
+            **{"exception.type": type(exc).__name__, "exception.message": str(exc)},
+        )
+        self.set_status("ERROR", str(exc).splitlines()[0] if str(exc) else type(exc).__name__)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Span":
+        """to_dict()の出力からスパンを復元する（ワーカープロセスで記録したスパンの出力用）."""
+        span = cls(data["name"], data["traceId"], data.get("parentSpanId") or None, data.get("attributes"))
+        span.span_id = data["spanId"]
+        span.events = list(data.get("events") or [])
+        span.status = data["status"]["code"]
+        span.status_message = data["status"]["message"]
+        span.start_time_ns = data["startTimeUnixNano"]
+        span.end_time_ns = data["endTimeUnixNano"]
+        return span
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """OTLP/JSONのスパンに準じた辞書を返す."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_time_ns,
+            "endTimeUnixNano": self.end_time_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class InMemorySpanExporter:
+    """終了したスパンをメモリに保持するエクスポーター（テスト用）."""
+    
+    def __init__(self):
+        self.spans: List[Span] = []
+    
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+    
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonlSpanExporter:
+    """
+    終了したスパンをJSONLファイルに追記するエクスポーター.
+    
+    書き込みはバックグラウンドスレッドで行い、イベントループではキューに積むだけにする.
+    """
+    
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: 出力先ファイルのパス
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+    
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+    
+    def shutdown(self) -> None:
+        """キューに残ったスパンを書き出してスレッドを停止する."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+    
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                # キューが空になったときだけフラッシュする
+                if self._queue.empty():
+                    f.flush()
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "quarto_mcp_span", default=None
+)
+
+
+class Tracer:
+    """スパンを生成し、終了時にエクスポーターへ渡すトレーサー."""
+    
+    def __init__(self, exporter: Optional[Any] = None):
+        """
+        Args:
+            exporter: export(span)とshutdown()を持つエクスポーター（Noneの場合は出力しない）
+        """
+        self.exporter = exporter
+    
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        現在のスパンの子としてスパンを開始するコンテキストマネージャー.
+        
+        例外が発生した場合はスパンに記録してから再送出する.
+        
+        Args:
+            name: スパン名
+            **attributes: 属性
+            
+        Yields:
+            Span
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        else:
+            span = Span(name, secrets.token_hex(16), None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_ns = time.time_ns()
+            if span.status == "UNSET":
+                span.status = "OK"
+            self.export(span)
+    
+    def export(self, span: Span) -> None:
+        """終了したスパンをエクスポーターへ渡す."""
+        if self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.debug(f"Failed to export span {span.name}: {e}")
+    
+    def shutdown(self) -> None:
+        """エクスポーターを停止する."""
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    """現在のスパンを返す."""
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    """現在のトレースIDを返す（スパン外ではNone）."""
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def remote_parent(traceparent: Optional[str]) -> Iterator[None]:
+    """
+    別プロセスから渡されたtraceparentを親として、以降のスパンを同じトレースに含める.
+    
+    親スパン自体は出力しない. traceparentが不正な場合は新しいトレースになる.
+    
+    Args:
+        traceparent: W3C traceparentヘッダーの値（Span.traceparent）
+    """
+    parts = (traceparent or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        yield
+        return
+    parent = Span("remote", parts[1])
+    parent.span_id = parts[2]
+    token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+class TraceContextFilter(logging.Filter):
+    """ログレコードに現在のtrace_id/span_idを付与するフィルター."""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def configure_tracing(settings: Optional[Settings] = None) -> Tracer:
+    """
+    設定に従ってトレーサーを構成する.
+    
+    設定（環境変数）:
+    - trace_file (QUARTO_MCP_TRACE_FILE): スパンの出力先
+      （未設定時はログディレクトリのtraces.jsonl、offで出力しない）
+      
+    Args:
+        settings: 使用する設定（省略時はプロセス共有の設定）
+        
+    Returns:
+        構成したTracer
+    """
+    global _tracer
+    
+    if settings is None:
+        settings = get_settings()
+    
+    if settings.trace_file is None:
+        exporter = None
+    else:
+        path = settings.trace_file or os.path.join(settings.log_dir, "traces.jsonl")
+        exporter = JsonlSpanExporter(Path(path))
+    
+    with _tracer_lock:
+        if _tracer is not None:
+            _tracer.shutdown()
+        _tracer = Tracer(exporter)
+        return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """
+    プロセス共有のトレーサーを差し替える.
+    
+    Args:
+        tracer: 使用するトレーサー（Noneの場合は次回get_tracer()で出力なしのトレーサーを作る）
+    """
+    global _tracer
+    
+    with _tracer_lock:
+        _tracer = tracer
+
+
+def get_tracer() -> Tracer:
+    """
+    プロセス共有のトレーサーを返す.
+    
+    configure_tracing()が呼ばれていない場合はスパンを出力しないトレーサーを返す
+    （トレースIDの採番とログへの付与は行われる）.
+    
+    Returns:
+        Tracer
+    """
+    global _tracer
+    
+    tracer = _tracer
+    if tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+            tracer = _tracer
+    return tracer
+
+
+def shutdown_tracing() -> None:
+    """トレーサーを停止し、未出力のスパンを書き出す."""
+    with _tracer_lock:
+        if _tracer is not None:
+            _tracer.shutdown()
+
+
+atexit.register(shutdown_tracing)
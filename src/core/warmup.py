@@ -0,0 +1,131 @@
+"""起動時のQuartoウォームアップ（初回レンダリングのコールドキャッシュ対策）."""
+
+import asyncio
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.models.formats import FORMAT_DEFINITIONS
+
+
+logger = logging.getLogger(__name__)
+
+# ウォームアップ用の文書（Denoのモジュールキャッシュ、pandoc、フォントキャッシュなどを一通り使わせる）
+WARMUP_DOCUMENT = """---
+title: "Warm-up"
+---
+
+# Warm-up
+
+Quarto warm-up document with **bold**, *italic* and `code`.
+
+| a | b |
+|---|---|
+| 1 | 2 |
+"""
+
+
+class QuartoWarmup:
+    """
+    起動時に小さな文書を指定形式でレンダリングし、Quartoのキャッシュを温める.
+    
+    コンテナ起動直後の最初のquarto renderは、Denoのモジュールキャッシュ、pandocの初回起動、
+    TinyTeXのフォントキャッシュ、Chromiumのプロファイル作成などで大きく遅れる.
+    ウォームアップはバックグラウンドで1形式ずつ実行し、その間もリクエストは受け付ける.
+    """
+    
+    IDLE = "idle"
+    RUNNING = "running"
+    READY = "ready"
+    FAILED = "failed"
+    
+    def __init__(self, render: Callable[..., Awaitable[Dict[str, Any]]], formats: List[str]):
+        """
+        Args:
+            render: render()と同じ引数を受け取り結果の辞書を返す非同期関数
+            formats: ウォームアップする出力形式IDのリスト
+        """
+        self.render = render
+        self.formats = list(formats)
+        self.state = self.IDLE if self.formats else self.READY
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.results: Dict[str, Dict[str, Any]] = {
+            format_id: {"state": self.IDLE} for format_id in self.formats
+        }
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def ready(self) -> bool:
+        """ウォームアップが完了したか（一部の形式が失敗した場合も完了とみなす）."""
+        return self.state in (self.READY, self.FAILED)
+    
+    def start(self) -> Optional[asyncio.Task]:
+        """
+        バックグラウンドでウォームアップを開始する.
+        
+        Returns:
+            ウォームアップのタスク（対象の形式がない場合はNone）
+        """
+        if not self.formats or self._task is not None:
+            return self._task
+        self._task = asyncio.create_task(self.run(), name="quarto-warmup")
+        return self._task
+    
+    async def run(self) -> None:
+        """すべての形式を順にレンダリングする."""
+        self.state = self.RUNNING
+        self.started_at = time.time()
+        logger.info(f"Quarto warm-up started: {', '.join(self.formats)}")
+        
+        with tempfile.TemporaryDirectory(prefix="quarto_mcp_warmup_") as temp_dir:
+            for format_id in self.formats:
+                await self._warm(format_id, Path(temp_dir))
+        
+        self.finished_at = time.time()
+        failed = [f for f, r in self.results.items() if r["state"] == self.FAILED]
+        self.state = self.FAILED if failed else self.READY
+        total_ms = int((self.finished_at - self.started_at) * 1000)
+        if failed:
+            logger.warning(f"Quarto warm-up finished in {total_ms}ms; failed formats: {', '.join(failed)}")
+        else:
+            logger.info(f"Quarto warm-up finished in {total_ms}ms")
+    
+    async def _warm(self, format_id: str, temp_dir: Path) -> None:
+        entry = self.results[format_id]
+        entry["state"] = self.RUNNING
+        extension = FORMAT_DEFINITIONS[format_id].extension
+        start = time.perf_counter()
+        try:
+            result = await self.render(
+                content=WARMUP_DOCUMENT,
+                format=format_id,
+                output_filename=str(temp_dir / f"warmup_{format_id}{extension}"),
+            )
+        except Exception as e:
+            result = {"success": False, "error": {"code": "UNKNOWN_ERROR", "message": str(e)}}
+        entry["duration_ms"] = int((time.perf_counter() - start) * 1000)
+        if result.get("success"):
+            entry["state"] = self.READY
+        else:
+            entry["state"] = self.FAILED
+            error = result.get("error") or {}
+            entry["error"] = f"{error.get('code', 'UNKNOWN_ERROR')}: {error.get('message', '')}"
+    
+    def status(self) -> Dict[str, Any]:
+        """ウォームアップの状態を返す."""
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "formats": {format_id: dict(entry) for format_id, entry in self.results.items()},
+        }
+    
+    async def aclose(self) -> None:
+        """実行中のウォームアップを中止する."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,260 @@
+"""レンダリングをワーカープロセスで実行するプール."""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.deadline import Deadline, current_deadline, deadline_scope
+from src.core.latency import LatencyModel
+from src.core.limits import INTERACTIVE, current_lane, lane_scope
+from src.core.logging_setup import configure_worker_logging, forward_worker_logs
+from src.core.renderer import QuartoRenderer
+from src.core.settings import Settings, get_settings, set_settings
+from src.core.spawner import start_spawner
+from src.core.tracing import InMemorySpanExporter, Span, Tracer, current_span, get_tracer, remote_parent, set_tracer
+from src.models.schemas import ErrorInfo, ErrorResponse
+from src.tools.render import render
+
+
+logger = logging.getLogger(__name__)
+
+# ワーカーがキャンセルの通知を確認する間隔（秒）
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class WorkerPool:
+    """
+    レンダリングを複数のワーカープロセスに振り分けるプール.
+    
+    YAMLの解析、正規表現による書き換え、結果のシリアライズなどCPUを使う前処理を
+    サーバープロセスのイベントループから切り離し、コア数に応じて並列化する.
+    ジョブキュー・セッションの集計・スパンとログの出力・Quartoの所要時間の分布は
+    サーバープロセスが持ち、ワーカーはレンダリング1件ごとに結果と記録したスパン、
+    Quartoの所要時間の実測を返す.
+    テンプレートとダイアグラムのキャッシュはディスク上で全プロセスが共有する.
+    
+    ワーカーが異常終了した場合は、実行中だったレンダリングをWORKER_CRASHEDとして
+    失敗させ、プールを作り直す（サーバーは停止しない）.
+    
+    呼び出しがキャンセルされた場合は、レンダリングごとのイベントでワーカーに通知し、
+    ワーカーはレンダリングのタスクをキャンセルしてQuartoのプロセスを終了させる.
+    """
+    
+    def __init__(
+        self,
+        workers: int,
+        config_path: Optional[Path] = None,
+        settings: Optional[Settings] = None,
+        latency: Optional[LatencyModel] = None,
+    ):
+        """
+        Args:
+            workers: ワーカープロセス数
+            config_path: テンプレート設定ファイルのパス
+            settings: ワーカーに引き継ぐ設定（省略時はプロセス共有の設定）
+            latency: ワーカーから返ったQuartoの所要時間を記録する分布
+        """
+        self.workers = workers
+        self.config_path = config_path
+        self.settings = settings if settings is not None else get_settings()
+        self.latency = latency
+        # スレッドを持つ親プロセスをforkしないようにspawnで起動する
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._log_queue = self._mp_context.Queue()
+        self._log_listener = forward_worker_logs(self._log_queue)
+        # キャンセルの通知に使うイベントはspawnしたワーカーにも渡せるようマネージャーで作る
+        self._manager = self._mp_context.Manager()
+        self._executor = self._create_executor()
+        self.metrics: Dict[str, int] = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "crashed": 0,
+            "restarts": 0,
+            "active": 0,
+        }
+    
+    @classmethod
+    def from_settings(
+        cls,
+        config_path: Optional[Path] = None,
+        settings: Optional[Settings] = None,
+        latency: Optional[LatencyModel] = None,
+    ) -> Optional["WorkerPool"]:
+        """
+        設定からワーカープールを生成する.
+        
+        設定（環境変数）:
+        - render_workers (QUARTO_MCP_WORKERS): ワーカープロセス数（0の場合は使わない）
+        
+        Args:
+            config_path: テンプレート設定ファイルのパス
+            settings: 使用する設定（省略時はプロセス共有の設定）
+            latency: ワーカーから返ったQuartoの所要時間を記録する分布
+            
+        Returns:
+            WorkerPool（ワーカー数が0の場合はNone）
+        """
+        if settings is None:
+            settings = get_settings()
+        if settings.render_workers <= 0:
+            return None
+        return cls(settings.render_workers, config_path=config_path, settings=settings, latency=latency)
+    
+    async def render(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ワーカープロセスでレンダリングを実行する.
+        
+        キャンセルされた場合はワーカーにも通知し、実行中のQuartoを終了させてから
+        CancelledErrorを送出する（ワーカーの終了は待たない）.
+        
+        Args:
+            request: render()の引数（content, format, output_filenameなど）
+            
+        Returns:
+            変換結果（成功時はRenderResult、失敗時はErrorResponseの辞書）
+        """
+        span = current_span()
+        traceparent = span.traceparent if span is not None else None
+        # 期限はUNIX時間のままワーカーに渡し、ワーカーでもQuartoのタイムアウトを切り詰める
+        deadline = current_deadline()
+        budget = (deadline.at, deadline.budget) if deadline is not None else None
+        # 子プロセスの優先度を決めるレーンもワーカーに引き継ぐ
+        lane = current_lane()
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        cancel = await asyncio.to_thread(self._manager.Event)
+        
+        self.metrics["submitted"] += 1
+        self.metrics["active"] += 1
+        try:
+            result, spans, samples = await loop.run_in_executor(
+                executor, _render_in_worker, request, traceparent, budget, lane, cancel
+            )
+        except asyncio.CancelledError:
+            # 実行器のfutureを取り消すだけではワーカーのQuartoが走り続ける
+            await asyncio.shield(asyncio.to_thread(cancel.set))
+            raise
+        except BrokenProcessPool:
+            self.metrics["crashed"] += 1
+            logger.error("Render worker process exited unexpectedly; restarting the worker pool")
+            self._restart(executor)
+            return ErrorResponse(
+                error=ErrorInfo(
+                    code="WORKER_CRASHED",
+                    message="The render worker process exited unexpectedly",
+                    details="The worker pool was restarted. Submit the render again.",
+                )
+            ).model_dump()
+        finally:
+            self.metrics["active"] -= 1
+        
+        # ワーカーで記録したスパンはサーバープロセスのトレーサーから出力する
+        tracer = get_tracer()
+        for data in spans:
+            tracer.export(Span.from_dict(data))
+        # Quartoの所要時間はサーバープロセスの分布に記録し、受け付けの推定とタイムアウトに使う
+        if self.latency is not None:
+            for sample in samples:
+                self.latency.record(*sample)
+        self.metrics["succeeded" if result.get("success") else "failed"] += 1
+        return result
+    
+    def stats(self) -> Dict[str, int]:
+        """ワーカー数と処理件数を返す."""
+        return {"workers": self.workers, **self.metrics}
+    
+    async def aclose(self) -> None:
+        """ワーカープロセスを停止する（実行中のレンダリングの終了を待つ）."""
+        await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+        self._manager.shutdown()
+        self._log_listener.stop()
+        self._log_queue.close()
+    
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._mp_context,
+            initializer=_init_worker,
+            initargs=(self.settings, self.config_path, self._log_queue),
+        )
+    
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """壊れたプールを新しいプールに置き換える（同時に失敗した呼び出しからは1回だけ）."""
+        if self._executor is not broken:
+            return
+        self._executor = self._create_executor()
+        self.metrics["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+class _WorkerState:
+    """ワーカープロセス内で使い回すイベントループとレンダラー."""
+    
+    def __init__(self, config_path: Optional[Path], settings: Settings):
+        # 共有HTTPクライアントなどはループに紐づくため、ループは1つを使い続ける
+        self.loop = asyncio.new_event_loop()
+        # Quartoの起動と資源使用量（wait4）の回収はワーカーごとのスポナーに任せる
+        if settings.spawner_enabled:
+            self.loop.run_until_complete(start_spawner())
+        self.renderer = QuartoRenderer(config_path=config_path, settings=settings)
+        self.loop.run_until_complete(self.renderer.launcher.resolve())
+        self.renderer.latency.journal = []
+        self.exporter = InMemorySpanExporter()
+        set_tracer(Tracer(self.exporter))
+
+
+_worker: Optional[_WorkerState] = None
+
+
+def _init_worker(settings: Settings, config_path: Optional[Path], log_queue: Any) -> None:
+    """ワーカープロセスの初期化（親プロセスの設定とログ出力先を引き継ぐ）."""
+    global _worker
+    
+    set_settings(settings)
+    configure_worker_logging(log_queue, settings)
+    _worker = _WorkerState(config_path, settings)
+
+
+def _render_in_worker(
+    request: Dict[str, Any],
+    traceparent: Optional[str],
+    budget: Optional[Tuple[float, float]] = None,
+    lane: str = INTERACTIVE,
+    cancel: Any = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, float, int, int]]]:
+    """
+    ワーカープロセスでレンダリングを1件実行し、結果と記録したスパン、Quartoの所要時間の実測を返す.
+    
+    cancelのイベントがセットされた場合はレンダリングのタスクをキャンセルする
+    （_execute_quartoがQuartoのプロセスを終了させ、CancelledErrorが送出される）.
+    """
+    state = _worker
+    deadline = Deadline(*budget) if budget is not None else None
+    
+    async def run() -> Dict[str, Any]:
+        with remote_parent(traceparent), deadline_scope(deadline), lane_scope(lane):
+            return await render(**request, renderer=state.renderer)
+    
+    async def watch() -> Dict[str, Any]:
+        task = asyncio.ensure_future(run())
+        if cancel is None:
+            return await task
+        while not task.done():
+            if cancel.is_set():
+                task.cancel()
+                break
+            await asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL)
+        return await task
+    
+    journal = state.renderer.latency.journal
+    try:
+        result = state.loop.run_until_complete(watch())
+        return result, [span.to_dict() for span in state.exporter.spans], list(journal)
+    finally:
+        state.exporter.spans.clear()
+        journal.clear()
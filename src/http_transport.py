@@ -0,0 +1,133 @@
+"""Streamable HTTPトランスポート（1プロセスで複数のMCPセッションを扱う）."""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from mcp.server import Server
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+from src.core.sessions import SessionRegistry
+from src.core.settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+MCP_SESSION_ID_HEADER = b"mcp-session-id"
+
+
+class HttpTransport:
+    """
+    MCPのStreamable HTTPトランスポート.
+    
+    すべてのセッションが同じServerインスタンス（とAppContext）を使うため、
+    テンプレートキャッシュ・ダイアグラムキャッシュ・ジョブキュー・HTTP接続プールは
+    セッション間で共有される. stdioトランスポートと同じイベントループで同時に動かせる.
+    
+    特徴:
+    - 同時に開けるセッション数を制限し、超過時はRetry-After付きの503を返す
+    - セッションの開始・終了をSessionRegistryに記録し、セッションごとに利用状況を集計する
+    """
+    
+    def __init__(self, server: Server, sessions: SessionRegistry, settings: Optional[Settings] = None):
+        """
+        Args:
+            server: MCPサーバー
+            sessions: セッションの集計先
+            settings: 使用する設定（省略時はプロセス共有の設定）
+        """
+        if settings is None:
+            settings = get_settings()
+        self.host = settings.server_host
+        self.port = settings.server_port
+        self.path = settings.server_path
+        self.max_sessions = settings.server_max_sessions
+        self.sessions = sessions
+        self.manager = StreamableHTTPSessionManager(
+            app=server,
+            session_idle_timeout=settings.server_session_idle_timeout,
+        )
+        self._uvicorn: Optional[Any] = None
+    
+    async def serve(self) -> None:
+        """HTTPサーバーを起動し、stop()が呼ばれるまで待ち受ける."""
+        import uvicorn
+        
+        # ログはサーバー全体の設定（キュー経由の出力）に任せる
+        config = uvicorn.Config(self, host=self.host, port=self.port, lifespan="off", log_config=None)
+        self._uvicorn = uvicorn.Server(config)
+        logger.info(f"Serving MCP over HTTP at http://{self.host}:{self.port}{self.path}")
+        async with self.manager.run():
+            await self._uvicorn.serve()
+    
+    def stop(self) -> None:
+        """待ち受けを終了する."""
+        if self._uvicorn is not None:
+            self._uvicorn.should_exit = True
+    
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        """ASGIアプリケーション."""
+        if scope["type"] != "http":
+            return
+        if (scope["path"].rstrip("/") or "/") != self.path:
+            await _send_json(send, 404, {"error": "Not found"})
+            return
+        
+        session_id = _header(scope, MCP_SESSION_ID_HEADER)
+        method = scope["method"]
+        
+        if session_id is None and method == "POST":
+            # 新しいセッションの開始要求
+            self.sessions.expire_idle()
+            if self.sessions.count("http") >= self.max_sessions:
+                logger.warning(f"Refusing new MCP session: {self.max_sessions} sessions are already open")
+                await _send_json(
+                    send,
+                    503,
+                    {
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": {"code": -32000, "message": "Too many open sessions"},
+                    },
+                    extra_headers=[(b"retry-after", b"5")],
+                )
+                return
+            send = self._register_new_session(send)
+        
+        await self.manager.handle_request(scope, receive, send)
+        
+        if method == "DELETE" and session_id is not None:
+            self.sessions.close(session_id)
+    
+    def _register_new_session(self, send):
+        """応答ヘッダーで払い出されたセッションIDを登録するsendを返す."""
+        async def wrapped(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                for key, value in message.get("headers", []):
+                    if key.lower() == MCP_SESSION_ID_HEADER:
+                        self.sessions.open(value.decode("latin-1"), "http")
+            await send(message)
+        
+        return wrapped
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_json(
+    send,
+    status: int,
+    body: Dict[str, Any],
+    extra_headers: Optional[List[Tuple[bytes, bytes]]] = None,
+) -> None:
+    payload = json.dumps(body).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(payload)).encode("ascii")),
+    ] + list(extra_headers or [])
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
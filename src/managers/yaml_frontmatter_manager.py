@@ -1,19 +1,13 @@
 """YAMLフロントマターの管理モジュール."""
 
-import re
 from typing import Optional, Any
-import yaml
+
+from src.core.document import QuartoDocument
 
 
 class YAMLFrontmatterManager:
     """YAMLフロントマターへのKroki設定の追加と管理を行うクラス."""
     
-    # YAMLヘッダーのパターン
-    YAML_HEADER_PATTERN = re.compile(
-        r'^---\s*\n(.*?)\n---\s*\n(.*)$',
-        re.DOTALL
-    )
-    
     def __init__(self, kroki_service_url: str):
         """
         YAMLFrontmatterManagerを初期化する.
@@ -39,47 +33,20 @@ class YAMLFrontmatterManager:
         Returns:
             Kroki設定が追加されたコンテンツ
         """
-        # YAMLヘッダーを抽出
-        yaml_dict, body = self._extract_yaml_header(content)
-        
-        # Kroki設定をマージ
-        merged_yaml = self._merge_kroki_config(yaml_dict)
-        
-        # YAMLと本文を再構築
-        return self._reconstruct_content(merged_yaml, body)
+        document = QuartoDocument.parse(content)
+        self.apply_kroki_config(document)
+        return document.serialize()
     
-    def _extract_yaml_header(self, content: str) -> tuple[Optional[dict[str, Any]], str]:
+    def apply_kroki_config(self, document: QuartoDocument) -> None:
         """
-        コンテンツからYAMLヘッダーを抽出する.
+        解析済みドキュメントのフロントマターにKroki設定を追加する.
+        
+        文字列への再構築は行わない（呼び出し側で1回だけシリアライズする）.
         
         Args:
-            content: Quarto Markdownコンテンツ
-            
-        Returns:
-            (YAML辞書, 本文) のタプル
+            document: 解析済みドキュメント
         """
-        match = self.YAML_HEADER_PATTERN.match(content)
-        
-        if match:
-            yaml_str = match.group(1).strip()  # 前後の空白を削除
-            body = match.group(2)
-            
-            # 空の場合は空辞書を返す
-            if not yaml_str:
-                return {}, body
-            
-            try:
-                yaml_dict = yaml.safe_load(yaml_str)
-                # 辞書でない場合は空辞書として扱う
-                if not isinstance(yaml_dict, dict):
-                    return {}, body
-                return yaml_dict if yaml_dict else {}, body
-            except yaml.YAMLError:
-                # YAML解析エラーの場合は空辞書として扱う
-                return {}, body
-        
-        # YAMLヘッダーがない場合
-        return {}, content
+        document.front_matter = self._merge_kroki_config(document.front_matter)
     
     def _merge_kroki_config(self, yaml_dict: Optional[dict[str, Any]]) -> dict[str, Any]:
         """
@@ -118,32 +85,6 @@ class YAMLFrontmatterManager:
         
         return yaml_dict
     
-    def _reconstruct_content(self, yaml_dict: dict[str, Any], body: str) -> str:
-        """
-        YAML辞書と本文からコンテンツを再構築する.
-        
-        Args:
-            yaml_dict: YAML辞書
-            body: 本文
-            
-        Returns:
-            YAMLヘッダーと本文を結合したコンテンツ
-        """
-        if not yaml_dict:
-            # YAMLが空の場合は本文のみ返す
-            return body
-        
-        # YAML辞書を文字列化
-        yaml_str = yaml.dump(
-            yaml_dict,
-            allow_unicode=True,
-            default_flow_style=False,
-            sort_keys=False
-        )
-        
-        # YAMLヘッダーとして構築
-        return f"---\n{yaml_str}---\n\n{body}"
-    
     def add_mermaid_config(self, content: str, format_id: str) -> str:
         """
         コンテンツのYAMLフロントマターにMermaid設定を追加する.
@@ -159,14 +100,19 @@ class YAMLFrontmatterManager:
         Returns:
             Mermaid設定が追加されたコンテンツ
         """
-        # YAMLヘッダーを抽出
-        yaml_dict, body = self._extract_yaml_header(content)
-        
-        # Mermaid設定をマージ
-        merged_yaml = self._merge_mermaid_config(yaml_dict, format_id)
+        document = QuartoDocument.parse(content)
+        self.apply_mermaid_config(document, format_id)
+        return document.serialize()
+    
+    def apply_mermaid_config(self, document: QuartoDocument, format_id: str) -> None:
+        """
+        解析済みドキュメントのフロントマターにMermaid設定を追加する.
         
-        # YAMLと本文を再構築
-        return self._reconstruct_content(merged_yaml, body)
+        Args:
+            document: 解析済みドキュメント
+            format_id: 出力形式ID（pptx, docx等）
+        """
+        document.front_matter = self._merge_mermaid_config(document.front_matter, format_id)
     
     def _merge_mermaid_config(self, yaml_dict: Optional[dict[str, Any]], format_id: str) -> dict[str, Any]:
         """
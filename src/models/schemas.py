@@ -14,12 +14,29 @@ class OutputInfo(BaseModel):
     size_bytes: int = Field(description="ファイルサイズ（バイト単位）")
 
 
+class ResourceUsage(BaseModel):
+    """Quarto CLIのプロセスの資源使用量（wait4で回収、Quartoが起動したpandocなども含む）."""
+    
+    cpu_user_ms: int = Field(description="ユーザーモードのCPU時間（ミリ秒）")
+    cpu_system_ms: int = Field(description="カーネルモードのCPU時間（ミリ秒）")
+    peak_rss_kb: int = Field(description="最大常駐メモリ（KiB、子孫のうち最大のプロセスの値）")
+    io_read_blocks: int = Field(description="ファイルシステムからの読み込みブロック数")
+    io_write_blocks: int = Field(description="ファイルシステムへの書き込みブロック数")
+
+
 class Metadata(BaseModel):
     """変換メタデータ."""
     
     quarto_version: str = Field(description="使用したQuarto CLIのバージョン")
     render_time_ms: int = Field(description="変換処理時間（ミリ秒）")
     warnings: List[str] = Field(default_factory=list, description="警告メッセージのリスト")
+    batch_size: Optional[int] = Field(
+        default=None, description="同じQuarto実行でまとめてレンダリングした文書数（1件ずつの場合はNone）"
+    )
+    resource_usage: Optional[ResourceUsage] = Field(
+        default=None,
+        description="Quarto CLIの資源使用量（バッチでは文書をまとめた1回の実行の値. スポナーを使わない場合はNone）",
+    )
 
 
 class RenderResult(BaseModel):
@@ -29,6 +46,7 @@ class RenderResult(BaseModel):
     format: str = Field(description="使用した出力形式ID")
     output: OutputInfo = Field(description="出力ファイル情報")
     metadata: Metadata = Field(description="変換メタデータ")
+    trace_id: Optional[str] = Field(default=None, description="トレースID（ログ・スパンとの対応付け用）")
 
 
 class ErrorInfo(BaseModel):
@@ -42,6 +60,10 @@ class ErrorInfo(BaseModel):
         default_factory=lambda: datetime.now(timezone.utc).isoformat(), 
         description="エラー発生日時"
     )
+    trace_id: Optional[str] = Field(default=None, description="トレースID（ログ・スパンとの対応付け用）")
+    retry_after_ms: Optional[int] = Field(
+        default=None, description="再試行までの目安（ミリ秒）. OVERLOADEDなど一時的なエラーの場合のみ"
+    )
 
 
 class ErrorResponse(BaseModel):
@@ -2,56 +2,50 @@
 
 import asyncio
 import logging
-import os
 import sys
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from typing import TYPE_CHECKING, Optional, Tuple
 
-import yaml
 from mcp.server import Server
 from mcp.types import Tool, TextContent
 import mcp.server.stdio
 
-from src.tools import render, formats  # , validate_mermaid
+from src.core.settings import get_settings
+from src.core.tracing import configure_tracing, get_tracer, shutdown_tracing
 
-# ログ設定: INFO以上のログを標準エラー出力とファイルに出力
-# 注: stdoutはJSON-RPC通信に使用されるため、ログはstderrに出力する
+# レンダラー、HTTPトランスポート、ツールの実装などはinitializeへの応答を遅らせないよう
+# 使うときに読み込む（python -X importtime -c "import src.server" で確認できる）
+if TYPE_CHECKING:
+    from src.core.app_context import AppContext
+    from src.core.sessions import SessionStats
+    from src.core.template_registry import TemplateRegistry
 
-# ログディレクトリを環境変数から取得（デフォルト: ./logs）
-log_dir = os.environ.get('QUARTO_MCP_LOG_DIR', 'logs')
-log_path = Path(log_dir)
-log_path.mkdir(parents=True, exist_ok=True)
 
-# ログファイルパス（ローテーション: 10MB、バックアップ3世代）
-log_file = log_path / 'quarto_mcp_server.log'
+logger = logging.getLogger(__name__)
 
-# ログフォーマット
-log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# サーバーインスタンス
+server = Server("quarto-mcp-server")
 
-# ハンドラー設定
-handlers = [
-    logging.StreamHandler(sys.stderr),  # 標準エラー出力
-    RotatingFileHandler(
-        log_file,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=3,
-        encoding='utf-8'
-    )
-]
 
-# 全ハンドラーにフォーマッターを適用
-for handler in handlers:
-    handler.setFormatter(log_formatter)
+# テンプレート設定ファイルのパス
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "templates.yaml"
 
-# ロガー設定
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=handlers
-)
+# 構築済みのツール定義（テンプレートレジストリのバージョン, ツール一覧）
+_tool_cache: Optional[Tuple[int, list[Tool]]] = None
 
+# run_server()がバックグラウンドで進めているAppContextの構築
+_context_startup: Optional["asyncio.Task[AppContext]"] = None
 
-# サーバーインスタンス
-server = Server("quarto-mcp-server")
+
+def _template_registry() -> "TemplateRegistry":
+    """
+    テンプレート設定のレジストリを返す.
+    
+    プロセス共有のレジストリで1回だけ読み込み、変更時のみ再読み込みする.
+    """
+    from src.core.template_registry import get_template_registry
+    
+    return get_template_registry(CONFIG_PATH)
 
 
 @server.list_tools()
@@ -59,37 +53,116 @@ async def list_tools() -> list[Tool]:
     """
     利用可能なMCPツールの一覧を返す.
     
+    ツール定義はテンプレート設定が変更されたときだけ構築し直す.
+    
     Returns:
         ツール定義のリスト
     """
-    # テンプレート設定ファイルからテンプレートIDを読み込む
-    config_path = Path(__file__).parent.parent / "config" / "templates.yaml"
-    template_ids = []
-    template_descriptions = {}
+    global _tool_cache
     
-    if config_path.exists():
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-                if config and "templates" in config and config["templates"]:
-                    for template_id, template_info in config["templates"].items():
-                        template_ids.append(template_id)
-                        if isinstance(template_info, dict) and "description" in template_info:
-                            template_descriptions[template_id] = template_info["description"]
-        except Exception:
-            # YAMLパースエラーは無視してデフォルトの説明を使用
-            pass
+    template_registry = _template_registry()
+    template_registry.refresh()
+    if _tool_cache is None or _tool_cache[0] != template_registry.version:
+        _tool_cache = (template_registry.version, _build_tools(template_registry.describe()))
+    return _tool_cache[1]
+
+
+def _build_tools(template_info_text: str) -> list[Tool]:
+    """
+    ツール定義を構築する.
     
-    # テンプレートIDのリストを説明文に追加
-    template_info_text = ""
-    if template_ids:
-        template_info_text = "\n\nAvailable template IDs:"
-        for tid in template_ids:
-            desc = template_descriptions.get(tid, "")
-            if desc:
-                template_info_text += f"\n  - {tid}: {desc}"
-            else:
-                template_info_text += f"\n  - {tid}"
+    Args:
+        template_info_text: templateパラメータの説明に追加するテンプレート一覧
+        
+    Returns:
+        ツール定義のリスト
+    """
+    render_schema = {
+        "type": "object",
+        "properties": {
+            "content": {
+                "type": "string",
+                "description": "Quarto Markdown content to convert",
+            },
+            "format": {
+                "type": "string",
+                "description": "Output format ID (e.g., pptx, html, pdf, docx)",
+                "enum": [
+                    "pptx", "html", "pdf", "docx", "revealjs", "beamer",
+                    "gfm", "commonmark", "hugo", "docusaurus", "markua",
+                    "mediawiki", "dokuwiki", "zimwiki", "jira", "xwiki",
+                    "jats", "ipynb", "rtf", "rst", "asciidoc", "org",
+                    "context", "texinfo", "man", "odt", "epub", "typst",
+                ],
+            },
+            "output_filename": {
+                "type": "string",
+                "description": "output file name",
+            },
+            "template": {
+                "type": "string",
+                "description": (
+                    "Template specification for PowerPoint format. "
+                    "Can be either a template ID (registered in templates.yaml) "
+                    "or an HTTP/HTTPS URL to a .pptx file. "
+                    f"URL will be automatically downloaded.{template_info_text}"
+                ),
+            },
+            "format_options": {
+                "type": "object",
+                "description": "Format-specific options (Quarto YAML header equivalent)",
+                "additionalProperties": True,
+            },
+        },
+        "required": ["content", "format", "output_filename"],
+    }
+    deadline_properties = {
+        "time_budget_ms": {
+            "type": "number",
+            "description": (
+                "Time budget in milliseconds, counted from when the server receives the call. "
+                "Work still queued when it runs out is dropped with DEADLINE_EXCEEDED, "
+                "and Quarto is stopped when the remaining budget is used up."
+            ),
+        },
+        "deadline": {
+            "type": ["number", "string"],
+            "description": (
+                "Absolute deadline as a UNIX timestamp in seconds or an ISO 8601 string with a time zone. "
+                "If time_budget_ms is also given, the earlier of the two is used."
+            ),
+        },
+    }
+    render_request_schema = {
+        **render_schema,
+        "properties": {**render_schema["properties"], **deadline_properties},
+    }
+    batch_schema = {
+        "type": "object",
+        "properties": {
+            **deadline_properties,
+            "documents": {
+                "type": "array",
+                "description": (
+                    "Documents to render, each with the same arguments as quarto_render. "
+                    "Documents with the same format are rendered together as one Quarto project."
+                ),
+                "items": render_schema,
+                "minItems": 1,
+            },
+        },
+        "required": ["documents"],
+    }
+    job_id_schema = {
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "string",
+                "description": "Job ID returned by quarto_render_submit",
+            },
+        },
+        "required": ["job_id"],
+    }
     
     return [
         Tool(
@@ -98,44 +171,50 @@ async def list_tools() -> list[Tool]:
                 "Convert Quarto Markdown to various formats (PowerPoint, PDF, HTML, etc.). "
                 "Supports custom PowerPoint templates via template ID or HTTP/HTTPS URL."
             ),
+            inputSchema=render_request_schema,
+        ),
+        Tool(
+            name="quarto_render_batch",
+            description=(
+                "Render many Quarto Markdown documents with a single Quarto run per output format. "
+                "Returns one result per document, in order, in the same format as quarto_render."
+            ),
+            inputSchema=batch_schema,
+        ),
+        Tool(
+            name="quarto_render_submit",
+            description=(
+                "Submit a Quarto render as a background job and return its job ID immediately. "
+                "Takes the same arguments as quarto_render. Poll quarto_render_status and "
+                "fetch the output with quarto_render_result."
+            ),
+            inputSchema=render_request_schema,
+        ),
+        Tool(
+            name="quarto_render_status",
+            description="Get the state, queue position and progress of a render job",
+            inputSchema=job_id_schema,
+        ),
+        Tool(
+            name="quarto_render_result",
+            description="Get the result of a finished render job (same format as quarto_render)",
+            inputSchema=job_id_schema,
+        ),
+        Tool(
+            name="quarto_render_cancel",
+            description="Cancel a queued or running render job",
+            inputSchema=job_id_schema,
+        ),
+        Tool(
+            name="quarto_server_status",
+            description=(
+                "Get the server status: Quarto warm-up readiness per format, "
+                "render job counts, the render queue per client, Quarto latency per format, "
+                "Quarto resource limits, open sessions and worker processes"
+            ),
             inputSchema={
                 "type": "object",
-                "properties": {
-                    "content": {
-                        "type": "string",
-                        "description": "Quarto Markdown content to convert",
-                    },
-                    "format": {
-                        "type": "string",
-                        "description": "Output format ID (e.g., pptx, html, pdf, docx)",
-                        "enum": [
-                            "pptx", "html", "pdf", "docx", "revealjs", "beamer",
-                            "gfm", "commonmark", "hugo", "docusaurus", "markua",
-                            "mediawiki", "dokuwiki", "zimwiki", "jira", "xwiki",
-                            "jats", "ipynb", "rtf", "rst", "asciidoc", "org",
-                            "context", "texinfo", "man", "odt", "epub", "typst",
-                        ],
-                    },
-                    "output_filename": {
-                        "type": "string",
-                        "description": "output file name",
-                    },
-                    "template": {
-                        "type": "string",
-                        "description": (
-                            "Template specification for PowerPoint format. "
-                            "Can be either a template ID (registered in templates.yaml) "
-                            "or an HTTP/HTTPS URL to a .pptx file. "
-                            f"URL will be automatically downloaded.{template_info_text}"
-                        ),
-                    },
-                    "format_options": {
-                        "type": "object",
-                        "description": "Format-specific options (Quarto YAML header equivalent)",
-                        "additionalProperties": True,
-                    },
-                },
-                "required": ["content", "format", "output_filename"],
+                "properties": {},
             },
         ),
         Tool(
@@ -176,6 +255,9 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """
     MCPツールを実行する.
     
+    ツール呼び出し全体を1つのトレースのルートスパンとして記録し、
+    呼び出し元のセッションの利用状況に加える. レンダリングはセッションごとの公平キューに並ぶ.
+    
     Args:
         name: ツール名
         arguments: ツール引数
@@ -183,8 +265,84 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     Returns:
         実行結果
     """
-    # テンプレート設定ファイルのパス
-    config_path = Path(__file__).parent.parent / "config" / "templates.yaml"
+    session_id, transport = _current_session()
+    sessions = (await _app_context()).sessions
+    with get_tracer().span("mcp.call_tool", **{"mcp.tool": name, "mcp.session_id": session_id}), \
+            sessions.track_call(session_id, transport, name) as session:
+        return await _dispatch_tool(name, arguments, session, _client_name())
+
+
+def _client_name() -> Optional[str]:
+    """
+    処理中のリクエストのクライアント名（initializeで送られたclientInfo.name）を返す.
+    
+    クライアントごとの待ち行列の重みの設定に使う. 取得できない場合はNone.
+    """
+    try:
+        session = server.request_context.session
+    except LookupError:
+        return None
+    params = getattr(session, "client_params", None)
+    client_info = getattr(params, "clientInfo", None)
+    return getattr(client_info, "name", None)
+
+
+def _current_session() -> Tuple[str, str]:
+    """
+    処理中のリクエストのセッションIDとトランスポート名を返す.
+    
+    HTTPトランスポートではmcp-session-idヘッダーの値、stdioでは固定のIDを使う.
+    """
+    try:
+        request = server.request_context.request
+    except LookupError:
+        request = None
+    headers = getattr(request, "headers", None)
+    session_id = headers.get("mcp-session-id") if headers is not None else None
+    if session_id:
+        return session_id, "http"
+    from src.core.sessions import STDIO_SESSION_ID
+    
+    return STDIO_SESSION_ID, "stdio"
+
+
+async def _app_context() -> "AppContext":
+    """
+    アプリケーションコンテキストを返す.
+    
+    run_server()が構築中の場合は完了を待つ. run_server()を経由せずに
+    呼ばれた場合は、その場で構築して設定する.
+    """
+    from src.core.app_context import AppContext, get_app_context, set_app_context
+    
+    if _context_startup is not None:
+        return await asyncio.shield(_context_startup)
+    context = get_app_context()
+    if context is None:
+        context = AppContext(config_path=CONFIG_PATH)
+        set_app_context(context)
+    return context
+
+
+async def _dispatch_tool(
+    name: str,
+    arguments: dict,
+    session: Optional["SessionStats"] = None,
+    client_name: Optional[str] = None,
+) -> list[TextContent]:
+    """ツール名に応じて処理を振り分ける."""
+    from src.core.deadline import Deadline
+    from src.core.scheduler import DEFAULT_CLIENT
+    
+    # レンダリングの待ち行列のクライアントキー
+    client = session.session_id if session is not None else DEFAULT_CLIENT
+    
+    # 期限は受け付けた時点から数える
+    if name in ("quarto_render", "quarto_render_batch", "quarto_render_submit"):
+        try:
+            deadline = Deadline.from_request(arguments.get("time_budget_ms"), arguments.get("deadline"))
+        except ValueError as e:
+            return [TextContent(type="text", text=f"Error: Invalid deadline ({e})")]
     
     if name == "quarto_render":
         # 必須パラメータの検証
@@ -204,22 +362,117 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
         template = arguments.get("template")
         format_options = arguments.get("format_options", {})
         
-        # レンダリング実行
-        result = await render.render(
+        # レンダリング実行（起動時に構築したレンダラー、またはワーカープロセスを使う）
+        result = await (await _app_context()).render(
             content=content,
             format=format_id,
             output_filename=output_filename,
             template=template,
             format_options=format_options,
-            config_path=config_path if config_path.exists() else None,
+            client=client,
+            client_name=client_name,
+            deadline=deadline,
         )
+        if session is not None:
+            from src.core.sessions import SessionRegistry
+            
+            SessionRegistry.record_render(session, result)
         
         # 結果をJSON文字列として返す
         import json
         return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+    
+    elif name == "quarto_render_batch":
+        documents = arguments.get("documents")
+        if not isinstance(documents, list) or not documents:
+            return [TextContent(type="text", text="Error: Missing required parameter (documents)")]
+        for index, document in enumerate(documents):
+            if not isinstance(document, dict) or not all(
+                document.get(key) for key in ("content", "format", "output_filename")
+            ):
+                return [
+                    TextContent(
+                        type="text",
+                        text=f"Error: Missing required parameters in documents[{index}] (content, format, output_filename)",
+                    )
+                ]
+        max_documents = get_settings().batch_max_documents
+        if len(documents) > max_documents:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error: Too many documents ({len(documents)}); the limit is {max_documents}",
+                )
+            ]
+        
+        result = await (await _app_context()).render_batch(
+            documents, client=client, client_name=client_name, deadline=deadline
+        )
+        if session is not None:
+            from src.core.sessions import SessionRegistry
+            
+            # 受け付けを拒否された場合（OVERLOADED、DEADLINE_EXCEEDED）は文書ごとの結果がない
+            for item in result.get("results", [result]):
+                SessionRegistry.record_render(session, item)
+        
+        import json
+        return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+    
+    elif name == "quarto_render_submit":
+        content = arguments.get("content")
+        format_id = arguments.get("format")
+        output_filename = arguments.get("output_filename")
+        
+        if not content or not format_id or not output_filename:
+            return [
+                TextContent(
+                    type="text",
+                    text="Error: Missing required parameters (content, format, output_filename)",
+                )
+            ]
+        
+        # 受け付けの判定は投入時に行う（待ち行列が上限に達している場合はOVERLOADED）
+        result = await (await _app_context()).submit(
+            content=content,
+            format=format_id,
+            output_filename=output_filename,
+            template=arguments.get("template"),
+            format_options=arguments.get("format_options", {}),
+            client=client,
+            client_name=client_name,
+            deadline=deadline,
+        )
+        
+        import json
+        return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+    
+    elif name in ("quarto_render_status", "quarto_render_result", "quarto_render_cancel"):
+        job_id = arguments.get("job_id")
+        if not job_id:
+            return [TextContent(type="text", text="Error: Missing required parameter (job_id)")]
+        
+        from src.tools import jobs
         
+        handler = {
+            "quarto_render_status": jobs.status,
+            "quarto_render_result": jobs.result,
+            "quarto_render_cancel": jobs.cancel,
+        }[name]
+        result = await handler((await _app_context()).jobs, job_id)
+        
+        import json
+        return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+    
+    elif name == "quarto_server_status":
+        result = (await _app_context()).status()
+        
+        import json
+        return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+    
     elif name == "quarto_list_formats":
         # フォーマット一覧取得
+        from src.tools import formats
+        
         format_list = await formats.list_formats()
         
         # 結果をJSON文字列として返す
@@ -250,13 +503,87 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     #     # 結果をJSON文字列として返す
     #     import json
     #     return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
-        
+    
     else:
         return [TextContent(type="text", text=f"Error: Unknown tool '{name}'")]
 
 
 async def run_server():
-    """MCPサーバーを起動する."""
+    """
+    MCPサーバーを起動する.
+    
+    レンダリング用のコンポーネント（AppContext）はバックグラウンドで構築し、
+    その間もinitializeやlist_toolsには応答する. ツールの実行は構築の完了を待つ.
+    """
+    global _context_startup
+    
+    from src.core.app_context import set_app_context
+    
+    settings = get_settings()
+    # スパンをJSONLファイルに出力する
+    configure_tracing(settings)
+    
+    # 子プロセスを起動するヘルパーは、キャッシュなどでメモリが増える前に起動しておく
+    if settings.spawner_enabled:
+        from src.core.spawner import start_spawner
+        
+        await start_spawner()
+    
+    # レンダリング用のコンポーネントを1回だけ構築し、全リクエストで共有する
+    _context_startup = asyncio.create_task(_start_app_context())
+    try:
+        if settings.transport == "stdio":
+            await _serve_stdio()
+        else:
+            from src.http_transport import HttpTransport
+            
+            # 全セッションが同じAppContextを共有する
+            context = await _context_startup
+            http = HttpTransport(server, context.sessions, settings)
+            if settings.transport == "http":
+                await http.serve()
+            else:
+                # stdioとHTTPを同時に提供し、stdioのクライアントが終了したらHTTPも止める
+                http_task = asyncio.create_task(http.serve())
+                try:
+                    await _serve_stdio()
+                finally:
+                    http.stop()
+                    await http_task
+    finally:
+        startup, _context_startup = _context_startup, None
+        context = await _finish_startup(startup)
+        set_app_context(None)
+        if context is not None:
+            await context.aclose()
+        if settings.spawner_enabled:
+            from src.core.spawner import stop_spawner
+            
+            await stop_spawner()
+        shutdown_tracing()
+
+
+async def _start_app_context() -> "AppContext":
+    """AppContextを構築して初期化する（構築はイベントループを止めないよう別スレッドで行う）."""
+    from src.core.app_context import AppContext, set_app_context
+    
+    context = await asyncio.to_thread(AppContext, config_path=CONFIG_PATH)
+    set_app_context(context)
+    await context.startup()
+    return context
+
+
+async def _finish_startup(startup: "asyncio.Task[AppContext]") -> Optional["AppContext"]:
+    """構築中のAppContextを待ち、構築できていればそれを返す."""
+    try:
+        return await startup
+    except Exception as e:
+        logger.error(f"Failed to start the application context: {e}")
+        return None
+
+
+async def _serve_stdio() -> None:
+    """stdioトランスポートでMCPサーバーを実行する."""
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -267,6 +594,12 @@ async def run_server():
 
 def main():
     """エントリーポイント."""
+    from src.core.logging_setup import configure_logging
+    
+    # ログ設定: ロガーはキューに積むだけで、標準エラー出力とファイルへの書き込みは
+    # バックグラウンドスレッドで行う（形式・レベル・間引きは設定で変更できる）
+    # 設定値はここで1回だけ読み込まれ、不正な値があれば起動時にエラーになる
+    configure_logging(get_settings())
     asyncio.run(run_server())
 
 
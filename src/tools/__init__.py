@@ -1,3 +1,3 @@
 """MCP tools for Quarto MCP Server."""
 
-__all__ = ["render", "formats"]
+__all__ = ["render", "formats", "jobs"]
@@ -0,0 +1,133 @@
+"""quarto_render_submit / status / result / cancel MCPツールの実装."""
+
+from typing import Any, Dict, Optional
+
+from src.core.deadline import Deadline
+from src.core.jobs import JobManager, JobNotFoundError, JobState
+from src.core.scheduler import DEFAULT_CLIENT
+from src.models.schemas import ErrorResponse, ErrorInfo
+
+
+async def submit(
+    manager: JobManager,
+    content: str,
+    format: str,
+    output_filename: str,
+    template: Optional[str] = None,
+    format_options: Optional[Dict[str, Any]] = None,
+    client: str = DEFAULT_CLIENT,
+    weight: float = 1.0,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """
+    レンダリングをジョブとして投入し、完了を待たずにジョブIDを返す.
+    
+    Args:
+        manager: ジョブマネージャー
+        content: Quarto Markdown形式の文字列
+        format: 出力形式ID
+        output_filename: 出力ファイル名
+        template: テンプレート指定（IDまたはURL）
+        format_options: 出力形式固有のオプション設定
+        client: 投入したクライアント（MCPセッションID）
+        weight: クライアントの重み
+        deadline: 期限（実行を始める前に過ぎた場合はDEADLINE_EXCEEDEDで失敗させる）
+        
+    Returns:
+        ジョブID・状態・待ち順位
+    """
+    record = await manager.submit({
+        "content": content,
+        "format": format,
+        "output_filename": output_filename,
+        "template": template,
+        "format_options": format_options,
+    }, client=client, weight=weight, deadline=deadline)
+    return {
+        "job_id": record.job_id,
+        "state": record.state,
+        "queue_position": manager.queue_position(record.job_id),
+    }
+
+
+async def status(manager: JobManager, job_id: str) -> Dict[str, Any]:
+    """
+    ジョブの状態（待ち順位・段階・進捗）を返す.
+    
+    Args:
+        manager: ジョブマネージャー
+        job_id: ジョブID
+        
+    Returns:
+        ジョブの状態（ジョブが存在しない場合はErrorResponse）
+    """
+    try:
+        return manager.status(job_id)
+    except JobNotFoundError as e:
+        return _not_found(e)
+
+
+async def result(manager: JobManager, job_id: str) -> Dict[str, Any]:
+    """
+    終了したジョブの結果を返す.
+    
+    Args:
+        manager: ジョブマネージャー
+        job_id: ジョブID
+        
+    Returns:
+        quarto_renderと同じ形式の結果
+        （未終了・キャンセル済み・存在しない場合はErrorResponse）
+    """
+    try:
+        record = manager.get(job_id)
+    except JobNotFoundError as e:
+        return _not_found(e)
+    
+    if not record.finished:
+        return ErrorResponse(
+            error=ErrorInfo(
+                code="JOB_NOT_FINISHED",
+                message=f"Job {job_id} is still {record.state}",
+                details="Poll quarto_render_status until the job has finished.",
+            )
+        ).model_dump()
+    if record.state == JobState.CANCELLED or record.result is None:
+        return ErrorResponse(
+            error=ErrorInfo(
+                code="JOB_CANCELLED",
+                message=f"Job {job_id} was cancelled",
+                details="Submit the render job again.",
+            )
+        ).model_dump()
+    return record.result
+
+
+async def cancel(manager: JobManager, job_id: str) -> Dict[str, Any]:
+    """
+    ジョブをキャンセルし、キャンセル後の状態を返す.
+    
+    終了済みのジョブはそのままの状態を返す.
+    
+    Args:
+        manager: ジョブマネージャー
+        job_id: ジョブID
+        
+    Returns:
+        ジョブの状態（ジョブが存在しない場合はErrorResponse）
+    """
+    try:
+        await manager.cancel(job_id)
+        return manager.status(job_id)
+    except JobNotFoundError as e:
+        return _not_found(e)
+
+
+def _not_found(error: JobNotFoundError) -> Dict[str, Any]:
+    return ErrorResponse(
+        error=ErrorInfo(
+            code="JOB_NOT_FOUND",
+            message=str(error),
+            details="The job ID is unknown or the finished job has expired.",
+        )
+    ).model_dump()
@@ -1,7 +1,7 @@
 """quarto_render MCPツールの実装."""
 
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Any, Dict, List, Optional
 
 from src.core.renderer import QuartoRenderer, QuartoRenderError
 from src.core.template_manager import (
@@ -12,6 +12,7 @@ from src.core.template_manager import (
     TemplateSizeExceededError,
     InvalidTemplateUrlError,
 )
+from src.core.tracing import get_tracer
 from src.models.schemas import RenderResult, ErrorResponse, ErrorInfo
 
 
@@ -22,6 +23,7 @@ async def render(
     template: Optional[str] = None,
     format_options: Optional[Dict[str, Any]] = None,
     config_path: Optional[Path] = None,
+    renderer: Optional[QuartoRenderer] = None,
 ) -> Dict[str, Any]:
     """
     Quarto Markdownを指定形式に変換する.
@@ -33,16 +35,103 @@ async def render(
         template: テンプレート指定（IDまたはURL）
         format_options: 出力形式固有のオプション設定
         config_path: テンプレート設定ファイルのパス
+        renderer: 使用するレンダラー（省略時はconfig_pathから新たに構築する）
         
     Returns:
         変換結果（成功時はRenderResult、失敗時はErrorResponse）
     """
+    tracer = get_tracer()
+    with tracer.span("quarto_render", **{"quarto.format": format, "quarto.template": template or ""}) as span:
+        result = await _render(
+            content=content,
+            format=format,
+            output_filename=output_filename,
+            template=template,
+            format_options=format_options,
+            config_path=config_path,
+            renderer=renderer,
+        )
+        
+        # 応答にトレースIDを含め、ログ・スパンと対応付けられるようにする
+        if result.get("success"):
+            result["trace_id"] = span.trace_id
+        else:
+            result["error"]["trace_id"] = span.trace_id
+            span.set_status("ERROR", result["error"]["code"])
+        return result
+
+
+async def render_batch(
+    documents: List[Dict[str, Any]],
+    config_path: Optional[Path] = None,
+    renderer: Optional[QuartoRenderer] = None,
+) -> Dict[str, Any]:
+    """
+    複数のQuarto Markdownを出力形式ごとに1回のQuarto実行でまとめて変換する.
+    
+    Args:
+        documents: quarto_renderと同じ引数（content, format, output_filename, template, format_options）の辞書のリスト
+        config_path: テンプレート設定ファイルのパス
+        renderer: 使用するレンダラー（省略時はconfig_pathから新たに構築する）
+        
+    Returns:
+        documentsと同じ順序の変換結果（resultsの各要素はquarto_renderの結果と同じ形式）
+    """
+    tracer = get_tracer()
+    with tracer.span("quarto_render_batch", **{"quarto.batch_size": len(documents)}) as span:
+        if renderer is None:
+            renderer = QuartoRenderer(config_path=config_path)
+        
+        outcomes = await renderer.render_batch([
+            {
+                "content": document["content"],
+                "format_id": document["format"],
+                "output_filename": document["output_filename"],
+                "template": document.get("template"),
+                "format_options": document.get("format_options") or {},
+            }
+            for document in documents
+        ])
+        
+        results = []
+        for document, outcome in zip(documents, outcomes):
+            if isinstance(outcome, RenderResult):
+                result = outcome.model_dump()
+                result["trace_id"] = span.trace_id
+            else:
+                result = _error_response(outcome, document.get("template"))
+                result["error"]["trace_id"] = span.trace_id
+            results.append(result)
+        
+        failed = sum(1 for result in results if not result.get("success"))
+        if failed:
+            span.set_status("ERROR", f"{failed} of {len(results)} documents failed")
+        return {
+            "success": failed == 0,
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results,
+            "trace_id": span.trace_id,
+        }
+
+
+async def _render(
+    content: str,
+    format: str,
+    output_filename: str,
+    template: Optional[str],
+    format_options: Optional[Dict[str, Any]],
+    config_path: Optional[Path],
+    renderer: Optional[QuartoRenderer],
+) -> Dict[str, Any]:
+    """render()の本体. 例外をエラーコード付きのErrorResponseに変換する."""
     if format_options is None:
         format_options = {}
     
     try:
-        # レンダラーを初期化
-        renderer = QuartoRenderer(config_path=config_path)
+        # レンダラーが渡されていなければ初期化
+        if renderer is None:
+            renderer = QuartoRenderer(config_path=config_path)
         
         # 変換を実行
         result = await renderer.render(
@@ -55,8 +144,14 @@ async def render(
         
         # 成功レスポンスを返す
         return result.model_dump()
-        
-    except TemplateNotFoundError as e:
+    
+    except Exception as e:
+        return _error_response(e, template)
+
+
+def _error_response(e: Exception, template: Optional[str]) -> Dict[str, Any]:
+    """レンダリング中の例外をエラーコード付きのErrorResponseの辞書に変換する."""
+    if isinstance(e, TemplateNotFoundError):
         # テンプレートが見つからない
         error_response = ErrorResponse(
             success=False,
@@ -67,8 +162,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except InvalidTemplateUrlError as e:
+    
+    if isinstance(e, InvalidTemplateUrlError):
         # 不正なURL
         error_response = ErrorResponse(
             success=False,
@@ -79,8 +174,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except TemplateSizeExceededError as e:
+    
+    if isinstance(e, TemplateSizeExceededError):
         # ファイルサイズ超過
         error_response = ErrorResponse(
             success=False,
@@ -91,8 +186,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except TemplateDownloadTimeoutError as e:
+    
+    if isinstance(e, TemplateDownloadTimeoutError):
         # ダウンロードタイムアウト
         error_response = ErrorResponse(
             success=False,
@@ -103,8 +198,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except TemplateDownloadError as e:
+    
+    if isinstance(e, TemplateDownloadError):
         # ダウンロード失敗
         error_response = ErrorResponse(
             success=False,
@@ -115,8 +210,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except TemplateError as e:
+    
+    if isinstance(e, TemplateError):
         # その他のテンプレートエラー
         error_response = ErrorResponse(
             success=False,
@@ -127,8 +222,8 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except QuartoRenderError as e:
+    
+    if isinstance(e, QuartoRenderError):
         # Quarto変換エラー
         error_response = ErrorResponse(
             success=False,
@@ -140,15 +235,14 @@ async def render(
             )
         )
         return error_response.model_dump()
-        
-    except Exception as e:
-        # その他のエラー
-        error_response = ErrorResponse(
-            success=False,
-            error=ErrorInfo(
-                code="UNKNOWN_ERROR",
-                message=f"An unexpected error occurred: {str(e)}",
-                details="An unexpected error occurred during rendering. Please check the logs for more information.",
-            )
+    
+    # その他のエラー
+    error_response = ErrorResponse(
+        success=False,
+        error=ErrorInfo(
+            code="UNKNOWN_ERROR",
+            message=f"An unexpected error occurred: {str(e)}",
+            details="An unexpected error occurred during rendering. Please check the logs for more information.",
         )
-        return error_response.model_dump()
+    )
+    return error_response.model_dump()
@@ -6,6 +6,8 @@ import re
 import shutil
 from typing import Optional, Dict, Any
 
+from src.core.spawner import create_subprocess_exec
+
 
 class MermaidCliValidator:
     """Mermaid CLI（mmdc）を使用したバリデーション."""
@@ -102,13 +104,10 @@ class MermaidCliValidator:
             # mmdcコマンドを標準入出力方式で実行
             # -i -: 標準入力から読み込み
             # -o <devnull>: 出力を破棄（クロスプラットフォーム対応）
-            process = await asyncio.create_subprocess_exec(
+            process = await create_subprocess_exec(
                 self._cli_path,
                 '-i', '-',
                 '-o', os.devnull,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
             )
             
             # Mermaidコードを標準入力に送信
@@ -3,6 +3,8 @@
 import re
 from typing import List, Dict, Any
 
+from src.core.fence_tokenizer import FencedBlock, tokenize_fenced_blocks
+
 
 class MermaidExtractor:
     """Quarto Markdown内のMermaidコードブロックを抽出し、不正記法を検出する."""
@@ -56,40 +58,23 @@ class MermaidExtractor:
             - code: Mermaidコード本体（マーカー除く）
         """
         blocks = []
-        lines = content.split('\n')
         
-        # Quarto拡張記法と標準Markdown記法の両方に対応（先頭の空白も許容）
-        pattern = r'^\s*```\{mermaid\}|^\s*```mermaid'
+        # Quarto拡張記法と標準Markdown記法の両方に対応（インデント・~~~・入れ子も考慮）
+        mermaid_blocks = [
+            block for block in tokenize_fenced_blocks(content)
+            if block.closed and block.language == "mermaid"
+        ]
         
-        i = 0
-        block_index = 0
-        while i < len(lines):
-            line = lines[i]
-            
-            # コードブロック開始を検出
-            if re.match(pattern, line):
-                start_line = i + 1  # 1始まり
-                code_lines = []
-                i += 1
-                
-                # コードブロックの終了を探す
-                while i < len(lines):
-                    if lines[i].strip() == '```':
-                        end_line = i + 1  # 1始まり
-                        
-                        blocks.append({
-                            'block_index': block_index,
-                            'start_line': start_line,
-                            'end_line': end_line,
-                            'code': '\n'.join(code_lines)
-                        })
-                        block_index += 1
-                        break
-                    else:
-                        code_lines.append(lines[i])
-                    i += 1
-            
-            i += 1
+        for block_index, block in enumerate(mermaid_blocks):
+            code = block.content(content)
+            if code.endswith('\n'):
+                code = code[:-1]
+            blocks.append({
+                'block_index': block_index,
+                'start_line': block.start_line,
+                'end_line': block.end_line,
+                'code': code,
+            })
         
         return blocks
     
@@ -115,14 +100,15 @@ class MermaidExtractor:
         """
         issues = []
         lines = content.split('\n')
+        fenced_blocks = tokenize_fenced_blocks(content)
         
         # 第1段階: 正規表現による不正パターン検出
         issues.extend(self._detect_typos(lines))
         issues.extend(self._detect_brace_spacing(lines))
-        issues.extend(self._detect_unclosed_blocks(lines))
+        issues.extend(self._detect_unclosed_blocks(lines, fenced_blocks))
         
         # 第2段階: コンテキスト検証によるキーワード検出
-        issues.extend(self._detect_unblocked_keywords(lines))
+        issues.extend(self._detect_unblocked_keywords(lines, fenced_blocks))
         
         # 重複除去と優先順位付け
         issues = self._merge_duplicate_issues(issues)
@@ -164,58 +150,46 @@ class MermaidExtractor:
         
         return issues
     
-    def _detect_unclosed_blocks(self, lines: List[str]) -> List[Dict[str, Any]]:
+    def _detect_unclosed_blocks(
+        self,
+        lines: List[str],
+        fenced_blocks: List[FencedBlock],
+    ) -> List[Dict[str, Any]]:
         """未閉鎖のコードブロックを検出する（第1段階）."""
         issues = []
-        open_blocks = []
         
-        for line_num, line in enumerate(lines, start=1):
-            stripped = line.strip()
+        for block in fenced_blocks:
+            if block.closed or block.language != "mermaid":
+                continue
             
-            # コードブロック開始
-            if re.match(r'^```\{mermaid\}|^```mermaid', stripped):
-                open_blocks.append(line_num)
-            # コードブロック終了
-            elif stripped == '```' and open_blocks:
-                open_blocks.pop()
-        
-        # 未閉鎖のブロックが残っている
-        for line_num in open_blocks:
             issues.append({
-                'line': line_num,
+                'line': block.start_line,
                 'issue_type': 'unclosed',
                 'severity': 'error',
                 'pattern': 'unclosed_block',
                 'suggestion': 'コードブロックが閉じられていません。```で終了してください',
-                'context': self._trim_context(lines[line_num - 1])
+                'context': self._trim_context(lines[block.start_line - 1])
             })
         
         return issues
     
-    def _detect_unblocked_keywords(self, lines: List[str]) -> List[Dict[str, Any]]:
+    def _detect_unblocked_keywords(
+        self,
+        lines: List[str],
+        fenced_blocks: List[FencedBlock],
+    ) -> List[Dict[str, Any]]:
         """コードブロック外のMermaidキーワードを検出する（第2段階）."""
         issues = []
-        in_code_block = False
-        in_mermaid_block = False
         reported_lines = set()  # 1行につき1回のみ報告
         
+        # フェンス行を含むコードブロック内の行番号
+        code_lines = set()
+        for block in fenced_blocks:
+            code_lines.update(range(block.start_line, block.end_line + 1))
+        
         for line_num, line in enumerate(lines, start=1):
-            stripped = line.strip()
-            
-            # コードブロックの状態管理
-            if stripped.startswith('```'):
-                if not in_code_block:
-                    # コードブロック開始
-                    in_code_block = True
-                    in_mermaid_block = 'mermaid' in stripped
-                else:
-                    # コードブロック終了
-                    in_code_block = False
-                    in_mermaid_block = False
-                continue
-            
             # コードブロック外の行をチェック
-            if not in_code_block and line_num not in reported_lines:
+            if line_num not in code_lines and line_num not in reported_lines:
                 # インラインコード（バッククォート1つ）を除外
                 cleaned_line = re.sub(r'`[^`]+`', '', line)
                 
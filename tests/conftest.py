@@ -0,0 +1,195 @@
+"""テスト共通のフィクスチャ."""
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.core.settings import reload_settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    """
+    各テストの開始時に設定を環境変数から読み込み直す.
+    
+    テスト中に環境変数を変更した場合は、reload_settings()を明示的に呼ぶこと.
+    """
+    return reload_settings()
+
+
+class StubKrokiServer:
+    """
+    Krokiサービスの代わりに使うローカルHTTPサーバー.
+    
+    POST /{type}/{format} にソースを送ると <svg>ソース</svg> を返す.
+    ソースに "FAIL" を含む場合はHTTP 500、"SLOW" を含む場合は slow_delay 秒待つ.
+    GET /health はhealthy属性に応じて200または503を返す.
+    """
+    
+    def __init__(self, delay: float = 0.0, slow_delay: float = 2.0):
+        self.delay = delay
+        self.slow_delay = slow_delay
+        self.healthy = True
+        self.requests = []
+        self.health_checks = 0
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _reply(self, status, body, content_type="image/svg+xml"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if self.path == "/health":
+                    with stub._lock:
+                        stub.health_checks += 1
+                    if stub.healthy:
+                        self._reply(200, b'{"status":"pass"}', "application/json")
+                    else:
+                        self._reply(503, b'{"status":"fail"}', "application/json")
+                else:
+                    self._reply(404, b"not found", "text/plain")
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                source = self.rfile.read(length).decode("utf-8")
+                with stub._lock:
+                    stub.requests.append((self.path, source, self.headers.get("Content-Type")))
+                    stub.connections.add(self.client_address)
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    time.sleep(stub.slow_delay if "SLOW" in source else stub.delay)
+                    if "FAIL" in source:
+                        self._reply(500, b"render error", "text/plain")
+                    else:
+                        self._reply(200, f"<svg>{source}</svg>".encode("utf-8"))
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+        
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def kroki_server():
+    """ローカルで起動したKroki代替サーバー."""
+    server = StubKrokiServer()
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+class StubTemplateServer:
+    """
+    テンプレート配布サーバーの代わりに使うローカルHTTPサーバー.
+    
+    GET /<name>.pptx に content を返し、ETagによる条件付きGETには304を返す.
+    delay秒待ってから応答する. GET/HEADの回数を記録する.
+    """
+    
+    def __init__(self, content: bytes = b"PK\x03\x04 template v1", delay: float = 0.0):
+        self.content = content
+        self.delay = delay
+        self.gets = 0
+        self.heads = 0
+        self.not_modified = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send_headers(self, status, length):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+                self.send_header("Content-Length", str(length))
+                self.send_header("ETag", stub.etag)
+                self.end_headers()
+            
+            def do_HEAD(self):
+                with stub._lock:
+                    stub.heads += 1
+                self._send_headers(200, len(stub.content))
+            
+            def do_GET(self):
+                with stub._lock:
+                    stub.connections.add(self.client_address)
+                if self.headers.get("If-None-Match") == stub.etag:
+                    with stub._lock:
+                        stub.not_modified += 1
+                    self._send_headers(304, 0)
+                    return
+                with stub._lock:
+                    stub.gets += 1
+                time.sleep(stub.delay)
+                content = stub.content
+                self._send_headers(200, len(content))
+                self.wfile.write(content)
+        
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def etag(self) -> str:
+        return '"' + hashlib.sha256(self.content).hexdigest()[:16] + '"'
+    
+    def url(self, name: str = "corporate.pptx") -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/{name}"
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def template_server():
+    """ローカルで起動したテンプレート配布サーバー."""
+    server = StubTemplateServer()
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
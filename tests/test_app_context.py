@@ -0,0 +1,123 @@
+"""アプリケーションコンテキストのテスト."""
+
+import pytest
+
+from src.core.app_context import AppContext, get_app_context, set_app_context
+from src.core.renderer import QuartoRenderer
+from src.core.settings import Settings, reload_settings
+from src.tools import render
+
+
+class TestQuartoRendererComponents:
+    """QuartoRendererが構築時にコンポーネントを用意することのテスト."""
+    
+    def test_environment_read_once(self, monkeypatch):
+        """Kroki設定がインスタンス生成時に確定し、再読み込みの影響を受けないこと."""
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", "http://kroki:8000")
+        monkeypatch.setenv("QUARTO_MCP_KROKI_IMAGE_FORMAT", "svg")
+        reload_settings()
+        renderer = QuartoRenderer()
+        
+        monkeypatch.delenv("QUARTO_MCP_KROKI_URL")
+        reload_settings()
+        
+        assert renderer._is_kroki_enabled() is True
+        assert renderer.kroki_yaml_manager.kroki_service_url == "http://kroki:8000"
+        assert renderer._kroki_converter("html").image_format == "svg"
+    
+    def test_settings_passed_explicitly(self):
+        """渡された設定が使われること."""
+        settings = Settings(quarto_timeout=42, kroki_url="https://kroki.io")
+        renderer = QuartoRenderer(settings=settings)
+        
+        assert renderer.timeout == 42
+        assert renderer._is_kroki_enabled() is True
+        assert renderer.template_manager.download_timeout == settings.template_download_timeout
+    
+    def test_converters_cached_per_format(self):
+        """KrokiConverterが出力形式ごとに1回だけ生成されること."""
+        renderer = QuartoRenderer()
+        
+        assert renderer._kroki_converter("pptx") is renderer._kroki_converter("pptx")
+        assert renderer._kroki_converter("pptx") is not renderer._kroki_converter("html")
+    
+    @pytest.mark.asyncio
+    async def test_quarto_version_cached(self, monkeypatch):
+        """Quartoのバージョン取得が1回だけ実行されること."""
+        calls = []
+        
+        class FakeProcess:
+            returncode = 0
+            
+            async def communicate(self):
+                return b"1.6.40\n", b""
+        
+        async def fake_exec(*args, **kwargs):
+            calls.append(args)
+            return FakeProcess()
+        
+        monkeypatch.setattr("asyncio.create_subprocess_exec", fake_exec)
+        renderer = QuartoRenderer()
+        
+        assert await renderer._get_quarto_version() == "1.6.40"
+        assert await renderer._get_quarto_version() == "1.6.40"
+        assert len(calls) == 1
+
+
+class TestAppContext:
+    """AppContextのテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_render_uses_context_renderer(self, tmp_path, monkeypatch):
+        """渡されたレンダラーが使われ、新たに構築されないこと."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        context = AppContext(config_path=config_file)
+        await context.startup()
+        used = []
+        
+        async def fake_render(**kwargs):
+            used.append(kwargs["format_id"])
+            raise ValueError("stop")
+        
+        monkeypatch.setattr(context.renderer, "render", fake_render)
+        monkeypatch.setattr(
+            "src.tools.render.QuartoRenderer",
+            lambda **kwargs: pytest.fail("renderer should not be constructed"),
+        )
+        
+        result = await render.render("# Test", "html", "out.html", renderer=context.renderer)
+        
+        assert used == ["html"]
+        assert result["success"] is False
+        await context.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_latency_model_shared(self, tmp_path):
+        """スケジューラーとワーカープールがレンダラーの所要時間の分布を共有すること."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        context = AppContext(config_path=config_file, settings=Settings(jobs_store_dir=None, render_workers=1))
+        try:
+            assert context.scheduler.latency is context.renderer.latency
+            assert context.workers.latency is context.renderer.latency
+            
+            context.renderer.latency.record("pdf", 4.0)
+            assert context.scheduler.estimate("pdf") == pytest.approx(4.0)
+            assert context.status()["latency"]["pdf"]["samples"] == 1
+        finally:
+            await context.aclose()
+    
+    def test_set_and_get(self):
+        """設定したコンテキストを取得できること."""
+        context = AppContext()
+        set_app_context(context)
+        try:
+            assert get_app_context() is context
+        finally:
+            set_app_context(None)
+        assert get_app_context() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
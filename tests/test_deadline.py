@@ -0,0 +1,81 @@
+"""レンダリング要求の期限のテスト."""
+
+import sys
+import time
+
+import pytest
+
+from src.core.deadline import Deadline, current_deadline, deadline_scope
+from src.core.renderer import QuartoRenderer, QuartoRenderError
+
+
+class TestDeadline:
+    """Deadlineのテスト."""
+    
+    def test_from_request(self):
+        """時間予算と絶対期限から早い方を期限にすること."""
+        now = [1000.0]
+        clock = lambda: now[0]
+        
+        assert Deadline.from_request(clock=clock) is None
+        deadline = Deadline.from_request(time_budget_ms=5000, clock=clock)
+        assert deadline.at == 1005.0
+        assert deadline.budget == 5.0
+        
+        deadline = Deadline.from_request(time_budget_ms=5000, deadline="1970-01-01T00:16:42Z", clock=clock)
+        assert deadline.at == 1002.0
+        
+        now[0] = 1001.5
+        assert deadline.remaining() == pytest.approx(0.5)
+        assert deadline.bound(600) == pytest.approx(0.5)
+        assert deadline.describe() == {"budget_ms": 2000, "used_ms": 1500, "remaining_ms": 500}
+        
+        now[0] = 1003.0
+        assert deadline.expired is True
+        assert deadline.bound(600) == 0
+    
+    @pytest.mark.parametrize("arguments", [
+        {"time_budget_ms": 0},
+        {"time_budget_ms": "soon"},
+        {"deadline": "tomorrow"},
+        {"deadline": "2030-01-01T00:00:00"},
+    ])
+    def test_invalid_values_rejected(self, arguments):
+        """不正な予算・期限はValueErrorになること."""
+        with pytest.raises(ValueError):
+            Deadline.from_request(**arguments)
+    
+    def test_scope(self):
+        """スコープ内だけ期限が設定されること."""
+        deadline = Deadline(time.time() + 10, 10)
+        with deadline_scope(deadline):
+            assert current_deadline() is deadline
+        assert current_deadline() is None
+
+
+class TestRendererDeadline:
+    """QuartoRendererが期限を守ることのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_expired_deadline_does_not_start_quarto(self, monkeypatch):
+        """期限を過ぎている場合はQuartoを起動せずにDEADLINE_EXCEEDEDになること."""
+        async def fail(*args, **kwargs):
+            raise AssertionError("Quarto must not be started")
+        
+        monkeypatch.setattr("src.core.renderer.create_subprocess_exec", fail)
+        renderer = QuartoRenderer()
+        with deadline_scope(Deadline(time.time() - 1, 5)):
+            with pytest.raises(QuartoRenderError) as exc_info:
+                await renderer._execute_quarto(["quarto", "render"])
+        assert exc_info.value.code == "DEADLINE_EXCEEDED"
+    
+    @pytest.mark.asyncio
+    async def test_timeout_is_remaining_budget(self):
+        """Quartoのタイムアウトが固定値ではなく残りの予算になること."""
+        renderer = QuartoRenderer(timeout=600)
+        start = time.monotonic()
+        with deadline_scope(Deadline(time.time() + 0.5, 0.5)):
+            with pytest.raises(QuartoRenderError) as exc_info:
+                await renderer._execute_quarto([sys.executable, "-c", "import time; time.sleep(30)"])
+        assert exc_info.value.code == "DEADLINE_EXCEEDED"
+        assert time.monotonic() - start < 10
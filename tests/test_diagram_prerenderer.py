@@ -0,0 +1,201 @@
+"""ダイアグラム事前レンダリングのテスト."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.converters.diagram_prerenderer import (
+    DiagramImageCache,
+    DiagramPrerenderer,
+    DiagramRenderError,
+    KrokiDiagramBackend,
+)
+from src.converters.kroki_client import KrokiClient
+from src.core.deadline import Deadline, deadline_scope
+from src.core.document import QuartoDocument
+from src.core.settings import reload_settings
+
+
+class FakeBackend:
+    """呼び出し回数と同時実行数を記録するテスト用バックエンド."""
+    
+    name = "fake"
+    
+    def __init__(self, fail_on=None, delay=0.0):
+        self.calls = []
+        self.fail_on = fail_on
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+    
+    async def render(self, source, image_format):
+        self.calls.append(source)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail_on and self.fail_on in source:
+                raise DiagramRenderError("boom")
+            return f"<svg>{source}</svg>".encode("utf-8")
+        finally:
+            self.active -= 1
+
+
+CONTENT = """---
+title: Test
+---
+
+# Slide
+
+```{mermaid #fig-flow}
+%%| fig-cap: Flow
+graph TD
+    A --> B
+```
+
+```mermaid
+sequenceDiagram
+    Alice->>Bob: Hello
+```
+"""
+
+
+class TestDiagramImageCache:
+    """DiagramImageCacheのテストクラス."""
+    
+    def test_put_and_get(self, tmp_path):
+        """保存した画像をキーで取得できること."""
+        cache = DiagramImageCache(tmp_path)
+        key = cache.make_key("fake", "svg", "graph TD")
+        
+        assert cache.get(key, "svg") is None
+        path = cache.put(key, "svg", b"<svg/>")
+        
+        assert cache.get(key, "svg") == path
+        assert path.read_bytes() == b"<svg/>"
+    
+    def test_key_depends_on_format_and_engine(self):
+        """キーがレンダラー名・画像形式・ソースに依存すること."""
+        keys = {
+            DiagramImageCache.make_key("kroki", "svg", "graph TD"),
+            DiagramImageCache.make_key("kroki", "png", "graph TD"),
+            DiagramImageCache.make_key("mmdc", "svg", "graph TD"),
+            DiagramImageCache.make_key("kroki", "svg", "graph LR"),
+        }
+        assert len(keys) == 4
+
+
+class TestDiagramPrerenderer:
+    """DiagramPrerendererのテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_blocks_replaced_with_images(self, tmp_path):
+        """Mermaidブロックが画像参照に置き換えられ、画像が作業ディレクトリに配置されること."""
+        backend = FakeBackend()
+        prerenderer = DiagramPrerenderer(backend, DiagramImageCache(tmp_path / "cache"))
+        document = QuartoDocument.parse(CONTENT)
+        workspace = tmp_path / "work"
+        workspace.mkdir()
+        
+        warnings = await prerenderer.prerender(document, "svg", workspace)
+        
+        assert warnings == []
+        assert "```" not in document.body
+        assert "![Flow](_diagrams/" in document.body
+        assert "{#fig-flow}" in document.body
+        assert document.front_matter == {"title": "Test"}
+        assert len(list((workspace / "_diagrams").iterdir())) == 2
+        # セルオプションはダイアグラムソースに含めない
+        assert all("%%|" not in source for source in backend.calls)
+    
+    @pytest.mark.asyncio
+    async def test_cache_reused_across_requests(self, tmp_path):
+        """変更のないダイアグラムは2回目以降レンダリングされないこと."""
+        backend = FakeBackend()
+        prerenderer = DiagramPrerenderer(backend, DiagramImageCache(tmp_path / "cache"))
+        
+        for index in range(3):
+            workspace = tmp_path / f"work{index}"
+            workspace.mkdir()
+            await prerenderer.prerender(QuartoDocument.parse(CONTENT), "svg", workspace)
+        
+        assert len(backend.calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_failed_block_is_kept(self, tmp_path):
+        """レンダリングに失敗したブロックは元のまま残り、警告が返ること."""
+        backend = FakeBackend(fail_on="sequenceDiagram")
+        prerenderer = DiagramPrerenderer(backend, DiagramImageCache(tmp_path / "cache"))
+        document = QuartoDocument.parse(CONTENT)
+        
+        warnings = await prerenderer.prerender(document, "png", tmp_path)
+        
+        assert len(warnings) == 1
+        assert "```mermaid\nsequenceDiagram" in document.body
+        assert "{#fig-flow}" in document.body
+    
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, tmp_path):
+        """同時レンダリング数が上限を超えないこと."""
+        backend = FakeBackend(delay=0.01)
+        prerenderer = DiagramPrerenderer(backend, DiagramImageCache(tmp_path / "cache"), concurrency=2)
+        content = "\n".join(f"```mermaid\ngraph TD\n    N{i}\n```\n" for i in range(8))
+        
+        await prerenderer.prerender(QuartoDocument.parse(content), "svg", tmp_path)
+        
+        assert len(backend.calls) == 8
+        assert backend.max_active <= 2
+    
+    @pytest.mark.asyncio
+    async def test_kroki_backend_fetches_within_budget(self, tmp_path, kroki_server):
+        """Krokiバックエンドはrender_manyでまとめて取得し、予算を超えたダイアグラムだけ元のまま残すこと."""
+        kroki_server.slow_delay = 1.0
+        client = KrokiClient(kroki_server.url, max_per_host=2)
+        backend = KrokiDiagramBackend(client, budget=0.3)
+        prerenderer = DiagramPrerenderer(backend, DiagramImageCache(tmp_path / "cache"))
+        content = "".join(f"```mermaid\ngraph TD\n    N{i}\n```\n\n" for i in range(4))
+        content += "```mermaid\ngraph TD\n    SLOW\n```\n"
+        document = QuartoDocument.parse(content)
+        
+        started = time.monotonic()
+        try:
+            warnings = await prerenderer.prerender(document, "svg", tmp_path)
+        finally:
+            await client.aclose()
+        
+        assert time.monotonic() - started < 0.9
+        assert len(kroki_server.requests) == 5
+        assert kroki_server.max_active <= 2
+        assert len(warnings) == 1 and "timed out" in warnings[0]
+        assert document.body.count("![](_diagrams/") == 4
+        assert "```mermaid\ngraph TD\n    SLOW" in document.body
+    
+    @pytest.mark.asyncio
+    async def test_kroki_budget_bounded_by_deadline(self, tmp_path, kroki_server):
+        """要求の期限が予算より短い場合は期限までで打ち切ること."""
+        kroki_server.slow_delay = 1.0
+        client = KrokiClient(kroki_server.url)
+        backend = KrokiDiagramBackend(client, budget=30.0)
+        
+        started = time.monotonic()
+        try:
+            with deadline_scope(Deadline.from_request(time_budget_ms=300)):
+                results = await backend.render_many(["graph TD", "SLOW"], "svg")
+        finally:
+            await client.aclose()
+        
+        assert time.monotonic() - started < 0.9
+        assert results[0] == b"<svg>graph TD</svg>"
+        assert isinstance(results[1], DiagramRenderError)
+    
+    def test_disabled_by_default(self, monkeypatch):
+        """環境変数が未設定の場合は事前レンダリングが無効であること."""
+        monkeypatch.delenv("QUARTO_MCP_DIAGRAM_PRERENDER", raising=False)
+        reload_settings()
+        
+        assert DiagramPrerenderer.from_environment() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
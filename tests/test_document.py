@@ -0,0 +1,119 @@
+"""QuartoDocumentのテスト."""
+
+import pytest
+import yaml
+
+from src.core.document import QuartoDocument
+from src.core.renderer import QuartoRenderer
+from src.converters.kroki_converter import KrokiConverter
+from src.managers.yaml_frontmatter_manager import YAMLFrontmatterManager
+
+
+class TestQuartoDocumentParse:
+    """QuartoDocument.parseのテストクラス."""
+    
+    def test_parse_without_front_matter(self):
+        """YAMLヘッダーがない場合は本文全体がbodyになること."""
+        content = "# Title\n\nBody"
+        document = QuartoDocument.parse(content)
+        
+        assert document.front_matter is None
+        assert document.has_front_matter is False
+        assert document.body == content
+    
+    def test_parse_with_front_matter(self):
+        """YAMLヘッダーと本文が分離されること."""
+        content = "---\ntitle: Test\n---\n\n# Content"
+        document = QuartoDocument.parse(content)
+        
+        assert document.front_matter == {"title": "Test"}
+        assert document.body == "# Content"
+    
+    def test_parse_non_dict_front_matter(self):
+        """辞書でないYAMLヘッダーは空辞書として扱われること."""
+        document = QuartoDocument.parse("---\njust a string\n---\n\n# Content")
+        
+        assert document.front_matter == {}
+        assert document.body.strip() == "# Content"
+    
+    def test_serialize_without_front_matter(self):
+        """フロントマターが空の場合は本文のみが返ること."""
+        document = QuartoDocument.parse("# Content")
+        
+        assert document.serialize() == "# Content"
+    
+    def test_serialize_roundtrip(self):
+        """シリアライズ結果を再解析すると同じフロントマターになること."""
+        document = QuartoDocument.parse("---\ntitle: テスト\nauthor: A\n---\n\n# Content\n")
+        
+        reparsed = QuartoDocument.parse(document.serialize())
+        
+        assert reparsed.front_matter == {"title": "テスト", "author": "A"}
+        assert reparsed.body.strip() == "# Content"
+
+
+class TestQuartoDocumentBlocks:
+    """フェンスコードブロック位置情報のテストクラス."""
+    
+    def test_blocks_spans(self):
+        """ブロックの位置とinfo文字列が取得できること."""
+        body = "text\n```{mermaid #fig-a}\ngraph TD\n```\n\n```python\nprint(1)\n```\n"
+        document = QuartoDocument.parse(body)
+        
+        blocks = document.blocks
+        assert len(blocks) == 2
+        assert blocks[0].language == "mermaid"
+        assert blocks[0].info == "{mermaid #fig-a}"
+        assert body[blocks[0].start:blocks[0].end] == "```{mermaid #fig-a}\ngraph TD\n```\n"
+        assert blocks[1].language == "python"
+    
+    def test_blocks_by_language(self):
+        """言語名でブロックを絞り込めること."""
+        document = QuartoDocument.parse("```mermaid\ngraph LR\n```\n```{mermaid}\npie\n```\n")
+        
+        assert len(document.blocks_by_language("mermaid")) == 2
+        assert document.blocks_by_language("python") == []
+    
+    def test_replace_body_resets_blocks(self):
+        """本文を置き換えるとブロック情報が再計算されること."""
+        document = QuartoDocument.parse("```mermaid\ngraph LR\n```\n")
+        assert len(document.blocks) == 1
+        
+        document.replace_body("no blocks")
+        assert document.blocks == []
+
+
+class TestSharedDocumentPipeline:
+    """解析済みドキュメントを共有する変換パイプラインのテストクラス."""
+    
+    def test_kroki_pipeline_on_document(self):
+        """KrokiConverterとYAMLFrontmatterManagerが同じドキュメントを更新すること."""
+        document = QuartoDocument.parse("---\ntitle: Test\n---\n\n```mermaid\ngraph LR\n```\n")
+        
+        converted = KrokiConverter(format_id="pptx", image_format="png").convert_document(document)
+        YAMLFrontmatterManager(kroki_service_url="http://kroki:8000").apply_kroki_config(document)
+        
+        assert converted == 1
+        assert "```kroki-mermaid" in document.body
+        assert document.front_matter["title"] == "Test"
+        assert document.front_matter["filters"] == ["quarto-kroki"]
+        assert document.front_matter["kroki"]["serviceUrl"] == "http://kroki:8000"
+    
+    def test_write_qmd_serializes_merged_header(self, tmp_path):
+        """_write_qmdがマージ済みヘッダーと本文を1つのファイルに書き出すこと."""
+        renderer = QuartoRenderer()
+        document = QuartoDocument.parse("---\ntitle: Test\n---\n\n# Content\n")
+        
+        qmd_path = tmp_path / "document.qmd"
+        renderer._write_qmd(qmd_path, document, "pptx", {"slide-level": 2}, "/tmp/t.pptx")
+        
+        written = qmd_path.read_text(encoding="utf-8")
+        header = yaml.safe_load(written.split("---\n")[1])
+        assert header["title"] == "Test"
+        assert header["pptx"]["slide-level"] == 2
+        assert header["pptx"]["reference-doc"] == "/tmp/t.pptx"
+        assert written.endswith("\n# Content\n")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,154 @@
+"""フェンスコードブロックトークナイザーのテスト."""
+
+import pytest
+
+from src.core.fence_tokenizer import tokenize_fenced_blocks, splice, rewrite_fence_info
+from src.converters.kroki_converter import KrokiConverter
+from src.core.renderer import QuartoRenderer
+from src.validators.mermaid_extractor import MermaidExtractor
+
+
+class TestTokenizeFencedBlocks:
+    """tokenize_fenced_blocksのテストクラス."""
+    
+    def test_backtick_and_tilde_fences(self):
+        """```と~~~の両方のフェンスを検出できること."""
+        text = "```mermaid\ngraph TD\n```\n~~~{mermaid}\npie\n~~~\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 2
+        assert blocks[0].fence == "```"
+        assert blocks[1].fence == "~~~"
+        assert blocks[1].is_braced is True
+        assert all(block.language == "mermaid" for block in blocks)
+    
+    def test_longer_fence_contains_shorter_fence(self):
+        """長いフェンス内の短いフェンスは入れ子のブロックとして扱わないこと."""
+        text = "````markdown\n```mermaid\ngraph TD\n```\n````\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].language == "markdown"
+        assert blocks[0].content(text) == "```mermaid\ngraph TD\n```\n"
+    
+    def test_closing_fence_must_match_character(self):
+        """異なる文字のフェンスでは閉じないこと."""
+        text = "~~~python\n```\nstill code\n~~~\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].end_line == 4
+    
+    def test_indented_fence(self):
+        """インデントされたフェンスを検出し、インデントを保持すること."""
+        text = "- item\n\n    ```mermaid\n    graph TD\n    ```\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].indent == "    "
+        assert blocks[0].start_line == 3
+        assert blocks[0].end_line == 5
+    
+    def test_fence_in_indented_code_block(self):
+        """4桁以上インデントされたフェンスはインデントコードブロックの一部として扱うこと."""
+        text = "Example:\n\n    ```mermaid\n    graph TD\n    A-->B\n    ```\n"
+        
+        assert tokenize_fenced_blocks(text) == []
+        assert KrokiConverter(format_id="html").convert(text) == text
+    
+    def test_fence_indent_relative_to_list_item(self):
+        """リスト項目の中ではインデントを項目の本文の桁から数えること."""
+        text = (
+            "1. step\n"
+            "   - nested\n\n"
+            "       ```mermaid\n       graph TD\n       ```\n\n"
+            "after the list\n\n"
+            "       ```mermaid\n       graph LR\n       ```\n"
+        )
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].start_line == 4
+        assert blocks[0].closed is True
+    
+    def test_indented_closing_fence_is_content(self):
+        """開始フェンスより4桁以上深いフェンス風の行では閉じないこと."""
+        text = "```markdown\n    ```\nstill code\n```\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].end_line == 4
+    
+    def test_backtick_info_with_backtick_is_not_fence(self):
+        """info文字列にバッククォートを含む行はフェンスとみなさないこと."""
+        blocks = tokenize_fenced_blocks("```inline``` text\n")
+        
+        assert blocks == []
+    
+    def test_unclosed_block(self):
+        """閉じられていないブロックは末尾までをブロックとすること."""
+        text = "# Title\n```{mermaid}\ngraph TD\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        assert len(blocks) == 1
+        assert blocks[0].closed is False
+        assert blocks[0].end == len(text)
+
+
+class TestSplice:
+    """splice / rewrite_fence_infoのテストクラス."""
+    
+    def test_splice_replacements(self):
+        """複数の置換が1回で適用されること."""
+        assert splice("abcdef", [(0, 1, "X"), (3, 5, "YZ")]) == "XbcYZf"
+    
+    def test_splice_without_replacements(self):
+        """置換がない場合は元のテキストを返すこと."""
+        assert splice("abc", []) == "abc"
+    
+    def test_rewrite_preserves_fence_and_indent(self):
+        """フェンス文字列・インデント・改行コードを保持すること."""
+        text = "  ~~~~mermaid\r\ngraph TD\r\n  ~~~~\r\n"
+        blocks = tokenize_fenced_blocks(text)
+        
+        result = rewrite_fence_info(text, blocks, "kroki-mermaid")
+        
+        assert result == "  ~~~~kroki-mermaid\r\ngraph TD\r\n  ~~~~\r\n"
+
+
+class TestFenceAwareConversion:
+    """トークナイザーを利用した変換処理のテストクラス."""
+    
+    NESTED = "````markdown\n```mermaid\ngraph TD\n```\n````\n\n```mermaid\ngraph LR\n```\n"
+    
+    def test_kroki_converter_skips_nested_fences(self):
+        """他のコードブロック内のMermaidフェンスはKroki記法に変換しないこと."""
+        result = KrokiConverter(format_id="html").convert(self.NESTED)
+        
+        assert result.count("```kroki-mermaid") == 1
+        assert "```mermaid\ngraph TD" in result
+    
+    def test_kroki_converter_tilde_fence(self):
+        """~~~フェンスもKroki記法に変換されること."""
+        result = KrokiConverter(format_id="html").convert("~~~{mermaid #fig-a}\ngraph TD\n~~~\n")
+        
+        assert result == "~~~kroki-mermaid\ngraph TD\n~~~\n"
+    
+    def test_mermaid_conversion_skips_nested_fences(self):
+        """標準Mermaid変換も他のコードブロック内のフェンスを変換しないこと."""
+        result = QuartoRenderer()._apply_mermaid_conversion(self.NESTED)
+        
+        assert result.count("```{mermaid}") == 1
+        assert "```mermaid\ngraph TD" in result
+    
+    def test_extractor_uses_tokenizer(self):
+        """MermaidExtractorが入れ子のフェンスを抽出しないこと."""
+        blocks = MermaidExtractor().extract_mermaid_blocks(self.NESTED)
+        
+        assert len(blocks) == 1
+        assert blocks[0]['code'] == "graph LR"
+        assert blocks[0]['start_line'] == 7
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
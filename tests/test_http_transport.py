@@ -0,0 +1,149 @@
+"""HTTPトランスポートとセッション集計のテスト."""
+
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from src import server as mcp_server
+from src.core.app_context import AppContext, set_app_context
+from src.core.sessions import SessionRegistry
+from src.core.settings import Settings
+from src.http_transport import HttpTransport
+
+
+PROTOCOL_VERSION = "2025-03-26"
+HEADERS = {"accept": "application/json, text/event-stream", "content-type": "application/json"}
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": PROTOCOL_VERSION,
+        "capabilities": {},
+        "clientInfo": {"name": "test", "version": "1.0"},
+    },
+}
+
+
+@asynccontextmanager
+async def http_app():
+    """セッション数の上限を1にしたHTTPトランスポートとクライアント."""
+    settings = Settings(server_max_sessions=1, jobs_store_dir="off")
+    context = AppContext(config_path=mcp_server.CONFIG_PATH, settings=settings)
+    set_app_context(context)
+    transport = HttpTransport(mcp_server.server, context.sessions, settings)
+    try:
+        async with transport.manager.run():
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=transport), base_url="http://test"
+            ) as client:
+                yield transport, client
+    finally:
+        set_app_context(None)
+        await context.aclose()
+
+
+async def _open_session(client):
+    response = await client.post("/mcp", headers=HEADERS, json=INITIALIZE)
+    assert response.status_code == 200
+    session_headers = dict(
+        HEADERS,
+        **{"mcp-session-id": response.headers["mcp-session-id"], "mcp-protocol-version": PROTOCOL_VERSION},
+    )
+    response = await client.post(
+        "/mcp", headers=session_headers, json={"jsonrpc": "2.0", "method": "notifications/initialized"}
+    )
+    assert response.status_code == 202
+    return session_headers
+
+
+class TestHttpTransport:
+    """HttpTransportのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_tool_call_is_accounted_to_session(self):
+        """HTTPセッションのツール呼び出しがセッションごとに集計されること."""
+        async with http_app() as (transport, client):
+            await self._check_tool_call(transport, client)
+    
+    async def _check_tool_call(self, transport, client):
+        headers = await _open_session(client)
+        session_id = headers["mcp-session-id"]
+        
+        response = await client.post(
+            "/mcp",
+            headers=headers,
+            json={"jsonrpc": "2.0", "id": 2, "method": "tools/call",
+                  "params": {"name": "quarto_list_formats", "arguments": {}}},
+        )
+        assert response.status_code == 200
+        assert "pptx" in response.text
+        
+        stats = transport.sessions.get(session_id)
+        assert stats.transport == "http"
+        assert stats.tool_calls == {"quarto_list_formats": 1}
+        assert stats.active_calls == 0
+    
+    @pytest.mark.asyncio
+    async def test_session_limit_and_close(self):
+        """上限を超えた新規セッションが503になり、DELETEで枠が空くこと."""
+        async with http_app() as (transport, client):
+            await self._check_session_limit(transport, client)
+    
+    async def _check_session_limit(self, transport, client):
+        headers = await _open_session(client)
+        
+        response = await client.post("/mcp", headers=HEADERS, json=INITIALIZE)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        
+        response = await client.delete("/mcp", headers=headers)
+        assert response.status_code == 200
+        assert transport.sessions.count("http") == 0
+        
+        response = await client.post("/mcp", headers=HEADERS, json=INITIALIZE)
+        assert response.status_code == 200
+    
+    @pytest.mark.asyncio
+    async def test_unknown_path(self):
+        """エンドポイント以外のパスが404になること."""
+        async with http_app() as (_, client):
+            response = await client.get("/other")
+            assert response.status_code == 404
+
+
+class TestSessionRegistry:
+    """SessionRegistryのテスト."""
+    
+    def test_track_call_counts_errors(self):
+        """例外で終了した呼び出しがエラーとして数えられること."""
+        registry = SessionRegistry()
+        with pytest.raises(RuntimeError):
+            with registry.track_call("s1", "http", "quarto_render"):
+                raise RuntimeError("boom")
+        
+        stats = registry.get("s1")
+        assert stats.tool_calls == {"quarto_render": 1}
+        assert stats.errors == 1
+        assert stats.active_calls == 0
+    
+    def test_record_render(self):
+        """レンダリングの成否が集計されること."""
+        registry = SessionRegistry()
+        with registry.track_call("s1", "stdio", "quarto_render") as stats:
+            SessionRegistry.record_render(stats, {"success": True})
+            SessionRegistry.record_render(stats, {"success": False, "error": {}})
+        assert (stats.renders, stats.render_failures) == (2, 1)
+    
+    def test_expire_idle(self):
+        """無通信のまま期限を過ぎたセッションだけが破棄されること."""
+        now = [100.0]
+        registry = SessionRegistry(idle_timeout=60, clock=lambda: now[0])
+        registry.open("old", "http")
+        now[0] += 50
+        registry.open("new", "http")
+        now[0] += 20
+        
+        assert registry.expire_idle() == ["old"]
+        assert registry.count("http") == 1
@@ -0,0 +1,256 @@
+"""非同期レンダリングジョブのテスト."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.core.deadline import Deadline
+from src.core.jobs import JobManager, JobNotFoundError, JobState, report_progress
+from src.tools import jobs
+
+
+class FakeRunner:
+    """ジョブの実行を外部から制御できるランナー."""
+    
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+    
+    async def __call__(self, request):
+        self.started.append(request["content"])
+        report_progress("rendering", 0.4)
+        await self.release.wait()
+        if request["content"] == "boom":
+            raise RuntimeError("boom")
+        return {"success": request["content"] != "fail", "output": request["content"]}
+
+
+async def _wait_until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def _request(content):
+    return {"content": content, "format": "html", "output_filename": f"/tmp/{content}.html"}
+
+
+class TestJobManager:
+    """JobManagerのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_submit_status_result(self):
+        """投入したジョブが実行され、状態と結果を取得できること."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1)
+        try:
+            record = await manager.submit(_request("a"))
+            await _wait_until(lambda: manager.get(record.job_id).state == JobState.RUNNING)
+            
+            status = manager.status(record.job_id)
+            assert status["stage"] == "rendering"
+            assert status["progress"] == pytest.approx(0.4)
+            assert status["queue_position"] is None
+            
+            runner.release.set()
+            await _wait_until(lambda: manager.get(record.job_id).finished)
+            assert manager.get(record.job_id).state == JobState.SUCCEEDED
+            assert manager.get(record.job_id).result == {"success": True, "output": "a"}
+            assert manager.status(record.job_id)["success"] is True
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_queue_position_and_concurrency(self):
+        """同時実行数を超えたジョブが待機し、待ち順位が返ること."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1)
+        try:
+            first = await manager.submit(_request("a"))
+            second = await manager.submit(_request("b"))
+            third = await manager.submit(_request("c"))
+            await _wait_until(lambda: runner.started == ["a"])
+            
+            assert manager.queue_position(first.job_id) is None
+            assert manager.queue_position(second.job_id) == 1
+            assert manager.queue_position(third.job_id) == 2
+            
+            runner.release.set()
+            await _wait_until(lambda: manager.get(third.job_id).finished)
+            assert runner.started == ["a", "b", "c"]
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_clients_take_turns(self):
+        """大量に投入したクライアントの後ろに、ほかのクライアントのジョブがすべて並ばないこと."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1)
+        try:
+            bulk = [await manager.submit(_request(f"bulk{i}"), client="agent") for i in range(4)]
+            await _wait_until(lambda: runner.started == ["bulk0"])
+            interactive = await manager.submit(_request("chat"), client="user")
+            
+            assert manager.get(interactive.job_id).client == "user"
+            assert manager.queue_position(interactive.job_id) == 1
+            assert manager.queue_position(bulk[3].job_id) == 4
+            
+            runner.release.set()
+            await _wait_until(lambda: manager.get(bulk[3].job_id).finished)
+            assert runner.started == ["bulk0", "chat", "bulk1", "bulk2", "bulk3"]
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_expired_job_is_not_run(self):
+        """待っている間に期限を過ぎたジョブは実行せずDEADLINE_EXCEEDEDで失敗させること."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1)
+        try:
+            first = await manager.submit(_request("a"))
+            late = await manager.submit(_request("late"), deadline=Deadline(time.time() + 0.1, 0.1))
+            await _wait_until(lambda: runner.started == ["a"])
+            assert manager.get(late.job_id).time_budget_ms == 100
+            await asyncio.sleep(0.2)
+            
+            runner.release.set()
+            await _wait_until(lambda: manager.get(late.job_id).finished)
+            assert manager.get(first.job_id).state == JobState.SUCCEEDED
+            assert manager.get(late.job_id).state == JobState.FAILED
+            assert manager.get(late.job_id).result["error"]["code"] == "DEADLINE_EXCEEDED"
+            assert runner.started == ["a"]
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_cancel_queued_and_running(self):
+        """待機中・実行中のジョブをキャンセルできること."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1)
+        try:
+            running = await manager.submit(_request("a"))
+            queued = await manager.submit(_request("b"))
+            await _wait_until(lambda: runner.started == ["a"])
+            
+            await manager.cancel(queued.job_id)
+            assert manager.get(queued.job_id).state == JobState.CANCELLED
+            
+            await manager.cancel(running.job_id)
+            assert manager.get(running.job_id).state == JobState.CANCELLED
+            
+            # ワーカーは次のジョブを受け付けられる
+            runner.release.set()
+            record = await manager.submit(_request("c"))
+            await _wait_until(lambda: manager.get(record.job_id).finished)
+            assert runner.started == ["a", "c"]
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_runner_exception_marks_failed(self):
+        """ランナーの例外がFAILEDとErrorResponse形式の結果になること."""
+        runner = FakeRunner()
+        runner.release.set()
+        manager = JobManager(runner)
+        try:
+            record = await manager.submit(_request("boom"))
+            await _wait_until(lambda: manager.get(record.job_id).finished)
+            assert record.state == JobState.FAILED
+            assert record.result["error"]["code"] == "UNKNOWN_ERROR"
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_retention(self):
+        """保持期間と件数の上限を超えた終了済みジョブが削除されること."""
+        now = [1000.0]
+        runner = FakeRunner()
+        runner.release.set()
+        manager = JobManager(runner, retention=60, max_retained=2, clock=lambda: now[0])
+        try:
+            ids = []
+            for content in ("a", "b", "c"):
+                record = await manager.submit(_request(content))
+                await _wait_until(lambda: manager.get(record.job_id).finished)
+                ids.append(record.job_id)
+            
+            await manager._prune()
+            with pytest.raises(JobNotFoundError):
+                manager.get(ids[0])
+            assert manager.get(ids[2]).finished
+            
+            now[0] += 61
+            await manager._prune()
+            with pytest.raises(JobNotFoundError):
+                manager.get(ids[2])
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_results_survive_restart(self, tmp_path):
+        """保存したジョブが再起動後に読み込まれ、未完了のジョブは中断扱いになること."""
+        runner = FakeRunner()
+        manager = JobManager(runner, max_concurrency=1, store_dir=tmp_path)
+        done = await manager.submit(_request("a"))
+        runner.release.set()
+        await _wait_until(lambda: manager.get(done.job_id).finished)
+        runner.release.clear()
+        pending = await manager.submit(_request("b"))
+        waiting = await manager.submit(_request("c"))
+        await _wait_until(lambda: runner.started == ["a", "b"])
+        # 待機中のジョブはプロセスが落ちた場合と同じく保存された状態のまま残る
+        manager._pending.clear()
+        await manager.aclose()
+        
+        restarted = JobManager(runner, store_dir=tmp_path)
+        assert await restarted.load() == 3
+        assert restarted.get(done.job_id).result == {"success": True, "output": "a"}
+        assert restarted.get(pending.job_id).state == JobState.CANCELLED
+        assert restarted.get(waiting.job_id).state == JobState.FAILED
+        assert restarted.get(waiting.job_id).result["error"]["code"] == "INTERRUPTED"
+
+
+class TestJobTools:
+    """ジョブ関連ツールのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_result_before_finish_and_unknown_job(self):
+        """未終了のジョブと存在しないジョブにエラーを返すこと."""
+        runner = FakeRunner()
+        manager = JobManager(runner)
+        try:
+            submitted = await jobs.submit(manager, "a", "html", "/tmp/a.html")
+            assert submitted["state"] == JobState.QUEUED
+            
+            result = await jobs.result(manager, submitted["job_id"])
+            assert result["error"]["code"] == "JOB_NOT_FINISHED"
+            
+            runner.release.set()
+            await _wait_until(lambda: manager.get(submitted["job_id"]).finished)
+            result = await jobs.result(manager, submitted["job_id"])
+            assert result == {"success": True, "output": "a"}
+            
+            for handler in (jobs.status, jobs.result, jobs.cancel):
+                response = await handler(manager, "missing")
+                assert response["error"]["code"] == "JOB_NOT_FOUND"
+        finally:
+            await manager.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_job_result(self):
+        """キャンセルしたジョブの結果がJOB_CANCELLEDになること."""
+        runner = FakeRunner()
+        manager = JobManager(runner)
+        try:
+            submitted = await jobs.submit(manager, "a", "html", "/tmp/a.html")
+            await _wait_until(lambda: runner.started == ["a"])
+            
+            status = await jobs.cancel(manager, submitted["job_id"])
+            assert status["state"] == JobState.CANCELLED
+            result = await jobs.result(manager, submitted["job_id"])
+            assert result["error"]["code"] == "JOB_CANCELLED"
+        finally:
+            await manager.aclose()
@@ -0,0 +1,122 @@
+"""KrokiClientのテスト（ローカルのKroki代替サーバーを使用）."""
+
+import time
+
+import pytest
+
+from src.converters.kroki_client import (
+    KrokiClient,
+    KrokiClientError,
+    KrokiTimeoutError,
+    get_shared_kroki_client,
+)
+from src.core.settings import reload_settings
+
+
+class TestKrokiClient:
+    """KrokiClientのテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_render_posts_source(self, kroki_server):
+        """ダイアグラムのソースがPOSTで送信されること."""
+        client = KrokiClient(kroki_server.url)
+        try:
+            data = await client.render("mermaid", "graph TD\n    A --> B", "svg")
+        finally:
+            await client.aclose()
+        
+        assert data == b"<svg>graph TD\n    A --> B</svg>"
+        path, source, content_type = kroki_server.requests[0]
+        assert path == "/mermaid/svg"
+        assert source == "graph TD\n    A --> B"
+        assert content_type == "text/plain"
+    
+    @pytest.mark.asyncio
+    async def test_render_many_parallel_with_host_limit(self, kroki_server):
+        """ホストごとの上限内で並行に取得し、接続が再利用されること."""
+        kroki_server.delay = 0.05
+        client = KrokiClient(kroki_server.url, max_per_host=5)
+        requests = [("mermaid", f"graph TD\n    N{i}", "svg") for i in range(20)]
+        
+        started = time.monotonic()
+        try:
+            results = await client.render_many(requests)
+        finally:
+            await client.aclose()
+        elapsed = time.monotonic() - started
+        
+        assert results == [f"<svg>{source}</svg>".encode("utf-8") for _, source, _ in requests]
+        # 直列なら1秒以上かかる（20 x 50ms）
+        assert elapsed < 0.6
+        assert kroki_server.max_active <= 5
+        # keep-aliveにより接続数は同時リクエスト数以下に抑えられる
+        assert len(kroki_server.connections) <= 5
+    
+    @pytest.mark.asyncio
+    async def test_render_many_reports_failures_per_item(self, kroki_server):
+        """失敗したダイアグラムだけがエラーになること."""
+        client = KrokiClient(kroki_server.url)
+        try:
+            results = await client.render_many([
+                ("mermaid", "graph TD", "svg"),
+                ("mermaid", "FAIL", "svg"),
+                ("mermaid", "pie", "png"),
+            ])
+        finally:
+            await client.aclose()
+        
+        assert results[0] == b"<svg>graph TD</svg>"
+        assert isinstance(results[1], KrokiClientError)
+        assert results[1].status_code == 500
+        assert results[2] == b"<svg>pie</svg>"
+    
+    @pytest.mark.asyncio
+    async def test_render_many_budget(self, kroki_server):
+        """時間予算を超えたダイアグラムはタイムアウトエラーになること."""
+        kroki_server.slow_delay = 1.0
+        client = KrokiClient(kroki_server.url)
+        
+        started = time.monotonic()
+        try:
+            results = await client.render_many(
+                [("mermaid", "graph TD", "svg"), ("mermaid", "SLOW", "svg")],
+                budget=0.3,
+            )
+        finally:
+            await client.aclose()
+        
+        assert time.monotonic() - started < 0.9
+        assert results[0] == b"<svg>graph TD</svg>"
+        assert isinstance(results[1], KrokiTimeoutError)
+    
+    @pytest.mark.asyncio
+    async def test_connection_error(self):
+        """接続できない場合はKrokiClientErrorになること."""
+        client = KrokiClient("http://127.0.0.1:9", request_timeout=1.0)
+        try:
+            with pytest.raises(KrokiClientError):
+                await client.render("mermaid", "graph TD", "svg")
+        finally:
+            await client.aclose()
+    
+    def test_shared_client_uses_environment(self, monkeypatch, kroki_server):
+        """QUARTO_MCP_KROKI_URLに対応する共有クライアントが返ること."""
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", kroki_server.url)
+        reload_settings()
+        
+        client = get_shared_kroki_client()
+        
+        assert client is not None
+        assert client.service_url == kroki_server.url
+        assert get_shared_kroki_client() is client
+    
+    def test_shared_client_disabled(self, monkeypatch):
+        """URLが未設定の場合はNoneが返ること."""
+        monkeypatch.delenv("QUARTO_MCP_KROKI_URL", raising=False)
+        reload_settings()
+        
+        assert get_shared_kroki_client() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,294 @@
+"""Krokiヘルスチェックとサーキットブレーカーのテスト."""
+
+import pytest
+
+from src.converters.diagram_prerenderer import DiagramRenderError, KrokiDiagramBackend
+from src.converters.kroki_client import KrokiClient
+from src.converters.kroki_health import (
+    CircuitBreaker,
+    KrokiHealthMonitor,
+    get_shared_kroki_health_monitor,
+)
+from src.core.renderer import QuartoRenderer, QuartoRenderError
+from src.core.settings import reload_settings
+
+
+class FakeClock:
+    """手動で進めるテスト用の時計."""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    """CircuitBreakerのテストクラス."""
+    
+    def test_opens_after_threshold(self):
+        """連続失敗が閾値に達すると回路が開くこと."""
+        breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+        
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+    
+    def test_success_resets_failures(self):
+        """成功すると連続失敗回数がリセットされること."""
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_half_open_allows_single_trial(self):
+        """reset_timeout経過後は1件だけ試行が許可されること."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+        breaker.record_failure()
+        
+        clock.now += 29
+        assert breaker.allow_request() is False
+        
+        clock.now += 1
+        assert breaker.allow_request() is True
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is False
+    
+    def test_half_open_failure_reopens(self):
+        """half_open中の失敗で回路が再び開くこと."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.0, clock=clock)
+        breaker.trip()
+        clock.now += 10
+        breaker.allow_request()
+        
+        breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestKrokiHealthMonitor:
+    """KrokiHealthMonitorのテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_result_is_cached(self, kroki_server):
+        """TTL内はヘルスチェックを再実行しないこと."""
+        clock = FakeClock()
+        monitor = KrokiHealthMonitor(KrokiClient(kroki_server.url), ttl=15.0, clock=clock)
+        
+        for _ in range(5):
+            assert await monitor.is_available() is True
+        
+        assert kroki_server.health_checks == 1
+        await monitor.client.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_stale_result_refreshed_in_background(self, kroki_server):
+        """TTL経過後は判定を待たせずに裏で再確認すること."""
+        clock = FakeClock()
+        monitor = KrokiHealthMonitor(KrokiClient(kroki_server.url), ttl=15.0, clock=clock)
+        await monitor.is_available()
+        
+        kroki_server.healthy = False
+        clock.now += 15
+        assert await monitor.is_available() is True
+        await monitor._probe_task
+        
+        assert kroki_server.health_checks == 2
+        assert await monitor.is_available() is False
+        await monitor.client.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_unhealthy_service_short_circuits(self, kroki_server):
+        """回路が開いている間はKrokiに問い合わせないこと."""
+        kroki_server.healthy = False
+        clock = FakeClock()
+        monitor = KrokiHealthMonitor(
+            KrokiClient(kroki_server.url),
+            breaker=CircuitBreaker(reset_timeout=30.0, clock=clock),
+            clock=clock,
+        )
+        
+        assert await monitor.is_available() is False
+        for _ in range(5):
+            assert await monitor.is_available() is False
+        
+        assert kroki_server.health_checks == 1
+        await monitor.client.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_recovers_through_half_open(self, kroki_server):
+        """reset_timeout経過後のヘルスチェック成功で回路が閉じること."""
+        kroki_server.healthy = False
+        clock = FakeClock()
+        monitor = KrokiHealthMonitor(
+            KrokiClient(kroki_server.url),
+            breaker=CircuitBreaker(reset_timeout=30.0, clock=clock),
+            clock=clock,
+        )
+        assert await monitor.is_available() is False
+        
+        kroki_server.healthy = True
+        clock.now += 30
+        
+        assert await monitor.is_available() is True
+        assert monitor.breaker.state == CircuitBreaker.CLOSED
+        await monitor.client.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_probe_exception_reopens_circuit(self, kroki_server):
+        """ヘルスチェックがHTTPエラー以外の例外を送出しても、half_openのまま残らず回路が開くこと."""
+        kroki_server.healthy = False
+        clock = FakeClock()
+        monitor = KrokiHealthMonitor(
+            KrokiClient(kroki_server.url),
+            breaker=CircuitBreaker(reset_timeout=30.0, clock=clock),
+            clock=clock,
+        )
+        assert await monitor.is_available() is False
+        
+        async def broken_health(timeout=None):
+            raise RuntimeError("unexpected response")
+        
+        monitor.client.health = broken_health
+        clock.now += 30
+        assert await monitor.is_available() is False
+        assert monitor.breaker.state == CircuitBreaker.OPEN
+        
+        # 次のreset_timeout経過後は再びヘルスチェックで回復できる
+        del monitor.client.health
+        kroki_server.healthy = True
+        clock.now += 30
+        assert await monitor.is_available() is True
+        assert monitor.breaker.state == CircuitBreaker.CLOSED
+        await monitor.client.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_unreachable_service(self):
+        """接続できないサービスは利用不可と判定されること."""
+        monitor = KrokiHealthMonitor(KrokiClient("http://127.0.0.1:9"), probe_timeout=0.5)
+        
+        assert await monitor.is_available() is False
+        await monitor.client.aclose()
+
+
+class TestKrokiDiagramBackendBreaker:
+    """KrokiDiagramBackendとサーキットブレーカーの連携テスト."""
+    
+    @pytest.mark.asyncio
+    async def test_server_errors_open_circuit(self, kroki_server):
+        """5xxが続くと回路が開き、以降は即座に失敗すること."""
+        client = KrokiClient(kroki_server.url)
+        monitor = KrokiHealthMonitor(client, breaker=CircuitBreaker(failure_threshold=2))
+        backend = KrokiDiagramBackend(client, monitor)
+        
+        for _ in range(2):
+            with pytest.raises(DiagramRenderError):
+                await backend.render("FAIL", "svg")
+        assert monitor.breaker.state == CircuitBreaker.OPEN
+        
+        with pytest.raises(DiagramRenderError, match="circuit open"):
+            await backend.render("graph TD", "svg")
+        assert len(kroki_server.requests) == 2
+        await client.aclose()
+
+
+class TestRendererKrokiFallback:
+    """QuartoRendererのKroki可用性判定のテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_unavailable_kroki(self, monkeypatch, kroki_server):
+        """Krokiが障害中の場合は利用不可と判定されること."""
+        kroki_server.healthy = False
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", kroki_server.url)
+        reload_settings()
+        renderer = QuartoRenderer()
+        
+        assert await renderer._is_kroki_available() is False
+        assert get_shared_kroki_health_monitor().breaker.state == CircuitBreaker.OPEN
+    
+    @pytest.mark.asyncio
+    async def test_available_kroki(self, monkeypatch, kroki_server):
+        """Krokiが正常な場合は利用可能と判定されること."""
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", kroki_server.url)
+        reload_settings()
+        renderer = QuartoRenderer()
+        
+        assert await renderer._is_kroki_available() is True
+    
+    
+    @pytest.mark.asyncio
+    async def test_quarto_kroki_failures_open_circuit(self, tmp_path, monkeypatch, kroki_server):
+        """/healthが正常でも、Krokiを使うQuartoの実行が失敗し続けると回路が開くこと."""
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", kroki_server.url)
+        monkeypatch.setenv("QUARTO_MCP_KROKI_BREAKER_THRESHOLD", "2")
+        reload_settings()
+        renderer = QuartoRenderer()
+        outcomes = [
+            QuartoRenderError("Quarto CLI timed out after 30 seconds", code="TIMEOUT"),
+            QuartoRenderError("Quarto CLI exited with code 1", stderr="Error running filter quarto-kroki", code="RENDER_FAILED"),
+            QuartoRenderError("Quarto CLI exited with code 1", stderr="kroki: HTTP 500", code="RENDER_FAILED"),
+        ]
+        
+        async def fake_quarto(command, cwd=None, timeout=None):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            (cwd / "document.html").write_text("<html></html>", encoding="utf-8")
+            return "", "", None
+        
+        monkeypatch.setattr(renderer, "_deploy_kroki_extension_or_raise", lambda temp_dir: None)
+        monkeypatch.setattr(renderer, "_execute_quarto", fake_quarto)
+        content = "```mermaid\ngraph TD\n    A-->B\n```\n"
+        monitor = get_shared_kroki_health_monitor()
+        
+        with pytest.raises(QuartoRenderError):
+            await renderer.render(content, "html", str(tmp_path / "a.html"))
+        assert monitor.breaker.state == CircuitBreaker.CLOSED
+        
+        # 成功すると連続失敗回数はリセットされる
+        outcomes.insert(0, None)
+        await renderer.render(content, "html", str(tmp_path / "b.html"))
+        for name in ("c", "d"):
+            with pytest.raises(QuartoRenderError):
+                await renderer.render(content, "html", str(tmp_path / f"{name}.html"))
+        assert monitor.breaker.state == CircuitBreaker.OPEN
+        assert kroki_server.health_checks == 1
+        assert await renderer._is_kroki_available() is False
+    
+    @pytest.mark.asyncio
+    async def test_unrelated_quarto_failure_not_counted(self, tmp_path, monkeypatch, kroki_server):
+        """Krokiと無関係な失敗や、図のない文書の失敗はKrokiの障害として数えないこと."""
+        monkeypatch.setenv("QUARTO_MCP_KROKI_URL", kroki_server.url)
+        monkeypatch.setenv("QUARTO_MCP_KROKI_BREAKER_THRESHOLD", "1")
+        reload_settings()
+        renderer = QuartoRenderer()
+        
+        async def failing_quarto(command, cwd=None, timeout=None):
+            raise QuartoRenderError("Quarto CLI timed out after 30 seconds", code="TIMEOUT")
+        
+        async def latex_error(command, cwd=None, timeout=None):
+            raise QuartoRenderError("Quarto CLI exited with code 1", stderr="! LaTeX Error", code="RENDER_FAILED")
+        
+        monkeypatch.setattr(renderer, "_deploy_kroki_extension_or_raise", lambda temp_dir: None)
+        monkeypatch.setattr(renderer, "_execute_quarto", failing_quarto)
+        with pytest.raises(QuartoRenderError):
+            await renderer.render("# No diagrams\n", "html", str(tmp_path / "a.html"))
+        
+        monkeypatch.setattr(renderer, "_execute_quarto", latex_error)
+        with pytest.raises(QuartoRenderError):
+            await renderer.render("```mermaid\ngraph TD\n```\n", "html", str(tmp_path / "b.html"))
+        
+        assert get_shared_kroki_health_monitor().breaker.state == CircuitBreaker.CLOSED
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -3,6 +3,7 @@
 import os
 import pytest
 from src.converters.kroki_converter import KrokiConverter
+from src.core.settings import reload_settings
 from src.managers.yaml_frontmatter_manager import YAMLFrontmatterManager
 
 
@@ -74,6 +75,7 @@ sequenceDiagram
     def test_env_var_override(self, monkeypatch):
         """環境変数が画像形式の指定を上書きすることをテスト."""
         monkeypatch.setenv("QUARTO_MCP_KROKI_IMAGE_FORMAT", "svg")
+        reload_settings()
         
         # pptxは通常pngだが、環境変数でsvgに上書きされる
         converter = KrokiConverter(format_id="pptx", image_format="auto")
@@ -0,0 +1,81 @@
+"""出力形式ごとの所要時間の分布と適応タイムアウトのテスト."""
+
+import pytest
+
+from src.core.latency import LatencyModel, measure
+
+
+class TestMeasure:
+    """measure()のテスト."""
+    
+    def test_counts_bytes_and_diagrams(self):
+        """UTF-8のバイト数と図のコードブロック数を数えること."""
+        content = "# 見出し\n\n```mermaid\ngraph TD; A-->B\n```\n\n```python\nprint(1)\n```\n\n```{dot}\ndigraph {}\n```\n"
+        size_bytes, diagrams = measure(content)
+        
+        assert size_bytes == len(content.encode("utf-8"))
+        assert diagrams == 2
+
+
+class TestLatencyModel:
+    """LatencyModelのテスト."""
+    
+    def test_uses_max_timeout_until_enough_samples(self):
+        """実測がmin_samples件に満たない形式は上限のタイムアウトを使うこと."""
+        model = LatencyModel(max_timeout=600, min_timeout=1, min_samples=3)
+        model.record("gfm", 0.5)
+        model.record("gfm", 0.5)
+        assert model.timeout("gfm") == 600
+        
+        model.record("gfm", 0.5)
+        assert model.timeout("gfm") == pytest.approx(1.5)
+        assert model.timeout("pdf") == 600
+    
+    def test_timeout_is_clamped(self):
+        """タイムアウトはmin_timeout〜max_timeoutに収まること."""
+        model = LatencyModel(max_timeout=60, min_timeout=10, min_samples=1)
+        model.record("gfm", 0.2)
+        model.record("pdf", 30.0)
+        
+        assert model.timeout("gfm") == 10
+        assert model.timeout("pdf") == 60
+    
+    def test_scales_with_document_size(self):
+        """推定所要時間とタイムアウトが文書の大きさに応じて伸びること."""
+        model = LatencyModel(max_timeout=600, min_timeout=1, multiplier=2, min_samples=1)
+        model.record("html", 4.0, size_bytes=LatencyModel.SIZE_UNIT, diagrams=2)
+        
+        # 作業量4で4秒 = 作業量1あたり1秒
+        assert model.expected("html") == pytest.approx(1.0)
+        assert model.expected("html", size_bytes=3 * LatencyModel.SIZE_UNIT, diagrams=1) == pytest.approx(5.0)
+        assert model.timeout("html", diagrams=4) == pytest.approx(10.0)
+    
+    def test_quantiles(self):
+        """タイムアウトは分位点を、推定所要時間は中央値を基準にすること."""
+        model = LatencyModel(max_timeout=600, min_timeout=1, multiplier=1, quantile=0.9, min_samples=1)
+        for seconds in range(1, 12):
+            model.record("pdf", float(seconds))
+        
+        assert model.expected("pdf") == pytest.approx(6.0)
+        assert model.timeout("pdf") == pytest.approx(10.0)
+        snapshot = model.snapshot()["pdf"]
+        assert snapshot["samples"] == 11
+        assert snapshot["p50_ms"] == 6000
+        assert snapshot["timeout_s"] == 10.0
+    
+    def test_default_estimate_and_disabled(self):
+        """実測がなければ既定の推定値を使い、無効の場合はタイムアウトを変えないこと."""
+        model = LatencyModel(max_timeout=600, min_samples=1, default_estimate=7.0, adaptive=False)
+        assert model.expected("docx") == 7.0
+        
+        model.record("docx", 1.0)
+        assert model.timeout("docx") == 600
+    
+    def test_window(self):
+        """直近window件の実測だけを使うこと."""
+        model = LatencyModel(min_samples=1, window=3)
+        for seconds in (100.0, 1.0, 1.0, 1.0):
+            model.record("pdf", seconds)
+        
+        assert model.snapshot()["pdf"]["samples"] == 3
+        assert model.expected("pdf") == pytest.approx(1.0)
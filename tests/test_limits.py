@@ -0,0 +1,63 @@
+"""Quartoの子プロセスの資源制限とレーンのテスト."""
+
+import sys
+
+import pytest
+
+from src.core.limits import BATCH, INTERACTIVE, JOB, ResourceLimits, current_lane, lane_scope
+from src.core.renderer import QuartoRenderer, QuartoRenderError
+from src.core.settings import Settings
+
+
+class TestResourceLimits:
+    """ResourceLimitsのテスト."""
+    
+    def test_from_settings(self):
+        """設定の値から子プロセスに渡す制限を作ること."""
+        settings = Settings(
+            quarto_memory_limit_mb=4096,
+            quarto_cpu_limit=300,
+            lane_nice={"job": 10},
+            lane_io_priority={"job": "idle"},
+        )
+        limits = ResourceLimits.from_settings(settings)
+        
+        assert limits.for_lane(JOB) == {"as": 4096 * 1024 * 1024, "cpu": 300, "nice": 10}
+        assert limits.for_lane(INTERACTIVE) == {"as": 4096 * 1024 * 1024, "cpu": 300}
+        assert ResourceLimits().for_lane(INTERACTIVE) is None
+    
+    def test_io_priority_command(self):
+        """I/O優先度が設定されたレーンだけioniceを経由して起動すること."""
+        limits = ResourceLimits(
+            io_priority={"job": "idle", "batch": "best-effort:7"}, ionice_path="/usr/bin/ionice"
+        )
+        
+        assert limits.command(["deno", "run"], JOB) == ["/usr/bin/ionice", "-c", "3", "-t", "--", "deno", "run"]
+        assert limits.command(["deno"], BATCH) == ["/usr/bin/ionice", "-c", "2", "-n", "7", "-t", "--", "deno"]
+        assert limits.command(["deno"], INTERACTIVE) == ["deno"]
+    
+    def test_lane_scope(self):
+        """スコープ内だけレーンが設定され、未知のレーンは拒否すること."""
+        assert current_lane() == INTERACTIVE
+        with lane_scope(JOB):
+            assert current_lane() == JOB
+        assert current_lane() == INTERACTIVE
+        
+        with pytest.raises(ValueError):
+            with lane_scope("bulk"):
+                pass
+
+
+class TestRendererLimits:
+    """QuartoRendererが資源制限を適用することのテスト."""
+    
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(sys.platform == "win32", reason="RLIMIT_CPU is not available on Windows")
+    async def test_cpu_limit(self):
+        """CPU時間の上限を超えたQuartoはRESOURCE_LIMITで失敗すること."""
+        renderer = QuartoRenderer(timeout=60)
+        renderer.limits = ResourceLimits(cpu_seconds=1)
+        
+        with pytest.raises(QuartoRenderError) as exc_info:
+            await renderer._execute_quarto([sys.executable, "-c", "while True: pass"])
+        assert exc_info.value.code == "RESOURCE_LIMIT"
@@ -0,0 +1,170 @@
+"""ログ出力パイプラインのテスト."""
+
+import json
+import logging
+
+import pytest
+
+from src.core.logging_setup import (
+    DiagnosticsBuffer,
+    JsonFormatter,
+    SamplingFilter,
+    capture_diagnostics,
+    configure_logging,
+    diagnostics_scope,
+    shutdown_logging,
+)
+from src.core.renderer import QuartoRenderer, QuartoRenderError
+from src.core.settings import Settings
+
+
+def make_record(name="src.core.renderer", level=logging.INFO, msg="hello", **extra):
+    """テスト用のログレコードを作成する."""
+    record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class RecordingHandler(logging.Handler):
+    """受け取ったレコードを保持するハンドラー."""
+    
+    def __init__(self):
+        super().__init__()
+        self.records = []
+    
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def recording_logger():
+    """伝播しないロガーと記録用ハンドラーを用意する."""
+    target = logging.getLogger("tests.diagnostics")
+    handler = RecordingHandler()
+    target.addHandler(handler)
+    target.propagate = False
+    target.setLevel(logging.DEBUG)
+    yield target, handler
+    target.removeHandler(handler)
+    target.propagate = True
+
+
+class TestJsonFormatter:
+    """JsonFormatterのテストクラス."""
+    
+    def test_structured_output(self):
+        """レコードが1行のJSONになり、extraが含まれること."""
+        line = JsonFormatter().format(make_record(msg="rendered", request_id="abc"))
+        
+        entry = json.loads(line)
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "src.core.renderer"
+        assert entry["message"] == "rendered"
+        assert entry["request_id"] == "abc"
+        assert "\n" not in line
+
+
+class TestSamplingFilter:
+    """SamplingFilterのテストクラス."""
+    
+    def test_samples_info_records(self):
+        """INFO以下は指定した割合だけ通すこと."""
+        sampler = SamplingFilter({"src.core": 0.25})
+        
+        passed = [sampler.filter(make_record()) for _ in range(8)]
+        
+        assert passed.count(True) == 2
+    
+    def test_warnings_and_other_loggers_pass(self):
+        """WARNING以上と対象外のロガーは間引かないこと."""
+        sampler = SamplingFilter({"src.core": 0})
+        
+        assert sampler.filter(make_record(level=logging.WARNING)) is True
+        assert sampler.filter(make_record(name="src.tools.render")) is True
+        assert sampler.filter(make_record(name="src.corex")) is True
+        assert sampler.filter(make_record()) is False
+
+
+class TestDiagnostics:
+    """診断情報バッファのテストクラス."""
+    
+    def test_discarded_on_success(self, recording_logger):
+        """成功時は何も出力されないこと."""
+        target, handler = recording_logger
+        
+        with diagnostics_scope(target) as buffer:
+            capture_diagnostics("Quarto stderr", "WARN: something")
+            assert buffer.entries() == [("Quarto stderr", "WARN: something")]
+        
+        assert handler.records == []
+    
+    def test_flushed_on_failure(self, recording_logger):
+        """失敗時は保持していた内容がERRORで出力されること."""
+        target, handler = recording_logger
+        
+        with pytest.raises(RuntimeError):
+            with diagnostics_scope(target):
+                capture_diagnostics("Quarto stderr", "ERROR: compilation failed")
+                raise RuntimeError("render failed")
+        
+        assert len(handler.records) == 1
+        record = handler.records[0]
+        assert record.levelno == logging.ERROR
+        assert "compilation failed" in record.getMessage()
+        assert record.reason == "render failed"
+    
+    def test_bounded(self):
+        """上限を超えると古い内容から捨てられること."""
+        buffer = DiagnosticsBuffer(max_bytes=10)
+        buffer.add("a", "x" * 6)
+        buffer.add("b", "y" * 6)
+        buffer.add("c", "z" * 100)
+        
+        entries = buffer.entries()
+        assert [label for label, _ in entries] == ["c"]
+        assert entries[0][1].startswith("...(truncated)")
+        assert buffer.dropped == 2
+
+
+class TestRendererDiagnostics:
+    """レンダラーの診断情報出力のテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_failed_render_flushes_headers(self, tmp_path, caplog):
+        """レンダリングが失敗した場合にYAMLヘッダーがERRORで出力されること."""
+        renderer = QuartoRenderer(quarto_path=str(tmp_path / "missing-quarto"))
+        
+        with caplog.at_level(logging.ERROR, logger="src.core.renderer"):
+            with pytest.raises(QuartoRenderError) as exc_info:
+                await renderer.render("---\ntitle: Test\n---\n# Body", "html", str(tmp_path / "out.html"))
+        
+        assert exc_info.value.code == "DEPENDENCY_MISSING"
+        assert any("Merged YAML header" in record.getMessage() for record in caplog.records)
+
+
+class TestConfigureLogging:
+    """configure_loggingのテストクラス."""
+    
+    def test_writes_json_through_queue(self, tmp_path):
+        """キュー経由でJSON形式のログがファイルに書かれ、コンポーネントごとのレベルが適用されること."""
+        settings = Settings(log_dir=str(tmp_path), log_levels={"tests.quiet": "WARNING"})
+        root = logging.getLogger()
+        previous_level = root.level
+        configure_logging(settings)
+        try:
+            logging.getLogger("tests.loud").info("visible", extra={"request_id": "r1"})
+            logging.getLogger("tests.quiet").info("hidden")
+        finally:
+            shutdown_logging()
+            root.setLevel(previous_level)
+            logging.getLogger("tests.quiet").setLevel(logging.NOTSET)
+        
+        lines = (tmp_path / "quarto_mcp_server.log").read_text(encoding="utf-8").splitlines()
+        entries = [json.loads(line) for line in lines]
+        assert [entry["message"] for entry in entries] == ["visible"]
+        assert entries[0]["request_id"] == "r1"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
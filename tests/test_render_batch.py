@@ -0,0 +1,133 @@
+"""プロジェクト単位のバッチレンダリングのテスト."""
+
+import json
+import sys
+
+import pytest
+
+from src.core.renderer import QuartoRenderer
+from src.tools.render import render_batch
+
+
+# quarto renderの代わりに、.qmdの内容をそのまま出力ファイルに書き出す偽のQuarto CLI
+# 本文に"FAIL"を含む文書は失敗させ、起動のたびに引数をcalls.jsonlに記録する
+FAKE_QUARTO = """#!{python}
+import json, pathlib, sys
+args = sys.argv[1:]
+with open({calls!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+if args == ["--version"]:
+    print("1.6.0")
+    sys.exit(0)
+extensions = {{"html": ".html", "pptx": ".pptx", "gfm": ".md"}}
+to = args[args.index("--to") + 1]
+if args[1].endswith(".qmd"):
+    jobs = [(args[1], args[args.index("--output") + 1])]
+else:
+    config = pathlib.Path("_quarto.yml").read_text()
+    names = [line.strip()[2:] for line in config.splitlines() if line.strip().startswith("- ")]
+    jobs = [(name, pathlib.Path(name).stem + extensions[to]) for name in names]
+for source, output in jobs:
+    text = pathlib.Path(source).read_text()
+    if "FAIL" in text:
+        sys.stderr.write("ERROR: compilation failed for " + source + "\\n")
+        sys.exit(1)
+    sys.stderr.write("WARNING: rendered " + source + "\\n")
+    pathlib.Path(output).write_text(text)
+"""
+
+
+@pytest.fixture
+def fake_quarto(tmp_path):
+    """偽のQuarto CLIのパスと、起動時の引数を読み出す関数を返す."""
+    calls = tmp_path / "calls.jsonl"
+    script = tmp_path / "quarto"
+    script.write_text(FAKE_QUARTO.format(python=sys.executable, calls=str(calls)), encoding="utf-8")
+    script.chmod(0o755)
+    
+    def read_calls():
+        if not calls.exists():
+            return []
+        return [json.loads(line) for line in calls.read_text().splitlines() if line != '["--version"]']
+    
+    return str(script), read_calls
+
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake Quarto CLI is a shebang script")
+
+
+class TestRenderBatch:
+    """QuartoRenderer.render_batchとquarto_render_batchのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_one_quarto_run_per_format(self, tmp_path, fake_quarto):
+        """同じ形式の文書は1回のquarto renderでまとめて変換され、出力が各リクエストに対応付けられること."""
+        quarto_path, read_calls = fake_quarto
+        renderer = QuartoRenderer(quarto_path=quarto_path)
+        out = tmp_path / "out"
+        requests = [
+            {"content": "# First", "format_id": "html", "output_filename": str(out / "first.html")},
+            {"content": "# Slides", "format_id": "pptx", "output_filename": str(out / "slides.pptx")},
+            {"content": "# Second", "format_id": "html", "output_filename": str(out / "second.html")},
+        ]
+        
+        results = await renderer.render_batch(requests)
+        
+        calls = read_calls()
+        assert len(calls) == 2
+        assert calls[0] == ["render", "--to", "html", "--no-execute"]
+        assert calls[1] == ["render", "--to", "pptx", "--no-execute"]
+        assert "# First" in (out / "first.html").read_text()
+        assert "# Second" in (out / "second.html").read_text()
+        assert "# Slides" in (out / "slides.pptx").read_text()
+        assert [result.output.filename for result in results] == ["first.html", "slides.pptx", "second.html"]
+        assert results[0].metadata.batch_size == 2
+        assert results[1].metadata.batch_size == 1
+        assert results[0].metadata.quarto_version == "1.6.0"
+    
+    @pytest.mark.asyncio
+    async def test_failed_project_render_falls_back_per_document(self, tmp_path, fake_quarto):
+        """プロジェクトの途中で失敗した場合、出力のない文書だけを個別に変換して失敗を特定すること."""
+        quarto_path, read_calls = fake_quarto
+        renderer = QuartoRenderer(quarto_path=quarto_path)
+        requests = [
+            {"content": f"# Doc {i}" + (" FAIL" if i == 1 else ""), "format_id": "gfm",
+             "output_filename": str(tmp_path / f"doc{i}.md")}
+            for i in range(3)
+        ]
+        
+        results = await renderer.render_batch(requests)
+        
+        assert results[0].metadata.batch_size == 3
+        assert results[1].code == "RENDER_FAILED"
+        assert "compilation failed" in results[1].stderr
+        assert results[2].metadata.batch_size is None
+        assert (tmp_path / "doc2.md").exists()
+        # 1回のプロジェクト実行と、出力のなかった2件の個別実行
+        assert len(read_calls()) == 3
+    
+    @pytest.mark.asyncio
+    async def test_tool_reports_per_document_errors(self, tmp_path, fake_quarto):
+        """文書ごとのエラーはその文書の結果として返り、ほかの文書は変換されること."""
+        quarto_path, _ = fake_quarto
+        renderer = QuartoRenderer(quarto_path=quarto_path)
+        
+        result = await render_batch(
+            [
+                {"content": "# Ok", "format": "html", "output_filename": str(tmp_path / "ok.html")},
+                {"content": "# Bad", "format": "unknown", "output_filename": str(tmp_path / "bad.out")},
+                {"content": "# Slides", "format": "pptx", "output_filename": str(tmp_path / "s.pptx"),
+                 "template": "no_such_template"},
+            ],
+            renderer=renderer,
+        )
+        
+        assert result["success"] is False
+        assert result["succeeded"] == 1
+        assert result["failed"] == 2
+        ok, bad, slides = result["results"]
+        assert ok["success"] is True
+        assert ok["trace_id"] == result["trace_id"]
+        assert bad["error"]["code"] == "UNSUPPORTED_FORMAT"
+        assert slides["error"]["code"] == "TEMPLATE_NOT_FOUND"
+        assert slides["error"]["trace_id"] == result["trace_id"]
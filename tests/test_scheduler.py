@@ -0,0 +1,481 @@
+"""レンダリングの受け付け制御のテスト."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from src import server as mcp_server
+from src.core.app_context import AppContext, set_app_context
+from src.core.deadline import Deadline, DeadlineExceededError
+from src.core.latency import LatencyModel
+from src.core.scheduler import FairQueue, OverloadedError, RenderScheduler
+from src.core.sessions import SessionStats
+from src.core.settings import Settings
+
+
+class Gate:
+    """実行を外部から止めておけるレンダリング."""
+    
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+    
+    def render(self, name):
+        async def run():
+            self.started.append(name)
+            await self.release.wait()
+            return name
+        
+        return run
+
+
+async def _wait_until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+class TestRenderScheduler:
+    """RenderSchedulerのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_limits_concurrency_in_order(self):
+        """同時実行数を超えた分は待ち、投入順に実行されること."""
+        scheduler = RenderScheduler(max_concurrency=2, max_queue_depth=10, max_queue_seconds=600)
+        gate = Gate()
+        tasks = [asyncio.create_task(scheduler.run(gate.render(f"r{i}"), ["html"])) for i in range(4)]
+        await _wait_until(lambda: len(gate.started) == 2)
+        
+        stats = scheduler.stats()
+        assert stats["running"] == 2
+        assert stats["queued"] == 2
+        assert stats["queued_seconds"] == pytest.approx(2 * scheduler.default_estimate / 2)
+        
+        gate.release.set()
+        assert await asyncio.gather(*tasks) == ["r0", "r1", "r2", "r3"]
+        assert gate.started == ["r0", "r1", "r2", "r3"]
+        assert scheduler.stats()["running"] == 0
+        assert scheduler.stats()["completed"] == 4
+    
+    @pytest.mark.asyncio
+    async def test_uses_shared_latency_model(self):
+        """渡された分布で推定し、実行枠の所要時間を分布に記録しないこと."""
+        latency = LatencyModel()
+        latency.record("pdf", 20.0)
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=10, max_queue_seconds=600, latency=latency)
+        
+        assert scheduler.latency is latency
+        assert scheduler.estimate("pdf") == pytest.approx(20.0)
+        assert scheduler.stats()["estimates"] == {"pdf": 20.0}
+        
+        async def render():
+            return "a"
+        
+        assert await scheduler.run(render, ["html"]) == "a"
+        assert latency.formats() == ["pdf"]
+    
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_is_full(self):
+        """待ち行列の件数が上限に達するとretry_after_ms付きで拒否すること."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=1, max_queue_seconds=600)
+        gate = Gate()
+        running = asyncio.create_task(scheduler.run(gate.render("a"), ["html"]))
+        queued = asyncio.create_task(scheduler.run(gate.render("b"), ["html"]))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 1)
+        
+        with pytest.raises(OverloadedError) as excinfo:
+            await scheduler.run(gate.render("c"), ["html"])
+        assert excinfo.value.retry_after_ms == int(scheduler.default_estimate * 1000)
+        assert scheduler.stats()["rejected"] == 1
+        
+        # 受け付け済みのジョブは拒否しない
+        job = asyncio.create_task(scheduler.run(gate.render("job"), ["html"], admit=False))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 2)
+        
+        gate.release.set()
+        assert await asyncio.gather(running, queued, job) == ["a", "b", "job"]
+    
+    @pytest.mark.asyncio
+    async def test_rejects_when_estimated_wait_is_too_long(self):
+        """推定待ち時間が上限を超える場合は拒否し、超過分を再試行の目安にすること."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=10, max_queue_seconds=30)
+        scheduler.latency.record("pdf", 20.0)
+        gate = Gate()
+        running = asyncio.create_task(scheduler.run(gate.render("a"), ["pdf"]))
+        queued = asyncio.create_task(scheduler.run(gate.render("b"), ["pdf"]))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 1)
+        
+        # 待ち20秒 + 自身の20秒 = 40秒 > 30秒
+        with pytest.raises(OverloadedError) as excinfo:
+            await scheduler.run(gate.render("c"), ["pdf"])
+        assert excinfo.value.retry_after_ms == 10000
+        
+        # 短い形式は受け付ける
+        scheduler.latency.record("gfm", 1.0)
+        short = asyncio.create_task(scheduler.run(gate.render("d"), ["gfm"]))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 2)
+        
+        gate.release.set()
+        await asyncio.gather(running, queued, short)
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """待機中に中止されたレンダリングは待ち行列から外れ、実行枠を消費しないこと."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=10, max_queue_seconds=600)
+        gate = Gate()
+        running = asyncio.create_task(scheduler.run(gate.render("a"), ["html"]))
+        waiting = asyncio.create_task(scheduler.run(gate.render("b"), ["html"]))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 1)
+        
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.stats()["queued"] == 0
+        
+        gate.release.set()
+        await running
+        assert gate.started == ["a"]
+        assert scheduler.stats()["running"] == 0
+
+
+class TestFairQueue:
+    """FairQueueのテスト."""
+    
+    def test_interleaves_clients(self):
+        """後から来たクライアントの要素が、先に大量投入したクライアントの間に入ること."""
+        queue = FairQueue()
+        for i in range(4):
+            queue.push(f"a{i}", "a")
+        queue.push("b0", "b")
+        queue.push("b1", "b")
+        
+        assert queue.position("b0") == 2
+        assert list(queue) == ["a0", "b0", "a1", "b1", "a2", "a3"]
+        assert [queue.pop() for _ in range(6)] == ["a0", "b0", "a1", "b1", "a2", "a3"]
+        assert queue.pop() is None
+    
+    def test_weights_and_eligibility(self):
+        """重みの大きいクライアントほど多く取り出され、対象外のクライアントは飛ばされること."""
+        queue = FairQueue()
+        for i in range(4):
+            queue.push(f"a{i}", "a", weight=2.0)
+            queue.push(f"b{i}", "b")
+        
+        assert [queue.pop() for _ in range(3)] == ["a0", "b0", "a1"]
+        assert queue.pop(lambda client: client != "b") == "a2"
+        assert queue.remove("b1") is True
+        assert queue.clients() == {"a": 1, "b": 2}
+    
+    def test_clear(self):
+        """clear()で要素と仮想時刻がすべて破棄されること."""
+        queue = FairQueue()
+        for i in range(3):
+            queue.push(f"a{i}", "a")
+        queue.pop()
+        queue.clear()
+        
+        assert len(queue) == 0
+        assert queue.pop() is None
+        assert queue.next_start("a") == 0.0
+
+
+class TestClientFairness:
+    """RenderSchedulerのクライアントごとの公平性のテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_batch_client_does_not_starve_others(self):
+        """大量に投入したクライアントがいても、ほかのクライアントのレンダリングが先に実行されること."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=20, max_queue_seconds=600)
+        gate = Gate()
+        bulk = [
+            asyncio.create_task(scheduler.run(gate.render(f"bulk{i}"), ["html"], client="agent"))
+            for i in range(4)
+        ]
+        await _wait_until(lambda: scheduler.stats()["queued"] == 3)
+        chat = asyncio.create_task(scheduler.run(gate.render("chat"), ["html"], client="user"))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 4)
+        
+        assert scheduler.stats()["clients"] == {
+            "agent": {"running": 1, "queued": 3},
+            "user": {"running": 0, "queued": 1},
+        }
+        
+        gate.release.set()
+        await asyncio.gather(*bulk, chat)
+        assert gate.started == ["bulk0", "chat", "bulk1", "bulk2", "bulk3"]
+    
+    @pytest.mark.asyncio
+    async def test_client_concurrency_cap(self):
+        """クライアントごとの同時実行数の上限を超えた分は、実行枠が空いていても待つこと."""
+        scheduler = RenderScheduler(
+            max_concurrency=3, max_queue_depth=20, max_queue_seconds=600, client_max_concurrency=1
+        )
+        gate = Gate()
+        tasks = [
+            asyncio.create_task(scheduler.run(gate.render(name), ["html"], client=client))
+            for name, client in [("a0", "a"), ("a1", "a"), ("b0", "b")]
+        ]
+        await _wait_until(lambda: len(gate.started) == 2)
+        
+        assert gate.started == ["a0", "b0"]
+        assert scheduler.stats()["running"] == 2
+        assert scheduler.stats()["queued"] == 1
+        
+        gate.release.set()
+        assert await asyncio.gather(*tasks) == ["a0", "a1", "b0"]
+    
+    @pytest.mark.asyncio
+    async def test_configured_weight(self):
+        """client_weightsで重みを設定したクライアントがより多くの順番を得ること."""
+        scheduler = RenderScheduler(
+            max_concurrency=1, max_queue_depth=20, max_queue_seconds=600, client_weights={"desktop": 3.0}
+        )
+        assert scheduler.weight_for("session-1", "desktop") == 3.0
+        assert scheduler.weight_for("session-1", None) == 1.0
+        
+        gate = Gate()
+        first = asyncio.create_task(scheduler.run(gate.render("first"), ["html"], client="warmup"))
+        await _wait_until(lambda: gate.started == ["first"])
+        tasks = [first]
+        for i in range(3):
+            tasks.append(asyncio.create_task(scheduler.run(gate.render(f"other{i}"), ["html"], client="other")))
+            tasks.append(asyncio.create_task(scheduler.run(gate.render(f"desk{i}"), ["html"], client="desktop")))
+        await _wait_until(lambda: scheduler.stats()["queued"] == 6)
+        
+        gate.release.set()
+        await asyncio.gather(*tasks)
+        assert gate.started == ["first", "other0", "desk0", "desk1", "desk2", "other1", "other2"]
+
+
+class TestDeadlines:
+    """RenderSchedulerの期限のテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_expired_waiter_is_dropped(self):
+        """実行枠を待っている間に期限を過ぎたレンダリングは実行されずに待ち行列から外れること."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=10, max_queue_seconds=600)
+        gate = Gate()
+        running = asyncio.create_task(scheduler.run(gate.render("a"), ["html"]))
+        await _wait_until(lambda: gate.started == ["a"])
+        
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.run(gate.render("late"), ["html"], deadline=Deadline(time.time() + 0.1, 0.1))
+        assert scheduler.stats()["queued"] == 0
+        assert scheduler.stats()["expired"] == 1
+        
+        gate.release.set()
+        await running
+        assert gate.started == ["a"]
+        assert scheduler.stats()["running"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_expired_deadline_rejected_before_queueing(self):
+        """受け付けた時点で期限を過ぎているレンダリングは待ち行列に入れないこと."""
+        scheduler = RenderScheduler(max_concurrency=1, max_queue_depth=10, max_queue_seconds=600)
+        gate = Gate()
+        
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.run(gate.render("late"), ["html"], deadline=Deadline(time.time() - 1, 1))
+        assert gate.started == []
+        assert scheduler.stats()["admitted"] == 0
+
+
+class TestAppContextAdmission:
+    """AppContextの受け付け制御のテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_overloaded_render_returns_error(self, tmp_path, monkeypatch):
+        """拒否されたレンダリングはOVERLOADEDとretry_after_msを返し、状態に待ち行列が含まれること."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        settings = Settings(
+            jobs_store_dir=None,
+            render_max_concurrency=1,
+            render_max_queue_depth=0,
+        )
+        context = AppContext(config_path=config_file, settings=settings)
+        gate = Gate()
+        
+        async def render_now(request):
+            return {"success": True, "output": await gate.render(request["content"])()}
+        
+        monkeypatch.setattr(context, "_render_now", render_now)
+        try:
+            first = asyncio.create_task(
+                context.render(content="a", format="html", output_filename=str(tmp_path / "a.html"))
+            )
+            await _wait_until(lambda: gate.started == ["a"])
+            
+            result = await context.render(content="b", format="html", output_filename=str(tmp_path / "b.html"))
+            assert result["success"] is False
+            assert result["error"]["code"] == "OVERLOADED"
+            assert result["error"]["retry_after_ms"] > 0
+            assert context.status()["scheduler"]["rejected"] == 1
+            
+            gate.release.set()
+            assert (await first)["output"] == "a"
+        finally:
+            await context.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_overloaded_batch_returns_error(self, tmp_path, monkeypatch):
+        """拒否されたバッチはツールの応答としてOVERLOADEDを返し、セッションに失敗として記録されること."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        settings = Settings(
+            jobs_store_dir=None,
+            render_max_concurrency=1,
+            render_max_queue_depth=0,
+        )
+        context = AppContext(config_path=config_file, settings=settings)
+        gate = Gate()
+        
+        async def render_now(request):
+            return {"success": True, "output": await gate.render(request["content"])()}
+        
+        monkeypatch.setattr(context, "_render_now", render_now)
+        set_app_context(context)
+        session = SessionStats(session_id="s1", transport="http", opened_at=0, last_seen=0)
+        try:
+            first = asyncio.create_task(
+                context.render(content="a", format="html", output_filename=str(tmp_path / "a.html"))
+            )
+            await _wait_until(lambda: gate.started == ["a"])
+            
+            documents = [{"content": "b", "format": "html", "output_filename": str(tmp_path / "b.html")}]
+            contents = await mcp_server._dispatch_tool("quarto_render_batch", {"documents": documents}, session)
+            result = json.loads(contents[0].text)
+            assert result["success"] is False
+            assert result["error"]["code"] == "OVERLOADED"
+            assert result["error"]["retry_after_ms"] > 0
+            assert session.renders == 1
+            assert session.render_failures == 1
+            
+            gate.release.set()
+            await first
+        finally:
+            set_app_context(None)
+            await context.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_overloaded_submit_returns_error(self, tmp_path, monkeypatch):
+        """投入されたジョブも待ち行列の上限に数えられ、超えた投入はOVERLOADEDを返すこと."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        settings = Settings(
+            jobs_store_dir=None,
+            jobs_max_concurrency=1,
+            render_max_concurrency=1,
+            render_max_queue_depth=2,
+            render_max_queue_seconds=3600,
+        )
+        context = AppContext(config_path=config_file, settings=settings)
+        gate = Gate()
+        
+        async def render_now(request):
+            return {"success": True, "output": await gate.render(request["content"])()}
+        
+        monkeypatch.setattr(context, "_render_now", render_now)
+        set_app_context(context)
+        session = SessionStats(session_id="s1", transport="http", opened_at=0, last_seen=0)
+        
+        async def submit(name):
+            arguments = {"content": name, "format": "html", "output_filename": str(tmp_path / f"{name}.html")}
+            contents = await mcp_server._dispatch_tool("quarto_render_submit", arguments, session)
+            return json.loads(contents[0].text)
+        
+        try:
+            assert "job_id" in await submit("a")
+            await _wait_until(lambda: gate.started == ["a"])
+            # 実行中の1件のほか、ジョブの待ち行列に2件まで並べられる
+            assert "job_id" in await submit("b")
+            assert "job_id" in await submit("c")
+            
+            result = await submit("d")
+            assert result["success"] is False
+            assert result["error"]["code"] == "OVERLOADED"
+            assert result["error"]["retry_after_ms"] > 0
+            assert context.jobs.stats()["queued"] == 2
+            assert context.status()["scheduler"]["rejected"] == 1
+            
+            gate.release.set()
+            await _wait_until(lambda: context.jobs.stats()["succeeded"] == 3)
+        finally:
+            set_app_context(None)
+            await context.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_result_reports_queue_position(self, tmp_path, monkeypatch):
+        """レンダリングの結果に、そのクライアントの待ち順位と待ち時間が含まれること."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        settings = Settings(jobs_store_dir=None, render_max_concurrency=1)
+        context = AppContext(config_path=config_file, settings=settings)
+        gate = Gate()
+        
+        async def render_now(request):
+            return {"success": True, "output": await gate.render(request["content"])()}
+        
+        monkeypatch.setattr(context, "_render_now", render_now)
+        try:
+            requests = [("a", "agent"), ("b", "agent"), ("c", "agent"), ("d", "user")]
+            tasks = [
+                asyncio.create_task(
+                    context.render(client=client, content=name, format="html", output_filename=f"{name}.html")
+                )
+                for name, client in requests
+            ]
+            await _wait_until(lambda: context.scheduler.stats()["queued"] == 3)
+            
+            gate.release.set()
+            a, b, c, d = await asyncio.gather(*tasks)
+            assert a["queue"]["queue_position"] is None
+            assert (b["queue"]["client"], b["queue"]["queue_position"]) == ("agent", 1)
+            assert (c["queue"]["client"], c["queue"]["queue_position"]) == ("agent", 2)
+            # 後から来たクライアントは先行するクライアントの待ちの後ろに並ばない
+            assert (d["queue"]["client"], d["queue"]["queue_position"]) == ("user", 1)
+            assert gate.started == ["a", "d", "b", "c"]
+        finally:
+            await context.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_result_reports_deadline(self, tmp_path, monkeypatch):
+        """期限付きの結果に予算の使用状況が含まれ、待ち行列で期限を過ぎた場合はDEADLINE_EXCEEDEDになること."""
+        config_file = tmp_path / "templates.yaml"
+        config_file.write_text("templates: {}\n", encoding="utf-8")
+        settings = Settings(jobs_store_dir=None, render_max_concurrency=1)
+        context = AppContext(config_path=config_file, settings=settings)
+        gate = Gate()
+        
+        async def render_now(request):
+            return {"success": True, "output": await gate.render(request["content"])()}
+        
+        monkeypatch.setattr(context, "_render_now", render_now)
+        try:
+            first = asyncio.create_task(
+                context.render(
+                    content="a", format="html", output_filename="a.html",
+                    deadline=Deadline.from_request(time_budget_ms=60000),
+                )
+            )
+            await _wait_until(lambda: gate.started == ["a"])
+            
+            late = await context.render(
+                content="b", format="html", output_filename="b.html",
+                deadline=Deadline.from_request(time_budget_ms=100),
+            )
+            assert late["success"] is False
+            assert late["error"]["code"] == "DEADLINE_EXCEEDED"
+            assert late["deadline"]["budget_ms"] == 100
+            assert late["deadline"]["remaining_ms"] == 0
+            
+            gate.release.set()
+            result = await first
+            assert result["deadline"]["budget_ms"] == 60000
+            assert 0 < result["deadline"]["used_ms"] < 60000
+            assert gate.started == ["a"]
+        finally:
+            await context.aclose()
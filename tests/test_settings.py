@@ -0,0 +1,125 @@
+"""設定の読み込みと検証のテスト."""
+
+import pytest
+
+from src.core.settings import Settings, SettingsError, get_settings, reload_settings
+
+
+class TestSettings:
+    """Settingsのテストクラス."""
+    
+    def test_defaults(self):
+        """環境変数がなければデフォルト値になること."""
+        settings = Settings.load(environ={})
+        
+        assert settings.quarto_timeout == 600
+        assert settings.template_download_timeout == 600
+        assert settings.kroki_enabled is False
+        assert settings.kroki_image_format is None
+        assert settings.template_cache_dir == "~/.cache/quarto-mcp/templates"
+        assert settings.diagram_prerender == "off"
+        assert settings.log_dir == "logs"
+    
+    def test_environment_values(self):
+        """環境変数の値が型変換されて読み込まれること."""
+        settings = Settings.load(environ={
+            "QUARTO_TIMEOUT": "120",
+            "QUARTO_MCP_KROKI_URL": " https://kroki.io ",
+            "QUARTO_MCP_KROKI_IMAGE_FORMAT": "SVG",
+            "QUARTO_TEMPLATE_CACHE_DIR": "off",
+            "QUARTO_MCP_DIAGRAM_PRERENDER": "Kroki",
+            "QUARTO_MCP_KROKI_HEALTH_TTL": "2.5",
+            "QUARTO_MCP_CLIENT_WEIGHTS": "claude-desktop=4, batch-agent=0.5",
+            "QUARTO_MCP_ADAPTIVE_TIMEOUTS": "false",
+            "QUARTO_MCP_ADAPTIVE_TIMEOUT_MIN": "5",
+            "QUARTO_MCP_LANE_NICE": "job=10, warmup=19",
+            "QUARTO_MCP_LANE_IO_PRIORITY": "job=Idle, batch=best-effort",
+        })
+        
+        assert settings.quarto_timeout == 120
+        assert settings.kroki_url == "https://kroki.io"
+        assert settings.kroki_enabled is True
+        assert settings.kroki_image_format == "svg"
+        assert settings.template_cache_dir is None
+        assert settings.diagram_prerender == "kroki"
+        assert settings.kroki_health_ttl == 2.5
+        assert settings.render_client_weights == {"claude-desktop": 4.0, "batch-agent": 0.5}
+        assert settings.adaptive_timeouts is False
+        assert settings.adaptive_timeout_min == 5.0
+        assert settings.lane_nice == {"job": 10, "warmup": 19}
+        assert settings.lane_io_priority == {"job": "idle", "batch": "best-effort:4"}
+    
+    def test_kroki_image_format_auto(self):
+        """QUARTO_MCP_KROKI_IMAGE_FORMAT=autoは未設定と同じく自動選択になること."""
+        settings = Settings.load(environ={"QUARTO_MCP_KROKI_IMAGE_FORMAT": "auto"})
+        
+        assert settings.kroki_image_format is None
+    
+    @pytest.mark.parametrize("name,value", [
+        ("QUARTO_TIMEOUT", "ten"),
+        ("QUARTO_TIMEOUT", "0"),
+        ("QUARTO_MCP_KROKI_URL", "kroki:8000"),
+        ("QUARTO_MCP_KROKI_IMAGE_FORMAT", "gif"),
+        ("QUARTO_MCP_DIAGRAM_PRERENDER", "graphviz"),
+        ("QUARTO_MCP_KROKI_MAX_CONNECTIONS", "-1"),
+        ("QUARTO_MCP_CLIENT_WEIGHTS", "agent=0"),
+        ("QUARTO_MCP_ADAPTIVE_TIMEOUT_MULTIPLIER", "0.5"),
+        ("QUARTO_MCP_QUARTO_MEMORY_LIMIT_MB", "-1"),
+        ("QUARTO_MCP_LANE_NICE", "bulk=5"),
+        ("QUARTO_MCP_LANE_NICE", "job=-5"),
+        ("QUARTO_MCP_LANE_IO_PRIORITY", "job=realtime"),
+        ("QUARTO_MCP_LANE_IO_PRIORITY", "job=best-effort:9"),
+    ])
+    def test_invalid_values_rejected(self, name, value):
+        """不正な値は環境変数名つきのエラーになること."""
+        with pytest.raises(SettingsError) as exc_info:
+            Settings.load(environ={name: value})
+        
+        assert name in str(exc_info.value)
+    
+    def test_config_file_overridden_by_environment(self, tmp_path):
+        """設定ファイルの値を環境変数が上書きすること."""
+        config_file = tmp_path / "settings.yaml"
+        config_file.write_text("quarto_timeout: 30\nkroki_url: http://kroki:8000\n", encoding="utf-8")
+        
+        settings = Settings.load(
+            environ={"QUARTO_MCP_CONFIG_FILE": str(config_file), "QUARTO_TIMEOUT": "45"}
+        )
+        
+        assert settings.quarto_timeout == 45
+        assert settings.kroki_url == "http://kroki:8000"
+    
+    def test_unknown_key_in_config_file(self, tmp_path):
+        """設定ファイルの未知のキーはエラーになること."""
+        config_file = tmp_path / "settings.yaml"
+        config_file.write_text("quarto_timout: 30\n", encoding="utf-8")
+        
+        with pytest.raises(SettingsError):
+            Settings.load(environ={}, config_file=config_file)
+
+
+class TestSettingsLifecycle:
+    """プロセス共有の設定のテストクラス."""
+    
+    def test_loaded_once(self, monkeypatch):
+        """環境変数を変更しても明示的に再読み込みするまで反映されないこと."""
+        first = get_settings()
+        monkeypatch.setenv("QUARTO_TIMEOUT", "77")
+        
+        assert get_settings() is first
+        assert reload_settings().quarto_timeout == 77
+        assert get_settings().quarto_timeout == 77
+    
+    def test_failed_reload_keeps_previous(self, monkeypatch):
+        """再読み込みに失敗した場合は以前の設定が維持されること."""
+        first = get_settings()
+        monkeypatch.setenv("QUARTO_TIMEOUT", "-5")
+        
+        with pytest.raises(SettingsError):
+            reload_settings()
+        
+        assert get_settings() is first
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,101 @@
+"""SingleFlightのテスト."""
+
+import asyncio
+
+import pytest
+
+from src.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """SingleFlightのテストクラス."""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """同じキーの同時呼び出しが1回の実行にまとめられること."""
+        flight = SingleFlight()
+        calls = []
+        
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+        
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(10)))
+        
+        assert results == ["result"] * 10
+        assert len(calls) == 1
+        assert not flight.in_flight("key")
+    
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        """異なるキーは別々に実行されること."""
+        flight = SingleFlight()
+        calls = []
+        
+        async def work(key):
+            calls.append(key)
+            await asyncio.sleep(0)
+            return key
+        
+        results = await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b")))
+        
+        assert results == ["a", "b"]
+        assert sorted(calls) == ["a", "b"]
+    
+    @pytest.mark.asyncio
+    async def test_exception_is_shared(self):
+        """例外がすべての待機者に伝わること."""
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        results = await asyncio.gather(
+            *(flight.do("key", work) for _ in range(3)), return_exceptions=True
+        )
+        
+        assert all(isinstance(result, ValueError) for result in results)
+    
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_does_not_affect_waiters(self):
+        """最初の呼び出し元がキャンセルされても他の待機者は結果を受け取ること."""
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.05)
+            return "result"
+        
+        leader = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        
+        assert await waiter == "result"
+    
+    @pytest.mark.asyncio
+    async def test_cleanup_after_last_user(self):
+        """結果を使うすべての呼び出し元が抜けた後にcleanupが呼ばれること."""
+        flight = SingleFlight()
+        released = []
+        
+        async def work():
+            await asyncio.sleep(0.01)
+            return "resource"
+        
+        async def use(delay):
+            async with flight.shared("key", work, cleanup=released.append) as resource:
+                await asyncio.sleep(delay)
+                assert released == []
+                return resource
+        
+        results = await asyncio.gather(use(0), use(0.02), use(0.01))
+        
+        assert results == ["resource"] * 3
+        assert released == ["resource"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
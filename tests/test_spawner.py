@@ -0,0 +1,180 @@
+"""子プロセスのスポナーのテスト."""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.core import spawner as spawner_module
+from src.core.spawner import Spawner, SpawnedProcess, create_subprocess_exec
+
+
+@asynccontextmanager
+async def running_spawner():
+    """プロセス共有のスポナーを起動し、終了時に停止する."""
+    spawner = await spawner_module.start_spawner()
+    assert spawner is not None
+    try:
+        yield spawner
+    finally:
+        await spawner_module.stop_spawner()
+
+
+class TestSpawner:
+    """Spawnerのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_collects_output_and_exit_code(self, tmp_path):
+        """標準出力・標準エラー出力・終了コード・作業ディレクトリが引き継がれること."""
+        async with running_spawner():
+            process = await create_subprocess_exec(
+                sys.executable, "-c",
+                "import os, sys; print(os.getcwd()); sys.stderr.write('warn'); sys.exit(3)",
+                cwd=tmp_path,
+            )
+            assert isinstance(process, SpawnedProcess)
+            assert process.pid > 0
+            stdout, stderr = await process.communicate()
+        
+        assert process.returncode == 3
+        assert stdout.decode().strip() == str(tmp_path)
+        assert stderr == b"warn"
+    
+    @pytest.mark.asyncio
+    async def test_large_output_and_stdin(self):
+        """標準入力を渡せ、大きな出力も欠けずに返ること."""
+        data = os.urandom(300 * 1024)
+        async with running_spawner():
+            process = await create_subprocess_exec(
+                sys.executable, "-c", "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read() * 2)"
+            )
+            stdout, _ = await process.communicate(input=data)
+        
+        assert process.returncode == 0
+        assert stdout == data * 2
+    
+    @pytest.mark.asyncio
+    async def test_missing_command_raises_file_not_found(self):
+        """存在しないコマンドは直接起動した場合と同じくFileNotFoundErrorになること."""
+        async with running_spawner():
+            with pytest.raises(FileNotFoundError):
+                await create_subprocess_exec("quarto-mcp-no-such-command")
+    
+    @pytest.mark.asyncio
+    async def test_kill(self):
+        """kill()で子プロセスが終了すること."""
+        async with running_spawner():
+            process = await create_subprocess_exec(sys.executable, "-c", "import time; time.sleep(60)")
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(process.communicate(), timeout=0.2)
+            process.kill()
+            returncode = await asyncio.wait_for(process.wait(), timeout=5)
+        
+        assert returncode != 0
+        with pytest.raises(ProcessLookupError):
+            process.kill()
+    
+    @pytest.mark.asyncio
+    async def test_reports_resource_usage(self):
+        """終了時にwait4()で回収した資源使用量が得られること."""
+        async with running_spawner():
+            process = await create_subprocess_exec(
+                sys.executable, "-c", "import time\nend = time.process_time() + 0.2\nwhile time.process_time() < end: pass"
+            )
+            await process.communicate()
+        
+        assert process.returncode == 0
+        assert set(process.usage) == {
+            "cpu_user_ms", "cpu_system_ms", "peak_rss_kb", "io_read_blocks", "io_write_blocks"
+        }
+        assert process.usage["cpu_user_ms"] + process.usage["cpu_system_ms"] >= 150
+        assert process.usage["peak_rss_kb"] > 0
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("use_spawner", [True, False])
+    async def test_applies_limits(self, use_spawner):
+        """資源制限とnice値が子プロセスに設定されること（スポナー経由でも直接起動でも）."""
+        script = (
+            "import os, resource; "
+            "print(resource.getrlimit(resource.RLIMIT_NOFILE)[0], resource.getrlimit(resource.RLIMIT_CPU)[0], os.nice(0))"
+        )
+        limits = {"nofile": 64, "cpu": 30, "nice": 5}
+        if use_spawner:
+            async with running_spawner():
+                process = await create_subprocess_exec(sys.executable, "-c", script, limits=limits)
+                stdout, _ = await process.communicate()
+        else:
+            process = await create_subprocess_exec(sys.executable, "-c", script, limits=limits)
+            stdout, _ = await process.communicate()
+        
+        nofile, cpu, nice = map(int, stdout.split())
+        assert nofile == 64
+        assert cpu == 30
+        assert nice >= 5
+    
+    @pytest.mark.asyncio
+    async def test_helper_exit_fails_pending_processes(self):
+        """ヘルパーが終了すると実行中の子プロセスの待機は失敗し、以後は直接起動されること."""
+        async with running_spawner() as spawner:
+            process = await create_subprocess_exec(sys.executable, "-c", "import time; time.sleep(60)")
+            spawner._process.kill()
+            with pytest.raises(OSError):
+                await asyncio.wait_for(process.wait(), timeout=5)
+            
+            assert spawner_module.get_spawner() is None
+            direct = await create_subprocess_exec(sys.executable, "-c", "print('direct')")
+            assert isinstance(direct, asyncio.subprocess.Process)
+            stdout, _ = await direct.communicate()
+            assert stdout.strip() == b"direct"
+    
+    @pytest.mark.asyncio
+    async def test_falls_back_without_spawner(self):
+        """スポナーが起動していない場合は直接起動すること."""
+        assert spawner_module.get_spawner() is None
+        process = await create_subprocess_exec(sys.executable, "-c", "print('ok')")
+        assert isinstance(process, asyncio.subprocess.Process)
+        stdout, _ = await process.communicate()
+        assert stdout.strip() == b"ok"
+    
+    @pytest.mark.asyncio
+    async def test_spawn_latency_by_server_size(self):
+        """サーバーのメモリ量ごとに、直接起動とスポナー経由の起動時間を比較する（結果は出力のみ）."""
+        iterations = int(os.environ.get("QUARTO_MCP_SPAWN_BENCH_ITERATIONS", "20"))
+        sizes = [int(size) for size in os.environ.get("QUARTO_MCP_SPAWN_BENCH_SIZES_MB", "0,256").split(",")]
+        argv = ["/bin/true"] if os.path.exists("/bin/true") else [sys.executable, "-c", "pass"]
+        
+        async def measure(direct: bool) -> float:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                if direct:
+                    process = await asyncio.create_subprocess_exec(
+                        *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                    )
+                else:
+                    process = await create_subprocess_exec(*argv)
+                await process.communicate()
+                assert process.returncode == 0
+            return (time.perf_counter() - start) / iterations * 1000
+        
+        spawner = Spawner()
+        await spawner.start()
+        spawner_module._spawner = spawner
+        try:
+            ballast = []
+            for size_mb in sizes:
+                # ページを実際に確保させる（書き込みのないメモリはforkのコストに影響しない）
+                while len(ballast) < size_mb // 64:
+                    ballast.append(b"x" * (64 * 1024 * 1024))
+                direct_ms = await measure(direct=True)
+                spawner_ms = await measure(direct=False)
+                print(
+                    f"\nspawn latency with {size_mb:>4} MiB ballast: "
+                    f"direct {direct_ms:.2f} ms, spawner {spawner_ms:.2f} ms"
+                )
+            ballast.clear()
+        finally:
+            spawner_module._spawner = None
+            await spawner.aclose()
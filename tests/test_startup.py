@@ -0,0 +1,122 @@
+"""起動時間のベンチマーク（importとlist_toolsへの最初の応答までの時間に上限を設ける）."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# 上限は環境変数で調整できる（遅いCI環境など）
+IMPORT_BUDGET_MS = float(os.environ.get("QUARTO_MCP_IMPORT_BUDGET_MS", "30"))
+FIRST_LIST_TOOLS_BUDGET_S = float(os.environ.get("QUARTO_MCP_STARTUP_BUDGET_S", "3.0"))
+
+# import src.server の時点で読み込まれてはいけないモジュール
+LAZY_MODULES = [
+    "src.core.app_context",
+    "src.core.renderer",
+    "src.core.logging_setup",
+    "src.http_transport",
+    "src.tools.render",
+    "src.tools.jobs",
+    "yaml",
+]
+
+
+def _server_env(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        "QUARTO_MCP_LOG_DIR": str(tmp_path / "logs"),
+        "QUARTO_MCP_JOBS_DIR": "off",
+        "QUARTO_MCP_TRANSPORT": "stdio",
+    })
+    env.pop("QUARTO_MCP_CONFIG_FILE", None)
+    return env
+
+
+def _own_import_ms(tmp_path) -> float:
+    """python -X importtime で計測した src.* モジュール自身のimport時間の合計（ミリ秒）."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.server"],
+        cwd=PROJECT_ROOT, env=_server_env(tmp_path), capture_output=True, text=True, check=True,
+    )
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if name.startswith("src.") or name == "src":
+            total_us += int(self_us)
+    return total_us / 1000
+
+
+def test_import_is_lazy(tmp_path):
+    """import src.server でレンダリング関連のモジュールを読み込まず、ログディレクトリも作らないこと."""
+    code = (
+        "import json, sys, src.server; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT, env=_server_env(tmp_path), capture_output=True, text=True, check=True,
+    )
+    assert json.loads(result.stdout) == []
+    assert not (tmp_path / "logs").exists()
+
+
+def test_import_budget(tmp_path):
+    """src.* モジュールのimport時間が上限以内であること."""
+    # 初回はバイトコードの生成を含むため2回目以降の最小値で判定する
+    _own_import_ms(tmp_path)
+    elapsed = min(_own_import_ms(tmp_path) for _ in range(3))
+    print(f"\nown import time: {elapsed:.1f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    assert elapsed <= IMPORT_BUDGET_MS
+
+
+def test_time_to_first_list_tools(tmp_path):
+    """python -m src.server の起動からlist_toolsの応答までが上限以内であること."""
+    messages = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2025-03-26",
+            "capabilities": {},
+            "clientInfo": {"name": "startup-benchmark", "version": "1.0"},
+        }},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+    ]
+    
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.server"],
+        cwd=PROJECT_ROOT, env=_server_env(tmp_path),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        for message in messages:
+            process.stdin.write(json.dumps(message) + "\n")
+        process.stdin.flush()
+        
+        tools = None
+        for line in process.stdout:
+            response = json.loads(line)
+            if response.get("id") == 2:
+                tools = response["result"]["tools"]
+                break
+        elapsed = time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            pytest.fail("server did not exit after stdin was closed")
+    
+    print(f"\ntime to first list_tools: {elapsed * 1000:.0f} ms (budget {FIRST_LIST_TOOLS_BUDGET_S:.1f} s)")
+    assert tools is not None
+    assert "quarto_render" in {tool["name"] for tool in tools}
+    assert elapsed <= FIRST_LIST_TOOLS_BUDGET_S
@@ -0,0 +1,304 @@
+"""URLテンプレートキャッシュのテスト."""
+
+import asyncio
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+
+import httpx
+import pytest
+
+from src.core.settings import reload_settings
+from src.core.template_cache import TemplateCache
+from src.core.template_manager import (
+    TemplateDownloadError,
+    TemplateManager,
+    TemplateSizeExceededError,
+)
+
+
+class FakeClock:
+    """手動で進めるテスト用の時計."""
+    
+    def __init__(self):
+        self.now = 1_700_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def store_bytes(cache, url, data, filename="template.pptx"):
+    """テスト用にデータをキャッシュへ登録する."""
+    staged = cache.staging_path()
+    staged.write_bytes(data)
+    return cache.store(url, filename, staged, hashlib.sha256(data).hexdigest())
+
+
+class TestTemplateCache:
+    """TemplateCacheのテストクラス."""
+    
+    def test_store_and_lookup(self, tmp_path):
+        """登録したエントリをURLで取得できること."""
+        cache = TemplateCache(tmp_path / "cache")
+        url = "https://example.com/a.pptx"
+        
+        assert cache.lookup(url) is None
+        store_bytes(cache, url, b"deck")
+        
+        entry = cache.lookup(url)
+        assert entry is not None
+        assert entry.size_bytes == 4
+        assert entry.sha256 == hashlib.sha256(b"deck").hexdigest()
+    
+    def test_corrupted_entry_discarded(self, tmp_path):
+        """内容が書き換えられたエントリは使用されないこと."""
+        cache = TemplateCache(tmp_path / "cache")
+        url = "https://example.com/a.pptx"
+        store_bytes(cache, url, b"deck")
+        data_path = cache._data_path(cache.make_key(url))
+        
+        data_path.write_bytes(b"evil")
+        
+        assert cache.lookup(url) is None
+        assert not data_path.exists()
+    
+    def test_materialize_hardlinks_into_workspace(self, tmp_path):
+        """作業ディレクトリにハードリンクで配置されること."""
+        cache = TemplateCache(tmp_path / "cache")
+        entry = store_bytes(cache, "https://example.com/a.pptx", b"deck", "corp.pptx")
+        workspace = tmp_path / "work"
+        workspace.mkdir()
+        
+        path = cache.materialize(entry, workspace)
+        
+        assert path == workspace / "corp.pptx"
+        assert path.read_bytes() == b"deck"
+        assert os.stat(path).st_ino == os.stat(cache._data_path(cache.make_key(entry.url))).st_ino
+    
+    def test_materialize_copies_when_link_fails(self, tmp_path, monkeypatch):
+        """ハードリンクできない場合は作業ディレクトリにコピーし、キャッシュ内のファイルを返さないこと."""
+        cache = TemplateCache(tmp_path / "cache")
+        entry = store_bytes(cache, "https://example.com/a.pptx", b"deck", "corp.pptx")
+        workspace = tmp_path / "work"
+        workspace.mkdir()
+        
+        def cross_device_link(source, target):
+            raise OSError(18, "Invalid cross-device link")
+        
+        monkeypatch.setattr(os, "link", cross_device_link)
+        path = cache.materialize(entry, workspace)
+        
+        data_path = cache._data_path(cache.make_key(entry.url))
+        assert path == workspace / "corp.pptx"
+        assert path.read_bytes() == b"deck"
+        assert os.stat(path).st_ino != os.stat(data_path).st_ino
+        # キャッシュから追い出されても作業ディレクトリのファイルは残る
+        cache._remove(cache.make_key(entry.url))
+        assert path.read_bytes() == b"deck"
+    
+    def test_lru_eviction(self, tmp_path):
+        """上限を超えると最終使用時刻の古いエントリから削除されること."""
+        clock = FakeClock()
+        cache = TemplateCache(tmp_path / "cache", max_bytes=25, clock=clock)
+        workspace = tmp_path / "work"
+        workspace.mkdir()
+        
+        first = store_bytes(cache, "https://example.com/1.pptx", b"x" * 10)
+        clock.now += 1
+        store_bytes(cache, "https://example.com/2.pptx", b"x" * 10)
+        clock.now += 1
+        cache.materialize(first, workspace)
+        clock.now += 1
+        store_bytes(cache, "https://example.com/3.pptx", b"x" * 10)
+        
+        assert cache.lookup("https://example.com/1.pptx") is not None
+        assert cache.lookup("https://example.com/2.pptx") is None
+        assert cache.lookup("https://example.com/3.pptx") is not None
+        assert cache.total_bytes() == 20
+    
+    def test_disabled_by_environment(self, monkeypatch):
+        """QUARTO_TEMPLATE_CACHE_DIR=offで無効化されること."""
+        monkeypatch.setenv("QUARTO_TEMPLATE_CACHE_DIR", "off")
+        reload_settings()
+        
+        assert TemplateCache.from_environment() is None
+
+
+class TestTemplateManagerCache:
+    """TemplateManagerとキャッシュの連携テスト."""
+    
+    @pytest.mark.asyncio
+    async def test_repeated_renders_download_once(self, tmp_path, template_server):
+        """TTL内の同じURLは1回しかダウンロードされないこと."""
+        manager = TemplateManager(template_cache=TemplateCache(tmp_path / "cache"))
+        url = template_server.url()
+        
+        for index in range(3):
+            workspace = tmp_path / f"work{index}"
+            workspace.mkdir()
+            path = await manager.resolve_template(url, "pptx", workspace)
+            assert open(path, "rb").read() == template_server.content
+        
+        assert template_server.gets == 1
+        assert template_server.not_modified == 0
+    
+    @pytest.mark.asyncio
+    async def test_revalidates_after_ttl(self, tmp_path, template_server):
+        """TTL経過後は条件付きGETで再検証し、304なら再ダウンロードしないこと."""
+        clock = FakeClock()
+        manager = TemplateManager(template_cache=TemplateCache(tmp_path / "cache", ttl=60, clock=clock))
+        url = template_server.url()
+        
+        await manager.resolve_template(url, "pptx", tmp_path)
+        clock.now += 61
+        path = await manager.resolve_template(url, "pptx", tmp_path)
+        
+        assert template_server.gets == 1
+        assert template_server.not_modified == 1
+        assert open(path, "rb").read() == template_server.content
+        
+        # 再検証で取得時刻が更新される
+        await manager.resolve_template(url, "pptx", tmp_path)
+        assert template_server.not_modified == 1
+    
+    @pytest.mark.asyncio
+    async def test_changed_template_is_refetched(self, tmp_path, template_server):
+        """サーバー側のテンプレートが更新されると新しい内容を取得すること."""
+        clock = FakeClock()
+        manager = TemplateManager(template_cache=TemplateCache(tmp_path / "cache", ttl=60, clock=clock))
+        url = template_server.url()
+        
+        first = tmp_path / "first"
+        first.mkdir()
+        old_path = await manager.resolve_template(url, "pptx", first)
+        template_server.content = b"PK\x03\x04 template v2"
+        clock.now += 61
+        second = tmp_path / "second"
+        second.mkdir()
+        new_path = await manager.resolve_template(url, "pptx", second)
+        
+        assert template_server.gets == 2
+        assert open(new_path, "rb").read() == b"PK\x03\x04 template v2"
+        # 既存の作業ディレクトリのリンクは古い内容のまま
+        assert open(old_path, "rb").read() == b"PK\x03\x04 template v1"
+    
+    @pytest.mark.asyncio
+    async def test_digest_check_runs_off_event_loop(self, tmp_path, monkeypatch, template_server):
+        """初回アクセス時のSHA-256検証がイベントループのスレッドで行われないこと."""
+        cache = TemplateCache(tmp_path / "cache")
+        url = template_server.url()
+        store_bytes(cache, url, template_server.content)
+        TemplateCache._verified.pop(str(cache._data_path(cache.make_key(url))))
+        digest_threads = []
+        original_digest = TemplateCache._file_digest
+        
+        def recording_digest(path):
+            digest_threads.append(threading.get_ident())
+            return original_digest(path)
+        
+        monkeypatch.setattr(TemplateCache, "_file_digest", staticmethod(recording_digest))
+        manager = TemplateManager(template_cache=cache)
+        
+        path = await manager.resolve_template(url, "pptx", tmp_path)
+        
+        assert open(path, "rb").read() == template_server.content
+        assert template_server.gets == 0
+        assert len(digest_threads) == 1
+        assert digest_threads[0] != threading.get_ident()
+    
+    @pytest.mark.asyncio
+    async def test_unexpected_not_modified_is_not_cached(self, tmp_path, monkeypatch):
+        """キャッシュがないのに304が返った場合は、エラーにしてエントリを登録しないこと."""
+        cache = TemplateCache(tmp_path / "cache")
+        manager = TemplateManager(template_cache=cache)
+        url = "https://example.com/corporate.pptx"
+        
+        async def not_modified(url, destination, headers=None):
+            return 304, httpx.Headers({"etag": '"stale"'}), None
+        
+        monkeypatch.setattr(manager, "_fetch", not_modified)
+        
+        with pytest.raises(TemplateDownloadError, match="304"):
+            await manager._refresh_cached_template(url, "corporate.pptx")
+        
+        assert cache.lookup(url) is None
+        assert list((tmp_path / "cache").rglob("*.json")) == []
+
+class TestTemplateDownloadCoalescing:
+    """同時ダウンロードのまとめ処理と共有HTTPクライアントのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_renders_share_one_transfer(self, tmp_path, template_server):
+        """同じURLの同時リクエストが1回の転送にまとめられること."""
+        template_server.delay = 0.1
+        manager = TemplateManager(template_cache=TemplateCache(tmp_path / "cache"))
+        workspaces = []
+        for index in range(8):
+            workspace = tmp_path / f"work{index}"
+            workspace.mkdir()
+            workspaces.append(workspace)
+        
+        paths = await asyncio.gather(
+            *(manager.resolve_template(template_server.url(), "pptx", ws) for ws in workspaces)
+        )
+        
+        assert template_server.gets == 1
+        assert template_server.heads == 0
+        assert all(open(path, "rb").read() == template_server.content for path in paths)
+    
+    @pytest.mark.asyncio
+    async def test_uncached_concurrent_downloads(self, tmp_path, monkeypatch, template_server):
+        """キャッシュ無効時も同時ダウンロードがまとめられ、共有ファイルが削除されること."""
+        monkeypatch.setenv("QUARTO_TEMPLATE_CACHE_DIR", "off")
+        reload_settings()
+        template_server.delay = 0.1
+        manager = TemplateManager()
+        assert manager.template_cache is None
+        shared_before = set(glob.glob(os.path.join(tempfile.gettempdir(), "quarto_mcp_template_*")))
+        workspaces = []
+        for index in range(4):
+            workspace = tmp_path / f"work{index}"
+            workspace.mkdir()
+            workspaces.append(workspace)
+        
+        paths = await asyncio.gather(
+            *(manager.resolve_template(template_server.url(), "pptx", ws) for ws in workspaces)
+        )
+        
+        assert template_server.gets == 1
+        assert [os.path.dirname(path) for path in paths] == [str(ws) for ws in workspaces]
+        assert all(open(path, "rb").read() == template_server.content for path in paths)
+        shared_after = set(glob.glob(os.path.join(tempfile.gettempdir(), "quarto_mcp_template_*")))
+        assert shared_after <= shared_before
+    
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, tmp_path, monkeypatch, template_server):
+        """連続したダウンロードで接続が再利用されること."""
+        monkeypatch.setenv("QUARTO_TEMPLATE_CACHE_DIR", "off")
+        reload_settings()
+        manager = TemplateManager()
+        
+        for _ in range(3):
+            await manager.resolve_template(template_server.url(), "pptx", tmp_path)
+        
+        assert template_server.gets == 3
+        assert len(template_server.connections) == 1
+    
+    @pytest.mark.asyncio
+    async def test_size_limit_from_get_response(self, tmp_path, template_server):
+        """HEADを送らずにGETレスポンスでサイズ制限を判定すること."""
+        manager = TemplateManager(
+            max_download_size=8, template_cache=TemplateCache(tmp_path / "cache")
+        )
+        
+        with pytest.raises(TemplateSizeExceededError):
+            await manager.resolve_template(template_server.url(), "pptx", tmp_path)
+        
+        assert template_server.heads == 0
+        assert list((tmp_path / "cache").glob(".download_*")) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,144 @@
+"""テンプレートレジストリのテスト."""
+
+import hashlib
+import os
+
+import pytest
+import yaml
+
+from src.core.template_manager import TemplateManager
+from src.core.template_registry import TemplateRegistry, get_template_registry
+
+
+class FakeClock:
+    """手動で進めるテスト用の時計."""
+    
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+
+def write_config(config_file, templates):
+    """テンプレート設定ファイルを書き込み、更新時刻を進める."""
+    config_file.write_text(yaml.dump({"templates": templates}), encoding="utf-8")
+    stat = config_file.stat()
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    """テンプレートファイルと設定ファイルを用意する."""
+    (tmp_path / "a.pptx").write_bytes(b"template a")
+    (tmp_path / "b.pptx").write_bytes(b"template b")
+    write_config(tmp_path / "templates.yaml", {
+        "a": {"path": str(tmp_path / "a.pptx"), "description": "Template A"},
+    })
+    return tmp_path
+
+
+class TestTemplateRegistry:
+    """TemplateRegistryのテストクラス."""
+    
+    def test_loads_once(self, template_dir, monkeypatch):
+        """変更がなければ設定ファイルを再解析しないこと."""
+        clock = FakeClock()
+        registry = TemplateRegistry(template_dir / "templates.yaml", poll_interval=1.0, clock=clock)
+        parsed = []
+        original = yaml.safe_load
+        monkeypatch.setattr(yaml, "safe_load", lambda f: parsed.append(1) or original(f))
+        
+        for _ in range(3):
+            assert list(registry.templates) == ["a"]
+            clock.now += 5
+        
+        assert len(parsed) == 1
+        assert registry.version == 1
+        info = registry.get("a")
+        assert info.description == "Template A"
+        assert info.size_bytes == len(b"template a")
+    
+    def test_reloads_on_change(self, template_dir):
+        """設定ファイルが変更されると再読み込みすること."""
+        clock = FakeClock()
+        config_file = template_dir / "templates.yaml"
+        registry = TemplateRegistry(config_file, poll_interval=1.0, clock=clock)
+        assert list(registry.templates) == ["a"]
+        
+        write_config(config_file, {
+            "a": {"path": str(template_dir / "a.pptx")},
+            "b": {"path": str(template_dir / "b.pptx")},
+        })
+        # 確認間隔内は再読み込みしない
+        assert list(registry.templates) == ["a"]
+        
+        clock.now += 1
+        assert sorted(registry.templates) == ["a", "b"]
+        assert registry.version == 2
+    
+    def test_warm_computes_digests(self, template_dir):
+        """warmでSHA-256が計算され、変更のないファイルは再読み込み後も引き継がれること."""
+        config_file = template_dir / "templates.yaml"
+        registry = TemplateRegistry(config_file, poll_interval=0)
+        registry.warm()
+        assert registry.get("a").sha256 == hashlib.sha256(b"template a").hexdigest()
+        assert registry.get("a").cache_key == registry.get("a").sha256
+        
+        write_config(config_file, {
+            "a": {"path": str(template_dir / "a.pptx")},
+            "b": {"path": str(template_dir / "b.pptx")},
+        })
+        
+        assert registry.get("a").sha256 == hashlib.sha256(b"template a").hexdigest()
+        assert registry.get("b").sha256 is None
+    
+    def test_template_file_change_invalidates_digest(self, template_dir):
+        """テンプレートファイルが変更されるとSHA-256が再計算されること."""
+        registry = TemplateRegistry(template_dir / "templates.yaml", poll_interval=0)
+        registry.warm()
+        
+        (template_dir / "a.pptx").write_bytes(b"template a, revised")
+        registry.warm()
+        
+        assert registry.get("a").sha256 == hashlib.sha256(b"template a, revised").hexdigest()
+    
+    def test_invalid_config_keeps_previous(self, template_dir):
+        """設定ファイルが壊れた場合は以前の内容を維持すること."""
+        config_file = template_dir / "templates.yaml"
+        registry = TemplateRegistry(config_file, poll_interval=0)
+        assert list(registry.templates) == ["a"]
+        
+        config_file.write_text("templates: [unclosed", encoding="utf-8")
+        os.utime(config_file, ns=(0, config_file.stat().st_mtime_ns + 2_000_000_000))
+        
+        assert list(registry.templates) == ["a"]
+    
+    def test_describe(self, template_dir):
+        """ツール説明文用のテンプレート一覧が生成されること."""
+        registry = TemplateRegistry(template_dir / "templates.yaml")
+        
+        assert registry.describe() == "\n\nAvailable template IDs:\n  - a: Template A"
+    
+    def test_missing_config(self, tmp_path):
+        """設定ファイルがない場合は空であること."""
+        registry = TemplateRegistry(tmp_path / "missing.yaml")
+        
+        assert registry.templates == {}
+        assert registry.describe() == ""
+
+
+def test_template_managers_share_registry(template_dir):
+    """同じ設定ファイルのTemplateManagerがレジストリを共有すること."""
+    config_file = template_dir / "templates.yaml"
+    
+    first = TemplateManager(config_path=config_file)
+    second = TemplateManager(config_path=config_file)
+    
+    assert first.registry is second.registry
+    assert first.registry is get_template_registry(config_file)
+    assert second.templates == {"a": str(template_dir / "a.pptx")}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,129 @@
+"""トレースのテスト."""
+
+import json
+import logging
+
+import pytest
+
+from src.core.renderer import QuartoRenderer
+from src.core.settings import Settings
+from src.core.tracing import (
+    InMemorySpanExporter,
+    TraceContextFilter,
+    Tracer,
+    configure_tracing,
+    current_trace_id,
+    get_tracer,
+    set_tracer,
+)
+from src.tools import render
+
+
+@pytest.fixture
+def exporter():
+    """メモリに記録するトレーサーを設定する."""
+    memory = InMemorySpanExporter()
+    set_tracer(Tracer(memory))
+    yield memory
+    set_tracer(None)
+
+
+class TestTracer:
+    """Tracerのテストクラス."""
+    
+    def test_nested_spans_share_trace(self, exporter):
+        """子スパンが親と同じtrace_idを持ち、親子関係が記録されること."""
+        tracer = get_tracer()
+        with tracer.span("parent") as parent:
+            with tracer.span("child", key="value") as child:
+                assert current_trace_id() == parent.trace_id
+        
+        assert current_trace_id() is None
+        assert [span.name for span in exporter.spans] == ["child", "parent"]
+        assert child.trace_id == parent.trace_id
+        assert child.parent_span_id == parent.span_id
+        assert len(parent.trace_id) == 32 and len(parent.span_id) == 16
+        assert child.attributes == {"key": "value"}
+        assert parent.status == "OK"
+    
+    def test_exception_recorded(self, exporter):
+        """例外がスパンに記録され、再送出されること."""
+        with pytest.raises(ValueError):
+            with get_tracer().span("failing"):
+                raise ValueError("boom")
+        
+        span = exporter.spans[0]
+        assert span.status == "ERROR"
+        assert span.status_message == "boom"
+        assert span.events[0]["attributes"]["exception.type"] == "ValueError"
+    
+    def test_log_records_carry_trace_id(self, exporter):
+        """スパン内のログにtrace_idが付与されること."""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", None, None)
+        with get_tracer().span("request") as span:
+            TraceContextFilter().filter(record)
+        
+        assert record.trace_id == span.trace_id
+        assert record.span_id == span.span_id
+
+
+class TestJsonlExporter:
+    """JsonlSpanExporterのテストクラス."""
+    
+    def test_writes_otlp_like_lines(self, tmp_path):
+        """終了したスパンが1行ずつJSONで書き出されること."""
+        tracer = configure_tracing(Settings(trace_file=str(tmp_path / "traces.jsonl")))
+        try:
+            with tracer.span("outer"):
+                with tracer.span("inner"):
+                    pass
+        finally:
+            tracer.shutdown()
+            set_tracer(None)
+        
+        lines = (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+        spans = [json.loads(line) for line in lines]
+        assert [span["name"] for span in spans] == ["inner", "outer"]
+        assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+        assert spans[1]["status"]["code"] == "OK"
+        assert spans[1]["endTimeUnixNano"] >= spans[1]["startTimeUnixNano"]
+    
+    def test_disabled(self):
+        """offの場合はエクスポーターを作らないこと."""
+        tracer = configure_tracing(Settings(trace_file="off"))
+        set_tracer(None)
+        
+        assert tracer.exporter is None
+
+
+class TestRenderTracing:
+    """レンダリングパイプラインのトレースのテスト."""
+    
+    @pytest.mark.asyncio
+    async def test_error_response_has_trace_id(self, exporter, tmp_path):
+        """失敗時の応答にtrace_idが含まれ、各段階のスパンが記録されること."""
+        renderer = QuartoRenderer(quarto_path=str(tmp_path / "missing-quarto"))
+        
+        result = await render.render(
+            "# Title", "html", str(tmp_path / "out.html"), renderer=renderer
+        )
+        
+        assert result["success"] is False
+        assert result["error"]["code"] == "DEPENDENCY_MISSING"
+        trace_id = result["error"]["trace_id"]
+        spans = {span.name: span for span in exporter.spans}
+        assert {
+            "quarto_render",
+            "QuartoRenderer.render",
+            "template.resolve",
+            "quarto.subprocess",
+            "workspace.cleanup",
+        } <= set(spans)
+        assert all(span.trace_id == trace_id for span in exporter.spans)
+        assert spans["quarto.subprocess"].status == "ERROR"
+        assert spans["quarto_render"].status == "ERROR"
+        assert spans["quarto_render"].parent_span_id is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,70 @@
+"""Quartoウォームアップのテスト."""
+
+import asyncio
+
+import pytest
+
+from src.core.app_context import AppContext
+from src.core.settings import Settings
+from src.core.warmup import QuartoWarmup
+
+
+class TestQuartoWarmup:
+    """QuartoWarmupのテスト."""
+    
+    def test_ready_without_formats(self):
+        """対象の形式がない場合は最初から準備完了であること."""
+        warmup = QuartoWarmup(None, [])
+        assert warmup.ready is True
+        assert warmup.start() is None
+    
+    @pytest.mark.asyncio
+    async def test_renders_each_format_in_background(self):
+        """各形式を順にレンダリングし、形式ごとの結果を報告すること."""
+        calls = []
+        release = asyncio.Event()
+        
+        async def render(content, format, output_filename):
+            calls.append((format, output_filename))
+            await release.wait()
+            if format == "pdf":
+                return {"success": False, "error": {"code": "RENDER_FAILED", "message": "no TinyTeX"}}
+            return {"success": True}
+        
+        warmup = QuartoWarmup(render, ["html", "pdf"])
+        task = warmup.start()
+        await asyncio.sleep(0)
+        assert warmup.status()["state"] == QuartoWarmup.RUNNING
+        assert warmup.ready is False
+        
+        release.set()
+        await task
+        
+        status = warmup.status()
+        assert status["ready"] is True
+        assert status["state"] == QuartoWarmup.FAILED
+        assert status["formats"]["html"]["state"] == QuartoWarmup.READY
+        assert status["formats"]["pdf"]["error"] == "RENDER_FAILED: no TinyTeX"
+        assert [format_id for format_id, _ in calls] == ["html", "pdf"]
+        assert calls[0][1].endswith("warmup_html.html")
+    
+    @pytest.mark.asyncio
+    async def test_context_starts_warmup(self, tmp_path):
+        """AppContextの起動時にウォームアップが始まり、状態に含まれること."""
+        settings = Settings(warmup_formats="html", jobs_store_dir=str(tmp_path))
+        context = AppContext(settings=settings)
+        
+        async def render(**request):
+            return {"success": True}
+        
+        context.warmup.render = render
+        try:
+            await context.startup()
+            await context.warmup._task
+            status = context.status()
+        finally:
+            await context.aclose()
+        
+        assert status["ready"] is True
+        assert status["warmup"]["formats"]["html"]["state"] == QuartoWarmup.READY
+        assert status["jobs"]["queued"] == 0
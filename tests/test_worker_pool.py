@@ -0,0 +1,135 @@
+"""ワーカープロセスプールのテスト."""
+
+import asyncio
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.core import worker_pool
+from src.core.latency import LatencyModel
+from src.core.settings import Settings
+from src.core.tracing import InMemorySpanExporter, Tracer, set_tracer
+from src.core.worker_pool import WorkerPool
+
+
+@pytest.fixture
+def exporter():
+    """サーバープロセス側のスパンを記録するエクスポーター."""
+    exporter = InMemorySpanExporter()
+    set_tracer(Tracer(exporter))
+    yield exporter
+    set_tracer(None)
+
+
+def _request(tmp_path):
+    return {"content": "# Title\n\nBody", "format": "html", "output_filename": str(tmp_path / "out.html")}
+
+
+@pytest.fixture
+def in_process_worker(monkeypatch):
+    """ワーカーの状態をこのプロセス内に作り、Quartoの実行を出力ファイルの作成に置き換える."""
+    state = worker_pool._WorkerState(None, Settings(render_workers=1, spawner_enabled=False))
+    
+    async def fake_quarto(command, cwd=None, timeout=None):
+        (cwd / "document.html").write_text("<html></html>", encoding="utf-8")
+        return "", "", None
+    
+    monkeypatch.setattr(state.renderer, "_execute_quarto", fake_quarto)
+    monkeypatch.setattr(worker_pool, "_worker", state)
+    yield state
+    state.loop.close()
+
+
+class TestWorkerPool:
+    """WorkerPoolのテスト."""
+    
+    def test_disabled_by_default(self):
+        """ワーカー数が0の場合はプールを作らないこと."""
+        assert WorkerPool.from_settings(settings=Settings()) is None
+    
+    @pytest.mark.asyncio
+    async def test_render_in_worker_joins_trace(self, tmp_path, exporter):
+        """ワーカーで実行したレンダリングの結果とスパンがサーバー側のトレースに含まれること."""
+        pool = WorkerPool(1, settings=Settings(render_workers=1, quarto_timeout=30))
+        try:
+            with Tracer(exporter).span("mcp.call_tool") as root:
+                result = await pool.render(_request(tmp_path))
+        finally:
+            await pool.aclose()
+        
+        # Quarto CLIの有無にかかわらずワーカーから結果が返る
+        trace_id = result["trace_id"] if result["success"] else result["error"]["trace_id"]
+        assert trace_id == root.trace_id
+        names = {span.name for span in exporter.spans}
+        assert {"quarto_render", "QuartoRenderer.render"} <= names
+        assert all(span.trace_id == root.trace_id for span in exporter.spans)
+        assert pool.stats()["submitted"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_worker_latency_recorded_in_server(self, tmp_path, exporter, in_process_worker):
+        """ワーカーで計測したQuartoの所要時間がサーバープロセスの分布に記録されること."""
+        latency = LatencyModel()
+        pool = WorkerPool(1, settings=Settings(render_workers=1), latency=latency)
+        pool._executor.shutdown()
+        pool._executor = ThreadPoolExecutor(1)
+        try:
+            result = await pool.render(_request(tmp_path))
+        finally:
+            await pool.aclose()
+        
+        assert result["success"] is True
+        assert latency.formats() == ["html"]
+        assert latency.snapshot()["html"]["samples"] == 1
+        # 送り返した実測はワーカー側から消える
+        assert in_process_worker.renderer.latency.journal == []
+    
+    @pytest.mark.asyncio
+    async def test_cancel_stops_quarto_in_worker(self, tmp_path, exporter, in_process_worker, monkeypatch):
+        """呼び出しをキャンセルするとワーカー内のレンダリングもキャンセルされ、Quartoが終了すること."""
+        started = threading.Event()
+        killed = threading.Event()
+        
+        async def slow_quarto(command, cwd=None, timeout=None):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                # 実際の_execute_quartoはここでQuartoのプロセスを終了させる
+                killed.set()
+                raise
+        
+        monkeypatch.setattr(in_process_worker.renderer, "_execute_quarto", slow_quarto)
+        pool = WorkerPool(1, settings=Settings(render_workers=1))
+        pool._executor.shutdown()
+        pool._executor = ThreadPoolExecutor(1)
+        try:
+            task = asyncio.create_task(pool.render(_request(tmp_path)))
+            assert await asyncio.to_thread(started.wait, 10)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert await asyncio.to_thread(killed.wait, 10)
+            assert pool.stats()["active"] == 0
+        finally:
+            await pool.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_worker_crash_restarts_pool(self, tmp_path, exporter):
+        """ワーカーが異常終了してもWORKER_CRASHEDを返し、次のレンダリングを受け付けること."""
+        pool = WorkerPool(1, settings=Settings(render_workers=1, quarto_timeout=30))
+        try:
+            await pool.render(_request(tmp_path))
+            for pid in list(pool._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            
+            result = await pool.render(_request(tmp_path))
+            assert result["error"]["code"] == "WORKER_CRASHED"
+            assert pool.stats()["restarts"] == 1
+            
+            result = await pool.render(_request(tmp_path))
+            assert result.get("error", {}).get("code") != "WORKER_CRASHED"
+        finally:
+            await pool.aclose()